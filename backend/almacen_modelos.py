@@ -0,0 +1,265 @@
+"""
+Almacén en disco de los modelos del predictor: un archivo XGBoost nativo
+(UBJSON) por producto y un manifest.
+
+    production_model/
+        manifest.json                       generación vigente, metadata, encodings e índice
+        <generación>/productos/<id>.ubj     modelo de cada producto
+        <generación>/global.ubj             modelo global
+        <generación>/arboles_*.npy          árboles compilados de todos los productos (LoteArboles)
+
+Cada guardado escribe una generación nueva y recién al final reemplaza
+manifest.json con os.replace (atómico): quien lee el manifest nunca ve una
+generación a medio escribir. Se conservan las dos generaciones más nuevas
+para los procesos que todavía usan la anterior; las demás se borran.
+
+Abrir el almacén solo lee el manifest: los modelos por producto se cargan
+bajo demanda en un LRU acotado (ModelosProducto) y los árboles compilados
+se abren con memory-map, así que el costo no crece con el catálogo.
+
+Un proceso que cargó una generación y sigue vivo mientras otros guardan dos
+más puede encontrarse con sus archivos borrados: cargar_modelo lanza
+GeneracionBorrada y quien lo usa (ProductionPredictor) recarga el manifest.
+"""
+import errno
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+
+import numpy as np
+
+from arboles_compilados import LoteArboles
+
+logger = logging.getLogger(__name__)
+
+FORMATO = 1
+MANIFEST = 'manifest.json'
+GENERACIONES_CONSERVADAS = 2
+
+
+def _capacidad_default():
+    """Modelos por producto en memoria por proceso (env COSTOS_ML_MODEL_CACHE, default 64)."""
+    try:
+        return max(1, int(os.environ.get('COSTOS_ML_MODEL_CACHE', '64')))
+    except ValueError:
+        return 64
+
+
+def clave_producto(producto_id):
+    """Clave de un producto en el manifest: '12' para 12, np.int64(12) o 12.0."""
+    if isinstance(producto_id, (int, np.integer)) and not isinstance(producto_id, (bool, np.bool_)):
+        return str(int(producto_id))
+    if isinstance(producto_id, (float, np.floating)) and float(producto_id).is_integer():
+        return str(int(producto_id))
+    return str(producto_id)
+
+
+def _id_producto(clave):
+    """Inversa de clave_producto para ids enteros."""
+    return int(clave) if clave.lstrip('-').isdigit() else clave
+
+
+class GeneracionBorrada(FileNotFoundError):
+    """El archivo pertenece a una generación que otro proceso ya borró."""
+
+
+def cargar_modelo(ruta):
+    """XGBRegressor desde un archivo nativo (.ubj / .json)."""
+    import xgboost
+
+    model = xgboost.XGBRegressor()
+    try:
+        model.load_model(ruta)
+    except xgboost.core.XGBoostError:
+        if not os.path.exists(ruta):
+            raise GeneracionBorrada(errno.ENOENT, 'Modelo borrado por un guardado posterior', ruta) from None
+        raise
+    return model
+
+
+def _copiar(origen, destino):
+    """Hard link (mismo archivo, sin copiar bytes) o copia si el sistema de archivos no lo permite."""
+    try:
+        os.link(origen, destino)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            raise
+        shutil.copyfile(origen, destino)
+
+
+def _entrenado(model):
+    try:
+        return model.__sklearn_is_fitted__()
+    except AttributeError:
+        return True
+
+
+class ModelosProducto(Mapping):
+    """
+    producto_id -> XGBRegressor, leído de su archivo la primera vez que se usa.
+
+    Mantiene en memoria los ``capacidad`` modelos usados más recientemente.
+    ``in`` y len() salen del manifest, sin tocar disco.
+    """
+
+    def __init__(self, directorio, archivos, capacidad=None):
+        """
+        Args:
+            directorio: directorio de la generación
+            archivos: clave_producto -> ruta relativa del modelo
+            capacidad: modelos en memoria (default: COSTOS_ML_MODEL_CACHE)
+        """
+        self._directorio = directorio
+        self._archivos = archivos
+        self.capacidad = capacidad or _capacidad_default()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, producto_id):
+        return clave_producto(producto_id) in self._archivos
+
+    def __getitem__(self, producto_id):
+        clave = clave_producto(producto_id)
+        if clave not in self._archivos:
+            raise KeyError(producto_id)
+        with self._lock:
+            model = self._cache.get(clave)
+            if model is not None:
+                self._cache.move_to_end(clave)
+                return model
+        model = cargar_modelo(os.path.join(self._directorio, self._archivos[clave]))
+        with self._lock:
+            self._cache[clave] = model
+            while len(self._cache) > self.capacidad:
+                self._cache.popitem(last=False)
+        return model
+
+    def __iter__(self):
+        return (_id_producto(clave) for clave in self._archivos)
+
+    def __len__(self):
+        return len(self._archivos)
+
+    def archivo(self, producto_id):
+        """Ruta del archivo del modelo, o None si el producto no tiene modelo."""
+        ruta = self._archivos.get(clave_producto(producto_id))
+        return os.path.join(self._directorio, ruta) if ruta else None
+
+    @property
+    def en_memoria(self):
+        return len(self._cache)
+
+
+class AlmacenModelos:
+    """Directorio con las generaciones de modelos y el manifest de la vigente."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    @property
+    def ruta_manifest(self):
+        return os.path.join(self.directorio, MANIFEST)
+
+    def existe(self):
+        return os.path.exists(self.ruta_manifest)
+
+    def leer_manifest(self):
+        with open(self.ruta_manifest, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('formato') != FORMATO:
+            raise ValueError(f"Formato de manifest no soportado: {manifest.get('formato')}")
+        return manifest
+
+    def guardar(self, *, models, global_model, arboles, product_encodings, is_trained, metadata):
+        """
+        Escribe una generación nueva y la publica en el manifest.
+
+        Args:
+            models: producto_id -> XGBRegressor (los no entrenados se omiten) o ruta
+                de un modelo ya guardado, que se enlaza a la generación nueva
+            global_model: XGBRegressor, ruta de un modelo ya guardado o None
+            arboles: (clave_producto -> fila, LoteArboles) o None
+            product_encodings: producto_id -> código del modelo global
+
+        Returns:
+            manifest escrito
+        """
+        generacion = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        directorio = os.path.join(self.directorio, generacion)
+        os.makedirs(os.path.join(directorio, 'productos'))
+
+        productos = {}
+        for producto_id, model in models.items():
+            if not isinstance(model, str) and not _entrenado(model):
+                continue
+            clave = clave_producto(producto_id)
+            ruta = f'productos/{clave}.ubj'
+            self._escribir_modelo(model, os.path.join(directorio, ruta))
+            productos[clave] = ruta
+
+        ruta_global = None
+        if global_model is not None:
+            ruta_global = 'global.ubj'
+            self._escribir_modelo(global_model, os.path.join(directorio, ruta_global))
+
+        manifest_arboles = None
+        if arboles is not None:
+            indice, lote = arboles
+            manifest_arboles = dict(lote.guardar(directorio), productos=sorted(indice, key=indice.get))
+
+        manifest = {
+            'formato': FORMATO,
+            'generacion': generacion,
+            'is_trained': bool(is_trained),
+            'productos': productos,
+            'global': ruta_global,
+            'arboles': manifest_arboles,
+            'product_encodings': [[_id_producto(clave_producto(pid)), int(codigo)]
+                                  for pid, codigo in product_encodings.items()],
+            'metadata': metadata or {},
+        }
+        temporal = self.ruta_manifest + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta_manifest)
+        self._borrar_generaciones_viejas()
+        return manifest
+
+    @staticmethod
+    def _escribir_modelo(model, destino):
+        if isinstance(model, str):
+            _copiar(model, destino)
+        else:
+            model.save_model(destino)
+
+    def _borrar_generaciones_viejas(self):
+        generaciones = sorted(
+            nombre for nombre in os.listdir(self.directorio)
+            if os.path.isdir(os.path.join(self.directorio, nombre))
+        )
+        for nombre in generaciones[:-GENERACIONES_CONSERVADAS]:
+            shutil.rmtree(os.path.join(self.directorio, nombre), ignore_errors=True)
+            logger.info("almacen_modelos.generacion_borrada path=%s", os.path.join(self.directorio, nombre))
+
+    def ruta(self, manifest, relativa):
+        """Ruta absoluta de un archivo de la generación del manifest."""
+        return os.path.join(self.directorio, manifest['generacion'], relativa)
+
+    def modelos(self, manifest, capacidad=None):
+        """ModelosProducto (carga bajo demanda) de la generación del manifest."""
+        return ModelosProducto(os.path.join(self.directorio, manifest['generacion']),
+                               manifest.get('productos') or {}, capacidad)
+
+    def arboles(self, manifest):
+        """(clave_producto -> fila, LoteArboles con memory-map) o None si no hay."""
+        info = manifest.get('arboles')
+        if not info:
+            return None
+        lote = LoteArboles.cargar(os.path.join(self.directorio, manifest['generacion']),
+                                  info['n_arboles'], info['profundidad'])
+        return {clave: i for i, clave in enumerate(info['productos'])}, lote
@@ -0,0 +1,325 @@
+"""
+Evaluación de escenarios del análisis marginal en lote.
+
+``/api/analisis-marginal`` calcula un único escenario por request. Aquí un
+conjunto de escenarios (lista explícita o grilla cruzada de parámetros) se
+evalúa de una vez sobre el mismo ContextoMes:
+
+- el costeo variable se calcula una sola vez por cada vector distinto de
+  factores de precio de materias primas (los escenarios que solo mueven
+  inflación, indirectos o producción lo comparten);
+- el escalamiento de indirectos se evalúa para el volumen de todos los
+  escenarios con una pasada de MatrizEscalamiento;
+- el resto son operaciones elemento a elemento sobre matrices
+  escenario × producto.
+
+Las fórmulas son las del endpoint individual, en el mismo orden de
+operaciones, por lo que cada fila coincide con la respuesta de
+``/api/analisis-marginal`` para ese escenario.
+
+Un escenario es un dict con cualquier combinación de:
+
+- ``inflacion``: inflación mensual (%) entre mes base y mes de producción
+- ``materia_prima``: {materia_prima_id: variación de precio (%)}
+- ``categoria``: {nombre_categoria: variación de precio (%)}
+- ``indirectos``: variación de los costos indirectos (%)
+- ``produccion``: variación del volumen producido (%)
+"""
+import itertools
+
+import numpy as np
+
+from catalogo import matriz_costeo
+
+MAX_ESCENARIOS = 2000
+
+_PARAMETROS_ESCALARES = ('inflacion', 'indirectos', 'produccion')
+_PARAMETROS_POR_CLAVE = ('materia_prima', 'categoria')
+
+
+def _numero(valor, nombre):
+    try:
+        return float(valor), None
+    except (ValueError, TypeError):
+        return None, f'{nombre} debe ser un número válido'
+
+
+def _valores_eje(spec, nombre):
+    """Lista de valores de un eje de la grilla: lista o {desde, hasta, paso}."""
+    if isinstance(spec, dict):
+        desde, error = _numero(spec.get('desde'), f'{nombre}.desde')
+        if error:
+            return None, error
+        hasta, error = _numero(spec.get('hasta'), f'{nombre}.hasta')
+        if error:
+            return None, error
+        paso, error = _numero(spec.get('paso'), f'{nombre}.paso')
+        if error:
+            return None, error
+        if paso <= 0 or hasta < desde:
+            return None, f'{nombre}: se requiere paso > 0 y hasta >= desde'
+        cantidad = int(np.floor((hasta - desde) / paso + 1e-9)) + 1
+        if cantidad > MAX_ESCENARIOS:
+            return None, f'{nombre}: demasiados valores ({cantidad})'
+        return [round(desde + i * paso, 10) for i in range(cantidad)], None
+    if isinstance(spec, (list, tuple)) and spec:
+        valores = []
+        for v in spec:
+            numero, error = _numero(v, nombre)
+            if error:
+                return None, error
+            valores.append(numero)
+        return valores, None
+    return None, f'{nombre} debe ser una lista de valores o {{desde, hasta, paso}}'
+
+
+def expandir_grilla(grilla):
+    """
+    Producto cartesiano de los ejes de una grilla.
+
+    Ejemplo: ``{'inflacion': {'desde': 0, 'hasta': 10, 'paso': 0.5},
+    'materia_prima': {'12': [-10, 0, 10]}}`` da 21 × 3 escenarios.
+
+    Returns:
+        (lista de escenarios, None) o (None, mensaje_error)
+    """
+    if not isinstance(grilla, dict) or not grilla:
+        return None, 'grilla debe ser un objeto con al menos un eje'
+    ejes = []  # (parametro, clave o None, valores)
+    for parametro, spec in grilla.items():
+        if parametro in _PARAMETROS_ESCALARES:
+            valores, error = _valores_eje(spec, parametro)
+            if error:
+                return None, error
+            ejes.append((parametro, None, valores))
+        elif parametro in _PARAMETROS_POR_CLAVE:
+            if not isinstance(spec, dict) or not spec:
+                return None, f'{parametro} debe ser un objeto {{clave: valores}}'
+            for clave, spec_clave in spec.items():
+                valores, error = _valores_eje(spec_clave, f'{parametro}.{clave}')
+                if error:
+                    return None, error
+                ejes.append((parametro, clave, valores))
+        else:
+            return None, f'Parámetro de grilla desconocido: {parametro}'
+
+    total = 1
+    for _, _, valores in ejes:
+        total *= len(valores)
+    if total > MAX_ESCENARIOS:
+        return None, f'La grilla genera {total} escenarios (máximo {MAX_ESCENARIOS})'
+
+    escenarios = []
+    for combinacion in itertools.product(*(valores for _, _, valores in ejes)):
+        escenario = {}
+        for (parametro, clave, _), valor in zip(ejes, combinacion):
+            if clave is None:
+                escenario[parametro] = valor
+            else:
+                escenario.setdefault(parametro, {})[clave] = valor
+        escenarios.append(escenario)
+    return escenarios, None
+
+
+def normalizar_escenario(datos):
+    """
+    Valida un escenario. Acepta también la forma del endpoint individual
+    (``{'tipo', 'valor', 'extra'}``).
+
+    Returns:
+        (escenario, None) o (None, mensaje_error)
+    """
+    if not isinstance(datos, dict):
+        return None, 'Cada escenario debe ser un objeto'
+    if 'tipo' in datos:
+        valor, error = _numero(datos.get('valor'), 'valor')
+        if error:
+            return None, error
+        tipo = datos['tipo']
+        if tipo in _PARAMETROS_ESCALARES:
+            datos = {'nombre': datos.get('nombre'), tipo: valor}
+        elif tipo in _PARAMETROS_POR_CLAVE:
+            if datos.get('extra') in (None, ''):
+                return None, f'El escenario {tipo} requiere extra'
+            datos = {'nombre': datos.get('nombre'), tipo: {datos['extra']: valor}}
+        else:
+            return None, f'Tipo de escenario desconocido: {tipo}'
+
+    escenario = {}
+    if datos.get('nombre') is not None:
+        escenario['nombre'] = str(datos['nombre'])
+    for parametro in _PARAMETROS_ESCALARES:
+        if datos.get(parametro) is not None:
+            valor, error = _numero(datos[parametro], parametro)
+            if error:
+                return None, error
+            escenario[parametro] = valor
+    for parametro in _PARAMETROS_POR_CLAVE:
+        if datos.get(parametro) is None:
+            continue
+        if not isinstance(datos[parametro], dict):
+            return None, f'{parametro} debe ser un objeto {{clave: variación %}}'
+        variaciones = {}
+        for clave, valor in datos[parametro].items():
+            numero, error = _numero(valor, f'{parametro}.{clave}')
+            if error:
+                return None, error
+            if parametro == 'materia_prima':
+                try:
+                    clave = int(clave)
+                except (ValueError, TypeError):
+                    return None, 'materia_prima debe usar ids numéricos como clave'
+            variaciones[clave] = numero
+        escenario[parametro] = variaciones
+    return escenario, None
+
+
+def escenario_a_dict(escenario):
+    """Escenario serializable (claves de materia_prima / categoria como texto)."""
+    return {
+        k: {str(c): v for c, v in valor.items()} if isinstance(valor, dict) else valor
+        for k, valor in escenario.items()
+    }
+
+
+def evaluar_escenarios(ctx, productos, escenarios, matriz=None):
+    """
+    Evalúa el análisis marginal de cada escenario.
+
+    Args:
+        ctx: ContextoMes del par de meses (con producción y costos)
+        productos: {producto_id: ProductoCatalogo o Producto} de ctx.produccion
+        escenarios: lista de escenarios normalizados
+        matriz: MatrizCosteo con los productos (opcional; por defecto la del
+                snapshot del catálogo)
+
+    Returns:
+        dict con ``producto_ids`` (P,), ``inflacion_acumulada`` (S,) y
+        matrices (S, P): costo_variable_unitario, costo_fijo_unitario,
+        costo_unitario_total, markup, margen_contribucion_pct,
+        punto_equilibrio_kg, costo_fijo_total_producto, produccion_kg.
+    """
+    producto_ids = list(ctx.produccion)
+    n_esc = len(escenarios)
+    kg_base = np.array([ctx.produccion[pid].kg for pid in producto_ids], dtype=np.float64)
+    minutos_base = np.array([ctx.produccion[pid].minutos for pid in producto_ids], dtype=np.float64)
+    precio_venta = np.array([productos[pid].precio_venta or 0 for pid in producto_ids], dtype=np.float64)
+
+    # --- Producción ---
+    ajuste_produccion = np.array(
+        [1 + e['produccion'] / 100 if 'produccion' in e else 1.0 for e in escenarios], dtype=np.float64
+    )
+    con_ajuste = np.array(['produccion' in e for e in escenarios])
+    total_kg = np.where(con_ajuste, ctx.total_kg * ajuste_produccion, ctx.total_kg)
+    total_minutos = np.where(con_ajuste, ctx.total_minutos * ajuste_produccion, ctx.total_minutos)
+    kg = np.where(con_ajuste[:, None], kg_base[None, :] * ajuste_produccion[:, None], kg_base[None, :])
+    minutos = np.where(
+        con_ajuste[:, None], minutos_base[None, :] * ajuste_produccion[:, None], minutos_base[None, :]
+    )
+
+    # --- Inflación acumulada ---
+    meses = ctx.meses_diferencia
+    inflacion = np.full(n_esc, ctx.inflacion_acumulada, dtype=np.float64)
+    if meses > 0:
+        for i, e in enumerate(escenarios):
+            if 'inflacion' in e:
+                acumulada = 1.0
+                for _ in range(meses):
+                    acumulada *= (1 + e['inflacion'] / 100)
+                inflacion[i] = acumulada
+
+    # --- Indirectos escalados por el volumen de cada escenario ---
+    escalados = ctx.matriz_escalamiento.evaluar(ctx.volumen_base_kg, total_kg)
+    ajuste_indirectos = np.array(
+        [1 + e['indirectos'] / 100 if 'indirectos' in e else 1.0 for e in escenarios], dtype=np.float64
+    )
+    total_sp = escalados['SP'] * inflacion * ajuste_indirectos
+    total_gif = escalados['GIF'] * inflacion * ajuste_indirectos
+    total_dep = escalados['DEP'] * inflacion * ajuste_indirectos
+
+    # --- Costo variable: un cálculo por vector de precios distinto ---
+    if matriz is None:
+        matriz = matriz_costeo([productos[pid] for pid in producto_ids])
+    filas = np.array([matriz.fila_por_producto[pid] for pid in producto_ids], dtype=np.int64)
+    costo_por_kg = np.empty((n_esc, len(producto_ids)), dtype=np.float64)
+    por_factores = {}
+    for i, e in enumerate(escenarios):
+        clave = (
+            tuple(sorted(e.get('materia_prima', {}).items())),
+            tuple(sorted(e.get('categoria', {}).items())),
+        )
+        if clave not in por_factores:
+            factor_mp = None
+            if clave[0]:
+                factor_mp = matriz.factor_por_materia_prima({mp: 1 + v / 100 for mp, v in clave[0]})
+            if clave[1]:
+                factor_cat = matriz.factor_por_categoria({cat: 1 + v / 100 for cat, v in clave[1]})
+                factor_mp = factor_cat if factor_mp is None else factor_mp * factor_cat
+            por_factores[clave] = matriz.calcular(factor_mp)['costo_por_kg'][filas]
+        costo_por_kg[i] = por_factores[clave]
+
+    costo_variable_unitario = costo_por_kg * inflacion[:, None]
+
+    # --- Costo fijo distribuido (SP por minutos, GIF y DEP por kg) ---
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_kg = np.where(total_kg[:, None] > 0, kg / total_kg[:, None], 0.0)
+        pct_sp = np.where(total_minutos[:, None] > 0, minutos / total_minutos[:, None], pct_kg)
+        costo_fijo_total = (
+            (total_sp[:, None] * pct_sp) + (total_gif[:, None] * pct_kg) + (total_dep[:, None] * pct_kg)
+        )
+        costo_fijo_unitario = np.where(kg > 0, costo_fijo_total / kg, 0.0)
+
+        costo_unitario_total = costo_variable_unitario + costo_fijo_unitario
+        markup = np.where(
+            costo_unitario_total > 0,
+            (precio_venta[None, :] - costo_unitario_total) / costo_unitario_total * 100,
+            0.0,
+        )
+        mc_unitario = precio_venta[None, :] - costo_variable_unitario
+        margen_contribucion_pct = np.where(
+            precio_venta[None, :] > 0, mc_unitario / precio_venta[None, :] * 100, 0.0
+        )
+        punto_equilibrio = np.where(mc_unitario > 0, costo_fijo_total / mc_unitario, 0.0)
+
+    return {
+        'producto_ids': producto_ids,
+        'inflacion_acumulada': inflacion,
+        'produccion_kg': kg,
+        'precio_venta': precio_venta,
+        'costo_variable_unitario': costo_variable_unitario,
+        'costo_fijo_unitario': costo_fijo_unitario,
+        'costo_unitario_total': costo_unitario_total,
+        'costo_fijo_total_producto': costo_fijo_total,
+        'markup': markup,
+        'margen_contribucion_pct': margen_contribucion_pct,
+        'punto_equilibrio_kg': punto_equilibrio,
+    }
+
+
+def totales_ponderados(resultado):
+    """Totales ponderados por kg de cada escenario (como en el endpoint individual)."""
+    kg = resultado['produccion_kg']
+    sum_kg = kg.sum(axis=1)
+    sum_cv = (resultado['costo_variable_unitario'] * kg).sum(axis=1)
+    sum_cf = resultado['costo_fijo_total_producto'].sum(axis=1)
+    sum_precio = (resultado['precio_venta'][None, :] * kg).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precio = np.where(sum_kg > 0, sum_precio / sum_kg, 0.0)
+        cv = np.where(sum_kg > 0, sum_cv / sum_kg, 0.0)
+        cf = np.where(sum_kg > 0, sum_cf / sum_kg, 0.0)
+        total = cv + cf
+        markup = np.where(total > 0, (precio - total) / total * 100, 0.0)
+        mc = precio - cv
+        mc_pct = np.where(precio > 0, mc / precio * 100, 0.0)
+        pe = np.where(mc > 0, sum_cf / mc, 0.0)
+    return {
+        'precio_ponderado': precio,
+        'costo_variable_ponderado': cv,
+        'costo_fijo_ponderado': cf,
+        'costo_total_ponderado': total,
+        'markup_ponderado': markup,
+        'total_produccion_kg': sum_kg,
+        'total_costo_fijo': sum_cf,
+        'punto_equilibrio_kg': pe,
+        'margen_contribucion_pct': mc_pct,
+    }
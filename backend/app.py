@@ -2,9 +2,9 @@ from flask import Flask, jsonify, request, send_file, abort
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from models import db, init_db, Categoria, MateriaPrima, HistorialPrecios, Producto, FormulaDetalle, ProduccionProgramada, ProduccionHistorica, CostoIndirecto, InflacionMensual, Usuario
+from models import db, init_db, Categoria, MateriaPrima, HistorialPrecios, Producto, FormulaDetalle, ProduccionProgramada, ProduccionHistorica, CostoIndirecto, InflacionMensual, Usuario, carga_formula_completa
 from datetime import datetime, date
-from sqlalchemy import extract, func
+from sqlalchemy import func
 import os
 import io
 import logging
@@ -12,6 +12,8 @@ import time
 import uuid
 import shutil
 
+import numpy as np
+
 # Cargar variables de entorno desde archivo .env
 # IMPORTANTE: Buscar el .env en la raíz del proyecto (un nivel arriba de backend/)
 from dotenv import load_dotenv
@@ -30,6 +32,24 @@ from sqlalchemy import text
 from sqlalchemy.orm import joinedload
 
 from logging_config import configure_logging
+from costeo_engine import CATEGORIA_ENVASES, chunks
+from costeo_cache import cache_costeo, init_costeo_cache
+from catalogo import catalogo, init_catalogo, matriz_costeo
+from indice_precios import indice_precios, init_indice_precios, parse_as_of
+from sensibilidad_costeo import cache_sensibilidad, init_sensibilidad_costeo
+from indice_uso import indice_uso, init_indice_uso
+from impacto_precios import previsualizar_cambio_precios
+from sandbox import normalizar_overlay, sandboxes
+from valores_costeo import FilaDistribucion
+from contexto_mensual import init_contexto_mensual, obtener_contexto
+from analisis_marginal import (
+    MAX_ESCENARIOS as MAX_ESCENARIOS_MARGINAL, escenario_a_dict, evaluar_escenarios, expandir_grilla,
+    normalizar_escenario, totales_ponderados,
+)
+from simulacion_margen import MAX_SORTEOS, PERCENTILES_DEFAULT, ModeloMargen, parse_distribucion, simular
+from indice_inflacion import indice_inflacion, init_indice_inflacion
+from consultas_produccion import filtro_mes, productos_con_totales
+from produccion_mensual import init_produccion_mensual, produccion_del_mes, reconstruir as reconstruir_produccion_mensual
 from auth import init_auth_routes, token_required, admin_required, decode_token
 
 app = Flask(__name__)
@@ -70,6 +90,53 @@ def _get_or_404(model, ident):
     return instance
 
 
+# Endpoints de solo cálculo que aceptan ?sandbox=<id>; el resto (escrituras
+# incluidas) lo rechaza para no confirmar en la base un cambio pedido sobre un sandbox
+_ENDPOINTS_SANDBOX = frozenset({
+    'get_costeo', 'get_costeo_completo', 'get_costeo_completo_todos', 'get_costeo_resumen',
+    'get_curva_escalamiento', 'get_analisis_marginal', 'evaluar_escenarios_marginal', 'simular_margen',
+    'calcular_distribucion_costos', 'proyeccion_multiperiodo',
+})
+
+
+def _sandbox_o_404(sandbox_id):
+    sandbox = sandboxes.obtener(sandbox_id)
+    if sandbox is None:
+        respuesta = jsonify({'error': f'Sandbox {sandbox_id} inexistente o expirado'})
+        respuesta.status_code = 404
+        abort(respuesta)
+    return sandbox
+
+
+def _sandbox_activo():
+    """Sandbox indicado con ?sandbox=<id> (resuelto en _resolver_sandbox) o None."""
+    return g.get('sandbox')
+
+
+def _contexto(mes_base, mes_produccion):
+    """ContextoMes del par de meses, con el overlay del sandbox activo si lo hay."""
+    sandbox = _sandbox_activo()
+    if sandbox is not None:
+        return sandbox.contexto(mes_base, mes_produccion)
+    return obtener_contexto(mes_base, mes_produccion)
+
+
+def _costeos(productos):
+    """{producto_id: costeo} (solo lectura), con el overlay del sandbox activo si lo hay."""
+    sandbox = _sandbox_activo()
+    if sandbox is not None:
+        return sandbox.costeos(productos)
+    return cache_costeo.costeos(productos)
+
+
+def _matriz_costeo(productos):
+    """MatrizCosteo de los productos, con el overlay del sandbox activo si lo hay."""
+    sandbox = _sandbox_activo()
+    if sandbox is not None:
+        return sandbox.matriz_costeo(productos)
+    return matriz_costeo(productos)
+
+
 
 @app.before_request
 def _log_request_start():
@@ -122,6 +189,25 @@ def _require_auth_for_api_routes():
     return None
 
 
+@app.before_request
+def _resolver_sandbox():
+    """
+    Resuelve ?sandbox=<id> una sola vez por request, antes de que el
+    endpoint entre en sus bloques try (un 404 dentro terminaría como 500).
+    Solo los endpoints de _ENDPOINTS_SANDBOX lo aceptan; en el resto es un 400.
+    """
+    g.sandbox = None
+    sandbox_id = request.args.get('sandbox')
+    if not sandbox_id or not request.path.startswith('/api/'):
+        return None
+    if request.endpoint not in _ENDPOINTS_SANDBOX:
+        return jsonify({'error': f'{request.method} {request.path} no admite ?sandbox'}), 400
+    g.sandbox = sandboxes.obtener(sandbox_id)
+    if g.sandbox is None:
+        return jsonify({'error': f'Sandbox {sandbox_id} inexistente o expirado'}), 404
+    return None
+
+
 @app.after_request
 def _log_request_end(response):
     try:
@@ -251,102 +337,6 @@ def _paginated_response(query, serializer, pagination):
     })
 
 
-def calcular_costos_con_escalamiento(costos, volumen_base_kg, volumen_proyectado_kg,
-                                       factor_limite_min=0.5, factor_limite_max=3.0):
-    """
-    Calcula los totales de costos indirectos aplicando escalamiento a costos variables.
-    
-    Los costos FIJOS permanecen sin cambio.
-    Los costos VARIABLES escalan según su factor de elasticidad:
-    - factor_elasticidad=1.0 (default): escalamiento lineal
-    - factor_elasticidad=0.5: solo escala 50% del cambio (economías de escala)
-    - factor_elasticidad=1.5: escala 150% del cambio (deseconomías de escala)
-    
-    Args:
-        costos: Lista de objetos CostoIndirecto
-        volumen_base_kg: Kg producidos en el mes base (referencia)
-        volumen_proyectado_kg: Kg proyectados para el mes de cálculo
-        factor_limite_min: Límite inferior global del factor (default 0.5)
-        factor_limite_max: Límite superior global del factor (default 3.0)
-    
-    Returns:
-        dict con:
-            - totales_base: {SP, GIF, DEP} montos originales
-            - totales_escalados: {SP, GIF, DEP} montos después del escalamiento
-            - total_fijos: suma de costos fijos
-            - total_variables_base: suma de costos variables antes de escalar
-            - total_variables_escalados: suma de costos variables después de escalar
-            - factor_escalamiento: factor base aplicado (antes de elasticidad)
-    """
-    # Inicializar totales
-    totales_base = {'SP': 0, 'GIF': 0, 'DEP': 0}
-    totales_fijos = {'SP': 0, 'GIF': 0, 'DEP': 0}
-    totales_variables_base = {'SP': 0, 'GIF': 0, 'DEP': 0}
-    
-    # Separar costos fijos y variables
-    for c in costos:
-        tipo = c.tipo_distribucion
-        if tipo in totales_base:
-            totales_base[tipo] += c.monto
-            if c.es_variable:
-                totales_variables_base[tipo] += c.monto
-            else:
-                totales_fijos[tipo] += c.monto
-    
-    # Calcular factor base de escalamiento
-    # Solo aplicar si hay volumen base > 0, de lo contrario factor = 1.0
-    if volumen_base_kg and volumen_base_kg > 0 and volumen_proyectado_kg:
-        factor_base = volumen_proyectado_kg / volumen_base_kg
-        # Aplicar límites globales al factor base
-        factor_base = max(factor_limite_min, min(factor_base, factor_limite_max))
-    else:
-        factor_base = 1.0
-    
-    # Aplicar escalamiento lineal a costos variables
-    totales_escalados = {'SP': 0, 'GIF': 0, 'DEP': 0}
-    total_variables_escalados = 0
-    
-    for tipo in ['SP', 'GIF', 'DEP']:
-        # Empezar con los fijos (no escalan)
-        totales_escalados[tipo] = totales_fijos[tipo]
-        
-        # Procesar cada costo variable individualmente
-        for c in [x for x in costos if x.tipo_distribucion == tipo and x.es_variable]:
-            # Obtener límite de variación en porcentaje (ej: 80 significa máximo +80%)
-            variacion_max_pct = getattr(c, 'variacion_max_pct', None)
-            
-            # El factor base ya está calculado (ej: 1.5 = +50% de producción)
-            factor_efectivo = factor_base
-            
-            # Si hay límite de variación, convertir porcentaje a factor máximo
-            # variacion_max_pct=80 → factor máximo = 1.8
-            if variacion_max_pct is not None and variacion_max_pct > 0:
-                factor_max = 1 + (variacion_max_pct / 100)
-                if factor_efectivo > factor_max:
-                    factor_efectivo = factor_max
-            
-            # Asegurar que el factor no sea menor a factor_limite_min
-            factor_efectivo = max(factor_limite_min, factor_efectivo)
-            
-            costo_escalado = c.monto * factor_efectivo
-            totales_escalados[tipo] += costo_escalado
-            total_variables_escalados += costo_escalado
-    
-    total_fijos = sum(totales_fijos.values())
-    total_variables_base = sum(totales_variables_base.values())
-    
-    return {
-        'totales_base': totales_base,
-        'totales_escalados': totales_escalados,
-        'total_fijos': total_fijos,
-        'total_variables_base': total_variables_base,
-        'total_variables_escalados': total_variables_escalados,
-        'factor_escalamiento': round(factor_base, 4),
-        'volumen_base_kg': volumen_base_kg,
-        'volumen_proyectado_kg': volumen_proyectado_kg
-    }
-
-
 # Configurar CORS según entorno
 FLASK_ENV = os.environ.get('FLASK_ENV', 'production')
 
@@ -556,6 +546,11 @@ def _verify_db_contents():
 if os.environ.get('COSTOS_EMBUTIDOS_SKIP_INIT_DB') != '1':
     init_db(app)
     
+    # Recalcular el agregado mensual de producción (absorbe escrituras de scripts)
+    with app.app_context():
+        reconstruir_produccion_mensual()
+        db.session.commit()
+    
     # Crear backup solo si hay datos
     db_status = _verify_db_contents()
     if db_status and (db_status['productos'] > 0 or db_status['materias_primas'] > 5):
@@ -564,6 +559,30 @@ if os.environ.get('COSTOS_EMBUTIDOS_SKIP_INIT_DB') != '1':
 # Inicializar rutas de autenticación (pasar el limiter para rate-limit en login)
 init_auth_routes(app, limiter=limiter)
 
+# Caché de costeo por producto (invalidación por eventos de SQLAlchemy)
+init_costeo_cache(app)
+
+# Índice inverso materia prima → productos (mantenido en cada edición de fórmula)
+init_indice_uso(app)
+
+# Snapshot en memoria del catálogo (se reconstruye en segundo plano tras cada commit)
+init_catalogo(app)
+
+# Índice temporal de precios (costeo a fecha con ?as_of=)
+init_indice_precios(app)
+
+# Matriz de sensibilidad costo/kg vs. precio de MP (se descarta si cambian fórmulas o rendimientos)
+init_sensibilidad_costeo(app)
+
+# Índice acumulado de inflación mensual (producto prefijo)
+init_indice_inflacion(app)
+
+# Contexto mensual de costos indirectos (LRU por par de meses + versión de tablas)
+init_contexto_mensual(app)
+
+# Agregado mensual de producción programada (mantenido en cada flush)
+init_produccion_mensual(app)
+
 
 # ===== CATEGORÍAS =====
 @app.route('/api/categorias', methods=['GET'])
@@ -615,6 +634,84 @@ def get_materia_prima(id):
     return jsonify(materia.to_dict())
 
 
+@app.route('/api/materias-primas/<int:id>/uso', methods=['GET'])
+def get_uso_materia_prima(id):
+    """
+    Productos activos que usan una materia prima y qué parte de su costo representa.
+
+    ``participacion_pct`` es el aporte de la materia prima (con el recargo por
+    merma, salvo ENVASES) sobre el total neto del batch.
+    """
+    materia = _get_or_404(MateriaPrima, id)
+    usos = indice_uso.usos(materia.id)
+    productos = []
+    for chunk in chunks(sorted(usos)):
+        productos.extend(Producto.query.filter(Producto.id.in_(chunk)).all())
+    costeos = cache_costeo.costeos(productos)
+
+    resultado = []
+    for p in productos:
+        costeo = costeos[p.id]
+        merma = costeo.producto.porcentaje_merma or 0
+        aporte = 0.0
+        for ing in costeo.ingredientes:
+            if ing.materia_prima_id == materia.id:
+                recargo = 1 + merma / 100 if merma > 0 and ing.categoria != CATEGORIA_ENVASES else 1
+                aporte += ing.costo_total * recargo
+        total_neto = costeo.total_neto
+        resultado.append({
+            'producto_id': p.id,
+            'codigo': p.codigo,
+            'nombre': p.nombre,
+            'cantidad': usos[p.id],
+            'costo_batch': aporte,
+            'participacion_pct': aporte / total_neto * 100 if total_neto else 0,
+        })
+    resultado.sort(key=lambda x: x['participacion_pct'], reverse=True)
+    return jsonify({
+        'materia_prima': materia.to_dict(),
+        'total_productos': len(resultado),
+        'productos': resultado,
+    })
+
+
+@app.route('/api/materias-primas/<int:id>/sensibilidad', methods=['GET'])
+def get_sensibilidad_materia_prima(id):
+    """
+    Productos activos más expuestos al precio de una materia prima.
+
+    Query params:
+    - top: (opcional) cantidad de productos, default 20
+
+    ``sensibilidad`` es ∂costo_por_kg/∂costo_unitario (incluye el recargo por
+    merma salvo ENVASES); ``impacto_1pct`` es la variación de costo_por_kg si
+    el precio actual sube 1 %.
+    """
+    materia = _get_or_404(MateriaPrima, id)
+    top = request.args.get('top', 20, type=int)
+    if top is None or top < 1:
+        return jsonify({'error': 'top debe ser un entero positivo'}), 400
+
+    expuestos = cache_sensibilidad.matriz().mas_expuestos(materia.id, top)
+    productos = {
+        p.id: p for p in Producto.query.filter(Producto.id.in_([pid for pid, _ in expuestos])).all()
+    } if expuestos else {}
+    precio = materia.costo_unitario or 0
+    return jsonify({
+        'materia_prima': materia.to_dict(),
+        'productos': [
+            {
+                'producto_id': pid,
+                'codigo': productos[pid].codigo,
+                'nombre': productos[pid].nombre,
+                'sensibilidad': sensibilidad,
+                'impacto_1pct': sensibilidad * precio * 0.01,
+            }
+            for pid, sensibilidad in expuestos
+        ],
+    })
+
+
 @app.route('/api/materias-primas', methods=['POST'])
 def create_materia_prima():
     data = get_json_data()
@@ -720,7 +817,22 @@ def update_materia_prima(id):
 
 @app.route('/api/materias-primas/<int:id>', methods=['DELETE'])
 def delete_materia_prima(id):
+    """
+    Baja lógica de una materia prima.
+
+    Query params:
+    - forzar: (opcional) true para darla de baja aunque la usen productos activos
+    """
     materia = _get_or_404(MateriaPrima, id)
+    forzar = request.args.get('forzar', 'false').lower() in ('1', 'true', 'si', 'sí')
+    usos = indice_uso.usos(materia.id)
+    if usos and not forzar:
+        productos = Producto.query.filter(Producto.id.in_(sorted(usos)[:10])).order_by(Producto.id).all()
+        return jsonify({
+            'error': f'La materia prima se usa en {len(usos)} producto(s) activo(s)',
+            'productos': [{'id': p.id, 'codigo': p.codigo, 'nombre': p.nombre} for p in productos],
+            'total_productos': len(usos),
+        }), 409
     materia.activo = False  # Soft delete
     db.session.commit()
     
@@ -785,10 +897,22 @@ def deshacer_ultimo_ajuste():
     if not cambios:
         return jsonify({'error': 'No se encontraron cambios para deshacer'}), 404
     
+    # Propagar el delta inverso al costeo cacheado (antes de tocar los precios)
+    materias = {m.id: m for m in MateriaPrima.query.filter(
+        MateriaPrima.id.in_({c.materia_prima_id for c in cambios})
+    ).all()}
+    cambios_precio = {}
+    for cambio in cambios:
+        materia = materias.get(cambio.materia_prima_id)
+        if materia:
+            anterior = cambios_precio.get(materia.id, (materia.costo_unitario, None))[0]
+            cambios_precio[materia.id] = (anterior, cambio.precio_anterior)
+    impacto = cache_costeo.propagar_cambio_precios(cambios_precio)
+    
     # Revertir cada cambio
     revertidos = []
     for cambio in cambios:
-        materia = MateriaPrima.query.get(cambio.materia_prima_id)
+        materia = materias.get(cambio.materia_prima_id)
         if materia:
             # Registrar la reversión en el historial
             reversion_entry = HistorialPrecios(
@@ -825,6 +949,7 @@ def deshacer_ultimo_ajuste():
         'success': True,
         'items_revertidos': len(revertidos),
         'detalle': revertidos,
+        'impacto_productos': impacto,
         'fecha_ajuste_original': ultimo_ajuste.fecha_cambio.isoformat(),
         'porcentaje_original': ultimo_ajuste.porcentaje_aplicado,
         'categoria_original': ultimo_ajuste.categoria_afectada
@@ -840,6 +965,8 @@ def ajustar_precios_materias_primas():
     Body JSON:
     - porcentaje: Porcentaje de ajuste (ej: 5 para 5%)
     - categoria: (opcional) Categoría específica a ajustar, si no se especifica ajusta todas
+    - dry_run: (opcional) true para calcular el impacto sin guardar cambios
+    - mes: (opcional, con dry_run) mes del plan de producción a valorizar (YYYY-MM), default mes actual
     """
     data = get_json_data()
     if not data:
@@ -855,6 +982,12 @@ def ajustar_precios_materias_primas():
     
     factor = 1 + (porcentaje / 100)
     categoria_filtro = data.get('categoria')
+    dry_run = bool(data.get('dry_run', False))
+    mes_plan = data.get('mes') or f"{date.today().year}-{date.today().month:02d}"
+    if dry_run:
+        _, _, error = validate_month_format(mes_plan, 'mes')
+        if error:
+            return jsonify({'error': error}), 400
     
     # Obtener materias primas a ajustar
     query = MateriaPrima.query.filter_by(activo=True)
@@ -871,14 +1004,55 @@ def ajustar_precios_materias_primas():
     if not materias:
         return jsonify({'error': 'No hay materias primas para ajustar'}), 400
     
+    precios_nuevos = {m.id: round(m.costo_unitario * factor, 2) for m in materias}
+
+    if dry_run:
+        # Impacto calculado en memoria: no se modifica ninguna fila
+        inicio = time.perf_counter()
+        vista_previa = previsualizar_cambio_precios(precios_nuevos, mes_plan)
+        duracion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info(
+            "materias_primas.ajuste_precios_dry_run porcentaje=%.2f categoria=%s items=%s productos=%s duracion_ms=%s",
+            float(porcentaje),
+            categoria_filtro or 'TODAS',
+            len(materias),
+            len(vista_previa['impacto_productos']),
+            duracion_ms
+        )
+        return jsonify({
+            'success': True,
+            'dry_run': True,
+            'porcentaje_aplicado': porcentaje,
+            'categoria': categoria_filtro or 'TODAS',
+            'items_ajustados': len(materias),
+            'detalle': [
+                {
+                    'id': m.id,
+                    'nombre': m.nombre,
+                    'categoria': m.categoria.nombre,
+                    'precio_anterior': m.costo_unitario,
+                    'precio_nuevo': precios_nuevos[m.id],
+                    'diferencia': round(precios_nuevos[m.id] - m.costo_unitario, 2)
+                }
+                for m in materias
+            ],
+            **vista_previa,
+            'duracion_ms': duracion_ms,
+        })
+
     # Generar ID único para este batch de ajuste
     batch_id = str(uuid.uuid4())
     
+    # Propagar el delta de precios al costeo cacheado (antes de tocar los precios)
+    impacto = cache_costeo.propagar_cambio_precios(
+        {m.id: (m.costo_unitario, precios_nuevos[m.id]) for m in materias}
+    )
+    
     # Aplicar ajuste y registrar historial
     ajustados = []
     for materia in materias:
         precio_anterior = materia.costo_unitario
-        precio_nuevo = round(precio_anterior * factor, 2)
+        precio_nuevo = precios_nuevos[materia.id]
         
         # Actualizar precio
         materia.costo_unitario = precio_nuevo
@@ -921,6 +1095,7 @@ def ajustar_precios_materias_primas():
         'categoria': categoria_filtro or 'TODAS',
         'items_ajustados': len(ajustados),
         'detalle': ajustados,
+        'impacto_productos': impacto,
         'batch_id': batch_id
     })
 
@@ -1174,6 +1349,96 @@ def save_formula(producto_id):
     return jsonify({'message': 'Fórmula guardada', 'count': len(ingredientes)})
 
 
+@app.route('/api/formulas/preview', methods=['POST'])
+def preview_formula():
+    """
+    Costeo de una fórmula sin guardarla (vista previa en vivo).
+
+    Body JSON:
+    - ingredientes: [{materia_prima_id, cantidad}, ...]
+    - peso_batch_kg: Peso del batch en kg
+    - porcentaje_merma: (opcional) % de merma, default 0
+    - producto_id: (opcional) producto que se está editando; aporta código,
+      nombre, precio y su producción del mes para el costo indirecto
+    - mes_base / mes_produccion: (opcional) par de meses del costo indirecto
+
+    Devuelve la estructura de GET /api/costeo/<id> (con costos indirectos si
+    se indica mes_base). Los precios salen de la matriz de costeo del
+    catálogo en memoria: no escribe en la base de datos.
+    """
+    inicio = time.perf_counter()
+    data = get_json_data()
+    if not data:
+        return jsonify({'error': 'Datos JSON requeridos'}), 400
+
+    peso_batch_kg, error = validate_positive_number(data.get('peso_batch_kg'), 'peso_batch_kg')
+    if error:
+        return jsonify({'error': error}), 400
+    if peso_batch_kg is None:
+        return jsonify({'error': 'peso_batch_kg es requerido'}), 400
+    merma, error = validate_positive_number(data.get('porcentaje_merma', 0), 'porcentaje_merma', allow_zero=True)
+    if error:
+        return jsonify({'error': error}), 400
+    merma = merma or 0
+    if merma > 100:
+        return jsonify({'error': 'porcentaje_merma no puede ser mayor a 100'}), 400
+
+    ingredientes = data.get('ingredientes') or []
+    if not isinstance(ingredientes, list):
+        return jsonify({'error': 'ingredientes debe ser una lista'}), 400
+    lineas = []
+    for ing in ingredientes:
+        try:
+            mp_id = int(ing.get('materia_prima_id'))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': 'materia_prima_id debe ser un entero'}), 400
+        cantidad, error = validate_positive_number(ing.get('cantidad'), 'cantidad')
+        if error:
+            return jsonify({'error': error}), 400
+        if cantidad is None:
+            return jsonify({'error': 'cantidad es requerida'}), 400
+        lineas.append((mp_id, cantidad))
+
+    mes_base = data.get('mes_base')
+    mes_produccion = data.get('mes_produccion')
+    if mes_base:
+        _, _, error = validate_month_format(mes_base, 'mes_base')
+        if error:
+            return jsonify({'error': error}), 400
+    if mes_produccion:
+        _, _, error = validate_month_format(mes_produccion, 'mes_produccion')
+        if error:
+            return jsonify({'error': error}), 400
+
+    # Producto transitorio (no se agrega a la sesión) con los parámetros editados
+    producto_id = data.get('producto_id')
+    if producto_id is not None:
+        existente = _get_or_404(Producto, producto_id)
+        candidato = Producto(
+            id=existente.id, codigo=existente.codigo, nombre=existente.nombre,
+            min_mo_kg=existente.min_mo_kg, precio_venta=existente.precio_venta,
+            activo=existente.activo, fecha_creacion=existente.fecha_creacion,
+        )
+    else:
+        candidato = Producto(
+            id=0, codigo=data.get('codigo') or '', nombre=data.get('nombre') or 'Vista previa',
+            min_mo_kg=data.get('min_mo_kg') or 0, precio_venta=data.get('precio_venta') or 0, activo=True,
+        )
+    candidato.peso_batch_kg = peso_batch_kg
+    candidato.porcentaje_merma = merma
+
+    base = catalogo.snapshot().matriz
+    desconocidas = sorted({mp_id for mp_id, _ in lineas if mp_id not in base.columna_por_mp})
+    if desconocidas:
+        return jsonify({'error': f'Materias primas inexistentes: {desconocidas}'}), 400
+    matriz = base.con_productos([candidato], {candidato.id: lineas})
+    costeo = matriz.costeo(candidato.id)
+    if mes_base:
+        costeo = _completar_costeo_indirecto(costeo, candidato, mes_base, mes_produccion)
+    costeo['duracion_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    return jsonify(costeo)
+
+
 @app.route('/api/formulas/<int:producto_id>/ingrediente', methods=['POST'])
 def add_ingrediente(producto_id):
     """Agregar un ingrediente a la fórmula"""
@@ -1231,145 +1496,66 @@ def delete_ingrediente(id):
 # ===== COSTEO =====
 @app.route('/api/costeo/<int:producto_id>', methods=['GET'])
 def get_costeo(producto_id):
-    """Obtiene el costeo completo de un producto"""
-    producto = _get_or_404(Producto, producto_id)
-    return jsonify(producto.get_costeo())
-
-
-@app.route('/api/costeo/<int:producto_id>/completo', methods=['GET'])
-def get_costeo_completo(producto_id):
     """
-    Obtiene el costeo completo de un producto incluyendo costos indirectos.
+    Obtiene el costeo completo de un producto.
     
     Query params:
-    - mes_base: Mes base de los costos indirectos (YYYY-MM)
-    - mes_produccion: Mes de producción para cálculo (YYYY-MM), default mes actual
+    - as_of: (opcional) Fecha YYYY-MM-DD; costea con los precios vigentes a esa fecha
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
     """
     producto = _get_or_404(Producto, producto_id)
-    mes_base = request.args.get('mes_base')
-    mes_produccion = request.args.get('mes_produccion')
-
-    logger.debug(
-        "costeo_completo.start producto_id=%s codigo=%s mes_base=%s mes_produccion=%s",
-        producto_id,
-        getattr(producto, 'codigo', None),
-        mes_base,
-        mes_produccion,
-    )
-    
-    # Validar formato de mes_base si se proporciona
-    if mes_base:
-        año_b, mes_b, error = validate_month_format(mes_base, 'mes_base')
-        if error:
-            return jsonify({'error': error}), 400
-    
-    # Validar formato de mes_produccion si se proporciona
-    if mes_produccion:
-        año_p, mes_p, error = validate_month_format(mes_produccion, 'mes_produccion')
+    as_of = request.args.get('as_of')
+    if as_of:
+        fecha, error = parse_as_of(as_of)
         if error:
             return jsonify({'error': error}), 400
-    
-    # Obtener costeo variable base
-    costeo_variable = producto.get_costeo()
-    
+        costeo = indice_precios.costeos_en([producto], fecha)[producto.id].to_dict()
+        costeo['as_of'] = as_of
+        return jsonify(costeo)
+    return jsonify(_costeos([producto])[producto.id].to_dict())
+
+
+def _completar_costeo_indirecto(costeo_variable, producto, mes_base, mes_produccion, ctx=None):
+    """
+    Agrega los costos indirectos de un mes al costeo variable de un producto.
+
+    Modifica y devuelve ``costeo_variable``. ``ctx`` permite reutilizar el
+    ContextoMes ya obtenido cuando se costean varios productos del mismo mes.
+    """
+    producto_id = producto.id
     if not mes_base:
         # Si no hay mes_base, devolver solo costeo variable
         costeo_variable['costos_indirectos'] = None
         costeo_variable['resumen']['costo_indirecto_por_kg'] = 0
         costeo_variable['resumen']['costo_total_por_kg'] = costeo_variable['resumen']['costo_por_kg']
-        return jsonify(costeo_variable)
+        return costeo_variable
     
     if not mes_produccion:
         mes_produccion = f"{date.today().year}-{date.today().month:02d}"
     
     try:
-        # Obtener costos indirectos del mes base
-        costos = CostoIndirecto.query.filter_by(mes_base=mes_base).all()
+        # Contexto del mes (costos, volumen base, inflación y producción), compartido entre productos
+        if ctx is None:
+            ctx = _contexto(mes_base, mes_produccion)
+        costos = ctx.costos
         
         if not costos:
             costeo_variable['costos_indirectos'] = {'error': f'No hay costos para mes base {mes_base}'}
             costeo_variable['resumen']['costo_indirecto_por_kg'] = 0
             costeo_variable['resumen']['costo_total_por_kg'] = costeo_variable['resumen']['costo_por_kg']
-            return jsonify(costeo_variable)
-        
-        # Parsear fechas
-        año_base, mes_base_num = map(int, mes_base.split('-'))
-        año_prod, mes_prod = map(int, mes_produccion.split('-'))
+            return costeo_variable
         
-        # ===== CALCULAR VOLUMEN DEL MES BASE (para escalamiento) =====
-        # PRIORIDAD: Usar ProduccionHistorica (real) si existe, si no ProduccionProgramada
+        # Volumen del mes base (ProduccionHistorica real si existe, si no ProduccionProgramada)
+        volumen_base_kg = ctx.volumen_base_kg
+        origen_volumen_base = ctx.origen_volumen_base
+        inflacion_acumulada = ctx.inflacion_acumulada
         
-        # 1. Intentar con producción histórica (real)
-        historico_base = ProduccionHistorica.query.filter(
-            ProduccionHistorica.año == año_base,
-            ProduccionHistorica.mes == mes_base_num
-        ).all()
-        
-        if historico_base:
-            # Usar producción real del mes base
-            volumen_base_kg = sum(h.cantidad_kg for h in historico_base)
-            origen_volumen_base = 'historico'
-        else:
-            # Fallback: usar producción programada del mes base
-            fecha_inicio_base = date(año_base, mes_base_num, 1)
-            if mes_base_num == 12:
-                fecha_fin_base = date(año_base + 1, 1, 1)
-            else:
-                fecha_fin_base = date(año_base, mes_base_num + 1, 1)
-            
-            producciones_base = ProduccionProgramada.query.filter(
-                ProduccionProgramada.fecha_programacion >= fecha_inicio_base,
-                ProduccionProgramada.fecha_programacion < fecha_fin_base
-            ).all()
-            
-            volumen_base_kg = sum(
-                p.cantidad_batches * p.producto.peso_batch_kg 
-                for p in producciones_base
-            )
-            origen_volumen_base = 'programado'
-        
-        # Calcular inflación acumulada
-        meses_diferencia = (año_prod - año_base) * 12 + (mes_prod - mes_base_num)
-        
-        inflacion_acumulada = 1.0
-        if meses_diferencia > 0:
-            inflaciones = InflacionMensual.query.filter(
-                InflacionMensual.mes > mes_base,
-                InflacionMensual.mes <= mes_produccion
-            ).all()
-            for inf in inflaciones:
-                inflacion_acumulada *= (1 + inf.porcentaje / 100)
-        
-        # Para calcular la distribución, necesitamos el total de producción del mes
-        # Usamos la producción programada del mes como referencia
-        fecha_inicio = date(año_prod, mes_prod, 1)
-        if mes_prod == 12:
-            fecha_fin = date(año_prod + 1, 1, 1)
-        else:
-            fecha_fin = date(año_prod, mes_prod + 1, 1)
-        
-        producciones = ProduccionProgramada.query.filter(
-            ProduccionProgramada.fecha_programacion >= fecha_inicio,
-            ProduccionProgramada.fecha_programacion < fecha_fin
-        ).all()
-        
-        # Calcular totales de producción
-        total_kg_mes = 0
-        total_minutos_mes = 0
-        kg_este_producto = 0
-        minutos_este_producto = 0
-        
-        for prod in producciones:
-            prod_obj = prod.producto
-            kg_producido = prod.cantidad_batches * prod_obj.peso_batch_kg
-            minutos = kg_producido * prod_obj.min_mo_kg
-            
-            total_kg_mes += kg_producido
-            total_minutos_mes += minutos
-            
-            if prod_obj.id == producto_id:
-                kg_este_producto += kg_producido
-                minutos_este_producto += minutos
+        # Para calcular la distribución usamos la producción programada del mes como referencia
+        total_kg_mes = ctx.total_kg
+        total_minutos_mes = ctx.total_minutos
+        produccion_producto = ctx.produccion.get(producto_id)
+        kg_este_producto = produccion_producto.kg if produccion_producto else 0
+        minutos_este_producto = produccion_producto.minutos if produccion_producto else 0
         
         # Si no hay producción programada, usar valores por defecto basados en 1 batch
         if total_kg_mes == 0:
@@ -1380,8 +1566,7 @@ def get_costeo_completo(producto_id):
             total_minutos_mes = minutos_este_producto
         
         # ===== APLICAR ESCALAMIENTO A COSTOS VARIABLES =====
-        # Ahora que tenemos total_kg_mes, escalamos los costos variables
-        escalamiento = calcular_costos_con_escalamiento(costos, volumen_base_kg, total_kg_mes)
+        escalamiento = ctx.escalamiento(total_kg_mes)
         factor_escalamiento = escalamiento['factor_escalamiento']
         
         # Aplicar inflación a los costos ya escalados
@@ -1407,6 +1592,8 @@ def get_costeo_completo(producto_id):
             costo_indirecto_total = costo_sp_producto + costo_gif_producto + costo_dep_producto
             costo_indirecto_por_kg = costo_indirecto_total / kg_este_producto
         else:
+            pct_kg = 0
+            pct_sp = 0
             costo_sp_producto = 0
             costo_gif_producto = 0
             costo_dep_producto = 0
@@ -1481,7 +1668,7 @@ def get_costeo_completo(producto_id):
             float(costeo_variable['resumen']['costo_total_por_kg']),
         )
         
-        return jsonify(costeo_variable)
+        return costeo_variable
         
     except Exception as e:
         logger.exception(
@@ -1493,24 +1680,223 @@ def get_costeo_completo(producto_id):
         costeo_variable['costos_indirectos'] = {'error': str(e)}
         costeo_variable['resumen']['costo_indirecto_por_kg'] = 0
         costeo_variable['resumen']['costo_total_por_kg'] = costeo_variable['resumen']['costo_por_kg']
-        return jsonify(costeo_variable)
+        return costeo_variable
+
+
+@app.route('/api/costeo/<int:producto_id>/completo', methods=['GET'])
+def get_costeo_completo(producto_id):
+    """
+    Obtiene el costeo completo de un producto incluyendo costos indirectos.
+    
+    Query params:
+    - mes_base: Mes base de los costos indirectos (YYYY-MM)
+    - mes_produccion: Mes de producción para cálculo (YYYY-MM), default mes actual
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
+    """
+    producto = _get_or_404(Producto, producto_id)
+    mes_base = request.args.get('mes_base')
+    mes_produccion = request.args.get('mes_produccion')
+
+    logger.debug(
+        "costeo_completo.start producto_id=%s codigo=%s mes_base=%s mes_produccion=%s",
+        producto_id,
+        getattr(producto, 'codigo', None),
+        mes_base,
+        mes_produccion,
+    )
+    
+    # Validar formato de mes_base si se proporciona
+    if mes_base:
+        año_b, mes_b, error = validate_month_format(mes_base, 'mes_base')
+        if error:
+            return jsonify({'error': error}), 400
+    
+    # Validar formato de mes_produccion si se proporciona
+    if mes_produccion:
+        año_p, mes_p, error = validate_month_format(mes_produccion, 'mes_produccion')
+        if error:
+            return jsonify({'error': error}), 400
+    
+    # Obtener costeo variable base (copia mutable desde la caché)
+    costeo_variable = _costeos([producto])[producto.id].to_dict()
+    
+    return jsonify(_completar_costeo_indirecto(costeo_variable, producto, mes_base, mes_produccion))
+
+
+@app.route('/api/costeo/completo', methods=['GET'])
+def get_costeo_completo_todos():
+    """
+    Costeo completo (variable + indirectos) de todos los productos activos en una sola pasada.
+
+    Query params:
+    - mes_base: Mes base de los costos indirectos (YYYY-MM)
+    - mes_produccion: Mes de producción para cálculo (YYYY-MM), default mes actual
+    - ids: (opcional) ids de producto separados por coma (ej: 1,4,7)
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
+
+    Los costeos variables se calculan juntos y el contexto del mes (volumen,
+    inflación y escalamiento) se obtiene una vez para todos los productos.
+    """
+    mes_base = request.args.get('mes_base')
+    mes_produccion = request.args.get('mes_produccion')
+    ids = request.args.get('ids')
+
+    if mes_base:
+        año_b, mes_b, error = validate_month_format(mes_base, 'mes_base')
+        if error:
+            return jsonify({'error': error}), 400
+    if mes_produccion:
+        año_p, mes_p, error = validate_month_format(mes_produccion, 'mes_produccion')
+        if error:
+            return jsonify({'error': error}), 400
+    elif mes_base:
+        mes_produccion = f"{date.today().year}-{date.today().month:02d}"
+
+    query = Producto.query.filter_by(activo=True)
+    if ids:
+        try:
+            producto_ids = [int(valor) for valor in ids.split(',') if valor.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids debe ser una lista de enteros separados por coma (ej: 1,4,7)'}), 400
+        query = query.filter(Producto.id.in_(producto_ids))
+    productos = query.order_by(Producto.id).all()
+
+    costeos = _costeos(productos)
+    ctx = None
+    if mes_base:
+        try:
+            ctx = _contexto(mes_base, mes_produccion)
+        except Exception as e:
+            logger.exception(
+                "costeo_completo_todos.error mes_base=%s mes_produccion=%s",
+                mes_base,
+                mes_produccion,
+            )
+            return jsonify({'error': str(e)}), 500
+
+    resultado = [
+        _completar_costeo_indirecto(costeos[p.id].to_dict(), p, mes_base, mes_produccion, ctx)
+        for p in productos
+    ]
+    logger.info(
+        "costeo_completo_todos.done productos=%s mes_base=%s mes_produccion=%s",
+        len(resultado),
+        mes_base,
+        mes_produccion,
+    )
+    return jsonify(resultado)
 
 
 @app.route('/api/costeo/resumen', methods=['GET'])
 def get_costeo_resumen():
-    """Obtiene resumen de costos de todos los productos"""
+    """
+    Obtiene resumen de costos de todos los productos.
+    
+    Query params:
+    - as_of: (opcional) Fecha YYYY-MM-DD; costea con los precios vigentes a esa fecha
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
+    """
+    as_of = request.args.get('as_of')
+    fecha = None
+    if as_of:
+        fecha, error = parse_as_of(as_of)
+        if error:
+            return jsonify({'error': error}), 400
     productos = Producto.query.filter_by(activo=True).all()
+    if fecha is not None:
+        costeos = indice_precios.costeos_en(productos, fecha)
+    else:
+        costeos = _costeos(productos)
     resumen = []
     for p in productos:
-        costeo = p.get_costeo()
+        costeo = costeos[p.id]
         resumen.append({
             'producto': p.to_dict(),
-            'costo_total': costeo['resumen']['total_neto'],
-            'costo_por_kg': costeo['resumen']['costo_por_kg']
+            'costo_total': costeo.total_neto,
+            'costo_por_kg': costeo.costo_por_kg
         })
     return jsonify(resumen)
 
 
+@app.route('/api/sandbox', methods=['POST'])
+def crear_sandbox():
+    """
+    Crea un sandbox what-if en memoria.
+
+    Body JSON (todas las secciones opcionales):
+    - precios: {materia_prima_id: costo_unitario}
+    - formulas: {producto_id: [{materia_prima_id, cantidad}, ...]}
+    - indirectos: {cuenta: monto}
+    - inflacion: {YYYY-MM: porcentaje}
+    - produccion: {YYYY-MM: {producto_id: batches}}
+
+    Los endpoints de costeo, distribución, análisis marginal y proyección
+    multiperíodo aceptan ``?sandbox=<id>`` para evaluarse contra el overlay
+    sin escribir en la base de datos. El sandbox expira tras
+    ``TTL_SEGUNDOS`` sin uso.
+    """
+    overlay, error = normalizar_overlay(get_json_data() or {})
+    if error:
+        return jsonify({'error': error}), 400
+    sandbox = sandboxes.crear(overlay)
+    logger.info("sandbox.crear id=%s secciones=%s", sandbox.id, ','.join(sorted(overlay)))
+    return jsonify(sandbox.to_dict()), 201
+
+
+@app.route('/api/sandbox/<sandbox_id>', methods=['GET'])
+def get_sandbox(sandbox_id):
+    return jsonify(_sandbox_o_404(sandbox_id).to_dict())
+
+
+@app.route('/api/sandbox/<sandbox_id>', methods=['PATCH'])
+def actualizar_sandbox(sandbox_id):
+    """Mezcla cambios en el overlay; un valor null quita la entrada."""
+    sandbox = _sandbox_o_404(sandbox_id)
+    cambios, error = normalizar_overlay(get_json_data(), parcial=True)
+    if error:
+        return jsonify({'error': error}), 400
+    sandbox.actualizar(cambios)
+    return jsonify(sandbox.to_dict())
+
+
+@app.route('/api/sandbox/<sandbox_id>', methods=['DELETE'])
+def eliminar_sandbox(sandbox_id):
+    if not sandboxes.eliminar(sandbox_id):
+        return jsonify({'error': f'Sandbox {sandbox_id} inexistente o expirado'}), 404
+    return jsonify({'message': 'Sandbox eliminado'})
+
+
+@app.route('/api/costeo/sensibilidad', methods=['GET'])
+def get_costeo_sensibilidad():
+    """
+    Matriz de sensibilidad ∂costo_por_kg/∂costo_unitario de los productos
+    activos respecto de cada materia prima (solo entradas no nulas).
+
+    Query params:
+    - ids: (opcional) ids de producto separados por coma (ej: 1,4,7)
+    """
+    ids = request.args.get('ids')
+    query = Producto.query.filter_by(activo=True)
+    if ids:
+        try:
+            producto_ids = [int(valor) for valor in ids.split(',') if valor.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids debe ser una lista de enteros separados por coma (ej: 1,4,7)'}), 400
+        query = query.filter(Producto.id.in_(producto_ids))
+    productos = query.order_by(Producto.id).all()
+
+    matriz = cache_sensibilidad.matriz()
+    return jsonify([
+        {
+            'producto_id': p.id,
+            'codigo': p.codigo,
+            'nombre': p.nombre,
+            'sensibilidades': {str(mp_id): valor for mp_id, valor in matriz.de_producto(p.id).items()},
+        }
+        for p in productos
+    ])
+
+
 # ===== PRODUCCIÓN PROGRAMADA =====
 @app.route('/api/produccion-programada', methods=['GET'])
 def get_produccion():
@@ -1526,10 +1912,7 @@ def get_produccion():
         # Filtrar por año-mes
         try:
             year, month = mes.split('-')
-            query = query.filter(
-                extract('year', ProduccionProgramada.fecha_programacion) == int(year),
-                extract('month', ProduccionProgramada.fecha_programacion) == int(month)
-            )
+            query = query.filter(*filtro_mes(int(year), int(month)))
         except ValueError:
             pass
     
@@ -1646,60 +2029,50 @@ def get_requerimientos():
     fecha = request.args.get('fecha')
     mes = request.args.get('mes')  # Formato: 2024-12
     
-    query = ProduccionProgramada.query
-    
+    condiciones = []
     if fecha:
-        query = query.filter(ProduccionProgramada.fecha_programacion == fecha)
+        condiciones = [ProduccionProgramada.fecha_programacion == fecha]
     elif mes:
         try:
             year, month = mes.split('-')
-            query = query.filter(
-                extract('year', ProduccionProgramada.fecha_programacion) == int(year),
-                extract('month', ProduccionProgramada.fecha_programacion) == int(month)
-            )
+            condiciones = filtro_mes(int(year), int(month))
         except ValueError:
             pass
     
-    programacion = query.all()
+    # Batches / kg por producto sumados en SQL
+    programacion = productos_con_totales(*condiciones)
+    totales = [total for _, total in programacion]
+    
+    # Costeo vectorizado: una sola matriz BOM para todos los productos del mes
+    matriz = matriz_costeo([producto for producto, _ in programacion])
+    columnas, cantidades, costos = matriz.requerimientos(
+        [(t.producto_id, t.batches) for t in totales]
+    )
     
-    requerimientos = {}
+    requerimientos = []
     totales_categoria = {}
     costo_total = 0
-    total_batches = 0
-    total_peso = 0
-    
-    for prog in programacion:
-        producto = prog.producto
-        costeo = producto.get_costeo()
-        total_batches += prog.cantidad_batches
-        total_peso += prog.cantidad_batches * producto.peso_batch_kg
+    total_batches = sum(t.batches for t in totales)
+    total_peso = sum(t.kg for t in totales)
+    
+    for col, cantidad_total, costo_requerido in zip(columnas, cantidades, costos):
+        cat = matriz.categorias[matriz.mp_categoria[col]]
+        requerimientos.append({
+            'materia_prima_id': int(matriz.mp_ids[col]),
+            'nombre': matriz.mp_nombres[col],
+            'categoria': cat,
+            'unidad': matriz.mp_unidades[col],
+            'cantidad_total': float(cantidad_total),
+            'costo_total': float(costo_requerido)
+        })
         
-        for ing in costeo['ingredientes']:
-            mp_id = ing['materia_prima_id']
-            cantidad_total = ing['cantidad'] * prog.cantidad_batches
-            costo_requerido = ing['costo_total'] * prog.cantidad_batches
-            
-            if mp_id not in requerimientos:
-                requerimientos[mp_id] = {
-                    'materia_prima_id': mp_id,
-                    'nombre': ing['nombre'],
-                    'categoria': ing['categoria'],
-                    'unidad': ing['unidad'],
-                    'cantidad_total': 0,
-                    'costo_total': 0
-                }
-            
-            requerimientos[mp_id]['cantidad_total'] += cantidad_total
-            requerimientos[mp_id]['costo_total'] += costo_requerido
-            
-            cat = ing['categoria']
-            if cat not in totales_categoria:
-                totales_categoria[cat] = 0
-            totales_categoria[cat] += costo_requerido
-            costo_total += costo_requerido
+        if cat not in totales_categoria:
+            totales_categoria[cat] = 0
+        totales_categoria[cat] += float(costo_requerido)
+        costo_total += float(costo_requerido)
     
     return jsonify({
-        'requerimientos': list(requerimientos.values()),
+        'requerimientos': requerimientos,
         'totales_categoria': totales_categoria,
         'costo_total': costo_total,
         'total_batches': total_batches,
@@ -1721,53 +2094,48 @@ def get_resumen_mensual():
     
     try:
         year, month = mes.split('-')
+        mes = f"{int(year)}-{int(month):02d}"
         
-        # Obtener producción del mes
-        produccion = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == int(year),
-            extract('month', ProduccionProgramada.fecha_programacion) == int(month)
-        ).all()
+        # Totales del mes por producto (agregado mensual, una consulta)
+        produccion = produccion_del_mes(mes)
+        
+        # Costeo de todos los productos del mes (caché + motor vectorizado)
+        costeos = cache_costeo.costeos(producto for producto, _, _, _ in produccion)
         
         # Calcular totales
         total_batches = 0
         total_peso = 0
         costo_total = 0
-        por_producto = {}
+        por_producto = []
         totales_categoria = {}
         
-        for prog in produccion:
-            producto = prog.producto
-            costeo = producto.get_costeo()
-            costo_batch = costeo['resumen']['total_neto']
+        for producto, batches, kg, _ in produccion:
+            costeo = costeos[producto.id]
+            costo_batch = costeo.total_neto
             
-            total_batches += prog.cantidad_batches
-            total_peso += prog.cantidad_batches * producto.peso_batch_kg
-            costo_total += prog.cantidad_batches * costo_batch
+            total_batches += batches
+            total_peso += kg
+            costo_total += batches * costo_batch
             
-            # Agrupar por producto
-            if producto.id not in por_producto:
-                por_producto[producto.id] = {
-                    'producto': producto.to_dict(),
-                    'batches': 0,
-                    'peso': 0,
-                    'costo': 0
-                }
-            por_producto[producto.id]['batches'] += prog.cantidad_batches
-            por_producto[producto.id]['peso'] += prog.cantidad_batches * producto.peso_batch_kg
-            por_producto[producto.id]['costo'] += prog.cantidad_batches * costo_batch
+            por_producto.append({
+                'producto': producto.to_dict(),
+                'batches': batches,
+                'peso': kg,
+                'costo': batches * costo_batch
+            })
             
             # Agrupar por categoría
-            for cat, data in costeo['totales_categoria'].items():
+            for cat, (_, costo) in costeo.totales_categoria.items():
                 if cat not in totales_categoria:
                     totales_categoria[cat] = 0
-                totales_categoria[cat] += data['costo'] * prog.cantidad_batches
+                totales_categoria[cat] += costo * batches
         
         return jsonify({
             'mes': mes,
             'total_batches': total_batches,
             'total_peso': total_peso,
             'costo_total': costo_total,
-            'por_producto': list(por_producto.values()),
+            'por_producto': por_producto,
             'totales_categoria': totales_categoria
         })
         
@@ -1876,6 +2244,16 @@ def train_ml_model():
 
         req = get_json_data() or {}
         cutoff_ym = req.get('cutoff_ym') or req.get('cutoff')
+        workers = req.get('workers')
+        if workers is not None:
+            try:
+                workers = int(workers)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': 'workers debe ser un entero'}), 400
+            if workers < 1:
+                return jsonify({'success': False, 'error': 'workers debe ser >= 1'}), 400
+        # Solo reentrenar los productos cuya serie cambió desde el último entrenamiento
+        incremental = bool(req.get('incremental', False))
         
         data = [
             {
@@ -1888,23 +2266,29 @@ def train_ml_model():
         ]
         
         logger.info(
-            "ml.train.start registros=%s productos=%s cutoff_ym=%s",
+            "ml.train.start registros=%s productos=%s cutoff_ym=%s incremental=%s",
             len(data),
             len(set(h.producto_id for h in historicos)),
-            cutoff_ym
+            cutoff_ym,
+            incremental
         )
         
         import time
         start_time = time.time()
-        result = predictor.train(data, cutoff_ym=cutoff_ym)
+        result = predictor.train(data, cutoff_ym=cutoff_ym, workers=workers, incremental=incremental)
         duration = time.time() - start_time
         
         if result.get('success'):
             logger.info(
-                "ml.train.success duration_sec=%.2f productos_entrenados=%s modelo_global=%s",
+                "ml.train.success duration_sec=%.2f productos_entrenados=%s modelo_global=%s workers=%s speedup=%s "
+                "reentrenados=%s reutilizados=%s",
                 duration,
                 result.get('productos_entrenados', 0),
-                result.get('modelo_global', False)
+                result.get('modelo_global', False),
+                result['paralelismo']['workers'],
+                result['paralelismo']['speedup'],
+                result['incremental']['productos_reentrenados'],
+                result['incremental']['productos_reutilizados']
             )
         else:
             logger.warning(
@@ -1941,12 +2325,15 @@ def predict_production():
             # Predecir para todos los productos activos
             productos = Producto.query.filter_by(activo=True).all()
             productos_ids = [p.id for p in productos]
+        else:
+            productos = Producto.query.filter(Producto.id.in_(productos_ids)).all()
         
         predicciones = predictor.predict_month(productos_ids, año, mes)
         
-        # Enriquecer con info del producto
+        # Enriquecer con info del producto (una sola consulta)
+        productos_por_id = {p.id: p for p in productos}
         for pred in predicciones:
-            producto = db.session.get(Producto, pred['producto_id'])
+            producto = productos_por_id.get(pred['producto_id'])
             if producto:
                 pred['producto'] = producto.to_dict()
         
@@ -1960,6 +2347,62 @@ def predict_production():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/ml/predict/horizonte', methods=['POST'])
+def predict_production_horizon():
+    """
+    Pronóstico de varios meses consecutivos para varios productos en una llamada.
+
+    Body JSON:
+    - año, mes: primer mes (default: mes actual)
+    - horizonte: cantidad de meses, 1 a 24 (default: 12)
+    - productos_ids: (opcional) default: productos activos
+
+    Las predicciones de cada mes alimentan los lags del siguiente (ver
+    ProductionPredictor.predict_horizon). Devuelve matrices producto x mes.
+    """
+    try:
+        from predictor import get_predictor
+        predictor = get_predictor()
+
+        if predictor is None:
+            return jsonify({'error': 'Predictor no disponible'}), 500
+
+        data = get_json_data() or {}
+        año = data.get('año') or date.today().year
+        mes = data.get('mes') or date.today().month
+        try:
+            año, mes = int(año), int(mes)
+            horizonte = int(data.get('horizonte', 12))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'año, mes y horizonte deben ser enteros'}), 400
+        if not 1 <= mes <= 12:
+            return jsonify({'error': 'mes debe estar entre 1 y 12'}), 400
+        if not 1 <= horizonte <= 24:
+            return jsonify({'error': 'horizonte debe estar entre 1 y 24'}), 400
+
+        productos_ids = data.get('productos_ids')
+        if not productos_ids:
+            productos_ids = [p.id for p in Producto.query.filter_by(activo=True).all()]
+
+        predicciones = predictor.predict_horizon(productos_ids, año, mes, horizonte)
+        meses = [f"{(año * 12 + mes - 1 + k) // 12}-{(mes - 1 + k) % 12 + 1:02d}" for k in range(horizonte)]
+
+        return jsonify({
+            'año': año,
+            'mes': mes,
+            'horizonte': horizonte,
+            'meses': meses,
+            'productos_ids': productos_ids,
+            # Filas = productos (orden de productos_ids), columnas = meses
+            'cantidad_kg': [[predicciones[k][i]['cantidad_kg'] for k in range(horizonte)] for i in range(len(productos_ids))],
+            'confianza': [[predicciones[k][i]['confianza'] for k in range(horizonte)] for i in range(len(productos_ids))],
+            'metodo': [[predicciones[k][i]['metodo'] for k in range(horizonte)] for i in range(len(productos_ids))],
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/ml/predict/<int:producto_id>', methods=['GET'])
 def predict_producto(producto_id):
     """Predice producción para un producto específico"""
@@ -2179,32 +2622,23 @@ def proyeccion_hibrida():
             año, mes, mes_base
         )
         
-        # 1. Obtener producción programada del mes
-        from sqlalchemy import extract
-        producciones_programadas = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == año,
-            extract('month', ProduccionProgramada.fecha_programacion) == mes
-        ).all()
-        
-        # Agrupar producción programada por producto_id (sumando si hay múltiples)
+        # 1. Obtener producción programada del mes (sumada por producto en SQL)
+        # Los productos del mix se guardan aparte; to_dict() recién al armar la respuesta
+        productos_mix = {}
         programado_por_producto = {}
-        for prod in producciones_programadas:
-            producto = prod.producto
-            kg = prod.cantidad_batches * producto.peso_batch_kg
-            if producto.id not in programado_por_producto:
-                programado_por_producto[producto.id] = {
-                    'producto_id': producto.id,
-                    'producto': producto.to_dict(),
-                    'cantidad_kg': 0,
-                    'cantidad_batches': 0,
-                    'origen': 'programado',
-                    'confianza': 1.0  # 100% confianza en datos programados
-                }
-            programado_por_producto[producto.id]['cantidad_kg'] += kg
-            programado_por_producto[producto.id]['cantidad_batches'] += prod.cantidad_batches
+        for producto, total in productos_con_totales(*filtro_mes(año, mes)):
+            productos_mix[producto.id] = producto
+            programado_por_producto[producto.id] = {
+                'producto_id': producto.id,
+                'cantidad_kg': total.kg,
+                'cantidad_batches': total.batches,
+                'origen': 'programado',
+                'confianza': 1.0  # 100% confianza en datos programados
+            }
         
         # 2. Obtener predicciones ML para productos sin programación
         productos_activos = Producto.query.filter_by(activo=True).all()
+        productos_por_id = {p.id: p for p in productos_activos}
         productos_ids_sin_programacion = [
             p.id for p in productos_activos 
             if p.id not in programado_por_producto
@@ -2222,11 +2656,11 @@ def proyeccion_hibrida():
         
         for pred in predicciones_ml:
             if pred.get('cantidad_kg') and pred['cantidad_kg'] > 0:
-                producto = db.session.get(Producto, pred['producto_id'])
+                producto = productos_por_id.get(pred['producto_id'])
                 if producto:
+                    productos_mix[producto.id] = producto
                     mix_produccion.append({
                         'producto_id': pred['producto_id'],
-                        'producto': producto.to_dict(),
                         'cantidad_kg': pred['cantidad_kg'],
                         'cantidad_batches': pred['cantidad_kg'] / producto.peso_batch_kg if producto.peso_batch_kg else 0,
                         'origen': 'ml',
@@ -2237,46 +2671,22 @@ def proyeccion_hibrida():
         # 4. Calcular costos si tenemos mes_base
         factor_escalamiento = 1.0
         if mes_base and mix_produccion:
-            # Obtener costos indirectos
-            costos = CostoIndirecto.query.filter_by(mes_base=mes_base).all()
+            # Contexto del mes (costos indirectos, volumen base e inflación)
+            ctx = obtener_contexto(mes_base, mes_produccion)
+            costos = ctx.costos
             
             if costos:
-                # Parsear mes_base para obtener año y mes
-                año_base, mes_base_num = map(int, mes_base.split('-'))
-                
-                # Obtener producción del mes base para escalamiento
-                fecha_inicio_base = date(año_base, mes_base_num, 1)
-                if mes_base_num == 12:
-                    fecha_fin_base = date(año_base + 1, 1, 1)
-                else:
-                    fecha_fin_base = date(año_base, mes_base_num + 1, 1)
-                
-                producciones_mes_base = ProduccionProgramada.query.filter(
-                    ProduccionProgramada.fecha_programacion >= fecha_inicio_base,
-                    ProduccionProgramada.fecha_programacion < fecha_fin_base
-                ).all()
-                
-                volumen_base_kg = sum(
-                    p.cantidad_batches * p.producto.peso_batch_kg 
-                    for p in producciones_mes_base
-                )
+                # Volumen del mes base para escalamiento (producción programada)
+                volumen_base_kg = ctx.volumen_base_programado_kg
                 
                 # Calcular volumen proyectado del mix
                 total_kg_mix = sum(p['cantidad_kg'] for p in mix_produccion)
                 
-                # Usar helper para calcular costos con escalamiento
-                escalamiento = calcular_costos_con_escalamiento(costos, volumen_base_kg, total_kg_mix)
+                # Costos con escalamiento (memoizado en el contexto)
+                escalamiento = ctx.escalamiento(total_kg_mix, volumen_base_kg)
                 factor_escalamiento = escalamiento['factor_escalamiento']
                 
-                # Calcular inflación acumulada
-                inflacion_acumulada = 1.0
-                if mes_produccion > mes_base:
-                    inflaciones = InflacionMensual.query.filter(
-                        InflacionMensual.mes > mes_base,
-                        InflacionMensual.mes <= mes_produccion
-                    ).all()
-                    for inf in inflaciones:
-                        inflacion_acumulada *= (1 + inf.porcentaje / 100)
+                inflacion_acumulada = ctx.inflacion_acumulada
                 
                 # Aplicar inflación a costos escalados
                 total_sp_aj = escalamiento['totales_escalados']['SP'] * inflacion_acumulada
@@ -2287,22 +2697,20 @@ def proyeccion_hibrida():
                 total_kg_mes = sum(p['cantidad_kg'] for p in mix_produccion)
                 total_minutos_mes = 0
                 for p in mix_produccion:
-                    producto = db.session.get(Producto, p['producto_id'])
-                    if producto:
-                        total_minutos_mes += p['cantidad_kg'] * (producto.min_mo_kg or 0)
+                    total_minutos_mes += p['cantidad_kg'] * (productos_mix[p['producto_id']].min_mo_kg or 0)
+                
+                # Costeo variable de todo el mix (caché + motor vectorizado)
+                costeos = cache_costeo.costeos(productos_mix.values())
                 
                 # Calcular costos por producto
                 for item in mix_produccion:
-                    producto = db.session.get(Producto, item['producto_id'])
-                    if not producto:
-                        continue
+                    producto = productos_mix[item['producto_id']]
                     
                     kg = item['cantidad_kg']
                     minutos = kg * (producto.min_mo_kg or 0)
                     
                     # Obtener costo MP base
-                    costeo = producto.get_costeo()
-                    mp_base_kg = costeo['resumen']['costo_por_kg'] if costeo else 0
+                    mp_base_kg = costeos[producto.id].costo_por_kg
                     mp_por_kg = mp_base_kg * inflacion_acumulada
                     
                     # Distribuir costos indirectos
@@ -2336,6 +2744,9 @@ def proyeccion_hibrida():
             año, mes, count_programados, count_ml, total_kg
         )
         
+        for item in mix_produccion:
+            item['producto'] = productos_mix[item['producto_id']].to_dict()
+        
         return jsonify({
             'año': año,
             'mes': mes,
@@ -2508,6 +2919,82 @@ def get_resumen_costos_indirectos():
     })
 
 
+@app.route('/api/costos-indirectos/curva-escalamiento', methods=['GET'])
+def get_curva_escalamiento():
+    """
+    Curva costo indirecto vs. volumen proyectado para un mes base.
+
+    Evalúa los totales SP/GIF/DEP escalados en una grilla de volúmenes con
+    una sola pasada vectorizada, e informa los volúmenes donde actúan los
+    topes variacion_max_pct y los límites globales del factor.
+
+    Query params:
+    - mes_base: Mes base de los costos indirectos (YYYY-MM)
+    - puntos: Cantidad de volúmenes a evaluar (default 200, máx. 2000)
+    - volumen_min / volumen_max: Rango en kg (default 0 a 3.5 × volumen base)
+    - volumen_base: Volumen base en kg (default: el del mes base)
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
+    """
+    mes_base = request.args.get('mes_base')
+    _, _, error = validate_month_format(mes_base, 'mes_base')
+    if error:
+        return jsonify({'error': error}), 400
+
+    puntos = request.args.get('puntos', 200, type=int)
+    if puntos < 2 or puntos > 2000:
+        return jsonify({'error': 'puntos debe estar entre 2 y 2000'}), 400
+
+    ctx = _contexto(mes_base, mes_base)
+    if not ctx.costos:
+        return jsonify({'error': f'No hay costos indirectos para mes base {mes_base}'}), 404
+
+    volumen_base_kg, error = validate_positive_number(request.args.get('volumen_base'), 'volumen_base')
+    if error:
+        return jsonify({'error': error}), 400
+    if volumen_base_kg is None:
+        volumen_base_kg = ctx.volumen_base_kg
+    if not volumen_base_kg:
+        return jsonify({'error': f'No hay volumen de producción para el mes base {mes_base}'}), 404
+
+    volumen_min, error = validate_positive_number(request.args.get('volumen_min', 0), 'volumen_min', allow_zero=True)
+    if error:
+        return jsonify({'error': error}), 400
+    volumen_max, error = validate_positive_number(
+        request.args.get('volumen_max', 3.5 * volumen_base_kg), 'volumen_max'
+    )
+    if error:
+        return jsonify({'error': error}), 400
+    if volumen_max <= volumen_min:
+        return jsonify({'error': 'volumen_max debe ser mayor a volumen_min'}), 400
+
+    matriz = ctx.matriz_escalamiento
+    volumenes = np.linspace(volumen_min, volumen_max, puntos)
+    curva = matriz.evaluar(volumen_base_kg, volumenes)
+
+    return jsonify({
+        'mes_base': mes_base,
+        'volumen_base_kg': round(volumen_base_kg, 2),
+        'origen_volumen_base': ctx.origen_volumen_base if request.args.get('volumen_base') is None else 'parametro',
+        'factor_limite_min': matriz.factor_limite_min,
+        'factor_limite_max': matriz.factor_limite_max,
+        'totales_base': {tipo: round(v, 2) for tipo, v in zip(('SP', 'GIF', 'DEP'), matriz.totales_base.tolist())},
+        'curva': {
+            'volumen_kg': np.round(volumenes, 2).tolist(),
+            'factor': np.round(curva['factor_base'], 4).tolist(),
+            'sp': np.round(curva['SP'], 2).tolist(),
+            'gif': np.round(curva['GIF'], 2).tolist(),
+            'dep': np.round(curva['DEP'], 2).tolist(),
+            'total': np.round(curva['total'], 2).tolist(),
+            'costo_por_kg': np.round(
+                np.divide(curva['total'], volumenes, out=np.zeros_like(volumenes), where=volumenes > 0), 4
+            ).tolist(),
+        },
+        'quiebres': [
+            {**q, 'volumen_kg': round(q['volumen_kg'], 2)} for q in matriz.quiebres(volumen_base_kg)
+        ],
+    })
+
+
 # ===== INFLACIÓN =====
 @app.route('/api/inflacion', methods=['GET'])
 def get_inflaciones():
@@ -2574,6 +3061,7 @@ def get_analisis_marginal():
     - escenario_tipo: Tipo de escenario (opcional: inflacion, materia_prima, categoria, indirectos, produccion)
     - escenario_valor: Valor porcentual del escenario (número)
     - escenario_extra: Parámetro extra según tipo (id de MP, nombre de categoría, etc.)
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
     """
     mes_base = request.args.get('mes_base')
     mes_produccion = request.args.get('mes_produccion')
@@ -2593,86 +3081,38 @@ def get_analisis_marginal():
         return jsonify({'error': error}), 400
 
     try:
-        # --- Obtener producción del mes ---
-        fecha_inicio = date(año_prod, mes_prod, 1)
-        fecha_fin = date(año_prod + 1, 1, 1) if mes_prod == 12 else date(año_prod, mes_prod + 1, 1)
-
-        producciones = ProduccionProgramada.query.filter(
-            ProduccionProgramada.fecha_programacion >= fecha_inicio,
-            ProduccionProgramada.fecha_programacion < fecha_fin
-        ).all()
+        # --- Contexto del mes (producción, costos, volumen base, inflación) ---
+        ctx = _contexto(mes_base, mes_produccion)
 
-        if not producciones:
+        if not ctx.produccion:
             return jsonify({'error': f'No hay producción programada para {mes_produccion}'}), 404
 
-        # --- Costos indirectos ---
-        costos = CostoIndirecto.query.filter_by(mes_base=mes_base).all()
+        costos = ctx.costos
         if not costos:
             return jsonify({'error': f'No hay costos indirectos para mes base {mes_base}'}), 404
 
-        # --- Volumen base para escalamiento ---
-        historico_base = ProduccionHistorica.query.filter(
-            ProduccionHistorica.año == año_base,
-            ProduccionHistorica.mes == mes_base_num
-        ).all()
-
-        if historico_base:
-            volumen_base_kg = sum(h.cantidad_kg for h in historico_base)
-        else:
-            fecha_inicio_base = date(año_base, mes_base_num, 1)
-            fecha_fin_base = date(año_base + 1, 1, 1) if mes_base_num == 12 else date(año_base, mes_base_num + 1, 1)
-            producciones_base = ProduccionProgramada.query.filter(
-                ProduccionProgramada.fecha_programacion >= fecha_inicio_base,
-                ProduccionProgramada.fecha_programacion < fecha_fin_base
-            ).all()
-            volumen_base_kg = sum(p.cantidad_batches * p.producto.peso_batch_kg for p in producciones_base)
-
-        # --- Calcular totales de producción ---
-        total_kg_mes = 0
-        total_minutos_mes = 0
-        produccion_por_producto = {}
-
-        for prod in producciones:
-            producto = prod.producto
-            kg_producido = prod.cantidad_batches * producto.peso_batch_kg
-            minutos = kg_producido * producto.min_mo_kg
-
-            total_kg_mes += kg_producido
-            total_minutos_mes += minutos
-
-            if producto.id not in produccion_por_producto:
-                produccion_por_producto[producto.id] = {'producto': producto, 'kg': 0, 'minutos': 0, 'batches': 0}
-            produccion_por_producto[producto.id]['kg'] += kg_producido
-            produccion_por_producto[producto.id]['minutos'] += minutos
-            produccion_por_producto[producto.id]['batches'] += prod.cantidad_batches
+        # --- Totales de producción (el contexto es compartido: no se modifica) ---
+        total_kg_mes = ctx.total_kg
+        total_minutos_mes = ctx.total_minutos
+        produccion_por_producto = ctx.produccion
 
-        # --- Escenario: ajuste de producción ---
+        # --- Escenario: ajuste de producción (se aplica a kg y minutos de cada fila) ---
         ajuste_produccion = 1.0
         if escenario_tipo == 'produccion' and escenario_valor is not None:
             ajuste_produccion = 1 + (escenario_valor / 100)
             total_kg_mes *= ajuste_produccion
             total_minutos_mes *= ajuste_produccion
-            for pid in produccion_por_producto:
-                produccion_por_producto[pid]['kg'] *= ajuste_produccion
-                produccion_por_producto[pid]['minutos'] *= ajuste_produccion
 
         # --- Inflación acumulada ---
-        meses_diferencia = (año_prod - año_base) * 12 + (mes_prod - mes_base_num)
-        inflacion_acumulada = 1.0
-        if meses_diferencia > 0:
-            if escenario_tipo == 'inflacion' and escenario_valor is not None:
-                for _ in range(meses_diferencia):
-                    inflacion_acumulada *= (1 + escenario_valor / 100)
-            else:
-                inflaciones = InflacionMensual.query.filter(
-                    InflacionMensual.mes > mes_base,
-                    InflacionMensual.mes <= mes_produccion
-                ).all()
-                for inf in inflaciones:
-                    inflacion_acumulada *= (1 + inf.porcentaje / 100)
+        meses_diferencia = ctx.meses_diferencia
+        inflacion_acumulada = ctx.inflacion_acumulada
+        if meses_diferencia > 0 and escenario_tipo == 'inflacion' and escenario_valor is not None:
+            inflacion_acumulada = 1.0
+            for _ in range(meses_diferencia):
+                inflacion_acumulada *= (1 + escenario_valor / 100)
 
         # --- Escalamiento de costos indirectos ---
-        escalamiento = calcular_costos_con_escalamiento(costos, volumen_base_kg, total_kg_mes)
+        escalamiento = ctx.escalamiento(total_kg_mes)
 
         # Escenario: ajuste de indirectos
         ajuste_indirectos = 1.0
@@ -2691,50 +3131,22 @@ def get_analisis_marginal():
         sum_kg = 0
         sum_precio_x_kg = 0
 
+        # --- Costeo variable vectorizado (con escenario de MP o categoría) ---
+        matriz = _matriz_costeo(ctx.productos.values())
+        factor_mp = None
+        if escenario_tipo == 'materia_prima' and escenario_valor is not None and escenario_extra:
+            factor_mp = matriz.factor_por_materia_prima({int(escenario_extra): 1 + (escenario_valor / 100)})
+        elif escenario_tipo == 'categoria' and escenario_valor is not None and escenario_extra:
+            factor_mp = matriz.factor_por_categoria({escenario_extra: 1 + (escenario_valor / 100)})
+        resultado_costeo = matriz.calcular(factor_mp)
+
         for prod_id, datos in produccion_por_producto.items():
-            producto = datos['producto']
-            kg_prod = datos['kg']
-            minutos_prod = datos['minutos']
+            producto = datos.producto
+            kg_prod = datos.kg * ajuste_produccion
+            minutos_prod = datos.minutos * ajuste_produccion
 
             # --- Costo variable unitario ---
-            costeo = producto.get_costeo()
-            costo_variable_base = costeo['resumen']['costo_por_kg']
-
-            # Escenario: ajuste de MP o categoría
-            if escenario_tipo == 'materia_prima' and escenario_valor is not None and escenario_extra:
-                mp_id = int(escenario_extra)
-                factor_mp = 1 + (escenario_valor / 100)
-                total_mp_ajustado = 0
-                total_envases_aj = 0
-                for ing in costeo['ingredientes']:
-                    costo_ing = ing['costo_total']
-                    if ing['materia_prima_id'] == mp_id:
-                        costo_ing *= factor_mp
-                    if ing['categoria'] == 'ENVASES':
-                        total_envases_aj += costo_ing
-                    else:
-                        total_mp_ajustado += costo_ing
-                costo_merma_aj = total_mp_ajustado * (producto.porcentaje_merma / 100)
-                total_neto_ajustado = total_mp_ajustado + costo_merma_aj + total_envases_aj
-                peso_neto = producto.peso_batch_kg * ((100 - producto.porcentaje_merma) / 100)
-                costo_variable_base = total_neto_ajustado / peso_neto if peso_neto > 0 else 0
-            elif escenario_tipo == 'categoria' and escenario_valor is not None and escenario_extra:
-                cat_nombre = escenario_extra
-                factor_cat = 1 + (escenario_valor / 100)
-                total_mp_ajustado = 0
-                total_envases_aj = 0
-                for ing in costeo['ingredientes']:
-                    costo_ing = ing['costo_total']
-                    if ing['categoria'] == cat_nombre:
-                        costo_ing *= factor_cat
-                    if ing['categoria'] == 'ENVASES':
-                        total_envases_aj += costo_ing
-                    else:
-                        total_mp_ajustado += costo_ing
-                costo_merma_aj = total_mp_ajustado * (producto.porcentaje_merma / 100)
-                total_neto_ajustado = total_mp_ajustado + costo_merma_aj + total_envases_aj
-                peso_neto = producto.peso_batch_kg * ((100 - producto.porcentaje_merma) / 100)
-                costo_variable_base = total_neto_ajustado / peso_neto if peso_neto > 0 else 0
+            costo_variable_base = float(resultado_costeo['costo_por_kg'][matriz.fila_por_producto[prod_id]])
 
             costo_variable_unitario = costo_variable_base * inflacion_acumulada
 
@@ -2823,6 +3235,199 @@ def get_analisis_marginal():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/analisis-marginal/escenarios', methods=['POST'])
+def evaluar_escenarios_marginal():
+    """
+    Evalúa varios escenarios del análisis marginal en una sola pasada.
+
+    Body JSON:
+    - mes_base, mes_produccion: YYYY-MM
+    - escenarios: lista de escenarios ({inflacion, materia_prima, categoria,
+      indirectos, produccion} o {tipo, valor, extra} como el endpoint GET), y/o
+    - grilla: ejes a cruzar, ej. {"inflacion": {"desde": 0, "hasta": 10, "paso": 0.5},
+      "materia_prima": {"12": [-10, 0, 10]}}
+
+    Devuelve matrices escenario × producto de costo unitario, markup,
+    margen de contribución y punto de equilibrio.
+    """
+    data = get_json_data()
+    if not data:
+        return jsonify({'error': 'Datos JSON requeridos'}), 400
+
+    mes_base = data.get('mes_base')
+    mes_produccion = data.get('mes_produccion')
+    _, _, error = validate_month_format(mes_base, 'mes_base')
+    if error:
+        return jsonify({'error': error}), 400
+    _, _, error = validate_month_format(mes_produccion, 'mes_produccion')
+    if error:
+        return jsonify({'error': error}), 400
+
+    escenarios = []
+    for datos in data.get('escenarios') or []:
+        escenario, error = normalizar_escenario(datos)
+        if error:
+            return jsonify({'error': error}), 400
+        escenarios.append(escenario)
+    if data.get('grilla') is not None:
+        grilla, error = expandir_grilla(data['grilla'])
+        if error:
+            return jsonify({'error': error}), 400
+        for datos in grilla:
+            escenario, error = normalizar_escenario(datos)
+            if error:
+                return jsonify({'error': error}), 400
+            escenarios.append(escenario)
+    if not escenarios:
+        return jsonify({'error': 'Debe especificar escenarios o grilla'}), 400
+    if len(escenarios) > MAX_ESCENARIOS_MARGINAL:
+        return jsonify({'error': f'Máximo {MAX_ESCENARIOS_MARGINAL} escenarios por request'}), 400
+
+    ctx = _contexto(mes_base, mes_produccion)
+    if not ctx.produccion:
+        return jsonify({'error': f'No hay producción programada para {mes_produccion}'}), 404
+    if not ctx.costos:
+        return jsonify({'error': f'No hay costos indirectos para mes base {mes_base}'}), 404
+
+    productos = ctx.productos
+    sandbox = _sandbox_activo()
+    matriz = sandbox.matriz_costeo(productos.values()) if sandbox is not None else None
+    resultado = evaluar_escenarios(ctx, productos, escenarios, matriz)
+    totales = totales_ponderados(resultado)
+
+    def _matriz(nombre):
+        return np.round(resultado[nombre], 2).tolist()
+
+    logger.info(
+        "analisis_marginal.escenarios mes_base=%s mes_produccion=%s escenarios=%s productos=%s",
+        mes_base, mes_produccion, len(escenarios), len(resultado['producto_ids'])
+    )
+
+    return jsonify({
+        'mes_base': mes_base,
+        'mes_produccion': mes_produccion,
+        'productos': [
+            {
+                'producto_id': pid,
+                'producto_codigo': productos[pid].codigo,
+                'producto_nombre': productos[pid].nombre,
+                'precio_venta': round(productos[pid].precio_venta or 0, 2),
+            }
+            for pid in resultado['producto_ids']
+        ],
+        'escenarios': [
+            {
+                **escenario_a_dict(e),
+                'inflacion_acumulada_pct': round((resultado['inflacion_acumulada'][i] - 1) * 100, 2),
+                'totales': {nombre: round(float(valores[i]), 2) for nombre, valores in totales.items()},
+            }
+            for i, e in enumerate(escenarios)
+        ],
+        'matrices': {
+            nombre: _matriz(nombre)
+            for nombre in (
+                'costo_variable_unitario', 'costo_fijo_unitario', 'costo_unitario_total',
+                'markup', 'margen_contribucion_pct', 'punto_equilibrio_kg', 'produccion_kg',
+            )
+        },
+    })
+
+
+@app.route('/api/analisis-marginal/simulacion', methods=['POST'])
+def simular_margen():
+    """
+    Simulación Monte Carlo del margen por producto.
+
+    Body JSON:
+    - mes_base, mes_produccion: YYYY-MM
+    - simulaciones: cantidad de sorteos (default 10000, máximo 100000)
+    - semilla: entero opcional para reproducir el resultado
+    - inflacion: distribución de la inflación mensual (%), ej.
+      {"distribucion": "normal", "media": 3, "desvio": 1}; también "fija"
+      {valor}, "uniforme" {min, max} y "triangular" {min, moda, max}
+    - categorias: {nombre_categoria: distribución del cambio de precio (%)}
+    - percentiles: lista (default [5, 25, 50, 75, 95])
+
+    Devuelve por producto percentiles de costo unitario y margen, y la
+    probabilidad de margen de contribución / neto negativo.
+    """
+    data = get_json_data()
+    if not data:
+        return jsonify({'error': 'Datos JSON requeridos'}), 400
+
+    mes_base = data.get('mes_base')
+    mes_produccion = data.get('mes_produccion')
+    _, _, error = validate_month_format(mes_base, 'mes_base')
+    if error:
+        return jsonify({'error': error}), 400
+    _, _, error = validate_month_format(mes_produccion, 'mes_produccion')
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        n_sorteos = int(data.get('simulaciones', 10000))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'simulaciones debe ser un entero'}), 400
+    if not 1 <= n_sorteos <= MAX_SORTEOS:
+        return jsonify({'error': f'simulaciones debe estar entre 1 y {MAX_SORTEOS}'}), 400
+
+    semilla = data.get('semilla')
+    if semilla is not None and (not isinstance(semilla, int) or isinstance(semilla, bool) or semilla < 0):
+        return jsonify({'error': 'semilla debe ser un entero no negativo'}), 400
+
+    percentiles = data.get('percentiles', list(PERCENTILES_DEFAULT))
+    if (not isinstance(percentiles, list) or not percentiles
+            or not all(isinstance(p, (int, float)) and not isinstance(p, bool) and 0 <= p <= 100 for p in percentiles)):
+        return jsonify({'error': 'percentiles debe ser una lista de números entre 0 y 100'}), 400
+
+    inflacion, error = parse_distribucion(data.get('inflacion', 0), 'inflacion')
+    if error:
+        return jsonify({'error': error}), 400
+    categorias = data.get('categorias') or {}
+    if not isinstance(categorias, dict):
+        return jsonify({'error': 'categorias debe ser un objeto {nombre: distribucion}'}), 400
+    shocks = {}
+    for nombre, spec in categorias.items():
+        shocks[nombre], error = parse_distribucion(spec, f'categorias.{nombre}')
+        if error:
+            return jsonify({'error': error}), 400
+
+    ctx = _contexto(mes_base, mes_produccion)
+    if not ctx.produccion:
+        return jsonify({'error': f'No hay producción programada para {mes_produccion}'}), 404
+    if not ctx.costos:
+        return jsonify({'error': f'No hay costos indirectos para mes base {mes_base}'}), 404
+
+    productos = ctx.productos
+    inicio = time.perf_counter()
+    sandbox = _sandbox_activo()
+    matriz = sandbox.matriz_costeo(productos.values()) if sandbox is not None else None
+    modelo = ModeloMargen.desde_contexto(ctx, productos, matriz)
+    desconocidas = sorted(set(shocks) - set(modelo.categorias))
+    if desconocidas:
+        return jsonify({'error': f'Categorías sin materias primas en las fórmulas: {desconocidas}'}), 400
+    resultado = simular(modelo, inflacion, shocks, n_sorteos, semilla=semilla, percentiles=percentiles)
+    duracion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+
+    for fila in resultado['productos']:
+        producto = productos[fila['producto_id']]
+        fila['producto_codigo'] = producto.codigo
+        fila['producto_nombre'] = producto.nombre
+
+    logger.info(
+        "analisis_marginal.simulacion mes_base=%s mes_produccion=%s sorteos=%s productos=%s pool=%s duracion_ms=%s",
+        mes_base, mes_produccion, n_sorteos, len(modelo.producto_ids), resultado['pool'], duracion_ms
+    )
+
+    return jsonify({
+        'mes_base': mes_base,
+        'mes_produccion': mes_produccion,
+        'semilla': semilla,
+        'duracion_ms': duracion_ms,
+        **resultado,
+    })
+
+
 # ===== DISTRIBUCIÓN DE COSTOS =====
 @app.route('/api/distribucion-costos', methods=['GET'])
 def calcular_distribucion_costos():
@@ -2832,6 +3437,7 @@ def calcular_distribucion_costos():
     Query params:
     - mes_base: Mes de los costos base (YYYY-MM)
     - mes_produccion: Mes de producción a calcular (YYYY-MM)
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
     """
     mes_base = request.args.get('mes_base')
     mes_produccion = request.args.get('mes_produccion')
@@ -2855,106 +3461,31 @@ def calcular_distribucion_costos():
             mes_produccion,
         )
         
-        # Obtener producción del mes
-        fecha_inicio = date(año_prod, mes_prod, 1)
-        if mes_prod == 12:
-            fecha_fin = date(año_prod + 1, 1, 1)
-        else:
-            fecha_fin = date(año_prod, mes_prod + 1, 1)
-        
-        producciones = ProduccionProgramada.query.filter(
-            ProduccionProgramada.fecha_programacion >= fecha_inicio,
-            ProduccionProgramada.fecha_programacion < fecha_fin
-        ).all()
-        
-        # Obtener costos indirectos del mes base
-        costos = CostoIndirecto.query.filter_by(mes_base=mes_base).all()
+        # Contexto del mes (costos, volumen base, inflación y producción)
+        ctx = _contexto(mes_base, mes_produccion)
+        costos = ctx.costos
         
         if not costos:
             return jsonify({'error': f'No hay costos cargados para el mes base {mes_base}'}), 404
         
-        # ===== OBTENER PRODUCCIÓN DEL MES BASE PARA ESCALAMIENTO =====
-        # PRIORIDAD: Usar ProduccionHistorica (real) si existe, si no ProduccionProgramada
+        # Volumen del mes base para escalamiento (ProduccionHistorica real si existe)
+        volumen_base_kg = ctx.volumen_base_kg
+        origen_volumen_base = ctx.origen_volumen_base
         
-        # 1. Intentar con producción histórica (real)
-        historico_base = ProduccionHistorica.query.filter(
-            ProduccionHistorica.año == año_base,
-            ProduccionHistorica.mes == mes_base_num
-        ).all()
-        
-        if historico_base:
-            # Usar producción real del mes base
-            volumen_base_kg = sum(h.cantidad_kg for h in historico_base)
-            origen_volumen_base = 'historico'
-        else:
-            # Fallback: usar producción programada del mes base
-            fecha_inicio_base = date(año_base, mes_base_num, 1)
-            if mes_base_num == 12:
-                fecha_fin_base = date(año_base + 1, 1, 1)
-            else:
-                fecha_fin_base = date(año_base, mes_base_num + 1, 1)
-            
-            producciones_base = ProduccionProgramada.query.filter(
-                ProduccionProgramada.fecha_programacion >= fecha_inicio_base,
-                ProduccionProgramada.fecha_programacion < fecha_fin_base
-            ).all()
-            
-            # Calcular volumen del mes base
-            volumen_base_kg = sum(
-                p.cantidad_batches * p.producto.peso_batch_kg 
-                for p in producciones_base
-            )
-            origen_volumen_base = 'programado'
-        
-        # Calcular volumen del mes proyectado (lo calcularemos más adelante con producciones)
-        # Por ahora inicializamos en 0, se actualizará después de procesar producciones
-        
-        # Calcular totales de costos por tipo (sin escalamiento aún, lo hacemos después)
-        total_sp = sum(c.monto for c in costos if c.tipo_distribucion == 'SP')
-        total_gif = sum(c.monto for c in costos if c.tipo_distribucion == 'GIF')
-        total_dep = sum(c.monto for c in costos if c.tipo_distribucion == 'DEP')
-        
-        # Calcular inflación acumulada
-        meses_diferencia = (año_prod - año_base) * 12 + (mes_prod - mes_base_num)
-        
-        inflacion_acumulada = 1.0
-        if meses_diferencia > 0:
-            # Obtener inflaciones entre mes_base y mes_produccion
-            inflaciones = InflacionMensual.query.filter(
-                InflacionMensual.mes > mes_base,
-                InflacionMensual.mes <= mes_produccion
-            ).all()
-            
-            for inf in inflaciones:
-                inflacion_acumulada *= (1 + inf.porcentaje / 100)
+        # Totales de costos por tipo (sin escalamiento)
+        total_sp = ctx.totales_base['SP']
+        total_gif = ctx.totales_base['GIF']
+        total_dep = ctx.totales_base['DEP']
         
-        # Calcular totales de producción
-        total_kg = 0
-        total_minutos = 0
-        produccion_por_producto = {}
+        inflacion_acumulada = ctx.inflacion_acumulada
         
-        for prod in producciones:
-            producto = prod.producto
-            kg_producido = prod.cantidad_batches * producto.peso_batch_kg
-            minutos = kg_producido * producto.min_mo_kg
-            
-            total_kg += kg_producido
-            total_minutos += minutos
-            
-            if producto.id not in produccion_por_producto:
-                produccion_por_producto[producto.id] = {
-                    'producto': producto.to_dict(),
-                    'kg': 0,
-                    'minutos': 0,
-                    'batches': 0
-                }
-            produccion_por_producto[producto.id]['kg'] += kg_producido
-            produccion_por_producto[producto.id]['minutos'] += minutos
-            produccion_por_producto[producto.id]['batches'] += prod.cantidad_batches
+        # Totales de producción del mes
+        total_kg = ctx.total_kg
+        total_minutos = ctx.total_minutos
+        produccion_por_producto = ctx.produccion
         
         # ===== APLICAR ESCALAMIENTO A COSTOS VARIABLES =====
-        # Usar el helper para calcular costos con escalamiento
-        escalamiento = calcular_costos_con_escalamiento(costos, volumen_base_kg, total_kg)
+        escalamiento = ctx.escalamiento(total_kg)
         factor_escalamiento = escalamiento['factor_escalamiento']
         
         # Aplicar inflación a los costos ya escalados
@@ -2964,37 +3495,22 @@ def calcular_distribucion_costos():
         
         # Distribuir costos
         distribucion = []
-        for prod_id, datos in produccion_por_producto.items():
-            pct_kg = (datos['kg'] / total_kg * 100) if total_kg > 0 else 0
+        for datos in produccion_por_producto.values():
+            pct_kg = (datos.kg / total_kg * 100) if total_kg > 0 else 0
 
             # SP: proporcional a minutos. Si no hay minutos (total_minutos==0), fallback a kg.
             if total_minutos > 0:
-                pct_sp = datos['minutos'] / total_minutos
+                pct_sp = datos.minutos / total_minutos
             else:
-                pct_sp = (datos['kg'] / total_kg) if total_kg > 0 else 0
+                pct_sp = (datos.kg / total_kg) if total_kg > 0 else 0
             pct_mo = pct_sp * 100
             
             costo_sp = total_sp_ajustado * pct_sp
             # Costo GIF y DEP proporcional a kg
-            costo_gif = (datos['kg'] / total_kg * total_gif_ajustado) if total_kg > 0 else 0
-            costo_dep = (datos['kg'] / total_kg * total_dep_ajustado) if total_kg > 0 else 0
-            
-            costo_total_indirecto = costo_sp + costo_gif + costo_dep
-            costo_indirecto_por_kg = costo_total_indirecto / datos['kg'] if datos['kg'] > 0 else 0
+            costo_gif = (datos.kg / total_kg * total_gif_ajustado) if total_kg > 0 else 0
+            costo_dep = (datos.kg / total_kg * total_dep_ajustado) if total_kg > 0 else 0
             
-            distribucion.append({
-                'producto': datos['producto'],
-                'kg_producidos': round(datos['kg'], 2),
-                'minutos_mo': round(datos['minutos'], 2),
-                'batches': datos['batches'],
-                'pct_kg': round(pct_kg, 2),
-                'pct_mo': round(pct_mo, 2),
-                'costo_sp': round(costo_sp, 2),
-                'costo_gif': round(costo_gif, 2),
-                'costo_dep': round(costo_dep, 2),
-                'costo_total_indirecto': round(costo_total_indirecto, 2),
-                'costo_indirecto_por_kg': round(costo_indirecto_por_kg, 2)
-            })
+            distribucion.append(FilaDistribucion(datos, pct_kg, pct_mo, costo_sp, costo_gif, costo_dep))
 
         sp_fallback_to_kg = bool(total_minutos == 0 and total_kg > 0 and total_sp_ajustado > 0)
         if sp_fallback_to_kg:
@@ -3046,7 +3562,7 @@ def calcular_distribucion_costos():
                 'dep_ajustado': round(total_dep_ajustado, 2),
                 'total_indirectos': round(total_sp_ajustado + total_gif_ajustado + total_dep_ajustado, 2)
             },
-            'distribucion': distribucion
+            'distribucion': [fila.to_dict() for fila in distribucion]
         })
         
     except Exception as e:
@@ -3392,6 +3908,18 @@ def download_user_guide():
 
 
 # ===== EXPORTACIÓN A EXCEL =====
+def _producciones_con_formula(año, mes_num):
+    """
+    Producción programada del mes con producto y fórmula completa precargados.
+
+    Evita las cargas perezosas por fila al recorrer prod.producto.get_costeo()
+    en exportaciones y PDFs.
+    """
+    return ProduccionProgramada.query.options(
+        carga_formula_completa(joinedload(ProduccionProgramada.producto))
+    ).filter(*filtro_mes(año, mes_num)).all()
+
+
 @app.route('/api/exportar/costeo/<int:producto_id>', methods=['GET'])
 def exportar_costeo_producto(producto_id):
     """
@@ -3404,7 +3932,7 @@ def exportar_costeo_producto(producto_id):
     try:
         import xlsxwriter
         
-        producto = _get_or_404(Producto, producto_id)
+        producto = Producto.query_con_formula().filter_by(id=producto_id).first_or_404()
         mes_base = request.args.get('mes_base')
         mes_produccion = request.args.get('mes_produccion', f"{date.today().year}-{date.today().month:02d}")
         
@@ -3535,10 +4063,7 @@ def exportar_produccion():
         año, mes_num = map(int, mes.split('-'))
         
         # Obtener producción del mes
-        producciones = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == año,
-            extract('month', ProduccionProgramada.fecha_programacion) == mes_num
-        ).all()
+        producciones = _producciones_con_formula(año, mes_num)
         
         # Crear archivo Excel en memoria
         output = io.BytesIO()
@@ -3645,10 +4170,7 @@ def exportar_requerimientos():
         año, mes_num = map(int, mes.split('-'))
         
         # Obtener producción del mes
-        producciones = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == año,
-            extract('month', ProduccionProgramada.fecha_programacion) == mes_num
-        ).all()
+        producciones = _producciones_con_formula(año, mes_num)
         
         # Calcular requerimientos
         requerimientos = {}
@@ -3898,10 +4420,7 @@ def exportar_pdf_produccion():
         año, mes_num = map(int, mes.split('-'))
         
         # Obtener producción del mes
-        producciones = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == año,
-            extract('month', ProduccionProgramada.fecha_programacion) == mes_num
-        ).all()
+        producciones = _producciones_con_formula(año, mes_num)
         
         # Crear PDF en memoria
         output = io.BytesIO()
@@ -4020,10 +4539,7 @@ def exportar_pdf_requerimientos():
         año, mes_num = map(int, mes.split('-'))
         
         # Obtener producción del mes
-        producciones = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == año,
-            extract('month', ProduccionProgramada.fecha_programacion) == mes_num
-        ).all()
+        producciones = _producciones_con_formula(año, mes_num)
         
         # Calcular requerimientos
         requerimientos = {}
@@ -4172,7 +4688,7 @@ def exportar_pdf_costeo(producto_id):
         from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
         from reportlab.lib import colors
         
-        producto = _get_or_404(Producto, producto_id)
+        producto = Producto.query_con_formula().filter_by(id=producto_id).first_or_404()
         mes_base = request.args.get('mes_base')
         mes_produccion = request.args.get('mes_produccion', f"{date.today().year}-{date.today().month:02d}")
         
@@ -4439,10 +4955,7 @@ def exportar_pdf_resumen_mensual():
         total_mp = MateriaPrima.query.filter_by(activo=True).count()
         
         # Producción del mes
-        producciones = ProduccionProgramada.query.filter(
-            extract('year', ProduccionProgramada.fecha_programacion) == año,
-            extract('month', ProduccionProgramada.fecha_programacion) == mes_num
-        ).all()
+        producciones = _producciones_con_formula(año, mes_num)
         
         total_batches = sum(p.cantidad_batches for p in producciones)
         total_kg = sum(p.cantidad_batches * p.producto.peso_batch_kg for p in producciones)
@@ -4607,6 +5120,9 @@ def proyeccion_multiperiodo():
     - mes_fin: Mes final (YYYY-MM)
     - mes_base_costos: Mes base para costos indirectos (YYYY-MM)
     - modo: 'mixto' | 'manual' | 'ml'
+
+    Query params:
+    - sandbox: (opcional) id de un sandbox what-if (ver POST /api/sandbox)
     
     Returns: Proyección consolidada con costos por mes y resumen
     """
@@ -4658,14 +5174,17 @@ def proyeccion_multiperiodo():
         productos = Producto.query.filter_by(activo=True).all()
         productos_dict = {p.id: p for p in productos}
         
-        # Obtener costos indirectos del mes base
-        costos_base = CostoIndirecto.query.filter_by(mes_base=mes_base_costos).all()
-        if not costos_base:
+        # Costeo variable (una sola vez para todo el rango)
+        costeos = _costeos(productos)
+        
+        # Costos indirectos del mes base (del contexto del primer mes; no dependen del mes proyectado)
+        ctx_inicial = _contexto(mes_base_costos, meses_proyeccion[0])
+        if not ctx_inicial.costos:
             return jsonify({'error': f'No hay costos indirectos para el mes base {mes_base_costos}'}), 400
         
-        total_sp_base = sum(c.monto for c in costos_base if c.tipo_distribucion == 'SP')
-        total_gif_base = sum(c.monto for c in costos_base if c.tipo_distribucion == 'GIF')
-        total_dep_base = sum(c.monto for c in costos_base if c.tipo_distribucion == 'DEP')
+        total_sp_base = ctx_inicial.totales_base['SP']
+        total_gif_base = ctx_inicial.totales_base['GIF']
+        total_dep_base = ctx_inicial.totales_base['DEP']
 
         logger.info(
             "proyeccion_multiperiodo.start mes_inicio=%s mes_fin=%s mes_base_costos=%s modo=%s meses=%s productos=%s sp_base=%.2f gif_base=%.2f dep_base=%.2f",
@@ -4680,29 +5199,31 @@ def proyeccion_multiperiodo():
             float(total_dep_base),
         )
         
+        # Inflación acumulada de todos los meses del rango en una sola consulta al índice
+        sandbox = _sandbox_activo()
+        if sandbox is not None:
+            inflaciones = sandbox.inflacion_acumulada_rango(mes_base_costos, meses_proyeccion)
+        else:
+            inflaciones = indice_inflacion.acumulada_rango(mes_base_costos, meses_proyeccion)
+
         # Procesar cada mes
         resultados_meses = []
         total_kg_periodo = 0
         costo_total_periodo = 0
         meses_manuales = 0
         meses_ml = 0
+        predicciones_por_mes = None  # mes -> predicciones ML (todo el rango en una llamada)
         
-        for mes_proj in meses_proyeccion:
+        for mes_proj, inflacion_mes in zip(meses_proyeccion, inflaciones):
             # Variables de diagnóstico del mes
             total_kg_mes = 0
             total_minutos_mes = 0
 
             año_proj, mes_proj_num = map(int, mes_proj.split('-'))
             
-            # Calcular inflación acumulada
-            inflacion_acumulada = 1.0
-            if mes_proj > mes_base_costos:
-                inflaciones = InflacionMensual.query.filter(
-                    InflacionMensual.mes > mes_base_costos,
-                    InflacionMensual.mes <= mes_proj
-                ).all()
-                for inf in inflaciones:
-                    inflacion_acumulada *= (1 + inf.porcentaje / 100)
+            # Contexto del mes: producción programada
+            ctx = _contexto(mes_base_costos, mes_proj)
+            inflacion_acumulada = float(inflacion_mes)
             
             # Ajustar costos indirectos por inflación
             total_sp = total_sp_base * inflacion_acumulada
@@ -4710,25 +5231,15 @@ def proyeccion_multiperiodo():
             total_dep = total_dep_base * inflacion_acumulada
             
             # Determinar fuente de datos: manual o ML
-            fecha_inicio_mes = date(año_proj, mes_proj_num, 1)
-            if mes_proj_num == 12:
-                fecha_fin_mes = date(año_proj + 1, 1, 1)
-            else:
-                fecha_fin_mes = date(año_proj, mes_proj_num + 1, 1)
-            
-            # Verificar si hay producción manual
-            produccion_manual = ProduccionProgramada.query.filter(
-                ProduccionProgramada.fecha_programacion >= fecha_inicio_mes,
-                ProduccionProgramada.fecha_programacion < fecha_fin_mes
-            ).all()
+            hay_produccion_manual = len(ctx.produccion) > 0
             
             usar_manual = False
             if modo == 'manual':
-                usar_manual = len(produccion_manual) > 0
+                usar_manual = hay_produccion_manual
             elif modo == 'ml':
                 usar_manual = False
             else:  # mixto
-                usar_manual = len(produccion_manual) > 0
+                usar_manual = hay_produccion_manual
             
             productos_mes = []
             fuente = 'manual' if usar_manual else 'ml'
@@ -4737,38 +5248,22 @@ def proyeccion_multiperiodo():
                 # Usar datos manuales
                 meses_manuales += 1
                 
-                # Calcular totales del mes
-                total_kg_mes = 0
-                total_minutos_mes = 0
-                prod_detalles = {}
-                
-                for prod_prog in produccion_manual:
-                    producto = prod_prog.producto
-                    kg_producido = prod_prog.cantidad_batches * producto.peso_batch_kg
-                    minutos = kg_producido * producto.min_mo_kg
-                    
-                    total_kg_mes += kg_producido
-                    total_minutos_mes += minutos
-                    
-                    if producto.id not in prod_detalles:
-                        prod_detalles[producto.id] = {
-                            'kg': 0,
-                            'minutos': 0
-                        }
-                    prod_detalles[producto.id]['kg'] += kg_producido
-                    prod_detalles[producto.id]['minutos'] += minutos
+                # Totales del mes
+                total_kg_mes = ctx.total_kg
+                total_minutos_mes = ctx.total_minutos
+                prod_detalles = ctx.produccion
                 
                 # Calcular costos por producto
                 for prod_id, detalles in prod_detalles.items():
                     try:
                         producto = productos_dict[prod_id]
-                        costeo = producto.get_costeo()
+                        costeo = costeos[prod_id]
                         
-                        kg = detalles['kg']
-                        minutos_prod = detalles['minutos']
+                        kg = detalles.kg
+                        minutos_prod = detalles.minutos
                         
                         # MP con inflación
-                        mp_base_kg = costeo['resumen']['costo_por_kg'] or 0
+                        mp_base_kg = costeo.costo_por_kg or 0
                         mp_por_kg = mp_base_kg * inflacion_acumulada
                         
                         # Costos indirectos distribuidos
@@ -4798,7 +5293,7 @@ def proyeccion_multiperiodo():
                             'ind_por_kg': round(ind_por_kg, 2),
                             'total_por_kg': round(total_por_kg, 2),
                             'costo_total': round(costo_total, 2),
-                            'sin_formula': costeo.get('advertencias') is not None
+                            'sin_formula': costeo.advertencias is not None
                         })
                         
                         total_kg_periodo += kg
@@ -4814,9 +5309,13 @@ def proyeccion_multiperiodo():
                 if predictor and predictor.is_trained:
                     meses_ml += 1
                     
-                    # Usar predict_month para obtener predicciones de todos los productos
-                    productos_ids = list(productos_dict.keys())
-                    predicciones = predictor.predict_month(productos_ids, año_proj, mes_proj_num)
+                    # Pronóstico recursivo de todo el rango (las predicciones de un mes alimentan
+                    # los lags del siguiente), calculado la primera vez que un mes usa ML
+                    if predicciones_por_mes is None:
+                        predicciones_por_mes = dict(zip(meses_proyeccion, predictor.predict_horizon(
+                            list(productos_dict.keys()), año_inicio, mes_inicio_num, len(meses_proyeccion)
+                        )))
+                    predicciones = predicciones_por_mes[mes_proj]
                     if predicciones and len(predicciones) > 0:
                         # Calcular totales del mes para distribución
                         total_kg_mes = sum(p['cantidad_kg'] for p in predicciones if p['cantidad_kg'] and p['cantidad_kg'] > 0)
@@ -4841,12 +5340,12 @@ def proyeccion_multiperiodo():
                                         continue
                                     
                                     producto = productos_dict[prod_id]
-                                    costeo = producto.get_costeo()
+                                    costeo = costeos[prod_id]
                                     kg = pred['cantidad_kg']
                                     minutos_prod = kg * (producto.min_mo_kg or 0)
                                     
                                     # MP con inflación
-                                    mp_base_kg = costeo['resumen']['costo_por_kg'] or 0
+                                    mp_base_kg = costeo.costo_por_kg or 0
                                     mp_por_kg = mp_base_kg * inflacion_acumulada
                                     
                                     # Costos indirectos distribuidos
@@ -4878,7 +5377,7 @@ def proyeccion_multiperiodo():
                                         'costo_total': round(costo_total, 2),
                                         'confianza': pred.get('confianza', 0),
                                         'metodo': pred.get('metodo', 'desconocido'),
-                                        'sin_formula': costeo.get('advertencias') is not None
+                                        'sin_formula': costeo.advertencias is not None
                                     })
                                     
                                     total_kg_periodo += kg
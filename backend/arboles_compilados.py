@@ -0,0 +1,255 @@
+"""
+Evaluación vectorizada (NumPy) de modelos XGBoost de árboles.
+
+predict_month predice cientos de productos, cada uno con su propio
+XGBRegressor: llamar a ``model.predict`` una vez por producto cuesta un
+overhead fijo de ~0.3 ms por llamada, que domina con una sola fila. Aquí
+los árboles de cada modelo se compilan a arrays (árbol binario completo,
+nivel por nivel) y todas las filas, cada una con su propio modelo, se
+evalúan juntas en unas pocas operaciones NumPy.
+
+El resultado es idéntico bit a bit al de XGBoost: comparaciones en float32
+(``x < umbral``; NaN sigue la rama por defecto) y suma secuencial en
+float32 de base_score + la hoja de cada árbol, en orden.
+
+Solo soporta booster gbtree de una salida, sin splits categóricos y con
+objetivo identidad (reg:squarederror); ``compilar()`` devuelve None para
+otros modelos y quien llama usa ``model.predict``.
+
+Un ``LoteArboles`` se puede guardar como archivos .npy y abrir con
+memory-map (``cargar``): predict_month evalúa directo sobre el archivo y
+el sistema operativo comparte esas páginas entre procesos.
+"""
+import json
+import os
+
+import numpy as np
+
+OBJETIVOS_IDENTIDAD = ('reg:squarederror',)
+
+
+class ArbolesCompilados:
+    """
+    Árboles de un modelo como árboles binarios completos de profundidad fija.
+
+    Los nodos internos de cada árbol están en orden de heap (nivel 0, nivel 1,
+    ...): el nodo j del nivel l está en la columna 2**l - 1 + j y sus hijos
+    son los nodos 2j y 2j + 1 del nivel siguiente. Las hojas que en XGBoost
+    quedan a menor profundidad se replican hacia abajo.
+    """
+
+    __slots__ = ('base', 'features', 'umbrales', 'por_defecto_izq', 'hojas', 'n_features')
+
+    def __init__(self, base, features, umbrales, por_defecto_izq, hojas, n_features):
+        """
+        Args:
+            base: base_score (float32)
+            features, umbrales, por_defecto_izq: (n_arboles, 2**profundidad - 1)
+            hojas: (n_arboles, 2**profundidad) float32
+            n_features: features que espera el modelo
+        """
+        self.base = base
+        self.features = features
+        self.umbrales = umbrales
+        self.por_defecto_izq = por_defecto_izq
+        self.hojas = hojas
+        self.n_features = n_features
+
+    @property
+    def n_arboles(self):
+        return self.hojas.shape[0]
+
+    @property
+    def profundidad(self):
+        return int(self.hojas.shape[1]).bit_length() - 1
+
+    def ampliado(self, n_arboles, profundidad):
+        """
+        Copia con más árboles y/o más profundidad, con la misma predicción.
+
+        Los árboles agregados son una hoja 0.0 (sumar +0.0 no cambia el float32)
+        y los niveles agregados siempre van a la izquierda (umbral +inf, NaN a la
+        izquierda) hacia hojas replicadas.
+        """
+        extra = profundidad - self.profundidad
+        features, umbrales, izq, hojas = self.features, self.umbrales, self.por_defecto_izq, self.hojas
+        if extra > 0:
+            nuevos = 2 ** profundidad - 2 ** self.profundidad
+            features = np.hstack([features, np.zeros((len(features), nuevos), dtype=features.dtype)])
+            umbrales = np.hstack([umbrales, np.full((len(umbrales), nuevos), np.inf, dtype=np.float32)])
+            izq = np.hstack([izq, np.ones((len(izq), nuevos), dtype=bool)])
+            hojas = np.repeat(hojas, 2 ** extra, axis=1)
+        faltan = n_arboles - self.n_arboles
+        if faltan > 0:
+            internos = features.shape[1]
+            features = np.vstack([features, np.zeros((faltan, internos), dtype=features.dtype)])
+            umbrales = np.vstack([umbrales, np.full((faltan, internos), np.inf, dtype=np.float32)])
+            izq = np.vstack([izq, np.ones((faltan, internos), dtype=bool)])
+            hojas = np.vstack([hojas, np.zeros((faltan, hojas.shape[1]), dtype=np.float32)])
+        return ArbolesCompilados(self.base, features, umbrales, izq, hojas, self.n_features)
+
+
+def compilar(model):
+    """
+    Compila un XGBRegressor (o Booster) entrenado.
+
+    Returns:
+        ArbolesCompilados, o None si el modelo no es soportado
+    """
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    learner = json.loads(booster.save_raw('json'))['learner']
+    params = learner['learner_model_param']
+    gbm = learner['gradient_booster']
+    if (learner['objective']['name'] not in OBJETIVOS_IDENTIDAD or gbm['name'] != 'gbtree'
+            or params.get('num_target', '1') != '1' or params.get('num_class', '0') != '0'
+            or gbm['model']['gbtree_model_param'].get('num_parallel_tree', '1') != '1'):
+        return None
+
+    trees = gbm['model']['trees']
+    try:
+        # Igual que XGBRegressor.predict: con early stopping usa hasta best_iteration
+        trees = trees[:model.best_iteration + 1]
+    except AttributeError:
+        pass
+    if not trees or any(any(tree.get('split_type', ())) for tree in trees):
+        return None
+
+    # Arrays planos de todos los nodos, con los hijos desplazados al índice global
+    tamaños = np.array([len(tree['left_children']) for tree in trees])
+    offsets = np.concatenate([[0], np.cumsum(tamaños)[:-1]])
+    repetidos = np.repeat(offsets, tamaños)
+    izquierdo = np.concatenate([tree['left_children'] for tree in trees]).astype(np.int64)
+    derecho = np.concatenate([tree['right_children'] for tree in trees]).astype(np.int64)
+    es_hoja = izquierdo == -1
+    izquierdo = izquierdo + repetidos
+    derecho = derecho + repetidos
+    feature = np.concatenate([tree['split_indices'] for tree in trees]).astype(np.int32)
+    # En hojas split_conditions guarda el valor de la hoja
+    condicion = np.concatenate([tree['split_conditions'] for tree in trees]).astype(np.float32)
+    por_defecto = np.concatenate([tree['default_left'] for tree in trees]).astype(bool)
+
+    features, umbrales, izq = [], [], []
+    nodos = offsets[:, None]
+    while not es_hoja[nodos].all():
+        hoja = es_hoja[nodos]
+        features.append(np.where(hoja, 0, feature[nodos]))
+        umbrales.append(np.where(hoja, np.float32(np.inf), condicion[nodos]))
+        izq.append(np.where(hoja, True, por_defecto[nodos]))
+        hijos_izq = np.where(hoja, nodos, izquierdo[nodos])
+        hijos_der = np.where(hoja, nodos, derecho[nodos])
+        nodos = np.stack([hijos_izq, hijos_der], axis=2).reshape(len(trees), -1)
+
+    n_arboles = len(trees)
+    vacio = np.zeros((n_arboles, 0))
+    return ArbolesCompilados(
+        np.float32(float(params['base_score'].strip('[]'))),
+        np.hstack(features).astype(np.int32) if features else vacio.astype(np.int32),
+        np.hstack(umbrales).astype(np.float32) if umbrales else vacio.astype(np.float32),
+        np.hstack(izq).astype(bool) if izq else vacio.astype(bool),
+        condicion[nodos],
+        int(params['num_feature']),
+    )
+
+
+class LoteArboles:
+    """Varios ArbolesCompilados apilados para evaluar filas de distintos modelos juntas."""
+
+    ARRAYS = ('features', 'umbrales', 'por_defecto_izq', 'hojas', 'bases', 'n_features')
+
+    __slots__ = ARRAYS + ('n_arboles', 'profundidad')
+
+    def __init__(self, features, umbrales, por_defecto_izq, hojas, bases, n_features, n_arboles, profundidad):
+        """
+        Arrays aplanados: el nodo n del árbol t del modelo m está en
+        (m * n_arboles + t) * (2**profundidad - 1) + n (ídem hojas con 2**profundidad).
+        bases y n_features tienen un valor por modelo.
+        """
+        self.features = features
+        self.umbrales = umbrales
+        self.por_defecto_izq = por_defecto_izq
+        self.hojas = hojas
+        self.bases = bases
+        self.n_features = n_features
+        self.n_arboles = n_arboles
+        self.profundidad = profundidad
+
+    @classmethod
+    def apilar(cls, compilados):
+        """Lote con estos modelos, en este orden (se amplían a los mismos árboles y profundidad)."""
+        compilados = list(compilados)
+        n_arboles = max(c.n_arboles for c in compilados)
+        profundidad = max(c.profundidad for c in compilados)
+        ampliados = [c.ampliado(n_arboles, profundidad) for c in compilados]
+        return cls(
+            np.stack([c.features for c in ampliados]).ravel(),
+            np.stack([c.umbrales for c in ampliados]).ravel(),
+            np.stack([c.por_defecto_izq for c in ampliados]).ravel(),
+            np.stack([c.hojas for c in ampliados]).ravel(),
+            np.array([c.base for c in compilados], dtype=np.float32),
+            np.array([c.n_features for c in compilados], dtype=np.int32),
+            n_arboles,
+            profundidad,
+        )
+
+    def __len__(self):
+        return len(self.bases)
+
+    def compilado(self, fila):
+        """ArbolesCompilados del modelo en la posición fila (copia, con los árboles y profundidad del lote)."""
+        internos, hojas = 2 ** self.profundidad - 1, 2 ** self.profundidad
+        n = self.n_arboles
+
+        def tramo(array, ancho):
+            return np.array(array[fila * n * ancho:(fila + 1) * n * ancho]).reshape(n, ancho)
+
+        return ArbolesCompilados(
+            np.float32(self.bases[fila]),
+            tramo(self.features, internos),
+            tramo(self.umbrales, internos),
+            tramo(self.por_defecto_izq, internos),
+            tramo(self.hojas, hojas),
+            int(self.n_features[fila]),
+        )
+
+    def guardar(self, directorio):
+        """Escribe un .npy por array en directorio; devuelve los parámetros para cargar()."""
+        for nombre in self.ARRAYS:
+            np.save(os.path.join(directorio, f'arboles_{nombre}.npy'), getattr(self, nombre))
+        return {'n_arboles': self.n_arboles, 'profundidad': self.profundidad}
+
+    @classmethod
+    def cargar(cls, directorio, n_arboles, profundidad):
+        """Abre un lote guardado con guardar(), con memory-map (solo lectura)."""
+        arrays = [np.load(os.path.join(directorio, f'arboles_{nombre}.npy'), mmap_mode='r') for nombre in cls.ARRAYS]
+        return cls(*arrays, n_arboles, profundidad)
+
+    def predecir(self, X, modelos):
+        """
+        Predice cada fila de X con su modelo.
+
+        Args:
+            X: matriz (n_filas, n_features)
+            modelos: posición en el lote del modelo de cada fila
+
+        Returns:
+            array float32 (n_filas,), igual a model.predict fila por fila
+        """
+        X = np.asarray(X, dtype=np.float32)
+        modelos = np.asarray(modelos, dtype=np.int64)
+        n_filas, n_features = X.shape
+        internos = 2 ** self.profundidad - 1
+        arbol = modelos[:, None] * self.n_arboles + np.arange(self.n_arboles)[None, :]
+        base_fila = (np.arange(n_filas) * n_features)[:, None]
+        valores = X.ravel()
+
+        posicion = np.zeros(arbol.shape, dtype=np.int64)
+        for nivel in range(self.profundidad):
+            nodo = arbol * internos + (2 ** nivel - 1) + posicion
+            x = valores[base_fila + self.features[nodo]]
+            a_izquierda = np.where(np.isnan(x), self.por_defecto_izq[nodo], x < self.umbrales[nodo])
+            posicion = 2 * posicion + ~a_izquierda
+
+        hojas = self.hojas[arbol * 2 ** self.profundidad + posicion]
+        # Suma secuencial en float32 (como XGBoost): base, árbol 0, árbol 1, ...
+        acumulado = np.concatenate([self.bases[modelos][:, None], hojas], axis=1)
+        return np.add.accumulate(acumulado, axis=1, dtype=np.float32)[:, -1]
@@ -0,0 +1,188 @@
+"""
+Snapshot en memoria del catálogo de costeo.
+
+Precios, categorías, productos y fórmulas son chicos y se leen en casi todos
+los requests. ``catalogo.snapshot()`` devuelve un ``SnapshotCatalogo``
+inmutable con:
+
+- la ``MatrizCosteo`` de todos los productos activos (vector de precios de
+  MP, códigos de categoría, parámetros de producto y fórmulas en CSR);
+- los productos como registros ``ProductoCatalogo`` (``__slots__``, sin
+  sesión ORM), que son también las filas de la matriz.
+
+Los lectores no toman locks: leen la referencia al snapshot actual y la
+comparan con un contador de generación. Al confirmar una transacción que
+toca Categoria, MateriaPrima, Producto o FormulaDetalle (``after_commit``)
+la generación avanza y un hilo en segundo plano reconstruye el snapshot y
+reemplaza la referencia de una vez; si un lector llega antes de que termine,
+lo reconstruye él mismo. El refresco en segundo plano se puede apagar
+(``init_catalogo(app, refresco_en_segundo_plano=False)``, como hacen los
+tests): el snapshot se reconstruye entonces en la primera lectura.
+
+Con cambios de catálogo sin confirmar en la sesión el snapshot se construye
+desde la base de datos y no se guarda.
+"""
+import logging
+import threading
+import time
+
+from models import db, Categoria, MateriaPrima, Producto, FormulaDetalle
+from costeo_engine import MatrizCosteo
+from invalidacion import registrar_invalidacion
+from valores_costeo import ProductoCatalogo
+
+logger = logging.getLogger(__name__)
+
+_MODELOS_CATALOGO = (Categoria, MateriaPrima, Producto, FormulaDetalle)
+
+_CLAVE_PENDIENTES = 'catalogo_pendientes'
+
+
+class SnapshotCatalogo:
+    """Catálogo activo en un instante; compartido entre requests, solo lectura."""
+
+    __slots__ = ('generacion', 'matriz', 'productos', 'construido_en', 'duracion_ms')
+
+    def __init__(self, generacion):
+        inicio = time.perf_counter()
+        self.generacion = generacion
+        matriz = MatrizCosteo.desde_db()
+        # Las filas quedan con registros desligados de la sesión en lugar de objetos ORM
+        matriz.productos = [ProductoCatalogo(p) for p in matriz.productos]
+        self.productos = {p.id: p for p in matriz.productos}
+        self.matriz = matriz
+        self.construido_en = time.time()
+        self.duracion_ms = (time.perf_counter() - inicio) * 1000
+
+    def contiene(self, producto_ids):
+        return all(pid in self.productos for pid in producto_ids)
+
+
+class CatalogoEnMemoria:
+    """Referencia al snapshot vigente y su reconstrucción."""
+
+    def __init__(self, refresco_en_segundo_plano=True):
+        """
+        Args:
+            refresco_en_segundo_plano: reconstruir el snapshot en un hilo al
+                confirmar cambios (requiere la app, ver init_catalogo)
+        """
+        self.refresco_en_segundo_plano = refresco_en_segundo_plano
+        self._snapshot = None
+        self._generacion = 0
+        self._lock = threading.Lock()  # serializa las reconstrucciones
+        self._app = None
+        self._pedido = threading.Event()
+        self._hilo = None
+        self._lock_generacion = threading.Lock()
+        self.reconstrucciones = 0
+
+    def snapshot(self, session=None):
+        """SnapshotCatalogo vigente (lo reconstruye si quedó desactualizado)."""
+        snapshot = self._snapshot
+        session = session if session is not None else db.session
+        if _tiene_pendientes(session):
+            return SnapshotCatalogo(self._generacion)
+        if snapshot is not None and snapshot.generacion == self._generacion:
+            return snapshot
+        return self.refrescar()
+
+    def refrescar(self):
+        """Reconstruye el snapshot si hace falta y lo publica."""
+        with self._lock:
+            generacion = self._generacion
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.generacion == generacion:
+                return snapshot
+            snapshot = SnapshotCatalogo(generacion)
+            self.reconstrucciones += 1
+            # Si hubo otro commit mientras se construía, se usa pero queda desactualizado
+            self._snapshot = snapshot
+        logger.debug(
+            "catalogo.snapshot generacion=%s productos=%s materias=%s duracion_ms=%.1f",
+            generacion, len(snapshot.productos), len(snapshot.matriz.mp_ids), snapshot.duracion_ms,
+        )
+        return snapshot
+
+    def invalidar(self):
+        with self._lock_generacion:
+            self._generacion += 1
+        if self._app is not None and self.refresco_en_segundo_plano:
+            self._iniciar_hilo()
+            self._pedido.set()
+
+    # ------------------------------------------------------------------
+    # Refresco en segundo plano
+    # ------------------------------------------------------------------
+    def _iniciar_hilo(self):
+        with self._lock_generacion:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._refrescar_en_segundo_plano, name='catalogo', daemon=True)
+            self._hilo.start()
+
+    def _refrescar_en_segundo_plano(self):
+        while True:
+            self._pedido.wait()
+            self._pedido.clear()
+            try:
+                with self._app.app_context():
+                    self.refrescar()
+                    db.session.remove()
+            except Exception:
+                logger.exception("catalogo.refresco_error")
+
+    def estadisticas(self):
+        snapshot = self._snapshot
+        return {
+            'generacion': self._generacion,
+            'generacion_snapshot': snapshot.generacion if snapshot is not None else None,
+            'productos': len(snapshot.productos) if snapshot is not None else 0,
+            'materias_primas': len(snapshot.matriz.mp_ids) if snapshot is not None else 0,
+            'reconstrucciones': self.reconstrucciones,
+            'ultima_duracion_ms': round(snapshot.duracion_ms, 2) if snapshot is not None else None,
+        }
+
+
+catalogo = CatalogoEnMemoria()
+
+
+def matriz_costeo(productos=None):
+    """
+    MatrizCosteo que incluye ``productos`` (todos los activos si es None).
+
+    Si todos están en el snapshot devuelve su matriz compartida (solo
+    lectura; puede tener más filas que las pedidas). Si no (productos
+    inactivos o recién creados) la construye desde la base de datos.
+    """
+    snapshot = catalogo.snapshot()
+    if productos is None:
+        return snapshot.matriz
+    productos = list(productos)
+    if snapshot.contiene(p.id for p in productos):
+        return snapshot.matriz
+    return MatrizCosteo.desde_db(productos)
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _tiene_pendientes(session):
+    if session.info.get(_CLAVE_PENDIENTES):
+        return True
+    # Cambios todavía sin flush (una consulta los haría visibles vía autoflush)
+    return any(
+        isinstance(obj, _MODELOS_CATALOGO)
+        for estado in (session.new, session.deleted, session.dirty) for obj in estado
+    )
+
+
+def init_catalogo(app=None, refresco_en_segundo_plano=True):
+    """
+    Registra los listeners de cambios (idempotente) y configura el refresco
+    en segundo plano, que usa ``app`` para abrir su contexto.
+    """
+    if app is not None:
+        catalogo._app = app
+    catalogo.refresco_en_segundo_plano = refresco_en_segundo_plano
+    registrar_invalidacion(_CLAVE_PENDIENTES, _MODELOS_CATALOGO, lambda session, anotado: catalogo.invalidar())
@@ -0,0 +1,93 @@
+"""
+Consultas agregadas sobre ProduccionProgramada.
+
+Los totales de producción de un período se calculan en la base de datos:
+``GROUP BY producto_id`` con ``SUM`` de batches, kg (``batches * peso_batch_kg``)
+y minutos de MO (``kg * min_mo_kg``), devolviendo tuplas livianas en lugar de
+una fila ORM por programación.
+
+El filtro por mes es un rango ``fecha_inicio <= fecha_programacion < fecha_fin``
+(sargable: usa el índice sobre fecha_programacion), en vez de
+``extract('year') / extract('month')``, que obliga a recorrer la tabla.
+"""
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy import func
+
+from models import db, Producto, ProduccionProgramada
+
+# Totales de un producto en el período
+TotalProducto = namedtuple('TotalProducto', 'producto_id batches kg minutos')
+
+
+def rango_mes(año, mes):
+    """Fechas [inicio, fin) de un mes."""
+    inicio = date(año, mes, 1)
+    fin = date(año + 1, 1, 1) if mes == 12 else date(año, mes + 1, 1)
+    return inicio, fin
+
+
+def filtro_mes(año, mes):
+    """Condiciones sargables para filtrar ProduccionProgramada por mes."""
+    inicio, fin = rango_mes(año, mes)
+    return (
+        ProduccionProgramada.fecha_programacion >= inicio,
+        ProduccionProgramada.fecha_programacion < fin,
+    )
+
+
+def _sumas():
+    kg = ProduccionProgramada.cantidad_batches * Producto.peso_batch_kg
+    return (
+        func.sum(ProduccionProgramada.cantidad_batches),
+        func.sum(kg),
+        func.sum(kg * func.coalesce(Producto.min_mo_kg, 0)),
+    )
+
+
+def totales_por_producto(*condiciones, session=None):
+    """
+    Totales por producto de las programaciones que cumplen las condiciones.
+
+    Args:
+        condiciones: expresiones SQLAlchemy sobre ProduccionProgramada
+            (por ejemplo ``*filtro_mes(2025, 3)``).
+
+    Returns:
+        lista de TotalProducto ordenada por producto_id.
+    """
+    session = session if session is not None else db.session
+    filas = (
+        session.query(ProduccionProgramada.producto_id, *_sumas())
+        .join(Producto, Producto.id == ProduccionProgramada.producto_id)
+        .filter(*condiciones)
+        .group_by(ProduccionProgramada.producto_id)
+        .order_by(ProduccionProgramada.producto_id)
+        .all()
+    )
+    return [TotalProducto(*fila) for fila in filas]
+
+
+def productos_con_totales(*condiciones, session=None):
+    """
+    Como totales_por_producto, pero trae también el Producto en la misma consulta.
+
+    Returns:
+        lista de (producto, TotalProducto) ordenada por producto_id.
+    """
+    session = session if session is not None else db.session
+    filas = (
+        session.query(Producto, *_sumas())
+        .join(ProduccionProgramada, ProduccionProgramada.producto_id == Producto.id)
+        .filter(*condiciones)
+        .group_by(Producto.id)
+        .order_by(Producto.id)
+        .all()
+    )
+    return [(producto, TotalProducto(producto.id, *sumas)) for producto, *sumas in filas]
+
+
+def totales_del_mes(año, mes, session=None):
+    """Totales por producto del mes (ver totales_por_producto)."""
+    return totales_por_producto(*filtro_mes(año, mes), session=session)
@@ -0,0 +1,364 @@
+"""
+Contexto mensual de costos indirectos.
+
+Los endpoints de costos indirectos (costeo completo, distribución, análisis
+marginal, proyecciones) necesitan para un par (mes_base, mes_produccion) los
+mismos insumos:
+
+- los CostoIndirecto del mes base y sus totales SP/GIF/DEP,
+- el volumen del mes base (ProduccionHistorica real, o ProduccionProgramada),
+- la inflación acumulada entre ambos meses (InflacionMensual),
+- los kg / minutos de MO / batches por producto del mes de producción
+  (leídos del agregado mensual, ver produccion_mensual.py),
+- el escalamiento de costos variables (calcular_costos_con_escalamiento).
+
+``obtener_contexto()`` los calcula una sola vez en un ``ContextoMes`` y lo
+guarda en una caché LRU. La clave incluye contadores de versión de las tablas
+involucradas, que se incrementan al confirmar cualquier escritura ORM sobre
+ellas: un contexto viejo simplemente deja de ser alcanzable y el LRU lo
+descarta.
+
+Los ContextoMes son compartidos entre requests: tratarlos como solo lectura.
+"""
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from models import (
+    db, CostoIndirecto, InflacionMensual, ProduccionHistorica, ProduccionProgramada, Producto,
+)
+from indice_inflacion import indice_inflacion
+from invalidacion import registrar_invalidacion
+from produccion_mensual import produccion_del_mes, kg_del_mes
+from valores_costeo import ProductoCatalogo, ProduccionProducto
+
+logger = logging.getLogger(__name__)
+
+# Tablas de las que depende un ContextoMes
+_MODELOS_CONTEXTO = (CostoIndirecto, InflacionMensual, ProduccionHistorica, ProduccionProgramada, Producto)
+
+_CLAVE_PENDIENTES = 'contexto_mensual_pendientes'
+
+# Copia inmutable de un CostoIndirecto (los objetos ORM no sobreviven a la sesión)
+CostoSnapshot = namedtuple('CostoSnapshot', 'cuenta tipo_distribucion monto es_variable variacion_max_pct')
+
+
+TIPOS_DISTRIBUCION = ('SP', 'GIF', 'DEP')
+
+
+class MatrizEscalamiento:
+    """
+    Costos indirectos de un mes base como arrays NumPy.
+
+    Con los montos, la marca de variable, el tope ``variacion_max_pct`` y el
+    tipo de distribución de cada cuenta como vectores, los totales escalados
+    de SP/GIF/DEP se evalúan para un vector completo de volúmenes
+    proyectados en una sola pasada (matriz volúmenes × cuentas).
+    """
+
+    def __init__(self, costos, factor_limite_min=0.5, factor_limite_max=3.0):
+        """
+        Args:
+            costos: iterable de CostoIndirecto o CostoSnapshot
+            factor_limite_min: límite inferior global del factor
+            factor_limite_max: límite superior global del factor
+        """
+        costos = list(costos)
+        self.factor_limite_min = factor_limite_min
+        self.factor_limite_max = factor_limite_max
+        self.cuentas = [getattr(c, 'cuenta', None) for c in costos]
+        self.montos = np.array([c.monto for c in costos], dtype=np.float64)
+        self.es_variable = np.array([bool(c.es_variable) for c in costos], dtype=bool)
+        # Tipo como código 0..2; las cuentas con otro tipo no suman en ningún total
+        codigos = {tipo: i for i, tipo in enumerate(TIPOS_DISTRIBUCION)}
+        self.tipos = np.array([codigos.get(c.tipo_distribucion, -1) for c in costos], dtype=np.int64)
+        # variacion_max_pct=80 → factor máximo 1.8 (sin tope: infinito)
+        topes = [getattr(c, 'variacion_max_pct', None) for c in costos]
+        self.variacion_max_pct = np.array(
+            [t if t is not None and t > 0 else np.nan for t in topes], dtype=np.float64
+        )
+        self.factor_max = np.where(np.isnan(self.variacion_max_pct), np.inf, 1 + self.variacion_max_pct / 100)
+        # Matriz cuentas × tipo (one-hot) para sumar por tipo con un producto matricial
+        self._por_tipo = np.zeros((len(costos), len(TIPOS_DISTRIBUCION)), dtype=np.float64)
+        validos = self.tipos >= 0
+        self._por_tipo[np.flatnonzero(validos), self.tipos[validos]] = 1.0
+
+        montos_fijos = np.where(self.es_variable, 0.0, self.montos)
+        montos_variables = np.where(self.es_variable, self.montos, 0.0)
+        self.totales_base = self.montos @ self._por_tipo
+        self.totales_fijos = montos_fijos @ self._por_tipo
+        self.totales_variables_base = montos_variables @ self._por_tipo
+        self._montos_variables = montos_variables
+
+    def factores_base(self, volumen_base_kg, volumenes_proyectados_kg):
+        """Factor global (con límites) para cada volumen proyectado."""
+        volumenes = np.asarray(volumenes_proyectados_kg, dtype=np.float64)
+        # Sin volumen base o sin volumen proyectado el factor es 1.0
+        if not volumen_base_kg or volumen_base_kg <= 0:
+            return np.ones_like(volumenes)
+        factores = np.clip(volumenes / volumen_base_kg, self.factor_limite_min, self.factor_limite_max)
+        return np.where((volumenes == 0) | np.isnan(volumenes), 1.0, factores)
+
+    def evaluar(self, volumen_base_kg, volumenes_proyectados_kg):
+        """
+        Totales escalados para cada volumen proyectado.
+
+        Returns:
+            dict con arrays (V,): ``factor_base``, ``SP``, ``GIF``, ``DEP``,
+            ``total`` y ``total_variables_escalados``.
+        """
+        factor_base = self.factores_base(volumen_base_kg, volumenes_proyectados_kg)
+        # Factor de cada cuenta: tope propio y piso global
+        factor_efectivo = np.maximum(
+            np.minimum(factor_base[:, None], self.factor_max[None, :]), self.factor_limite_min
+        )
+        escalados = factor_efectivo * self._montos_variables[None, :]
+        por_tipo = self.totales_fijos[None, :] + escalados @ self._por_tipo
+        resultado = {'factor_base': factor_base}
+        for i, tipo in enumerate(TIPOS_DISTRIBUCION):
+            resultado[tipo] = por_tipo[:, i]
+        resultado['total'] = por_tipo.sum(axis=1)
+        resultado['total_variables_escalados'] = escalados @ self._por_tipo.sum(axis=1)
+        return resultado
+
+    def quiebres(self, volumen_base_kg):
+        """
+        Volúmenes (kg) en los que cambia la pendiente de la curva costo-volumen.
+
+        Returns:
+            lista de dicts {'volumen_kg', 'origen', 'cuenta'} ordenada por volumen.
+        """
+        if not volumen_base_kg or volumen_base_kg <= 0:
+            return []
+        puntos = [
+            {'volumen_kg': volumen_base_kg * self.factor_limite_min, 'origen': 'factor_limite_min', 'cuenta': None},
+            {'volumen_kg': volumen_base_kg * self.factor_limite_max, 'origen': 'factor_limite_max', 'cuenta': None},
+        ]
+        for i in np.flatnonzero(self.es_variable & np.isfinite(self.factor_max) & (self.tipos >= 0)):
+            tope = self.factor_max[i]
+            if self.factor_limite_min < tope < self.factor_limite_max:
+                puntos.append({'volumen_kg': volumen_base_kg * tope, 'origen': 'variacion_max_pct',
+                               'cuenta': self.cuentas[i]})
+        return sorted(puntos, key=lambda p: p['volumen_kg'])
+
+
+def calcular_costos_con_escalamiento(costos, volumen_base_kg, volumen_proyectado_kg,
+                                       factor_limite_min=0.5, factor_limite_max=3.0, matriz=None):
+    """
+    Calcula los totales de costos indirectos aplicando escalamiento a costos variables.
+    
+    Los costos FIJOS permanecen sin cambio.
+    Los costos VARIABLES escalan linealmente con el volumen: factor =
+    volumen_proyectado / volumen_base, acotado por los límites globales y,
+    hacia arriba, por el ``variacion_max_pct`` de cada cuenta.
+    
+    Args:
+        costos: Lista de objetos CostoIndirecto
+        volumen_base_kg: Kg producidos en el mes base (referencia)
+        volumen_proyectado_kg: Kg proyectados para el mes de cálculo
+        factor_limite_min: Límite inferior global del factor (default 0.5)
+        factor_limite_max: Límite superior global del factor (default 3.0)
+        matriz: MatrizEscalamiento ya construida para ``costos`` (opcional)
+    
+    Returns:
+        dict con:
+            - totales_base: {SP, GIF, DEP} montos originales
+            - totales_escalados: {SP, GIF, DEP} montos después del escalamiento
+            - total_fijos: suma de costos fijos
+            - total_variables_base: suma de costos variables antes de escalar
+            - total_variables_escalados: suma de costos variables después de escalar
+            - factor_escalamiento: factor base aplicado (antes de elasticidad)
+    """
+    if matriz is None:
+        matriz = MatrizEscalamiento(costos, factor_limite_min, factor_limite_max)
+    curva = matriz.evaluar(volumen_base_kg, [volumen_proyectado_kg or 0])
+    
+    return {
+        'totales_base': dict(zip(TIPOS_DISTRIBUCION, matriz.totales_base.tolist())),
+        'totales_escalados': {tipo: float(curva[tipo][0]) for tipo in TIPOS_DISTRIBUCION},
+        'total_fijos': float(matriz.totales_fijos.sum()),
+        'total_variables_base': float(matriz.totales_variables_base.sum()),
+        'total_variables_escalados': float(curva['total_variables_escalados'][0]),
+        'factor_escalamiento': round(float(curva['factor_base'][0]), 4),
+        'volumen_base_kg': volumen_base_kg,
+        'volumen_proyectado_kg': volumen_proyectado_kg
+    }
+
+
+class ContextoMes:
+    """Insumos de costos indirectos para un par (mes_base, mes_produccion)."""
+
+    def __init__(self, mes_base, mes_produccion):
+        self.mes_base = mes_base
+        self.mes_produccion = mes_produccion
+        año_base, mes_base_num = map(int, mes_base.split('-'))
+
+        # --- Costos indirectos del mes base ---
+        self.costos = [
+            CostoSnapshot(c.cuenta, c.tipo_distribucion, c.monto, c.es_variable, c.variacion_max_pct)
+            for c in CostoIndirecto.query.filter_by(mes_base=mes_base).all()
+        ]
+        self.totales_base = {
+            tipo: sum(c.monto for c in self.costos if c.tipo_distribucion == tipo)
+            for tipo in TIPOS_DISTRIBUCION
+        }
+        self.matriz_escalamiento = MatrizEscalamiento(self.costos)
+
+        # --- Volumen del mes base ---
+        # PRIORIDAD: ProduccionHistorica (real) si existe, si no ProduccionProgramada
+        historico_base = ProduccionHistorica.query.filter(
+            ProduccionHistorica.año == año_base,
+            ProduccionHistorica.mes == mes_base_num
+        ).all()
+        self._volumen_base_programado_kg = None
+        if historico_base:
+            self.volumen_base_kg = sum(h.cantidad_kg for h in historico_base)
+            self.origen_volumen_base = 'historico'
+        else:
+            self.volumen_base_kg = self.volumen_base_programado_kg
+            self.origen_volumen_base = 'programado'
+
+        # --- Inflación acumulada (mes_base, mes_produccion] ---
+        self.inflacion_acumulada = indice_inflacion.acumulada(mes_base, mes_produccion)
+
+        # --- Producción programada del mes por producto ---
+        self.total_kg = 0
+        self.total_minutos = 0
+        self.produccion = {}  # producto_id -> ProduccionProducto
+        for producto, batches, kg, minutos in produccion_del_mes(mes_produccion):
+            self.total_kg += kg
+            self.total_minutos += minutos
+            self.produccion[producto.id] = ProduccionProducto(ProductoCatalogo(producto), kg, minutos, batches)
+
+        self._escalamientos = {}
+        self._lock = threading.Lock()
+
+    @property
+    def volumen_base_programado_kg(self):
+        """Kg programados en el mes base (se consulta solo si se necesita)."""
+        if self._volumen_base_programado_kg is None:
+            self._volumen_base_programado_kg = kg_del_mes(self.mes_base)
+        return self._volumen_base_programado_kg
+
+    @property
+    def productos(self):
+        """{producto_id: ProductoCatalogo} de los productos con producción en el mes."""
+        return {pid: datos.producto for pid, datos in self.produccion.items()}
+
+    @property
+    def meses_diferencia(self):
+        año_base, mes_base_num = map(int, self.mes_base.split('-'))
+        año_prod, mes_prod = map(int, self.mes_produccion.split('-'))
+        return (año_prod - año_base) * 12 + (mes_prod - mes_base_num)
+
+    def escalamiento(self, volumen_proyectado_kg=None, volumen_base_kg=None):
+        """
+        Resultado de calcular_costos_con_escalamiento (memoizado por volúmenes).
+
+        Por defecto usa el volumen base del contexto y el total de kg
+        programados del mes de producción.
+        """
+        if volumen_proyectado_kg is None:
+            volumen_proyectado_kg = self.total_kg
+        if volumen_base_kg is None:
+            volumen_base_kg = self.volumen_base_kg
+        clave = (volumen_base_kg, volumen_proyectado_kg)
+        with self._lock:
+            resultado = self._escalamientos.get(clave)
+            if resultado is None:
+                resultado = calcular_costos_con_escalamiento(
+                    self.costos, volumen_base_kg, volumen_proyectado_kg, matriz=self.matriz_escalamiento
+                )
+                self._escalamientos[clave] = resultado
+        return resultado
+
+
+class CacheContextos:
+    """LRU de ContextoMes por (mes_base, mes_produccion, versiones de tablas)."""
+
+    def __init__(self, max_entradas=64):
+        self._lock = threading.RLock()
+        self._entradas = OrderedDict()
+        self._versiones = {modelo.__tablename__: 0 for modelo in _MODELOS_CONTEXTO}
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+
+    def versiones(self):
+        with self._lock:
+            return tuple(sorted(self._versiones.items()))
+
+    def incrementar_versiones(self, tablas):
+        with self._lock:
+            for tabla in tablas:
+                self._versiones[tabla] += 1
+
+    def obtener(self, mes_base, mes_produccion, session=None):
+        clave = (mes_base, mes_produccion, self.versiones())
+        with self._lock:
+            contexto = self._entradas.get(clave)
+            if contexto is not None:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return contexto
+            self.misses += 1
+
+        contexto = ContextoMes(mes_base, mes_produccion)
+
+        # No cachear contextos que ven escrituras sin confirmar de la sesión
+        session = session if session is not None else db.session
+        if session.info.get(_CLAVE_PENDIENTES):
+            return contexto
+        with self._lock:
+            self._entradas[clave] = contexto
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return contexto
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            for tabla in self._versiones:
+                self._versiones[tabla] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'contextos_cacheados': len(self._entradas),
+                'versiones': dict(self._versiones),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+cache_contextos = CacheContextos()
+
+
+def obtener_contexto(mes_base, mes_produccion):
+    """ContextoMes (compartido, solo lectura) para el par de meses."""
+    return cache_contextos.obtener(mes_base, mes_produccion)
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _anotar(session, objetos):
+    session.info.setdefault(_CLAVE_PENDIENTES, set()).update(obj.__tablename__ for obj in objetos)
+
+
+def _anotar_masivo(orm_execute_state):
+    tabla = orm_execute_state.bind_mapper.class_.__tablename__
+    orm_execute_state.session.info.setdefault(_CLAVE_PENDIENTES, set()).add(tabla)
+
+
+def _al_confirmar(session, tablas):
+    cache_contextos.incrementar_versiones(tablas)
+    logger.debug("contexto_mensual.versiones tablas=%s", ','.join(sorted(tablas)))
+
+
+def init_contexto_mensual(app=None):
+    """Registra los listeners de versionado de tablas (idempotente)."""
+    registrar_invalidacion(_CLAVE_PENDIENTES, _MODELOS_CONTEXTO, _al_confirmar,
+                           anotar=_anotar, anotar_masivo=_anotar_masivo)
@@ -0,0 +1,391 @@
+"""
+Caché en proceso del costeo variable por producto.
+
+El costo unitario de un producto solo cambia cuando cambia:
+- el ``costo_unitario`` (o nombre/unidad/categoría) de una MateriaPrima de su fórmula,
+- una fila de FormulaDetalle del producto,
+- un campo del propio Producto (peso del batch, merma, etc.).
+
+Este módulo mantiene el costeo de cada producto (``CosteoProducto``, ver
+valores_costeo.py) y lo invalida con precisión escuchando eventos de SQLAlchemy sobre esos tres
+modelos. Un índice inverso materia prima → productos permite que una edición
+de precio solo invalide los productos cuyas fórmulas usan esa materia prima.
+
+Las invalidaciones se acumulan en ``after_flush`` y se aplican en
+``after_commit`` (se descartan en rollback). Un sello de versión evita guardar
+en caché un cálculo que empezó antes de una invalidación concurrente.
+
+Los costeos que faltan se calculan sobre la matriz del snapshot del catálogo
+(``catalogo.py``), sin volver a leer fórmulas y precios de la base.
+
+Los ajustes masivos de precios no invalidan: ``propagar_cambio_precios()``
+calcula el delta de costo por producto (cantidades × variación de precio) y
+al confirmar la transacción lo aplica sobre los costeos cacheados.
+
+Nota: solo ve escrituras hechas por este proceso (la app corre con un único
+worker de gunicorn). Los scripts que escriben directo en la BD deben
+ejecutarse con la app detenida o llamar a ``cache_costeo.invalidar_todo()``.
+"""
+import logging
+import threading
+
+import numpy as np
+from sqlalchemy import inspect as sa_inspect
+
+from models import db, Categoria, MateriaPrima, Producto, FormulaDetalle
+from catalogo import matriz_costeo
+from costeo_engine import CATEGORIA_ENVASES, chunks
+from indice_uso import indice_uso
+from invalidacion import registrar_invalidacion, valores_alcanzados
+from valores_costeo import CosteoProducto
+
+logger = logging.getLogger(__name__)
+
+# Atributos de MateriaPrima que forman parte del costeo cacheado
+_ATRIBUTOS_MP = ('costo_unitario', 'nombre', 'unidad', 'categoria_id')
+
+_CLAVE_PENDIENTES = 'costeo_cache_pendientes'
+_CLAVE_DELTA = 'costeo_cache_delta_precios'
+
+
+class CacheCosteo:
+    """Costeo por producto con invalidación por dependencias."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._costeos = {}        # producto_id -> CosteoProducto
+        self._mp_por_producto = {}  # producto_id -> set(materia_prima_id)
+        self._uso_mp = {}         # materia_prima_id -> set(producto_id) (índice inverso)
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def costeos(self, productos, session=None):
+        """
+        Devuelve {producto_id: CosteoProducto} para los productos dados.
+
+        Los valores son compartidos con la caché: tratarlos como solo lectura
+        (``to_dict()`` da una copia con la estructura de get_costeo()).
+        Los productos ausentes se calculan juntos con el motor vectorizado.
+        """
+        productos = list(productos)
+        resultado = {}
+        faltantes = []
+        with self._lock:
+            version_inicial = self._version
+            for p in productos:
+                costeo = self._costeos.get(p.id)
+                if costeo is None:
+                    faltantes.append(p)
+                else:
+                    resultado[p.id] = costeo
+            self.hits += len(resultado)
+            self.misses += len(faltantes)
+
+        if not faltantes:
+            return resultado
+
+        matriz = matriz_costeo(faltantes)
+        calculado = matriz.calcular()
+        nuevos = {}
+        for p in faltantes:
+            nuevos[p.id] = (matriz.costeo_producto(p.id, calculado), matriz.materias_de(p.id))
+        resultado.update({pid: costeo for pid, (costeo, _) in nuevos.items()})
+
+        # No cachear cálculos que ven cambios sin confirmar de la sesión
+        session = session if session is not None else db.session
+        if session.info.get(_CLAVE_PENDIENTES):
+            return resultado
+
+        with self._lock:
+            if self._version != version_inicial:
+                return resultado
+            for pid, (costeo, materias) in nuevos.items():
+                self._costeos[pid] = costeo
+                self._mp_por_producto[pid] = materias
+                for mp_id in materias:
+                    self._uso_mp.setdefault(mp_id, set()).add(pid)
+        return resultado
+
+    def costeo(self, producto, session=None):
+        """Copia mutable del costeo de un producto (misma estructura que get_costeo())."""
+        return self.costeos([producto], session)[producto.id].to_dict()
+
+    def propagar_cambio_precios(self, cambios, session=None):
+        """
+        Prepara la propagación incremental de un cambio de precios.
+
+        Debe llamarse ANTES de modificar los precios en la sesión. Calcula el
+        delta de costo por batch de cada producto activo afectado como
+        Q · Δp (Q = cantidades de la fórmula, Δp = variación de precio) y lo
+        registra en la sesión: al hacer commit los costeos cacheados se
+        actualizan con el delta en lugar de invalidarse.
+
+        Args:
+            cambios: {materia_prima_id: (precio_anterior, precio_nuevo)}
+
+        Returns:
+            Lista de impacto por producto con costo_por_kg anterior y nuevo.
+        """
+        session = session if session is not None else db.session
+        delta_precio = {
+            mp_id: nuevo - anterior for mp_id, (anterior, nuevo) in cambios.items() if nuevo != anterior
+        }
+        if not delta_precio:
+            return []
+
+        producto_ids = sorted(indice_uso.productos_que_usan(delta_precio))
+        productos = []
+        for chunk in chunks(producto_ids):
+            productos.extend(Producto.query.filter(Producto.id.in_(chunk)).order_by(Producto.id).all())
+        with self._lock:
+            version = self._version
+        anteriores = self.costeos(productos, session)
+
+        # Matriz dispersa de cantidades restringida a las materias primas cambiadas
+        filas, cantidades, variaciones, envase = [], [], [], []
+        for i, p in enumerate(productos):
+            for ing in anteriores[p.id].ingredientes:
+                d = delta_precio.get(ing.materia_prima_id)
+                if d is not None:
+                    filas.append(i)
+                    cantidades.append(ing.cantidad)
+                    variaciones.append(d)
+                    envase.append(ing.categoria == CATEGORIA_ENVASES)
+        filas = np.asarray(filas, dtype=np.int64)
+        delta_linea = np.asarray(cantidades, dtype=float) * np.asarray(variaciones, dtype=float)
+        envase = np.asarray(envase, dtype=bool)
+        n = len(productos)
+        delta_mp = np.bincount(filas[~envase], weights=delta_linea[~envase], minlength=n)
+        delta_envases = np.bincount(filas[envase], weights=delta_linea[envase], minlength=n)
+
+        nuevos = {}
+        impacto = []
+        for i, p in enumerate(productos):
+            anterior = anteriores[p.id]
+            nuevo = _aplicar_delta(anterior, cambios, float(delta_mp[i]), float(delta_envases[i]))
+            nuevos[p.id] = nuevo
+            antes = anterior.costo_por_kg
+            despues = nuevo.costo_por_kg
+            impacto.append({
+                'producto_id': p.id,
+                'codigo': p.codigo,
+                'nombre': p.nombre,
+                'delta_costo_batch': float(delta_mp[i] + delta_envases[i]),
+                'costo_por_kg_anterior': antes,
+                'costo_por_kg_nuevo': despues,
+                'diferencia': despues - antes,
+            })
+
+        registro = session.info.setdefault(_CLAVE_DELTA, {'materias': set(), 'nuevos': {}, 'version': version})
+        registro['materias'].update(delta_precio)
+        registro['nuevos'].update(nuevos)
+        registro['version'] = min(registro['version'], version)
+        impacto.sort(key=lambda x: abs(x['diferencia']), reverse=True)
+        return impacto
+
+    def _aplicar_deltas(self, registro, materias_pendientes):
+        """Guarda los costeos con delta aplicado; devuelve las materias no cubiertas."""
+        materias_delta = registro['materias'] & set(materias_pendientes)
+        restantes = set(materias_pendientes) - materias_delta
+        with self._lock:
+            if self._version != registro['version']:
+                # Otra invalidación intervino: el delta partió de valores viejos
+                return set(materias_pendientes)
+            afectados = set()
+            for mp_id in materias_delta:
+                afectados.update(self._uso_mp.get(mp_id, ()))
+            # Productos cacheados sin delta calculado (p. ej. inactivos) se invalidan;
+            # el incremento de versión descarta además cálculos en curso con precios viejos
+            self.invalidar_productos(afectados - set(registro['nuevos']))
+            for pid, costeo in registro['nuevos'].items():
+                materias = costeo.materias()
+                self._costeos[pid] = costeo
+                self._mp_por_producto[pid] = materias
+                for mp_id in materias:
+                    self._uso_mp.setdefault(mp_id, set()).add(pid)
+        return restantes
+
+    def productos_que_usan(self, materia_prima_id):
+        """Productos cacheados cuyas fórmulas usan la materia prima."""
+        with self._lock:
+            return set(self._uso_mp.get(materia_prima_id, ()))
+
+    # ------------------------------------------------------------------
+    # Invalidación
+    # ------------------------------------------------------------------
+    def invalidar_productos(self, producto_ids):
+        with self._lock:
+            self._version += 1
+            for pid in producto_ids:
+                self._costeos.pop(pid, None)
+                for mp_id in self._mp_por_producto.pop(pid, ()):
+                    usos = self._uso_mp.get(mp_id)
+                    if usos is not None:
+                        usos.discard(pid)
+                        if not usos:
+                            del self._uso_mp[mp_id]
+
+    def invalidar_materias_primas(self, materia_prima_ids):
+        with self._lock:
+            afectados = set()
+            for mp_id in materia_prima_ids:
+                afectados.update(self._uso_mp.get(mp_id, ()))
+            self.invalidar_productos(afectados)
+        return afectados
+
+    def invalidar_todo(self):
+        with self._lock:
+            self._version += 1
+            self._costeos.clear()
+            self._mp_por_producto.clear()
+            self._uso_mp.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'productos_cacheados': len(self._costeos),
+                'materias_indexadas': len(self._uso_mp),
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+cache_costeo = CacheCosteo()
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _aplicar_delta(costeo, cambios, delta_mp, delta_envases):
+    """Costeo con los nuevos precios y los totales desplazados por el delta."""
+    ingredientes = []
+    totales_categoria = dict(costeo.totales_categoria)
+    for ing in costeo.ingredientes:
+        cambio = cambios.get(ing.materia_prima_id)
+        if cambio is not None:
+            ing = ing.con_precio(cambio[1])
+            cantidad, costo = totales_categoria[ing.categoria]
+            totales_categoria[ing.categoria] = (cantidad, costo + ing.cantidad * (cambio[1] - cambio[0]))
+        ingredientes.append(ing)
+
+    merma = costeo.producto.porcentaje_merma
+    total_materia_prima = costeo.total_materia_prima + delta_mp
+    total_envases = costeo.total_envases + delta_envases
+    costo_merma = total_materia_prima * (merma / 100) if merma > 0 else 0
+    materia_prima_neta = total_materia_prima + costo_merma
+    total_neto = materia_prima_neta + total_envases
+    peso_neto = costeo.peso_neto_batch_kg
+    return CosteoProducto(
+        costeo.producto,
+        tuple(ingredientes),
+        totales_categoria,
+        costeo.advertencias,
+        total_materia_prima,
+        costo_merma,
+        materia_prima_neta,
+        total_envases,
+        total_neto,
+        costeo.rendimiento,
+        peso_neto,
+        total_neto / peso_neto if peso_neto and peso_neto > 0 else 0,
+    )
+
+
+def _pendientes(session):
+    return session.info.setdefault(
+        _CLAVE_PENDIENTES, {'productos': set(), 'materias': set(), 'todo': False}
+    )
+
+
+def _valores_atributo(obj, nombre):
+    """Valores actual y anterior (si cambió) de un atributo."""
+    historia = sa_inspect(obj).attrs[nombre].history
+    valores = set(historia.added or ()) | set(historia.deleted or ()) | set(historia.unchanged or ())
+    valores.discard(None)
+    return valores
+
+
+def _anotar(session, objetos):
+    pendientes = None
+    for obj in objetos:
+        if isinstance(obj, FormulaDetalle):
+            pendientes = pendientes or _pendientes(session)
+            pendientes['productos'].update(_valores_atributo(obj, 'producto_id'))
+        elif isinstance(obj, MateriaPrima):
+            if obj in session.new:
+                continue
+            estado = sa_inspect(obj)
+            if obj in session.deleted or any(estado.attrs[a].history.has_changes() for a in _ATRIBUTOS_MP):
+                pendientes = pendientes or _pendientes(session)
+                pendientes['materias'].add(obj.id)
+        elif isinstance(obj, Producto):
+            if obj in session.new:
+                continue
+            if obj in session.deleted or session.is_modified(obj, include_collections=False):
+                pendientes = pendientes or _pendientes(session)
+                pendientes['productos'].add(obj.id)
+        elif isinstance(obj, Categoria):
+            if obj not in session.new:
+                pendientes = pendientes or _pendientes(session)
+                pendientes['todo'] = True
+
+
+def _anotar_masivo(orm_execute_state):
+    pendientes = _pendientes(orm_execute_state.session)
+    if orm_execute_state.is_delete and orm_execute_state.bind_mapper.class_ is FormulaDetalle:
+        # save_formula borra la fórmula de un producto con Query.delete(): solo ese producto
+        alcanzados = valores_alcanzados(orm_execute_state, FormulaDetalle.producto_id)
+        if alcanzados is not None:
+            pendientes['productos'].update(alcanzados)
+            return
+    # UPDATE masivos (pueden mover líneas o cambiar precios/categorías) y DELETE sin WHERE
+    pendientes['todo'] = True
+
+
+def _al_confirmar(session, pendientes):
+    if pendientes['todo']:
+        cache_costeo.invalidar_todo()
+        logger.debug("costeo_cache.invalidar_todo")
+        return
+    materias = pendientes['materias']
+    delta = session.info.get(_CLAVE_DELTA)
+    if delta and materias:
+        materias = cache_costeo._aplicar_deltas(delta, materias)
+        logger.debug(
+            "costeo_cache.delta_precios materias=%s productos=%s",
+            len(pendientes['materias']) - len(materias),
+            len(delta['nuevos']),
+        )
+    afectados = set()
+    if materias:
+        afectados = cache_costeo.invalidar_materias_primas(materias)
+    if pendientes['productos']:
+        cache_costeo.invalidar_productos(pendientes['productos'])
+    logger.debug(
+        "costeo_cache.invalidar materias=%s productos=%s afectados_por_mp=%s",
+        len(materias),
+        len(pendientes['productos']),
+        len(afectados),
+    )
+
+
+def init_costeo_cache(app=None):
+    """Registra los listeners de invalidación (idempotente)."""
+    registrar_invalidacion(
+        _CLAVE_PENDIENTES,
+        (FormulaDetalle, MateriaPrima, Producto, Categoria),
+        _al_confirmar,
+        anotar=_anotar,
+        anotar_masivo=_anotar_masivo,
+        # Deltas de precio de ajustar-precios: se aplican al confirmar y se descartan
+        descartar=(_CLAVE_DELTA,),
+    )
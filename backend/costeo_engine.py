@@ -0,0 +1,485 @@
+"""
+Motor de costeo vectorizado.
+
+Carga la estructura de fórmulas (BOM) completa una sola vez y la representa
+como una matriz dispersa producto × materia prima (formato CSR), junto con el
+vector de precios y la máscara de categorías de las materias primas.
+
+Con esa representación los totales de costeo de todos los productos
+(total_materia_prima, costo_merma, total_envases, total_neto, costo_por_kg)
+se obtienen con unas pocas operaciones NumPy, en lugar de llamar a
+``Producto.get_costeo()`` dentro de un loop (que dispara varias consultas
+lazy por ingrediente).
+
+Los resultados son idénticos a ``Producto.get_costeo()``: las líneas de cada
+producto se acumulan en el mismo orden (id de FormulaDetalle) y con las mismas
+operaciones aritméticas.
+"""
+import copy
+
+import numpy as np
+
+from models import db, Categoria, MateriaPrima, Producto, FormulaDetalle
+from valores_costeo import ProductoCatalogo, LineaIngrediente, CosteoProducto
+
+CATEGORIA_ENVASES = 'ENVASES'
+
+# Límite de parámetros por cláusula IN (SQLite antiguo admite 999)
+_IN_CHUNK = 500
+
+
+def chunks(valores, size=_IN_CHUNK):
+    """Parte valores en tramos de a lo sumo size elementos, para cláusulas IN."""
+    for i in range(0, len(valores), size):
+        yield valores[i:i + size]
+
+
+class MatrizCosteo:
+    """
+    BOM de un conjunto de productos en formato CSR.
+
+    Filas = productos (en el orden recibido), columnas = materias primas.
+    Para el producto en la fila ``f`` sus líneas de fórmula ocupan
+    ``indptr[f]:indptr[f + 1]`` en ``indices`` (columna de la MP),
+    ``cantidades`` y ``detalle_ids``.
+    """
+
+    def __init__(self, productos, materias, detalles):
+        """
+        Args:
+            productos: lista de objetos Producto (define el orden de filas)
+            materias: iterable de tuplas (id, nombre, unidad, costo_unitario, categoria)
+            detalles: iterable de tuplas (id, producto_id, materia_prima_id, cantidad)
+                      ordenadas por (producto_id, id)
+        """
+        self.productos = list({p.id: p for p in productos}.values())
+        self.fila_por_producto = {p.id: i for i, p in enumerate(self.productos)}
+
+        # --- Columnas: materias primas ---
+        materias = list(materias)
+        self.mp_ids = np.array([m[0] for m in materias], dtype=np.int64)
+        self.columna_por_mp = {int(mp_id): j for j, mp_id in enumerate(self.mp_ids)}
+        self.mp_nombres = [m[1] for m in materias]
+        self.mp_unidades = [m[2] for m in materias]
+        self.precios = np.array([m[3] for m in materias], dtype=np.float64)
+
+        self.categorias = []
+        codigo_por_categoria = {}
+        codigos = []
+        for m in materias:
+            if m[4] not in codigo_por_categoria:
+                codigo_por_categoria[m[4]] = len(self.categorias)
+                self.categorias.append(m[4])
+            codigos.append(codigo_por_categoria[m[4]])
+        self.codigo_por_categoria = codigo_por_categoria
+        self.mp_categoria = np.array(codigos, dtype=np.int64)
+        self.es_envase = np.array(
+            [m[4] == CATEGORIA_ENVASES for m in materias], dtype=bool
+        )
+
+        # --- Líneas de fórmula (CSR) ---
+        conteo = np.zeros(len(self.productos), dtype=np.int64)
+        filas, indices, cantidades, detalle_ids = [], [], [], []
+        for det_id, producto_id, mp_id, cantidad in detalles:
+            fila = self.fila_por_producto.get(producto_id)
+            col = self.columna_por_mp.get(mp_id)
+            if fila is None or col is None:
+                continue
+            filas.append(fila)
+            indices.append(col)
+            cantidades.append(cantidad)
+            detalle_ids.append(det_id)
+            conteo[fila] += 1
+
+        # Orden estable por fila para preservar el orden por id dentro de cada producto
+        filas = np.array(filas, dtype=np.int64)
+        orden = np.argsort(filas, kind='stable')
+        self.filas = filas[orden]
+        self.indices = np.array(indices, dtype=np.int64)[orden]
+        self.cantidades = np.array(cantidades, dtype=np.float64)[orden]
+        self.detalle_ids = np.array(detalle_ids, dtype=np.int64)[orden]
+        self.indptr = np.concatenate(([0], np.cumsum(conteo)))
+
+        # --- Parámetros de producto ---
+        self.peso_batch_kg = np.array(
+            [p.peso_batch_kg or 0 for p in self.productos], dtype=np.float64
+        )
+        self.porcentaje_merma = np.array(
+            [p.porcentaje_merma or 0 for p in self.productos], dtype=np.float64
+        )
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+    @classmethod
+    def desde_db(cls, productos=None):
+        """
+        Construye la matriz leyendo la base de datos en tres consultas.
+
+        Args:
+            productos: lista de Producto a costear. Si es None se usan todos
+                       los productos activos.
+        """
+        if productos is None:
+            productos = Producto.query.filter_by(activo=True).all()
+            detalles_query = (
+                db.session.query(
+                    FormulaDetalle.id,
+                    FormulaDetalle.producto_id,
+                    FormulaDetalle.materia_prima_id,
+                    FormulaDetalle.cantidad,
+                )
+                .join(Producto, Producto.id == FormulaDetalle.producto_id)
+                .filter(Producto.activo == True)  # noqa: E712
+                .order_by(FormulaDetalle.producto_id, FormulaDetalle.id)
+            )
+            detalles = detalles_query.all()
+        else:
+            productos = list(productos)
+            ids = sorted({p.id for p in productos})
+            detalles = []
+            for chunk in chunks(ids):
+                detalles.extend(
+                    db.session.query(
+                        FormulaDetalle.id,
+                        FormulaDetalle.producto_id,
+                        FormulaDetalle.materia_prima_id,
+                        FormulaDetalle.cantidad,
+                    )
+                    .filter(FormulaDetalle.producto_id.in_(chunk))
+                    .order_by(FormulaDetalle.producto_id, FormulaDetalle.id)
+                    .all()
+                )
+
+        materias = (
+            db.session.query(
+                MateriaPrima.id,
+                MateriaPrima.nombre,
+                MateriaPrima.unidad,
+                MateriaPrima.costo_unitario,
+                Categoria.nombre,
+            )
+            .join(Categoria, Categoria.id == MateriaPrima.categoria_id)
+            .order_by(MateriaPrima.id)
+            .all()
+        )
+        return cls(productos, materias, detalles)
+
+    # ------------------------------------------------------------------
+    # Cálculo vectorizado
+    # ------------------------------------------------------------------
+    def factor_por_materia_prima(self, factores):
+        """Vector (M,) de factores de precio a partir de {materia_prima_id: factor}."""
+        factor = np.ones(len(self.mp_ids), dtype=np.float64)
+        for mp_id, valor in factores.items():
+            col = self.columna_por_mp.get(mp_id)
+            if col is not None:
+                factor[col] = valor
+        return factor
+
+    def factor_por_categoria(self, factores):
+        """Vector (M,) de factores de precio a partir de {nombre_categoria: factor}."""
+        factor = np.ones(len(self.mp_ids), dtype=np.float64)
+        for nombre, valor in factores.items():
+            codigo = self.codigo_por_categoria.get(nombre)
+            if codigo is not None:
+                factor[self.mp_categoria == codigo] = valor
+        return factor
+
+    def con_precios(self, precios):
+        """Copia liviana de la matriz con otro vector (M,) de costos unitarios."""
+        copia = copy.copy(self)
+        copia.precios = np.asarray(precios, dtype=np.float64)
+        return copia
+
+    def con_formulas(self, formulas):
+        """
+        Copia con las fórmulas de algunos productos reemplazadas.
+
+        Args:
+            formulas: {producto_id: [(materia_prima_id, cantidad), ...]}; las
+                      líneas nuevas llevan detalle_id 0 y se ignoran las
+                      materias primas o productos que no están en la matriz.
+        """
+        reemplazos = {
+            self.fila_por_producto[pid]: lineas
+            for pid, lineas in formulas.items() if pid in self.fila_por_producto
+        }
+        copia = copy.copy(self)
+        if not reemplazos:
+            return copia
+        conservar = ~np.isin(self.filas, list(reemplazos))
+        filas, indices, cantidades = [], [], []
+        for fila, lineas in reemplazos.items():
+            for mp_id, cantidad in lineas:
+                col = self.columna_por_mp.get(mp_id)
+                if col is not None:
+                    filas.append(fila)
+                    indices.append(col)
+                    cantidades.append(cantidad)
+        filas = np.concatenate([self.filas[conservar], np.array(filas, dtype=np.int64)])
+        orden = np.argsort(filas, kind='stable')
+        copia.filas = filas[orden]
+        copia.indices = np.concatenate([self.indices[conservar], np.array(indices, dtype=np.int64)])[orden]
+        copia.cantidades = np.concatenate(
+            [self.cantidades[conservar], np.array(cantidades, dtype=np.float64)]
+        )[orden]
+        copia.detalle_ids = np.concatenate(
+            [self.detalle_ids[conservar], np.zeros(len(indices), dtype=np.int64)]
+        )[orden]
+        copia.indptr = np.concatenate(([0], np.cumsum(np.bincount(copia.filas, minlength=len(self.productos)))))
+        return copia
+
+    def con_productos(self, productos, formulas):
+        """
+        Matriz con las mismas columnas (materias primas y precios) y otras filas.
+
+        Permite costear fórmulas que no están guardadas reutilizando las
+        columnas de una matriz ya construida, sin consultar la base de datos.
+
+        Args:
+            productos: objetos con id, peso_batch_kg, porcentaje_merma y to_dict()
+            formulas: {producto_id: [(materia_prima_id, cantidad), ...]}; las
+                      materias primas que no están en la matriz se ignoran.
+        """
+        copia = copy.copy(self)
+        copia.productos = list({p.id: p for p in productos}.values())
+        copia.fila_por_producto = {p.id: i for i, p in enumerate(copia.productos)}
+        filas, indices, cantidades = [], [], []
+        for fila, producto in enumerate(copia.productos):
+            for mp_id, cantidad in formulas.get(producto.id, ()):
+                col = self.columna_por_mp.get(mp_id)
+                if col is not None:
+                    filas.append(fila)
+                    indices.append(col)
+                    cantidades.append(cantidad)
+        copia.filas = np.array(filas, dtype=np.int64)
+        copia.indices = np.array(indices, dtype=np.int64)
+        copia.cantidades = np.array(cantidades, dtype=np.float64)
+        copia.detalle_ids = np.zeros(len(indices), dtype=np.int64)
+        copia.indptr = np.concatenate(([0], np.cumsum(np.bincount(copia.filas, minlength=len(copia.productos)))))
+        copia.peso_batch_kg = np.array([p.peso_batch_kg or 0 for p in copia.productos], dtype=np.float64)
+        copia.porcentaje_merma = np.array([p.porcentaje_merma or 0 for p in copia.productos], dtype=np.float64)
+        return copia
+
+    def costos_linea(self, factor_mp=None):
+        """
+        Costo de cada línea de fórmula (cantidad × costo_unitario).
+
+        Args:
+            factor_mp: vector opcional (M,) que multiplica el costo de cada
+                       línea según su materia prima (escenarios de precio).
+        """
+        costos = self.cantidades * self.precios[self.indices]
+        if factor_mp is not None:
+            costos = costos * np.asarray(factor_mp, dtype=np.float64)[self.indices]
+        return costos
+
+    def calcular(self, factor_mp=None):
+        """
+        Calcula el resumen de costeo de todos los productos.
+
+        Returns:
+            dict de arrays (P,) con las mismas claves que ``resumen`` en
+            ``Producto.get_costeo()`` más ``num_ingredientes`` y
+            ``tiene_advertencias``.
+        """
+        n = len(self.productos)
+        costos = self.costos_linea(factor_mp)
+        envase_linea = self.es_envase[self.indices]
+
+        total_materia_prima = np.bincount(
+            self.filas, weights=np.where(envase_linea, 0.0, costos), minlength=n
+        )
+        total_envases = np.bincount(
+            self.filas, weights=np.where(envase_linea, costos, 0.0), minlength=n
+        )
+        merma = self.porcentaje_merma
+        costo_merma = np.where(merma > 0, total_materia_prima * (merma / 100), 0.0)
+        materia_prima_neta = total_materia_prima + costo_merma
+        total_neto = materia_prima_neta + total_envases
+
+        rendimiento = 100 - merma
+        peso_neto_batch_kg = self.peso_batch_kg * (rendimiento / 100)
+        peso_valido = peso_neto_batch_kg > 0
+        costo_por_kg = np.divide(
+            total_neto, peso_neto_batch_kg,
+            out=np.zeros(n, dtype=np.float64), where=peso_valido,
+        )
+
+        num_ingredientes = np.diff(self.indptr)
+        tiene_advertencias = ~peso_valido | ((total_materia_prima == 0) & (num_ingredientes == 0))
+
+        return {
+            'total_materia_prima': total_materia_prima,
+            'costo_merma': costo_merma,
+            'materia_prima_neta': materia_prima_neta,
+            'total_envases': total_envases,
+            'total_neto': total_neto,
+            'peso_batch_kg': self.peso_batch_kg,
+            'porcentaje_merma': merma,
+            'rendimiento': rendimiento,
+            'peso_neto_batch_kg': peso_neto_batch_kg,
+            'costo_por_kg': costo_por_kg,
+            'num_ingredientes': num_ingredientes,
+            'tiene_advertencias': tiene_advertencias,
+        }
+
+    def sensibilidad_lineas(self):
+        """
+        Derivada de ``costo_por_kg`` respecto del costo unitario de la MP de
+        cada línea de fórmula: cantidad × (1 + merma/100 si la línea no es de
+        ENVASES y hay merma) / peso_neto_batch_kg. Es 0 si el peso neto no es
+        positivo, igual que ``calcular()``.
+
+        No depende de los precios.
+        """
+        merma = self.porcentaje_merma
+        recargo_merma = np.where(merma > 0, 1 + merma / 100, 1.0)
+        peso_neto_batch_kg = self.peso_batch_kg * ((100 - merma) / 100)
+        inverso_peso = np.divide(
+            1.0, peso_neto_batch_kg,
+            out=np.zeros(len(self.productos), dtype=np.float64), where=peso_neto_batch_kg > 0,
+        )
+        recargo = np.where(self.es_envase[self.indices], 1.0, recargo_merma[self.filas])
+        return self.cantidades * recargo * inverso_peso[self.filas]
+
+    def totales_por_categoria(self, factor_mp=None):
+        """
+        Matrices (P, C) de cantidad y costo por producto y categoría.
+
+        Returns:
+            (cantidades, costos, presentes) donde ``presentes`` indica si el
+            producto tiene al menos una línea de esa categoría.
+        """
+        n, c = len(self.productos), len(self.categorias)
+        clave = self.filas * c + self.mp_categoria[self.indices]
+        costos = self.costos_linea(factor_mp)
+        forma = (n, c)
+        cantidades = np.bincount(clave, weights=self.cantidades, minlength=n * c).reshape(forma)
+        costos_cat = np.bincount(clave, weights=costos, minlength=n * c).reshape(forma)
+        presentes = np.bincount(clave, minlength=n * c).reshape(forma) > 0
+        return cantidades, costos_cat, presentes
+
+    def requerimientos(self, batches_por_producto):
+        """
+        Requerimientos de materia prima para una lista de producciones.
+
+        Args:
+            batches_por_producto: lista de tuplas (producto_id, cantidad_batches)
+                                  en el orden en que se deben acumular.
+
+        Returns:
+            (columnas, cantidad_total, costo_total) con las columnas de MP en
+            orden de primera aparición.
+        """
+        tramos, multiplicadores = [], []
+        for producto_id, batches in batches_por_producto:
+            fila = self.fila_por_producto.get(producto_id)
+            if fila is None:
+                continue
+            inicio, fin = self.indptr[fila], self.indptr[fila + 1]
+            if fin > inicio:
+                tramos.append(np.arange(inicio, fin))
+                multiplicadores.append(np.full(fin - inicio, batches, dtype=np.float64))
+
+        m = len(self.mp_ids)
+        if not tramos:
+            vacio = np.zeros(0, dtype=np.int64)
+            return vacio, np.zeros(0), np.zeros(0)
+
+        lineas = np.concatenate(tramos)
+        batches = np.concatenate(multiplicadores)
+        cols = self.indices[lineas]
+        costos = self.costos_linea()[lineas]
+
+        cantidad_total = np.bincount(cols, weights=self.cantidades[lineas] * batches, minlength=m)
+        costo_total = np.bincount(cols, weights=costos * batches, minlength=m)
+
+        usadas, primera = np.unique(cols, return_index=True)
+        columnas = usadas[np.argsort(primera, kind='stable')]
+        return columnas, cantidad_total[columnas], costo_total[columnas]
+
+    def materias_de(self, producto_id):
+        """Ids de las materias primas usadas en la fórmula de un producto."""
+        fila = self.fila_por_producto[producto_id]
+        cols = self.indices[self.indptr[fila]:self.indptr[fila + 1]]
+        return {int(mp_id) for mp_id in self.mp_ids[cols]}
+
+    # ------------------------------------------------------------------
+    # Vistas compatibles con Producto.get_costeo()
+    # ------------------------------------------------------------------
+    def costeo_producto(self, producto_id, resultado=None):
+        """CosteoProducto de un producto (``resultado`` de ``calcular()`` opcional)."""
+        fila = self.fila_por_producto[producto_id]
+        producto = ProductoCatalogo.de(self.productos[fila])
+        if resultado is None:
+            resultado = self.calcular()
+
+        inicio, fin = self.indptr[fila], self.indptr[fila + 1]
+        ingredientes = []
+        totales_categoria = {}
+        for detalle_id, col, cantidad in zip(
+            self.detalle_ids[inicio:fin].tolist(), self.indices[inicio:fin].tolist(),
+            self.cantidades[inicio:fin].tolist(),
+        ):
+            categoria = self.categorias[self.mp_categoria[col]]
+            linea = LineaIngrediente(
+                detalle_id, int(self.mp_ids[col]), self.mp_nombres[col], categoria,
+                self.mp_unidades[col], float(self.precios[col]), cantidad,
+            )
+            ingredientes.append(linea)
+            total = totales_categoria.setdefault(categoria, [0, 0])
+            total[0] += cantidad
+            total[1] += linea.costo_total
+
+        advertencias = []
+        if not resultado['peso_neto_batch_kg'][fila] > 0:
+            if producto.peso_batch_kg and producto.peso_batch_kg > 0:
+                advertencias.append(f'El rendimiento es 0% o negativo (merma = {producto.porcentaje_merma}%)')
+            else:
+                advertencias.append('El peso del batch es 0 o no está definido')
+        if resultado['total_materia_prima'][fila] == 0 and len(ingredientes) == 0:
+            advertencias.append('Este producto no tiene fórmula definida')
+
+        return CosteoProducto(
+            producto,
+            tuple(ingredientes),
+            {categoria: tuple(total) for categoria, total in totales_categoria.items()},
+            tuple(advertencias) if advertencias else None,
+            float(resultado['total_materia_prima'][fila]),
+            float(resultado['costo_merma'][fila]),
+            float(resultado['materia_prima_neta'][fila]),
+            float(resultado['total_envases'][fila]),
+            float(resultado['total_neto'][fila]),
+            float(resultado['rendimiento'][fila]),
+            float(resultado['peso_neto_batch_kg'][fila]),
+            float(resultado['costo_por_kg'][fila]),
+        )
+
+    def costeo(self, producto_id, resultado=None):
+        """
+        Devuelve el costeo de un producto con la misma estructura que
+        ``Producto.get_costeo()``.
+        """
+        return self.costeo_producto(producto_id, resultado).to_dict()
+
+    def totales_categoria(self, producto_id, totales=None):
+        """
+        Bloque ``totales_categoria`` de ``get_costeo()`` para un producto,
+        tomado de las matrices de ``totales_por_categoria()``.
+        """
+        if totales is None:
+            totales = self.totales_por_categoria()
+        cantidades, costos, _ = totales
+        fila = self.fila_por_producto[producto_id]
+        codigos = dict.fromkeys(
+            int(c) for c in self.mp_categoria[self.indices[self.indptr[fila]:self.indptr[fila + 1]]]
+        )
+        return {
+            self.categorias[c]: {
+                'cantidad': float(cantidades[fila, c]),
+                'costo': float(costos[fila, c]),
+            }
+            for c in codigos
+        }
@@ -0,0 +1,113 @@
+"""
+Vista previa del impacto de un cambio de precios de materias primas.
+
+Calcula en memoria, sin escribir en la base de datos, lo que produciría un
+ajuste de precios:
+
+- costo_por_kg anterior y nuevo de cada producto activo afectado (y su margen
+  de contribución sobre el precio de venta);
+- costo y totales por categoría del plan de producción de un mes, con la
+  misma definición que ``/api/resumen-mensual`` (batches × total_neto y
+  batches × costo por categoría).
+
+Los productos afectados salen del índice de uso (``indice_uso``) y la matriz
+de costeo es la del snapshot del catálogo (``catalogo.py``); el costeo
+anterior y el nuevo son dos pasadas del motor vectorizado sobre la misma
+matriz con distinto vector de precios.
+"""
+import numpy as np
+
+from models import Producto
+from catalogo import matriz_costeo
+from costeo_engine import chunks
+from indice_uso import indice_uso
+from produccion_mensual import produccion_del_mes
+
+
+def _margen_pct(precio_venta, costo_por_kg):
+    if not precio_venta:
+        return None
+    return (precio_venta - costo_por_kg) / precio_venta * 100
+
+
+def previsualizar_cambio_precios(precios_nuevos, mes):
+    """
+    Args:
+        precios_nuevos: {materia_prima_id: costo_unitario nuevo}
+        mes: mes del plan de producción (YYYY-MM)
+
+    Returns:
+        dict con ``impacto_productos`` (ordenado por |diferencia| de
+        costo_por_kg), ``plan`` y ``totales_categoria`` del plan.
+    """
+    afectados = indice_uso.productos_que_usan(list(precios_nuevos))
+    plan = produccion_del_mes(mes)
+    batches_plan = {producto.id: batches for producto, batches, _, _ in plan}
+
+    productos = {producto.id: producto for producto, _, _, _ in plan}
+    faltantes = sorted(afectados - set(productos))
+    for chunk in chunks(faltantes):
+        productos.update((p.id, p) for p in Producto.query.filter(Producto.id.in_(chunk)).all())
+
+    matriz = matriz_costeo([productos[pid] for pid in sorted(productos)])
+    precios = matriz.precios.copy()
+    for mp_id, precio in precios_nuevos.items():
+        col = matriz.columna_por_mp.get(mp_id)
+        if col is not None:
+            precios[col] = precio
+    nueva = matriz.con_precios(precios)
+    anterior, nuevo = matriz.calcular(), nueva.calcular()
+    _, costos_cat_anterior, presentes = matriz.totales_por_categoria()
+    _, costos_cat_nuevo, _ = nueva.totales_por_categoria()
+
+    # --- Productos afectados ---
+    impacto = []
+    for pid in sorted(afectados):
+        fila = matriz.fila_por_producto[pid]
+        producto = matriz.productos[fila]
+        antes = float(anterior['costo_por_kg'][fila])
+        despues = float(nuevo['costo_por_kg'][fila])
+        impacto.append({
+            'producto_id': pid,
+            'codigo': producto.codigo,
+            'nombre': producto.nombre,
+            'delta_costo_batch': float(nuevo['total_neto'][fila] - anterior['total_neto'][fila]),
+            'costo_por_kg_anterior': antes,
+            'costo_por_kg_nuevo': despues,
+            'diferencia': despues - antes,
+            'variacion_pct': (despues - antes) / antes * 100 if antes else 0,
+            'margen_contribucion_pct_anterior': _margen_pct(producto.precio_venta, antes),
+            'margen_contribucion_pct_nuevo': _margen_pct(producto.precio_venta, despues),
+        })
+    impacto.sort(key=lambda x: abs(x['diferencia']), reverse=True)
+
+    # --- Plan del mes ---
+    batches = np.zeros(len(matriz.productos), dtype=np.float64)
+    for pid, cantidad in batches_plan.items():
+        batches[matriz.fila_por_producto[pid]] = cantidad
+    costo_anterior = float(batches @ anterior['total_neto'])
+    costo_nuevo = float(batches @ nuevo['total_neto'])
+    por_categoria_anterior = batches @ costos_cat_anterior
+    por_categoria_nuevo = batches @ costos_cat_nuevo
+    en_plan = presentes[batches > 0].any(axis=0)
+
+    return {
+        'impacto_productos': impacto,
+        'plan': {
+            'mes': mes,
+            'productos': len(batches_plan),
+            'costo_total_anterior': costo_anterior,
+            'costo_total_nuevo': costo_nuevo,
+            'diferencia': costo_nuevo - costo_anterior,
+            'variacion_pct': (costo_nuevo - costo_anterior) / costo_anterior * 100 if costo_anterior else 0,
+        },
+        'totales_categoria': {
+            categoria: {
+                'anterior': float(por_categoria_anterior[c]),
+                'nuevo': float(por_categoria_nuevo[c]),
+                'diferencia': float(por_categoria_nuevo[c] - por_categoria_anterior[c]),
+            }
+            for c, categoria in enumerate(matriz.categorias)
+            if en_plan[c]
+        },
+    }
@@ -0,0 +1,111 @@
+"""
+Índice acumulado de inflación mensual sobre InflacionMensual.
+
+La inflación acumulada entre dos meses es el producto de ``1 + porcentaje/100``
+de los meses en el intervalo ``(mes_desde, mes_hasta]``. El índice guarda los
+meses cargados ordenados junto con el producto prefijo de esos factores, de
+modo que cualquier consulta es el cociente de dos prefijos:
+
+    factor(desde, hasta) = prefijo[pos(hasta)] / prefijo[pos(desde)]
+
+donde ``pos(m)`` es la cantidad de meses cargados ``<= m``. Los meses sin fila
+no aportan inflación (factor 1), igual que el cálculo con consultas por rango.
+
+El índice se construye con una consulta la primera vez que se usa y se
+descarta cuando se confirma una transacción que crea, edita o borra filas de
+InflacionMensual.
+"""
+import logging
+import threading
+from bisect import bisect_right
+
+import numpy as np
+from models import db, InflacionMensual
+from invalidacion import registrar_invalidacion
+
+logger = logging.getLogger(__name__)
+
+_CLAVE_CAMBIOS = 'indice_inflacion_cambios'
+
+
+class IndiceInflacion:
+    """Producto prefijo de factores de inflación mensual."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._datos = None
+
+    def _asegurar(self):
+        with self._lock:
+            if self._datos is not None:
+                return self._datos
+            filas = (
+                db.session.query(InflacionMensual.mes, InflacionMensual.porcentaje)
+                .order_by(InflacionMensual.mes)
+                .all()
+            )
+            meses = [mes for mes, _ in filas]
+            factores = np.array([1 + porcentaje / 100 for _, porcentaje in filas], dtype=np.float64)
+            # Un factor 0 (-100 %) anularía el cociente de prefijos: se cuenta
+            # aparte y el prefijo lo trata como neutro.
+            es_cero = factores == 0
+            prefijo = np.ones(len(meses) + 1, dtype=np.float64)
+            prefijo[1:] = np.cumprod(np.where(es_cero, 1.0, factores))
+            ceros = np.zeros(len(meses) + 1, dtype=np.int64)
+            ceros[1:] = np.cumsum(es_cero)
+            datos = {
+                'meses': meses,
+                'meses_np': np.array(meses, dtype='<U7'),
+                'prefijo': prefijo,
+                'ceros': ceros,
+            }
+            # Con cambios sin confirmar en la sesión el índice se usa pero no se guarda
+            if not db.session.info.get(_CLAVE_CAMBIOS):
+                self._datos = datos
+            logger.debug("indice_inflacion.construir meses=%s", len(meses))
+            return datos
+
+    def invalidar(self):
+        with self._lock:
+            self._datos = None
+
+    def acumulada(self, mes_desde, mes_hasta):
+        """
+        Factor de inflación acumulada entre ``mes_desde`` (excluido) y
+        ``mes_hasta`` (incluido), ambos YYYY-MM. Devuelve 1.0 si el
+        intervalo está vacío.
+        """
+        datos = self._asegurar()
+        i = bisect_right(datos['meses'], mes_desde)
+        j = bisect_right(datos['meses'], mes_hasta)
+        if j <= i:
+            return 1.0
+        if datos['ceros'][j] > datos['ceros'][i]:
+            return 0.0
+        return float(datos['prefijo'][j] / datos['prefijo'][i])
+
+    def acumulada_rango(self, mes_desde, meses_hasta):
+        """
+        Inflación acumulada desde ``mes_desde`` hasta cada mes de ``meses_hasta``.
+
+        Returns:
+            array (len(meses_hasta),) de factores.
+        """
+        datos = self._asegurar()
+        i = bisect_right(datos['meses'], mes_desde)
+        j = np.searchsorted(datos['meses_np'], np.array(meses_hasta, dtype='<U7'), side='right')
+        factores = datos['prefijo'][j] / datos['prefijo'][i]
+        factores[datos['ceros'][j] > datos['ceros'][i]] = 0.0
+        factores[j <= i] = 1.0
+        return factores
+
+
+indice_inflacion = IndiceInflacion()
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def init_indice_inflacion(app=None):
+    """Registra los listeners que descartan el índice (idempotente)."""
+    registrar_invalidacion(_CLAVE_CAMBIOS, (InflacionMensual,), lambda session, anotado: indice_inflacion.invalidar())
@@ -0,0 +1,246 @@
+"""
+Índice temporal de precios de materias primas sobre HistorialPrecios.
+
+Cada fila del historial cierra el intervalo del precio anterior y abre uno
+nuevo. Para cada materia prima el índice guarda esos cambios ordenados por
+fecha, de modo que el precio vigente en un instante es:
+
+- el ``precio_nuevo`` del último cambio con ``fecha_cambio <= instante``;
+- si el instante es anterior al primer cambio, el ``precio_anterior`` de ese
+  primer cambio;
+- si la materia prima no tiene historial, su ``costo_unitario`` actual.
+
+El índice se construye en bloque (una consulta) la primera vez que se usa y
+luego se mantiene incrementalmente: las filas nuevas de HistorialPrecios se
+insertan al confirmarse la transacción. Las consultas resuelven todas las
+materias primas y fechas en una sola pasada de ``np.searchsorted``.
+
+Solo los precios son históricos: la fórmula y los parámetros del producto
+(peso del batch, merma) son los vigentes.
+"""
+import bisect
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from models import db, HistorialPrecios
+from costeo_engine import MatrizCosteo
+from invalidacion import registrar_invalidacion
+
+logger = logging.getLogger(__name__)
+
+_CLAVE_NUEVOS = 'indice_precios_nuevos'
+
+
+class IndicePrecios:
+    """Intervalos de vigencia de precios por materia prima."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._series = None      # materia_prima_id -> lista ordenada de (fecha, id, anterior, nuevo)
+        self._empaquetado = None  # arrays NumPy derivados de _series (se regeneran tras cambios)
+
+    # ------------------------------------------------------------------
+    # Construcción y mantenimiento
+    # ------------------------------------------------------------------
+    def _asegurar_series(self):
+        if self._series is not None:
+            return self._series
+        filas = (
+            db.session.query(
+                HistorialPrecios.materia_prima_id,
+                HistorialPrecios.fecha_cambio,
+                HistorialPrecios.id,
+                HistorialPrecios.precio_anterior,
+                HistorialPrecios.precio_nuevo,
+            )
+            .order_by(HistorialPrecios.materia_prima_id, HistorialPrecios.fecha_cambio, HistorialPrecios.id)
+            .all()
+        )
+        series = {}
+        for mp_id, fecha, hid, anterior, nuevo in filas:
+            series.setdefault(mp_id, []).append((fecha, hid, anterior, nuevo))
+        self._series = series
+        self._empaquetado = None
+        logger.debug("indice_precios.construir filas=%s materias=%s", len(filas), len(series))
+        return series
+
+    def agregar(self, filas):
+        """
+        Inserta cambios nuevos en el índice.
+
+        Args:
+            filas: iterable de tuplas (materia_prima_id, fecha_cambio, id,
+                   precio_anterior, precio_nuevo)
+        """
+        with self._lock:
+            if self._series is None:
+                return  # se construirá completo en la próxima consulta
+            for mp_id, fecha, hid, anterior, nuevo in filas:
+                bisect.insort(self._series.setdefault(mp_id, []), (fecha, hid, anterior, nuevo))
+            self._empaquetado = None
+
+    def invalidar(self):
+        with self._lock:
+            self._series = None
+            self._empaquetado = None
+
+    def _empaquetar(self):
+        """Arrays planos ordenados por (materia prima, fecha, id)."""
+        if self._empaquetado is not None:
+            return self._empaquetado
+        series = self._asegurar_series()
+        mp_orden = np.array(sorted(series), dtype=np.int64)
+        largos = [len(series[int(mp_id)]) for mp_id in mp_orden]
+        ptr = np.zeros(len(mp_orden) + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum(largos)
+        fechas, anteriores, nuevos = [], [], []
+        for mp_id in mp_orden:
+            for fecha, _, anterior, nuevo in series[int(mp_id)]:
+                fechas.append(fecha)
+                anteriores.append(anterior)
+                nuevos.append(nuevo)
+        fechas = np.array(fechas, dtype='datetime64[us]')
+        instantes = np.unique(fechas)
+        # Clave compuesta (columna, rango temporal) ordenada: el rango de cada
+        # fecha se mide contra los instantes únicos del historial, así un único
+        # searchsorted encuentra el último cambio <= fecha de cada materia prima.
+        col = np.repeat(np.arange(len(mp_orden), dtype=np.int64), largos)
+        base = len(instantes) + 1
+        self._empaquetado = {
+            'mp_orden': mp_orden,
+            'ptr': ptr,
+            'instantes': instantes,
+            'base': base,
+            'clave': col * base + np.searchsorted(instantes, fechas, side='right'),
+            'anteriores': np.array(anteriores, dtype=np.float64),
+            'nuevos': np.array(nuevos, dtype=np.float64),
+        }
+        return self._empaquetado
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def precios_en(self, mp_ids, precios_actuales, fechas):
+        """
+        Precios vigentes de varias materias primas en varias fechas.
+
+        Args:
+            mp_ids: array (M,) de ids de materia prima
+            precios_actuales: array (M,) con el costo_unitario actual (se usa
+                              para materias primas sin historial)
+            fechas: lista de datetime (D,)
+
+        Returns:
+            array (D, M) de costos unitarios.
+        """
+        mp_ids = np.asarray(mp_ids, dtype=np.int64)
+        precios_actuales = np.asarray(precios_actuales, dtype=np.float64)
+        instantes_q = np.array(fechas, dtype='datetime64[us]')
+        with self._lock:
+            emp = self._empaquetar()
+        resultado = np.broadcast_to(precios_actuales, (len(instantes_q), len(mp_ids))).copy()
+        if len(emp['mp_orden']) == 0 or len(mp_ids) == 0:
+            return resultado
+
+        pos = np.searchsorted(emp['mp_orden'], mp_ids)
+        pos_valida = np.minimum(pos, len(emp['mp_orden']) - 1)
+        con_historial = emp['mp_orden'][pos_valida] == mp_ids
+        col = pos_valida[con_historial]
+        inicio = emp['ptr'][col]
+
+        rango_q = np.searchsorted(emp['instantes'], instantes_q, side='right')
+        clave_q = col[None, :] * emp['base'] + rango_q[:, None]
+        ultimo = np.searchsorted(emp['clave'], clave_q, side='right') - 1
+
+        vigente = ultimo >= inicio[None, :]
+        precios = np.where(
+            vigente,
+            emp['nuevos'][np.maximum(ultimo, 0)],
+            emp['anteriores'][inicio][None, :],
+        )
+        resultado[:, con_historial] = precios
+        return resultado
+
+    def intervalos(self, materia_prima_id):
+        """Intervalos [desde, hasta) de vigencia de cada precio de una materia prima."""
+        with self._lock:
+            serie = list(self._asegurar_series().get(materia_prima_id, ()))
+        if not serie:
+            return []
+        intervalos = [{'desde': None, 'hasta': serie[0][0], 'precio': serie[0][2]}]
+        for i, (fecha, _, _, nuevo) in enumerate(serie):
+            hasta = serie[i + 1][0] if i + 1 < len(serie) else None
+            intervalos.append({'desde': fecha, 'hasta': hasta, 'precio': nuevo})
+        return intervalos
+
+    def costeos_en(self, productos, fecha):
+        """
+        Costeo de productos con los precios vigentes en ``fecha``.
+
+        Returns:
+            {producto_id: CosteoProducto}
+        """
+        matriz = MatrizCosteo.desde_db(productos)
+        precios = self.precios_en(matriz.mp_ids, matriz.precios, [fecha])[0]
+        historica = matriz.con_precios(precios)
+        resultado = historica.calcular()
+        return {p.id: historica.costeo_producto(p.id, resultado) for p in historica.productos}
+
+
+indice_precios = IndicePrecios()
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _anotar(session, objetos):
+    if any(obj in session.dirty or obj in session.deleted for obj in objetos):
+        session.info[_CLAVE_NUEVOS] = None  # edición/borrado: reconstruir completo
+        return
+    filas = [
+        (obj.materia_prima_id, obj.fecha_cambio, obj.id, obj.precio_anterior, obj.precio_nuevo)
+        for obj in objetos
+    ]
+    nuevos = session.info.setdefault(_CLAVE_NUEVOS, [])
+    if nuevos is not None:
+        nuevos.extend(filas)
+
+
+def _anotar_masivo(orm_execute_state):
+    orm_execute_state.session.info[_CLAVE_NUEVOS] = None
+
+
+def _al_confirmar(session, nuevos):
+    if nuevos is None:
+        indice_precios.invalidar()
+    else:
+        indice_precios.agregar(nuevos)
+
+
+def init_indice_precios(app=None):
+    """Registra los listeners que mantienen el índice (idempotente)."""
+    registrar_invalidacion(_CLAVE_NUEVOS, (HistorialPrecios,), _al_confirmar,
+                           anotar=_anotar, anotar_masivo=_anotar_masivo)
+
+
+def parse_as_of(valor):
+    """
+    Convierte el parámetro ``as_of`` en datetime.
+
+    Acepta YYYY-MM-DD (se toma el final de ese día) o un datetime ISO.
+    Returns:
+        (datetime, None) o (None, mensaje_error)
+    """
+    try:
+        if len(valor) == 10:
+            dia = datetime.strptime(valor, '%Y-%m-%d')
+            return dia.replace(hour=23, minute=59, second=59, microsecond=999999), None
+        fecha = datetime.fromisoformat(valor)
+        if fecha.tzinfo is not None:
+            # fecha_cambio se guarda en UTC sin zona horaria
+            fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        return fecha, None
+    except (ValueError, TypeError):
+        return None, 'as_of debe tener formato YYYY-MM-DD (ej: 2025-03-15) o fecha ISO'
@@ -0,0 +1,171 @@
+"""
+Índice inverso materia prima → productos que la usan (where-used).
+
+Guarda, para los productos activos, ``{materia_prima_id: {producto_id: cantidad}}``
+(la cantidad suma las líneas repetidas de la fórmula) y el índice directo
+producto → materias primas para poder reemplazar la fórmula de un producto.
+
+Se construye con una consulta la primera vez que se usa y luego se mantiene
+por producto: al confirmar una transacción que toca FormulaDetalle o el
+estado activo de un Producto, esos productos quedan marcados y la próxima
+lectura recarga solo sus líneas. Los UPDATE/DELETE masivos sobre
+FormulaDetalle consultan antes qué productos alcanzan (``save_formula``
+reemplaza la fórmula con ``Query.delete()``); los de Producto descartan el
+índice completo.
+
+Con cambios sin confirmar en la sesión las lecturas consultan la base de
+datos directamente y no tocan el índice.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from sqlalchemy import inspect as sa_inspect
+
+from models import db, Producto, FormulaDetalle
+from costeo_engine import chunks
+from invalidacion import registrar_invalidacion, valores_alcanzados
+
+logger = logging.getLogger(__name__)
+
+_CLAVE_PENDIENTES = 'indice_uso_pendientes'
+
+
+def _lineas(producto_ids=None, materia_prima_ids=None):
+    """(producto_id, materia_prima_id, cantidad) de productos activos."""
+    base = (
+        db.session.query(FormulaDetalle.producto_id, FormulaDetalle.materia_prima_id, FormulaDetalle.cantidad)
+        .join(Producto, Producto.id == FormulaDetalle.producto_id)
+        .filter(Producto.activo == True)  # noqa: E712
+    )
+    if producto_ids is None and materia_prima_ids is None:
+        return base.all()
+    columna, ids = (
+        (FormulaDetalle.producto_id, producto_ids) if producto_ids is not None
+        else (FormulaDetalle.materia_prima_id, materia_prima_ids)
+    )
+    filas = []
+    for chunk in chunks(sorted(ids)):
+        filas.extend(base.filter(columna.in_(chunk)).all())
+    return filas
+
+
+class IndiceUso:
+    """Dónde se usa cada materia prima, mantenido por producto."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._por_mp = None        # materia_prima_id -> {producto_id: cantidad}
+        self._por_producto = None  # producto_id -> {materia_prima_id: cantidad}
+        self._desactualizados = set()
+
+    def _agregar(self, filas):
+        for producto_id, mp_id, cantidad in filas:
+            usos = self._por_mp.setdefault(mp_id, {})
+            usos[producto_id] = usos.get(producto_id, 0.0) + cantidad
+            materias = self._por_producto.setdefault(producto_id, {})
+            materias[mp_id] = materias.get(mp_id, 0.0) + cantidad
+
+    def _quitar(self, producto_id):
+        for mp_id in self._por_producto.pop(producto_id, ()):
+            usos = self._por_mp.get(mp_id)
+            if usos is not None:
+                usos.pop(producto_id, None)
+                if not usos:
+                    del self._por_mp[mp_id]
+
+    def _asegurar(self):
+        with self._lock:
+            if self._por_mp is None:
+                self._por_mp, self._por_producto = {}, {}
+                self._desactualizados.clear()
+                self._agregar(_lineas())
+                logger.debug("indice_uso.construir materias=%s productos=%s",
+                             len(self._por_mp), len(self._por_producto))
+            elif self._desactualizados:
+                ids = sorted(self._desactualizados)
+                self._desactualizados.clear()
+                for pid in ids:
+                    self._quitar(pid)
+                self._agregar(_lineas(producto_ids=ids))
+                logger.debug("indice_uso.actualizar productos=%s", len(ids))
+
+    def usos(self, materia_prima_id):
+        """{producto_id: cantidad por batch} de los productos activos que usan la materia prima."""
+        if db.session.info.get(_CLAVE_PENDIENTES):
+            usos = defaultdict(float)
+            for producto_id, _, cantidad in _lineas(materia_prima_ids=[materia_prima_id]):
+                usos[producto_id] += cantidad
+            return dict(usos)
+        with self._lock:
+            self._asegurar()
+            return dict(self._por_mp.get(materia_prima_id, {}))
+
+    def productos_que_usan(self, materia_prima_ids):
+        """Ids de los productos activos que usan alguna de las materias primas."""
+        if db.session.info.get(_CLAVE_PENDIENTES):
+            return {producto_id for producto_id, _, _ in _lineas(materia_prima_ids=list(materia_prima_ids))}
+        with self._lock:
+            self._asegurar()
+            productos = set()
+            for mp_id in materia_prima_ids:
+                productos.update(self._por_mp.get(mp_id, ()))
+            return productos
+
+    def marcar_productos(self, producto_ids):
+        with self._lock:
+            if self._por_mp is not None:
+                self._desactualizados.update(producto_ids)
+
+    def invalidar(self):
+        with self._lock:
+            self._por_mp = None
+            self._por_producto = None
+            self._desactualizados.clear()
+
+
+indice_uso = IndiceUso()
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _pendientes(session):
+    return session.info.setdefault(_CLAVE_PENDIENTES, {'productos': set(), 'todo': False})
+
+
+def _anotar(session, objetos):
+    for obj in objetos:
+        if isinstance(obj, FormulaDetalle):
+            historia = sa_inspect(obj).attrs.producto_id.history
+            ids = set(historia.added or ()) | set(historia.deleted or ()) | set(historia.unchanged or ())
+            ids.discard(None)
+            _pendientes(session)['productos'].update(ids)
+        elif (obj in session.new or obj in session.deleted
+                or sa_inspect(obj).attrs.activo.history.has_changes()):
+            _pendientes(session)['productos'].add(obj.id)
+
+
+def _anotar_masivo(orm_execute_state):
+    pendientes = _pendientes(orm_execute_state.session)
+    if orm_execute_state.bind_mapper.class_ is Producto:
+        pendientes['todo'] = True
+        return
+    alcanzados = valores_alcanzados(orm_execute_state, FormulaDetalle.producto_id)
+    if alcanzados is None:
+        pendientes['todo'] = True
+    else:
+        pendientes['productos'].update(alcanzados)
+
+
+def _al_confirmar(session, pendientes):
+    if pendientes['todo']:
+        indice_uso.invalidar()
+    else:
+        indice_uso.marcar_productos(pendientes['productos'])
+
+
+def init_indice_uso(app=None):
+    """Registra los listeners que mantienen el índice (idempotente)."""
+    registrar_invalidacion(_CLAVE_PENDIENTES, (FormulaDetalle, Producto), _al_confirmar,
+                           anotar=_anotar, anotar_masivo=_anotar_masivo)
@@ -0,0 +1,100 @@
+"""
+Invalidación de cachés en memoria con eventos de sesión de SQLAlchemy.
+
+Las cachés del costeo (costeo_cache, catalogo, indice_uso, ...) siguen el
+mismo ciclo: durante la transacción anotan en ``session.info[clave]`` qué
+cambió, tanto en un flush (objetos nuevos, modificados o borrados) como en
+UPDATE/DELETE masivos (``Query.delete()``, ``update()``), que no pasan por
+el flush. Recién al confirmar (after_commit) aplican lo anotado; un rollback
+lo descarta. ``registrar_invalidacion`` registra ese ciclo para una clave:
+
+    registrar_invalidacion('indice_inflacion_cambios', (InflacionMensual,),
+                           lambda session, anotado: indice_inflacion.invalidar())
+
+Por defecto se anota ``True`` ante cualquier cambio; ``anotar`` y
+``anotar_masivo`` permiten anotar algo más preciso (qué productos, qué
+tablas) en ``session.info[clave]``; ``valores_alcanzados`` resuelve qué filas
+va a tocar un UPDATE/DELETE masivo.
+"""
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+_registradas = set()
+
+
+def valores_alcanzados(orm_execute_state, columna):
+    """
+    Valores distintos de ``columna`` en las filas que va a tocar un
+    UPDATE/DELETE masivo (se consultan antes de que se ejecute).
+
+    Returns:
+        set, o None si la sentencia no tiene WHERE (alcanza toda la tabla)
+    """
+    condicion = orm_execute_state.statement.whereclause
+    if condicion is None:
+        return None
+    return set(orm_execute_state.session.execute(select(columna).where(condicion).distinct()).scalars())
+
+
+def registrar_invalidacion(clave, modelos, al_confirmar, *, anotar=None, anotar_masivo=None, descartar=()):
+    """
+    Registra los listeners de una caché (idempotente por clave).
+
+    Args:
+        clave: clave de session.info con lo anotado en la transacción
+        modelos: clases cuyos cambios interesan (incluye subclases)
+        al_confirmar: función(session, anotado) llamada en after_commit si se
+            anotó algo en la transacción
+        anotar: función(session, objetos) llamada en cada flush con las
+            instancias de ``modelos`` nuevas, modificadas o borradas (si hay);
+            por defecto anota True
+        anotar_masivo: función(orm_execute_state) llamada antes de un
+            UPDATE/DELETE masivo sobre ``modelos``; por defecto anota True
+        descartar: otras claves de session.info que la caché usa durante la
+            transacción y se borran al confirmar o revertir
+    """
+    if clave in _registradas:
+        return
+    modelos = tuple(modelos)
+
+    def marcar(session, *_):
+        session.info[clave] = True
+
+    anotar = anotar or marcar
+    anotar_masivo = anotar_masivo or (lambda orm_execute_state: marcar(orm_execute_state.session))
+
+    def _after_flush(session, flush_context):
+        objetos = [
+            obj for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+            if isinstance(obj, modelos)
+        ]
+        if objetos:
+            anotar(session, objetos)
+
+    def _do_orm_execute(orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, modelos):
+            anotar_masivo(orm_execute_state)
+
+    def _after_commit(session):
+        try:
+            if clave in session.info:
+                al_confirmar(session, session.info.pop(clave))
+        finally:
+            _limpiar(session)
+
+    def _after_soft_rollback(session, previous_transaction):
+        session.info.pop(clave, None)
+        _limpiar(session)
+
+    def _limpiar(session):
+        for otra in descartar:
+            session.info.pop(otra, None)
+
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
+    _registradas.add(clave)
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -148,6 +149,11 @@ class Producto(db.Model):
             'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None
         }
     
+    @classmethod
+    def query_con_formula(cls):
+        """Query de productos con la fórmula completa precargada (ver carga_formula_completa)."""
+        return cls.query.options(carga_formula_completa())
+    
     def get_costeo(self):
         """Calcula el costeo completo del producto"""
         ingredientes = []
@@ -226,6 +232,27 @@ class Producto(db.Model):
         }
 
 
+def carga_formula_completa(ruta_producto=None):
+    """
+    Opción de carga del grafo Producto → FormulaDetalle → MateriaPrima → Categoria.
+
+    Los detalles se traen con un SELECT ... IN por lote de productos y la materia
+    prima y su categoría con JOIN en esa misma consulta, de modo que get_costeo()
+    no dispara cargas perezosas: el número de consultas no depende del tamaño
+    del catálogo.
+
+    Args:
+        ruta_producto: loader que llega a Producto desde otra entidad, por ejemplo
+            joinedload(ProduccionProgramada.producto). Si es None la opción se
+            aplica sobre una consulta de Producto.
+    """
+    if ruta_producto is None:
+        carga = selectinload(Producto.formula_detalles)
+    else:
+        carga = ruta_producto.selectinload(Producto.formula_detalles)
+    return carga.joinedload(FormulaDetalle.materia_prima).joinedload(MateriaPrima.categoria)
+
+
 class FormulaDetalle(db.Model):
     __tablename__ = 'formula_detalles'
     
@@ -249,7 +276,7 @@ class ProduccionProgramada(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), nullable=False)
     cantidad_batches = db.Column(db.Float, nullable=False)
-    fecha_programacion = db.Column(db.Date, nullable=False)
+    fecha_programacion = db.Column(db.Date, nullable=False, index=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     # Campos para ML
     es_sugerencia_ml = db.Column(db.Boolean, default=False)
@@ -277,6 +304,34 @@ class ProduccionProgramada(db.Model):
         }
 
 
+class ProduccionMensual(db.Model):
+    """Totales de ProduccionProgramada por mes y producto (mantenido por produccion_mensual.py)"""
+    __tablename__ = 'produccion_mensual'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), nullable=False)
+    batches = db.Column(db.Float, nullable=False, default=0)
+    kg = db.Column(db.Float, nullable=False, default=0)  # batches * peso_batch_kg
+    minutos = db.Column(db.Float, nullable=False, default=0)  # kg * min_mo_kg
+
+    producto = db.relationship('Producto')
+
+    # El índice único (mes, producto_id) también sirve las consultas por mes
+    __table_args__ = (
+        db.UniqueConstraint('mes', 'producto_id', name='unique_mes_producto'),
+    )
+
+    def to_dict(self):
+        return {
+            'mes': self.mes,
+            'producto_id': self.producto_id,
+            'batches': self.batches,
+            'kg': self.kg,
+            'minutos': self.minutos
+        }
+
+
 class ProduccionHistorica(db.Model):
     """Almacena datos históricos de producción importados desde Excel"""
     __tablename__ = 'produccion_historica'
@@ -400,6 +455,18 @@ def init_db(app):
         except Exception as e:
             print(f"⚠️ Migración precio_venta: {e}")
         
+        # Índice sobre fecha_programacion (filtros por rango de mes)
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_produccion_programada_fecha_programacion '
+                    'ON produccion_programada (fecha_programacion)'
+                ))
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ Migración índice fecha_programacion: {e}")
+        
         # Crear usuario administrador por defecto si no existe ninguno
         if Usuario.query.count() == 0:
             admin = Usuario(
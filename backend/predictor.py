@@ -12,9 +12,17 @@ import os
 import pickle
 import logging
 import json
+import hashlib
+import functools
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date
 import numpy as np
 
+from almacen_modelos import AlmacenModelos, GeneracionBorrada, ModelosProducto, cargar_modelo, clave_producto
+from arboles_compilados import LoteArboles, compilar
+
 logger = logging.getLogger(__name__)
 
 # Estas librerías se importan solo cuando se necesitan
@@ -55,24 +63,82 @@ def _ensure_imports():
         pd = pandas
 
 
+def _train_workers_default():
+    """Procesos para entrenar (env COSTOS_ML_TRAIN_WORKERS; por defecto, un proceso por CPU)."""
+    try:
+        return max(1, int(os.environ.get('COSTOS_ML_TRAIN_WORKERS', '0')) or os.cpu_count() or 1)
+    except ValueError:
+        return 1
+
+
+def _timed_call(fn, *args):
+    """
+    Ejecuta fn(*args) y devuelve (resultado serializado con pickle, segundos de CPU).
+
+    Corre dentro de los workers (y en el proceso actual si es secuencial): en
+    ambos casos el resultado llega como bytes, así el pickle final del modelo
+    es idéntico byte a byte sin importar cuántos workers se usaron. Se mide
+    CPU y no reloj: con más workers que CPUs el reloj de cada tarea incluye la
+    espera por CPU y sobreestimaría la duración secuencial.
+    """
+    inicio = time.process_time()
+    resultado = pickle.dumps(fn(*args), protocol=pickle.HIGHEST_PROTOCOL)
+    return resultado, time.process_time() - inicio
+
+
+def _recargar_si_generacion_borrada(metodo):
+    """
+    Si la generación cargada se borró mientras se usaba (otro proceso guardó
+    dos más entre el chequeo del manifest y la lectura de un modelo), recarga
+    la generación vigente y reintenta una vez.
+    """
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        try:
+            return metodo(self, *args, **kwargs)
+        except GeneracionBorrada as e:
+            logger.warning("predictor.generation_deleted path=%s", e.filename)
+            self._load_model()
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
+
 class ProductionPredictor:
     """
     Predictor de producción basado en XGBoost.
     Entrena un modelo por producto o un modelo global con features de producto.
     """
     
+    # Formato anterior (un pickle con todos los modelos): se migra al almacén al cargarlo.
+    # El almacén vive junto a este archivo: models/production_model/ (almacen_modelos.py)
     MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'production_model.pkl')
     META_PATH = os.path.join(os.path.dirname(__file__), 'models', 'production_model.meta.json')
+
+    FEATURES_VERSION = 'v2.0_with_lags'
+    PRODUCT_MODEL_PARAMS = {
+        'n_estimators': 500,
+        'max_depth': 3,
+        'learning_rate': 0.05,
+        'subsample': 0.9,
+        'colsample_bytree': 0.9,
+        'objective': 'reg:squarederror',
+        'random_state': 42,
+        'n_jobs': 1,
+    }
+    GLOBAL_MODEL_PARAMS = dict(PRODUCT_MODEL_PARAMS, n_estimators=700, max_depth=4)
     
     def __init__(self, *, load_models=False):
-        self.models = {}  # producto_id -> modelo entrenado
+        self.models = {}  # producto_id -> modelo entrenado (ModelosProducto al cargar del almacén)
         self.global_model = None
         self.product_encodings = {}  # producto_id -> código numérico
         self.is_trained = False
         self.metadata = {}
         self._models_loaded = False
+        self._arboles = None  # (clave_producto -> fila, LoteArboles) para predict_month en lote
+        self._manifest_firma = None  # (st_ino, st_mtime_ns) del manifest cargado; None si no viene del almacén
+        self._history_cache = None  # (product_histories, matriz de lags) para predict_month
 
-        # Por performance, evitamos des-picklear modelos en endpoints como /api/ml/status.
+        # Por performance, evitamos leer modelos en endpoints como /api/ml/status.
         # Se cargan bajo demanda al predecir o entrenar.
         if load_models:
             self._load_model()
@@ -91,41 +157,127 @@ class ProductionPredictor:
         except Exception as e:
             logger.warning("predictor.meta_load_failed path=%s error=%s", self.META_PATH, str(e))
 
+    @property
+    def global_model(self):
+        """Modelo global; si viene del almacén se lee recién al usarlo."""
+        if self._global_model is None and self._global_path is not None:
+            self._global_model = cargar_modelo(self._global_path)
+        return self._global_model
+
+    @global_model.setter
+    def global_model(self, model):
+        self._global_model = model
+        self._global_path = None
+
+    def _has_global_model(self):
+        return self._global_model is not None or self._global_path is not None
+
+    def _store(self):
+        """Almacén de modelos junto a MODEL_PATH (production_model.pkl -> production_model/)."""
+        return AlmacenModelos(os.path.splitext(self.MODEL_PATH)[0])
+
     def _ensure_models_loaded(self):
-        """Carga el pickle del modelo solo cuando es necesario (predict/train)."""
-        if self._models_loaded:
+        """
+        Carga el manifest de modelos solo cuando es necesario (predict/train), y
+        lo vuelve a cargar si otro proceso guardó una generación nueva: el
+        almacén conserva solo dos, y la que este proceso tiene cargada se borra
+        después de dos guardados ajenos.
+        """
+        if self._models_loaded and not self._store_changed():
             return
         self._load_model()
+
+    def _store_changed(self):
+        """True si el manifest del almacén cambió desde que se cargó (un os.stat)."""
+        if self._manifest_firma is None:
+            return False
+        try:
+            estado = os.stat(self._store().ruta_manifest)
+        except OSError:
+            return False
+        return (estado.st_ino, estado.st_mtime_ns) != self._manifest_firma
     
     def _load_model(self):
-        """Carga modelo guardado si existe"""
-        if os.path.exists(self.MODEL_PATH):
-            try:
-                with open(self.MODEL_PATH, 'rb') as f:
-                    data = pickle.load(f)
-                    self.models = data.get('models', {})
-                    self.global_model = data.get('global_model')
-                    self.product_encodings = data.get('product_encodings', {})
-                    self.is_trained = data.get('is_trained', False)
-                    self.metadata = data.get('metadata', {})
+        """
+        Carga el manifest del almacén si existe (los modelos se leen bajo demanda).
+
+        Si solo existe el pickle del formato anterior, lo migra al almacén y lo
+        renombra a production_model.pkl.migrado.
+        """
+        almacen = self._store()
+        try:
+            if not almacen.existe() and os.path.exists(self.MODEL_PATH):
+                self._migrate_pickle()
+            if almacen.existe():
+                self._load_store(almacen)
                 self._models_loaded = True
-                logger.info("predictor.model_loaded path=%s models=%s", self.MODEL_PATH, len(self.models))
-            except Exception as e:
-                logger.error("predictor.model_load_failed path=%s error=%s", self.MODEL_PATH, str(e))
-                self._models_loaded = False
+                logger.info("predictor.model_loaded path=%s models=%s", almacen.ruta_manifest, len(self.models))
+        except Exception as e:
+            logger.error("predictor.model_load_failed path=%s error=%s", almacen.directorio, str(e))
+            self._models_loaded = False
+
+    def _load_store(self, almacen):
+        """Apunta el predictor a la generación vigente del almacén, sin leer modelos."""
+        # Firma tomada antes de leer: si el manifest cambia en el medio, el próximo chequeo recarga
+        estado = os.stat(almacen.ruta_manifest)
+        manifest = almacen.leer_manifest()
+        self._manifest_firma = (estado.st_ino, estado.st_mtime_ns)
+        self.models = almacen.modelos(manifest)
+        self.global_model = None
+        if manifest.get('global'):
+            self._global_path = almacen.ruta(manifest, manifest['global'])
+        self._arboles = almacen.arboles(manifest)
+        self.product_encodings = {pid: codigo for pid, codigo in manifest.get('product_encodings', [])}
+        self.is_trained = manifest.get('is_trained', False)
+        self.metadata = manifest.get('metadata', {})
+
+    def _migrate_pickle(self):
+        """Convierte el pickle del formato anterior al almacén (una sola vez)."""
+        _ensure_imports()
+        with open(self.MODEL_PATH, 'rb') as f:
+            data = pickle.load(f)
+        self.models = data.get('models', {})
+        self.global_model = data.get('global_model')
+        self.product_encodings = data.get('product_encodings', {})
+        self.is_trained = data.get('is_trained', False)
+        self.metadata = data.get('metadata', {})
+        # Pickles anteriores a arboles_compilados.py no traen árboles: se compilan acá
+        compilados = data.get('compiled_models', {})
+        self._arboles = self._stack_compiled({
+            pid: compilados[pid] if compilados.get(pid) is not None else self._compile_model(model)
+            for pid, model in self.models.items()
+        })
+        self._save_model()
+        try:
+            os.replace(self.MODEL_PATH, self.MODEL_PATH + '.migrado')
+        except FileNotFoundError:
+            pass  # otro proceso migró el mismo pickle
+        logger.info("predictor.model_migrated path=%s models=%s", self.MODEL_PATH, len(self.models))
+
+    @staticmethod
+    def _stack_compiled(compilados):
+        """(clave_producto -> fila, LoteArboles) de los modelos compilados, o None si no hay."""
+        pares = [(clave_producto(pid), compilado) for pid, compilado in compilados.items() if compilado is not None]
+        if not pares:
+            return None
+        return {clave: i for i, (clave, _) in enumerate(pares)}, LoteArboles.apilar(c for _, c in pares)
     
     def _save_model(self):
-        """Guarda el modelo entrenado"""
-        os.makedirs(os.path.dirname(self.MODEL_PATH), exist_ok=True)
-        with open(self.MODEL_PATH, 'wb') as f:
-            pickle.dump({
-                'models': self.models,
-                'global_model': self.global_model,
-                'product_encodings': self.product_encodings,
-                'is_trained': self.is_trained,
-                'metadata': self.metadata
-            }, f)
-        logger.info("predictor.model_saved path=%s models=%s", self.MODEL_PATH, len(self.models))
+        """Guarda el modelo entrenado en el almacén (un archivo por producto + manifest)"""
+        almacen = self._store()
+        models = self.models
+        if isinstance(models, ModelosProducto):
+            # Modelos ya guardados: se enlazan sus archivos, sin leerlos
+            models = {pid: models.archivo(pid) for pid in models}
+        almacen.guardar(
+            models=models,
+            global_model=self._global_model if self._global_model is not None else self._global_path,
+            arboles=self._arboles,
+            product_encodings=self.product_encodings,
+            is_trained=self.is_trained,
+            metadata=self.metadata,
+        )
+        logger.info("predictor.model_saved path=%s models=%s", almacen.ruta_manifest, len(self.models))
         self._save_metadata_only()
 
     def _save_metadata_only(self):
@@ -134,7 +286,7 @@ class ProductionPredictor:
             meta_payload = {
                 'is_trained': self.is_trained,
                 'productos_con_modelo': len(self.models),
-                'tiene_modelo_global': self.global_model is not None,
+                'tiene_modelo_global': self._has_global_model(),
                 'metadata': self.metadata or {}
             }
             with open(self.META_PATH, 'w', encoding='utf-8') as f:
@@ -143,7 +295,8 @@ class ProductionPredictor:
         except Exception as e:
             logger.warning("predictor.meta_save_failed path=%s error=%s", self.META_PATH, str(e))
 
-    def _time_split_last_n(self, df, n_last=2):
+    @staticmethod
+    def _time_split_last_n(df, n_last=2):
         """Split temporal (train/val) tomando las últimas n observaciones como validación."""
         _ensure_imports()
         if df is None or len(df) <= n_last:
@@ -166,7 +319,8 @@ class ProductionPredictor:
         denom = np.maximum(np.abs(y_true), eps)
         return float(np.mean(np.abs((y_true - y_pred) / denom)) * 100.0)
     
-    def _create_features(self, df, include_lags=False, target_col='cantidad_kg'):
+    @staticmethod
+    def _create_features(df, include_lags=False, target_col='cantidad_kg'):
         """
         Crea features para el modelo a partir de las fechas.
         
@@ -260,7 +414,8 @@ class ProductionPredictor:
         
         return None
 
-    def _fit_xgb_regressor(self, model, X_train, y_train, X_val=None, y_val=None):
+    @staticmethod
+    def _fit_xgb_regressor(model, X_train, y_train, X_val=None, y_val=None):
         """Entrena un XGBRegressor con early-stopping de forma compatible entre versiones."""
         _ensure_imports()
 
@@ -295,7 +450,223 @@ class ProductionPredictor:
             # Fallback: entrenar sin early stopping
             model.fit(X_train, y_train)
     
-    def train(self, historico_data, *, cutoff_ym=None):
+    @staticmethod
+    def _train_product_model(df_prod):
+        """
+        Entrena el modelo de un producto (serie con al menos 6 meses).
+
+        Returns:
+            (modelo, (rmse, mape) o None si no hubo validación, ArbolesCompilados o None)
+        """
+        _ensure_imports()
+
+        # IMPORTANTE: Ordenar cronológicamente para lags correctos
+        df_prod = df_prod.sort_values(['año', 'mes']).reset_index(drop=True)
+
+        # Validación temporal: si hay suficiente historia, separa últimos 2 meses
+        df_train, df_val = (df_prod, None)
+        if len(df_prod) >= 12:
+            df_train, df_val = ProductionPredictor._time_split_last_n(df_prod, n_last=2)
+
+        # Crear features CON lags si hay suficiente historia
+        use_lags = len(df_train) >= 13  # Necesita al menos 13 para lag_12 + 1 fila válida
+        X_train = ProductionPredictor._create_features(df_train, include_lags=use_lags, target_col='cantidad_kg')
+        y_train = df_train['cantidad_kg'].values
+
+        # Filtrar filas con NaN por lags (primeras 12 filas con lag_12)
+        if use_lags:
+            valid_mask = ~X_train.isna().any(axis=1)
+            X_train = X_train[valid_mask]
+            y_train = y_train[valid_mask]
+
+        model = xgboost.XGBRegressor(**ProductionPredictor.PRODUCT_MODEL_PARAMS)
+
+        validacion = None
+        if df_val is not None and len(df_val) > 0:
+            # Para validación, usamos la serie completa hasta val para tener lags correctos
+            df_for_val = pd.concat([df_train, df_val], ignore_index=True)
+            X_all = ProductionPredictor._create_features(df_for_val, include_lags=use_lags, target_col='cantidad_kg')
+            X_val = X_all.iloc[-len(df_val):]
+            y_val = df_val['cantidad_kg'].values
+
+            # Filtrar NaN en validación
+            if use_lags:
+                valid_val_mask = ~X_val.isna().any(axis=1)
+                X_val = X_val[valid_val_mask]
+                y_val = np.array(y_val)[valid_val_mask.values]
+
+            if len(X_val) > 0 and len(X_train) > 0:
+                ProductionPredictor._fit_xgb_regressor(model, X_train, y_train, X_val=X_val, y_val=y_val)
+                y_pred = model.predict(X_val)
+                validacion = (ProductionPredictor._rmse(y_val, y_pred), ProductionPredictor._mape(y_val, y_pred))
+            else:
+                ProductionPredictor._fit_xgb_regressor(model, X_train, y_train)
+        else:
+            if len(X_train) > 0:
+                ProductionPredictor._fit_xgb_regressor(model, X_train, y_train)
+
+        return model, validacion, ProductionPredictor._compile_model(model)
+
+    @staticmethod
+    def _compile_model(model):
+        """Árboles compilados para predict_month, o None si el modelo no es compatible (o no se entrenó)."""
+        try:
+            return compilar(model)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _train_global_model(df_grouped, product_encodings):
+        """
+        Entrena el modelo global (todas las series, producto codificado como feature).
+
+        Returns:
+            (modelo, (rmse, mape) o None si no hubo validación)
+        """
+        _ensure_imports()
+
+        df_global = df_grouped.copy()
+        df_global['producto_encoded'] = df_global['producto_id'].map(product_encodings)
+
+        # Split temporal global por las últimas 2 observaciones (ordenadas por año/mes)
+        df_global_sorted = df_global.sort_values(['año', 'mes']).reset_index(drop=True)
+        df_g_train, df_g_val = (df_global_sorted, None)
+        if len(df_global_sorted) >= 24:
+            df_g_train, df_g_val = ProductionPredictor._time_split_last_n(df_global_sorted, n_last=2)
+
+        X_g_train = ProductionPredictor._create_features(df_g_train)
+        X_g_train['producto_encoded'] = df_g_train['producto_encoded']
+        y_g_train = df_g_train['cantidad_kg'].values
+
+        model = xgboost.XGBRegressor(**ProductionPredictor.GLOBAL_MODEL_PARAMS)
+
+        validacion = None
+        if df_g_val is not None and len(df_g_val) > 0:
+            X_g_val = ProductionPredictor._create_features(df_g_val)
+            X_g_val['producto_encoded'] = df_g_val['producto_encoded']
+            y_g_val = df_g_val['cantidad_kg'].values
+            ProductionPredictor._fit_xgb_regressor(model, X_g_train, y_g_train, X_val=X_g_val, y_val=y_g_val)
+            y_g_pred = model.predict(X_g_val)
+            validacion = (ProductionPredictor._rmse(y_g_val, y_g_pred), ProductionPredictor._mape(y_g_val, y_g_pred))
+        else:
+            ProductionPredictor._fit_xgb_regressor(model, X_g_train, y_g_train)
+
+        return model, validacion
+
+    def _run_training_jobs(self, series, datos_global, *, workers=None):
+        """
+        Entrena los modelos por producto y el global, en paralelo si workers > 1.
+
+        Cada modelo usa random_state fijo y n_jobs=1, así que el resultado es el
+        mismo en cualquier proceso; los resultados se devuelven en el orden de
+        ``series``. Los workers se lanzan con 'spawn' (el proceso de la API tiene
+        hilos y OpenMP ya inicializado: hacer fork no es seguro).
+
+        Args:
+            series: lista de (producto_id, DataFrame del producto)
+            datos_global: (df_grouped, product_encodings) o None si no hay modelo global
+
+        Returns:
+            (resultados por producto, resultado global o None, dict de paralelismo)
+        """
+        workers = _train_workers_default() if workers is None else max(1, int(workers))
+        n_tareas = len(series) + (1 if datos_global is not None else 0)
+        workers = min(workers, max(1, n_tareas))
+        inicio = time.perf_counter()
+
+        resultado_global = None
+        resultados = None
+        duraciones = []
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    # El global es la tarea más larga: se encola primero
+                    futuro_global = pool.submit(_timed_call, ProductionPredictor._train_global_model, *datos_global) \
+                        if datos_global is not None else None
+                    futuros = [pool.submit(_timed_call, ProductionPredictor._train_product_model, df_prod)
+                               for _, df_prod in series]
+                    resultados = []
+                    for futuro in futuros:
+                        resultado, duracion = futuro.result()
+                        resultados.append(pickle.loads(resultado))
+                        duraciones.append(duracion)
+                    if futuro_global is not None:
+                        resultado_global, duracion = futuro_global.result()
+                        resultado_global = pickle.loads(resultado_global)
+                        duraciones.append(duracion)
+            except Exception as e:
+                logger.warning("predictor.train.pool_failed workers=%s error=%s", workers, str(e))
+                resultados, resultado_global, duraciones = None, None, []
+                workers = 1
+
+        if resultados is None:
+            resultados = []
+            for _, df_prod in series:
+                resultado, duracion = _timed_call(ProductionPredictor._train_product_model, df_prod)
+                resultados.append(pickle.loads(resultado))
+                duraciones.append(duracion)
+            if datos_global is not None:
+                resultado_global, duracion = _timed_call(ProductionPredictor._train_global_model, *datos_global)
+                resultado_global = pickle.loads(resultado_global)
+                duraciones.append(duracion)
+
+        duracion_total = time.perf_counter() - inicio
+        duracion_secuencial = sum(duraciones)
+        paralelismo = {
+            'workers': workers,
+            'duracion_seg': round(duracion_total, 3),
+            # Suma del CPU de cada ajuste: lo que tardaría en un solo proceso
+            'duracion_secuencial_estimada_seg': round(duracion_secuencial, 3),
+            'speedup': round(duracion_secuencial / duracion_total, 2) if duracion_total > 0 else None
+        }
+        logger.info(
+            "predictor.train.jobs workers=%s modelos=%s duration_sec=%.2f speedup=%s",
+            workers, n_tareas, duracion_total, paralelismo['speedup']
+        )
+        return resultados, resultado_global, paralelismo
+
+    @classmethod
+    def _config_hash(cls):
+        """Hash de lo que define un modelo además de su serie: hiperparámetros, features y versión de XGBoost."""
+        _ensure_imports()
+        config = {
+            'producto': cls.PRODUCT_MODEL_PARAMS,
+            'global': cls.GLOBAL_MODEL_PARAMS,
+            'features_version': cls.FEATURES_VERSION,
+            'xgboost': xgboost.__version__,
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _series_hash(df_prod):
+        """Hash del contenido de una serie (año, mes, cantidad_kg en orden cronológico)."""
+        valores = df_prod.sort_values(['año', 'mes'])[['año', 'mes', 'cantidad_kg']].to_numpy(dtype=np.float64)
+        return hashlib.sha256(np.ascontiguousarray(valores).tobytes()).hexdigest()
+
+    def _previous_training(self, config_hash):
+        """
+        Modelos del último entrenamiento guardado que train(incremental=True) puede reutilizar.
+
+        Returns:
+            (dict con modelos, árboles, hashes y validaciones; o None si no hay un
+            entrenamiento compatible, motivo)
+        """
+        self._ensure_models_loaded()
+        meta = self.metadata or {}
+        if not self.is_trained or not isinstance(self.models, ModelosProducto):
+            return None, 'sin_modelo_guardado'
+        if meta.get('config_hash') != config_hash or 'series_hash' not in meta:
+            return None, 'configuracion_distinta'
+        return {
+            'models': self.models,
+            'arboles': self._arboles,
+            'global_path': self._global_path,
+            'series_hash': meta['series_hash'],
+            'validacion': meta.get('validacion_por_producto', {}),
+            'validacion_global': meta.get('validacion_global'),
+        }, None
+
+    def train(self, historico_data, *, cutoff_ym=None, workers=None, incremental=False):
         """
         Entrena el modelo con datos históricos.
         
@@ -304,17 +675,28 @@ class ProductionPredictor:
             cutoff_ym: str opcional con formato YYYY-MM. Si se provee, entrena solo con
                 registros <= cutoff (útil para backtesting y para evitar entrenar con
                 "futuro" respecto de un horizonte de predicción).
+            workers: procesos para entrenar en paralelo los modelos por producto y el
+                global (por defecto COSTOS_ML_TRAIN_WORKERS o un proceso por CPU;
+                1 = secuencial en el proceso actual). El resultado no depende de este valor.
+            incremental: reutilizar los modelos del último entrenamiento guardado cuya
+                serie (hash del contenido) y configuración no cambiaron; el global se
+                reentrena solo si cambió alguna serie. Da los mismos modelos y métricas
+                que entrenar todo; sin un entrenamiento compatible, entrena todo.
         
         Returns:
             dict con métricas del entrenamiento
         """
         _ensure_imports()
+        config_hash = self._config_hash()
+        previo, motivo_completo = self._previous_training(config_hash) if incremental else (None, 'no_solicitado')
 
-        # Entrenar siempre desde cero (evita depender de modelos previos)
+        # Entrenar desde cero (en modo incremental, salvo los modelos reutilizables de `previo`)
         self.models = {}
+        self._arboles = None
         self.global_model = None
         self.product_encodings = {}
         self._models_loaded = True
+        self._manifest_firma = None
         
         if not historico_data or len(historico_data) < 3:
             return {'success': False, 'error': 'Datos insuficientes (mínimo 3 registros)'}
@@ -357,6 +739,7 @@ class ProductionPredictor:
         
         # Entrenar modelo por producto si hay suficientes datos
         productos = df_grouped['producto_id'].unique()
+        series_por_producto = dict(tuple(df_grouped.groupby('producto_id', sort=False)))
         metrics = {
             'productos_entrenados': 0,
             'productos_sin_datos': 0,
@@ -370,117 +753,87 @@ class ProductionPredictor:
 
         rmse_list = []
         mape_list = []
-        
-        for producto_id in productos:
-            df_prod = df_grouped[df_grouped['producto_id'] == producto_id].copy()
-            
-            if len(df_prod) >= 6:  # Mínimo 6 meses para entrenar
-                # IMPORTANTE: Ordenar cronológicamente para lags correctos
-                df_prod = df_prod.sort_values(['año', 'mes']).reset_index(drop=True)
-                
-                # Validación temporal: si hay suficiente historia, separa últimos 2 meses
-                df_train, df_val = (df_prod, None)
-                if len(df_prod) >= 12:
-                    df_train, df_val = self._time_split_last_n(df_prod, n_last=2)
-
-                # Crear features CON lags si hay suficiente historia
-                use_lags = len(df_train) >= 13  # Necesita al menos 13 para lag_12 + 1 fila válida
-                X_train = self._create_features(df_train, include_lags=use_lags, target_col='cantidad_kg')
-                y_train = df_train['cantidad_kg'].values
-                
-                # Filtrar filas con NaN por lags (primeras 12 filas con lag_12)
-                if use_lags:
-                    valid_mask = ~X_train.isna().any(axis=1)
-                    X_train = X_train[valid_mask]
-                    y_train = y_train[valid_mask]
-
-                model = xgboost.XGBRegressor(
-                    n_estimators=500,
-                    max_depth=3,
-                    learning_rate=0.05,
-                    subsample=0.9,
-                    colsample_bytree=0.9,
-                    objective='reg:squarederror',
-                    random_state=42,
-                    n_jobs=1
-                )
-
-                if df_val is not None and len(df_val) > 0:
-                    # Para validación, usamos la serie completa hasta val para tener lags correctos
-                    df_for_val = pd.concat([df_train, df_val], ignore_index=True)
-                    X_all = self._create_features(df_for_val, include_lags=use_lags, target_col='cantidad_kg')
-                    X_val = X_all.iloc[-len(df_val):]
-                    y_val = df_val['cantidad_kg'].values
-                    
-                    # Filtrar NaN en validación
-                    if use_lags:
-                        valid_val_mask = ~X_val.isna().any(axis=1)
-                        X_val = X_val[valid_val_mask]
-                        y_val = np.array(y_val)[valid_val_mask.values]
-                    
-                    if len(X_val) > 0 and len(X_train) > 0:
-                        self._fit_xgb_regressor(model, X_train, y_train, X_val=X_val, y_val=y_val)
-                        y_pred = model.predict(X_val)
-                        rmse = self._rmse(y_val, y_pred)
-                        mape = self._mape(y_val, y_pred)
-                        rmse_list.append(rmse)
-                        mape_list.append(mape)
-                        metrics['validacion']['productos_con_validacion'] += 1
-                    else:
-                        self._fit_xgb_regressor(model, X_train, y_train)
-                else:
-                    if len(X_train) > 0:
-                        self._fit_xgb_regressor(model, X_train, y_train)
-
-                self.models[producto_id] = model
-                metrics['productos_entrenados'] += 1
-            else:
-                metrics['productos_sin_datos'] += 1
-        
-        # Entrenar modelo global para productos sin suficientes datos
-        if len(df_grouped) >= 12:
+        compilados = {}
+        series_hash = {clave_producto(pid): self._series_hash(series_por_producto[pid]) for pid in productos}
+        validacion_por_producto = {}
+
+        # Mínimo 6 meses para entrenar
+        productos_a_entrenar = [pid for pid in productos if len(series_por_producto[pid]) >= 6]
+        metrics['productos_sin_datos'] = len(productos) - len(productos_a_entrenar)
+        entrenar_global = len(df_grouped) >= 12
+        if entrenar_global:
             # Codificar producto_id
             for i, pid in enumerate(productos):
                 self.product_encodings[pid] = i
-            
-            df_global = df_grouped.copy()
-            df_global['producto_encoded'] = df_global['producto_id'].map(self.product_encodings)
-            
-            # Split temporal global por las últimas 2 observaciones (ordenadas por año/mes)
-            df_global_sorted = df_global.sort_values(['año', 'mes']).reset_index(drop=True)
-            df_g_train, df_g_val = (df_global_sorted, None)
-            if len(df_global_sorted) >= 24:
-                df_g_train, df_g_val = self._time_split_last_n(df_global_sorted, n_last=2)
-
-            X_g_train = self._create_features(df_g_train)
-            X_g_train['producto_encoded'] = df_g_train['producto_encoded']
-            y_g_train = df_g_train['cantidad_kg'].values
-
-            self.global_model = xgboost.XGBRegressor(
-                n_estimators=700,
-                max_depth=4,
-                learning_rate=0.05,
-                subsample=0.9,
-                colsample_bytree=0.9,
-                objective='reg:squarederror',
-                random_state=42,
-                n_jobs=1
-            )
 
-            if df_g_val is not None and len(df_g_val) > 0:
-                X_g_val = self._create_features(df_g_val)
-                X_g_val['producto_encoded'] = df_g_val['producto_encoded']
-                y_g_val = df_g_val['cantidad_kg'].values
-                self._fit_xgb_regressor(self.global_model, X_g_train, y_g_train, X_val=X_g_val, y_val=y_g_val)
-                y_g_pred = self.global_model.predict(X_g_val)
-                metrics['validacion']['rmse_global'] = self._rmse(y_g_val, y_g_pred)
-                metrics['validacion']['mape_global'] = self._mape(y_g_val, y_g_pred)
+        # Modo incremental: misma serie y misma configuración -> mismo modelo. Se
+        # reutiliza el archivo guardado (sin leerlo), su validación y sus árboles.
+        reutilizados = {}
+        reutilizar_global = False
+        if previo is not None:
+            indice_previo, lote_previo = previo['arboles'] or ({}, None)
+            for pid in productos_a_entrenar:
+                clave = clave_producto(pid)
+                archivo = previo['models'].archivo(pid)
+                if archivo and clave in previo['validacion'] and previo['series_hash'].get(clave) == series_hash[clave]:
+                    validacion = previo['validacion'][clave]
+                    fila = indice_previo.get(clave)
+                    reutilizados[pid] = (
+                        archivo,
+                        tuple(validacion) if validacion is not None else None,
+                        lote_previo.compilado(fila) if fila is not None else None,
+                    )
+            # El global ve todas las series: se reutiliza solo si ninguna cambió
+            reutilizar_global = (entrenar_global and previo['global_path'] is not None
+                                 and previo['series_hash'] == series_hash)
+
+        productos_nuevos = [pid for pid in productos_a_entrenar if pid not in reutilizados]
+        resultados, resultado_global, paralelismo = self._run_training_jobs(
+            [(pid, series_por_producto[pid]) for pid in productos_nuevos],
+            (df_grouped, self.product_encodings) if entrenar_global and not reutilizar_global else None,
+            workers=workers,
+        )
+        if reutilizar_global:
+            validacion_global = previo['validacion_global']
+            resultado_global = (previo['global_path'], tuple(validacion_global) if validacion_global is not None else None)
+        resultados = dict(zip(productos_nuevos, resultados))
+
+        # Merge en el orden de los productos: mismo modelo y mismas métricas que en secuencial.
+        # Los modelos reutilizados quedan como ruta de archivo hasta _save_model.
+        for producto_id in productos_a_entrenar:
+            model, validacion, compilado = reutilizados.get(producto_id) or resultados[producto_id]
+            validacion_por_producto[clave_producto(producto_id)] = validacion
+            if validacion is not None:
+                rmse_list.append(validacion[0])
+                mape_list.append(validacion[1])
+                metrics['validacion']['productos_con_validacion'] += 1
+            self.models[producto_id] = model
+            compilados[producto_id] = compilado
+            metrics['productos_entrenados'] += 1
+
+        # Modelo global para productos sin suficientes datos
+        validacion_global = None
+        if resultado_global is not None:
+            modelo_global, validacion_global = resultado_global
+            if reutilizar_global:
+                self._global_path = modelo_global  # archivo guardado: se lee recién al usarlo
             else:
-                self._fit_xgb_regressor(self.global_model, X_g_train, y_g_train)
+                self.global_model = modelo_global
+            if validacion_global is not None:
+                metrics['validacion']['rmse_global'] = validacion_global[0]
+                metrics['validacion']['mape_global'] = validacion_global[1]
             metrics['modelo_global'] = True
         else:
             metrics['modelo_global'] = False
-        
+        metrics['paralelismo'] = paralelismo
+        metrics['incremental'] = {
+            'aplicado': previo is not None,
+            'motivo_completo': motivo_completo,
+            'productos_reentrenados': len(productos_nuevos),
+            'productos_reutilizados': len(reutilizados),
+            'modelo_global_reentrenado': entrenar_global and not reutilizar_global,
+        }
+
         # Agregar métricas agregadas si hubo validación por producto
         if rmse_list:
             metrics['validacion']['rmse_promedio'] = float(np.mean(rmse_list))
@@ -498,8 +851,7 @@ class ProductionPredictor:
         # Guardar historial reciente por producto para uso en predicción con lags
         product_histories = {}
         for producto_id in productos:
-            df_prod = df_grouped[df_grouped['producto_id'] == producto_id].copy()
-            df_prod = df_prod.sort_values(['año', 'mes']).reset_index(drop=True)
+            df_prod = series_por_producto[producto_id].sort_values(['año', 'mes']).reset_index(drop=True)
             # Guardar últimos 15 meses para tener suficiente para lag_12 + buffer
             recent = df_prod.tail(15)[['año', 'mes', 'cantidad_kg']].to_dict('records')
             product_histories[str(producto_id)] = recent
@@ -516,18 +868,60 @@ class ProductionPredictor:
                 'adf_pvalue': stationarity_result.get('adf', {}).get('pvalue') if stationarity_result else None,
                 'kpss_pvalue': stationarity_result.get('kpss', {}).get('pvalue') if stationarity_result else None
             },
-            'features_version': 'v2.0_with_lags',
-            'product_histories': product_histories
+            'features_version': self.FEATURES_VERSION,
+            'product_histories': product_histories,
+            # Para train(incremental=True): qué cambió y métricas de los modelos reutilizados
+            'config_hash': config_hash,
+            'series_hash': series_hash,
+            'validacion_por_producto': validacion_por_producto,
+            'validacion_global': validacion_global,
         }
 
 
 
         self.is_trained = True
+        self._arboles = self._stack_compiled(compilados)
         self._save_model()
+        # Liberar los modelos recién entrenados: de acá en más se leen del almacén bajo demanda
+        self._load_store(self._store())
         
         metrics['success'] = True
         return metrics
     
+    _METODOS = {
+        'modelo_producto': (0.85, 'Predicción basada en historial del producto'),
+        'modelo_global': (0.70, 'Predicción basada en modelo global'),
+    }
+
+    @classmethod
+    def _prediction_result(cls, prediccion, metodo):
+        confianza, mensaje = cls._METODOS[metodo]
+        return {
+            'cantidad_kg': float(max(0, round(float(prediccion), 2))),
+            'confianza': confianza,
+            'metodo': metodo,
+            'mensaje': mensaje
+        }
+
+    @staticmethod
+    def _sin_modelo_result():
+        return {
+            'cantidad_kg': None,
+            'confianza': 0,
+            'metodo': 'sin_modelo',
+            'mensaje': 'Modelo no entrenado. Ejecute el entrenamiento primero.'
+        }
+
+    @staticmethod
+    def _sin_datos_result():
+        return {
+            'cantidad_kg': None,
+            'confianza': 0,
+            'metodo': 'sin_datos',
+            'mensaje': 'Sin datos históricos para este producto. Use entrada manual.'
+        }
+
+    @_recargar_si_generacion_borrada
     def predict(self, producto_id, año, mes, producto_similar_id=None):
         """
         Predice la producción para un producto en un mes específico.
@@ -547,12 +941,7 @@ class ProductionPredictor:
         self._ensure_models_loaded()
         
         if not self.is_trained:
-            return {
-                'cantidad_kg': None,
-                'confianza': 0,
-                'metodo': 'sin_modelo',
-                'mensaje': 'Modelo no entrenado. Ejecute el entrenamiento primero.'
-            }
+            return self._sin_modelo_result()
         
         # Crear features para la predicción
         # NOTA: Para predicción con lags, necesitamos el historial del producto.
@@ -589,12 +978,7 @@ class ProductionPredictor:
         if producto_id in self.models:
             try:
                 prediccion = self.models[producto_id].predict(X)[0]
-                return {
-                    'cantidad_kg': float(max(0, round(float(prediccion), 2))),
-                    'confianza': 0.85,
-                    'metodo': 'modelo_producto',
-                    'mensaje': f'Predicción basada en historial del producto'
-                }
+                return self._prediction_result(prediccion, 'modelo_producto')
             except ValueError as e:
                 # Fallback si hay mismatch de features
                 logger.warning("predict.feature_mismatch producto_id=%s error=%s", producto_id, str(e))
@@ -614,36 +998,290 @@ class ProductionPredictor:
         if self.global_model is not None and producto_id in self.product_encodings:
             X['producto_encoded'] = self.product_encodings[producto_id]
             prediccion = self.global_model.predict(X)[0]
-            return {
-                'cantidad_kg': float(max(0, round(float(prediccion), 2))),
-                'confianza': 0.70,
-                'metodo': 'modelo_global',
-                'mensaje': 'Predicción basada en modelo global'
-            }
+            return self._prediction_result(prediccion, 'modelo_global')
         
         # Método 4: Promedio global si nada más funciona
-        return {
-            'cantidad_kg': None,
-            'confianza': 0,
-            'metodo': 'sin_datos',
-            'mensaje': 'Sin datos históricos para este producto. Use entrada manual.'
-        }
+        return self._sin_datos_result()
     
+    @staticmethod
+    def _predict_rows(model, X):
+        """
+        Igual que model.predict(X) para una matriz NumPy, directo sobre el booster.
+
+        Evita el overhead por llamada del wrapper sklearn (contexto de config,
+        validación), que en predict_month se paga una vez por producto.
+        """
+        try:
+            iteration_range = (0, model.best_iteration + 1)  # modelos con early stopping
+        except AttributeError:
+            iteration_range = (0, 0)
+        return model.get_booster().inplace_predict(X, iteration_range=iteration_range, validate_features=False)
+
+    @staticmethod
+    def _base_feature_matrix(año, mes, n):
+        """Features sin lags (mismas columnas y orden que _create_features) repetidas en n filas."""
+        fila = np.array([
+            mes,
+            año,
+            ((mes - 1) // 3) + 1,
+            int(mes == 12),
+            int(mes in (12, 1, 2)),
+            int(mes in (6, 7, 8)),
+            np.sin(2 * np.pi * mes / 12),
+            np.cos(2 * np.pi * mes / 12),
+        ], dtype=float)
+        return np.tile(fila, (n, 1))
+
+    def _history_matrix(self):
+        """
+        Últimos 12 valores de cada serie de product_histories como matriz.
+
+        Returns:
+            (str(producto_id) -> fila, matriz (n, 12) alineada a la derecha con NaN
+            a la izquierda, largo de cada historial, último mes de cada historial
+            como año * 12 + mes - 1). Se arma una vez por historial.
+        """
+        histories = self.metadata.get('product_histories', {}) or {}
+        if self._history_cache is not None and self._history_cache[0] is histories:
+            return self._history_cache[1]
+
+        indice = {}
+        valores = np.full((len(histories), 12), np.nan)
+        largos = np.zeros(len(histories), dtype=int)
+        ultimo_mes = np.full(len(histories), -1, dtype=int)
+        for i, (clave, history) in enumerate(histories.items()):
+            indice[clave] = i
+            history = sorted(history or [], key=lambda r: (r['año'], r['mes']))
+            largos[i] = len(history)
+            ultimos = [r['cantidad_kg'] for r in history[-12:]]
+            if ultimos:
+                valores[i, 12 - len(ultimos):] = ultimos
+                ultimo_mes[i] = int(history[-1]['año']) * 12 + int(history[-1]['mes']) - 1
+        resultado = (indice, valores, largos, ultimo_mes)
+        self._history_cache = (histories, resultado)
+        return resultado
+
+    def _history_buffers(self, productos_ids):
+        """
+        Historial de cada producto de productos_ids (copia, se puede modificar).
+
+        Returns:
+            (últimos 12 valores (n, 12) con NaN a la izquierda, largo del historial,
+            último mes del historial como año * 12 + mes - 1; -1 sin historial)
+        """
+        indice, valores, largos, meses = self._history_matrix()
+        n = len(productos_ids)
+        filas = np.array([indice.get(str(pid), -1) for pid in productos_ids], dtype=int)
+        conocidas = filas >= 0
+        ultimos = np.full((n, 12), np.nan)
+        ultimos[conocidas] = valores[filas[conocidas]]
+        largo = np.zeros(n, dtype=int)
+        largo[conocidas] = largos[filas[conocidas]]
+        ultimo_mes = np.full(n, -1, dtype=int)
+        ultimo_mes[conocidas] = meses[filas[conocidas]]
+        return ultimos, largo, ultimo_mes
+
+    @staticmethod
+    def _lag_features(ultimos, largo, X_base):
+        """
+        Features con lags para predecir el mes de X_base a continuación de `ultimos`.
+
+        Reproduce en una sola pasada vectorizada lo que predict() arma con
+        _create_features sobre historial + fila a predecir: lag_1..3 y lag_12 del
+        historial, media/desv. móviles de 3 (la fila a predecir aporta NaN),
+        diff_1 = 0 y momentum = 1.
+
+        Returns:
+            (matriz (n, 16), máscara de filas con lags válidos; en las demás
+            predict() usa features sin lags)
+        """
+        n = len(ultimos)
+        lag_1, lag_2, lag_3, lag_12 = ultimos[:, -1], ultimos[:, -2], ultimos[:, -3], ultimos[:, 0]
+        # Ventana de 3 = [lag_2, lag_1, NaN]: con min_periods=1 promedia los valores presentes
+        ventana = ultimos[:, -2:]
+        presentes = ~np.isnan(ventana)
+        n_presentes = presentes.sum(axis=1)
+        suma = np.where(presentes, ventana, 0.0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rolling_mean = np.where(n_presentes > 0, suma / n_presentes, np.nan)
+            rolling_std = np.where(n_presentes == 2, np.abs(ventana[:, 1] - ventana[:, 0]) / np.sqrt(2), 0.0)
+
+        X = np.column_stack([
+            X_base,
+            lag_1, lag_2, lag_3, lag_12,
+            rolling_mean, rolling_std,
+            np.zeros(n),  # diff_1
+            np.ones(n),   # momentum
+        ])
+        validas = (largo >= 3) & ~np.isnan(X).any(axis=1)
+        return X, validas
+
+    def _lag_feature_matrix(self, productos_ids, X_base):
+        """_lag_features con el historial guardado de cada producto (ver _lag_features)."""
+        ultimos, largo, _ = self._history_buffers(productos_ids)
+        return self._lag_features(ultimos, largo, X_base)
+
+    def _batch_plan(self, productos_ids):
+        """
+        Con qué modelo se puede predecir cada producto (se arma una vez por lote).
+
+        Returns:
+            dict de arrays por producto: 'fila' en el lote de árboles compilados
+            (-1 si no tiene), 'n_features' que espera su modelo (-1 sin modelo),
+            'compilado' y 'codigo_global' (-1 si el global no lo cubre)
+        """
+        indice_arboles, lote = self._arboles or ({}, None)
+        n = len(productos_ids)
+        fila = np.full(n, -1, dtype=int)
+        n_features = np.full(n, -1, dtype=int)
+        codigo_global = np.full(n, -1, dtype=int)
+        hay_global = self._has_global_model()
+        for i, pid in enumerate(productos_ids):
+            f = indice_arboles.get(clave_producto(pid))
+            if f is not None:
+                fila[i] = f
+                n_features[i] = lote.n_features[f]
+            elif pid in self.models:
+                # Sin árboles compilados: hay que leer el modelo (o no se llegó a entrenar)
+                n_features[i] = getattr(self.models[pid], 'n_features_in_', None) or -1
+            if hay_global and pid in self.product_encodings:
+                codigo_global[i] = self.product_encodings[pid]
+        return {'fila': fila, 'n_features': n_features, 'compilado': fila >= 0, 'codigo_global': codigo_global}
+
+    def _predict_batch(self, productos_ids, plan, X_base, X_lags, con_lags):
+        """
+        Predicciones de un mes para productos_ids (formato de predict(), sin producto_id).
+
+        Método 1: modelo del producto, si espera las features disponibles (con o
+        sin lags; si no, predict() cae al global por mismatch y acá se detecta
+        por cantidad de features). Las filas con árboles compilados se evalúan
+        todas juntas y las demás con model.predict. Método 3: modelo global, en
+        una sola llamada. Sin ninguno: sin_datos.
+        """
+        ancho = np.where(con_lags, X_lags.shape[1], X_base.shape[1])
+        con_modelo = plan['n_features'] == ancho
+        al_global = ~con_modelo
+        resultados = [None] * len(productos_ids)
+
+        filas_compiladas = np.flatnonzero(con_modelo & plan['compilado'])
+        if len(filas_compiladas):
+            # Las primeras columnas de X_lags son las features base: un modelo sin
+            # lags solo lee esas, así que todas las filas van en una misma matriz
+            _, lote = self._arboles
+            predicciones = lote.predecir(X_lags[filas_compiladas], plan['fila'][filas_compiladas])
+            for i, prediccion in zip(filas_compiladas, predicciones):
+                resultados[i] = self._prediction_result(prediccion, 'modelo_producto')
+
+        for i in np.flatnonzero(con_modelo & ~plan['compilado']):
+            x = X_lags[i:i + 1] if con_lags[i] else X_base[i:i + 1]
+            try:
+                prediccion = self._predict_rows(self.models[productos_ids[i]], x)[0]
+                resultados[i] = self._prediction_result(prediccion, 'modelo_producto')
+            except ValueError as e:
+                logger.warning("predict.feature_mismatch producto_id=%s error=%s", productos_ids[i], str(e))
+                al_global[i] = True
+
+        filas_global = np.flatnonzero(al_global & (plan['codigo_global'] >= 0))
+        if len(filas_global):
+            X_global = np.column_stack([X_base[filas_global], plan['codigo_global'][filas_global]])
+            for i, prediccion in zip(filas_global, self._predict_rows(self.global_model, X_global)):
+                resultados[i] = self._prediction_result(prediccion, 'modelo_global')
+
+        return [r if r is not None else self._sin_datos_result() for r in resultados]
+
+    @_recargar_si_generacion_borrada
     def predict_month(self, productos_ids, año, mes):
         """
         Predice producción para múltiples productos en un mes.
+
+        Mismo resultado que predict() producto por producto, pero en lote: las
+        features de todos los productos se arman en una pasada de NumPy, las
+        filas de modelos por producto se evalúan juntas con sus árboles
+        compilados (arboles_compilados.py) y las del modelo global en una sola
+        llamada. Los árboles compilados se abren con memory-map desde el
+        almacén: predict_month no lee los modelos por producto salvo los que
+        no se pudieron compilar, que se predicen uno por uno.
         
         Returns:
             Lista de predicciones
         """
-        resultados = []
+        _ensure_imports()
         # Cargar modelos una sola vez
         self._ensure_models_loaded()
-        for pid in productos_ids:
-            pred = self.predict(pid, año, mes)
+        productos_ids = list(productos_ids)
+        año, mes = int(año), int(mes)
+
+        if not self.is_trained:
+            return [dict(self._sin_modelo_result(), producto_id=pid) for pid in productos_ids]
+
+        X_base = self._base_feature_matrix(año, mes, len(productos_ids))
+        X_lags, con_lags = self._lag_feature_matrix(productos_ids, X_base)
+        resultados = self._predict_batch(productos_ids, self._batch_plan(productos_ids), X_base, X_lags, con_lags)
+        for pid, pred in zip(productos_ids, resultados):
             pred['producto_id'] = pid
-            resultados.append(pred)
         return resultados
+
+    @_recargar_si_generacion_borrada
+    def predict_horizon(self, productos_ids, año, mes, horizonte):
+        """
+        Predice `horizonte` meses consecutivos desde año/mes para varios productos.
+
+        Pronóstico recursivo: los meses entre el fin del historial de cada
+        producto y cada mes a predecir se completan con sus propias
+        predicciones, que alimentan los lags (lag_1..3, lag_12, media y desv.
+        móviles) del mes siguiente. predict_month, en cambio, arma los lags
+        con el historial guardado aunque el mes esté lejos de su final. Cada
+        paso evalúa todos los productos en lote como predict_month; el mes
+        siguiente al historial (o uno dentro de él) da lo mismo que predict_month.
+
+        Args:
+            productos_ids: productos a predecir
+            año, mes: primer mes del horizonte
+            horizonte: cantidad de meses (>= 1)
+
+        Returns:
+            lista de `horizonte` listas (una por mes, en orden) con el formato
+            de predict_month
+        """
+        _ensure_imports()
+        self._ensure_models_loaded()
+        productos_ids = list(productos_ids)
+        inicio = int(año) * 12 + int(mes) - 1
+        fin = inicio + int(horizonte)
+
+        if not self.is_trained:
+            return [[dict(self._sin_modelo_result(), producto_id=pid) for pid in productos_ids]
+                    for _ in range(inicio, fin)]
+
+        ultimos, largo, ultimo_mes = self._history_buffers(productos_ids)
+        plan = self._batch_plan(productos_ids)
+        todos = np.ones(len(productos_ids), dtype=bool)
+        # La recursión arranca en el mes siguiente al historial más viejo (si es anterior al horizonte)
+        con_historial = ultimo_mes >= 0
+        desde = min(inicio, int(ultimo_mes[con_historial].min()) + 1) if con_historial.any() else inicio
+
+        horizonte_resultados = []
+        for paso in range(desde, fin):
+            # Productos cuyo historial termina antes de este mes: su predicción alimenta los lags
+            recursivos = con_historial & (ultimo_mes < paso)
+            # Antes del horizonte solo hace falta simular los productos recursivos
+            filas = np.flatnonzero(todos if paso >= inicio else recursivos)
+            ids = [productos_ids[i] for i in filas]
+            X_base = self._base_feature_matrix(paso // 12, paso % 12 + 1, len(filas))
+            X_lags, con_lags = self._lag_features(ultimos[filas], largo[filas], X_base)
+            predicciones = self._predict_batch(ids, {k: v[filas] for k, v in plan.items()}, X_base, X_lags, con_lags)
+
+            if paso >= inicio:
+                for pid, pred in zip(ids, predicciones):
+                    pred['producto_id'] = pid
+                horizonte_resultados.append(predicciones)
+
+            valores = np.full(len(productos_ids), np.nan)
+            valores[filas] = [np.nan if p['cantidad_kg'] is None else p['cantidad_kg'] for p in predicciones]
+            ultimos[recursivos] = np.column_stack([ultimos[recursivos, 1:], valores[recursivos]])
+            largo[recursivos] += 1
+
+        return horizonte_resultados
     
     def get_training_status(self):
         """Retorna el estado del entrenamiento"""
@@ -656,27 +1294,36 @@ class ProductionPredictor:
                     'is_trained': bool(meta.get('is_trained', False)),
                     'productos_con_modelo': int(meta.get('productos_con_modelo', 0) or 0),
                     'tiene_modelo_global': bool(meta.get('tiene_modelo_global', False)),
-                    'model_path': self.MODEL_PATH if os.path.exists(self.MODEL_PATH) else None,
+                    'model_path': self._model_path(),
                     'metadata': meta.get('metadata', {}) or {}
                 }
             except Exception:
                 pass
 
-        # Compatibilidad hacia atrás: si hay modelo pickle pero no hay meta JSON,
-        # cargar una sola vez para reconstruir metadata y luego persistirla.
-        if not self._models_loaded and os.path.exists(self.MODEL_PATH):
+        # Compatibilidad hacia atrás: si hay modelo (almacén o pickle) pero no hay
+        # meta JSON, cargar una sola vez para reconstruir metadata y luego persistirla.
+        if not self._models_loaded and (self._store().existe() or os.path.exists(self.MODEL_PATH)):
             self._load_model()
             if self._models_loaded and not os.path.exists(self.META_PATH):
                 self._save_metadata_only()
+        elif self._models_loaded:
+            self._ensure_models_loaded()  # recarga si otro proceso entrenó
 
         return {
             'is_trained': self.is_trained,
             'productos_con_modelo': len(self.models),
-            'tiene_modelo_global': self.global_model is not None,
-            'model_path': self.MODEL_PATH if os.path.exists(self.MODEL_PATH) else None,
+            'tiene_modelo_global': self._has_global_model(),
+            'model_path': self._model_path(),
             'metadata': self.metadata or {}
         }
 
+    def _model_path(self):
+        """Manifest del almacén (o pickle sin migrar) si hay modelo guardado."""
+        almacen = self._store()
+        if almacen.existe():
+            return almacen.ruta_manifest
+        return self.MODEL_PATH if os.path.exists(self.MODEL_PATH) else None
+
 
 # Instancia global del predictor (protegida contra errores de carga)
 try:
@@ -0,0 +1,240 @@
+"""
+Agregado mensual de la producción programada.
+
+La tabla ``produccion_mensual`` guarda, por (mes, producto), la suma de
+batches de ProduccionProgramada junto con los kg (``batches * peso_batch_kg``)
+y los minutos de mano de obra (``kg * min_mo_kg``). Los endpoints de costos
+indirectos leen los totales de un mes con una sola consulta por el índice
+``(mes, producto_id)`` en lugar de recorrer cada programación.
+
+Mantenimiento incremental (en el flush, misma transacción que la escritura):
+
+- alta / edición / baja de ProduccionProgramada: se resta lo que la fila
+  aportaba antes del flush (leído de la BD en ``before_flush``) y se suma lo
+  que aporta ahora, en las filas (mes, producto) afectadas;
+- cambio de ``peso_batch_kg`` o ``min_mo_kg`` de un Producto: se recalculan
+  kg y minutos de las filas de ese producto.
+
+Como kg y minutos son lineales en los batches, siempre se derivan de la suma
+de batches con los valores vigentes del producto.
+
+Los UPDATE/DELETE masivos (``Query.update()``/``delete()``) no pasan por el
+flush: en ese caso la tabla se reconstruye completa antes del commit. Al
+iniciar la app también se reconstruye, para absorber escrituras hechas por
+scripts fuera del proceso.
+"""
+import logging
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from models import db, Producto, ProduccionProgramada, ProduccionMensual
+
+logger = logging.getLogger(__name__)
+
+_CLAVE_RECONSTRUIR = 'produccion_mensual_reconstruir'
+_CLAVE_ANTERIORES = 'produccion_mensual_anteriores'
+
+# Atributos del Producto que cambian kg / minutos
+_ATRIBUTOS_PRODUCTO = ('peso_batch_kg', 'min_mo_kg')
+
+# Por debajo de esto una fila sin batches se considera vacía (residuo de coma flotante)
+_EPSILON_BATCHES = 1e-9
+
+_tabla = ProduccionMensual.__table__
+_productos = Producto.__table__
+
+
+def clave_mes(fecha):
+    """'YYYY-MM' de una fecha."""
+    return f"{fecha.year}-{fecha.month:02d}"
+
+
+# ----------------------------------------------------------------------
+# Lectura
+# ----------------------------------------------------------------------
+def produccion_del_mes(mes, session=None):
+    """
+    Totales por producto de un mes (YYYY-MM).
+
+    Returns:
+        lista de (producto, batches, kg, minutos) ordenada por producto_id.
+    """
+    session = session if session is not None else db.session
+    return (
+        session.query(Producto, ProduccionMensual.batches, ProduccionMensual.kg, ProduccionMensual.minutos)
+        .join(ProduccionMensual, ProduccionMensual.producto_id == Producto.id)
+        .filter(ProduccionMensual.mes == mes)
+        .order_by(ProduccionMensual.producto_id)
+        .all()
+    )
+
+
+def kg_del_mes(mes, session=None):
+    """Kg programados en el mes (YYYY-MM)."""
+    session = session if session is not None else db.session
+    total = session.query(func.sum(ProduccionMensual.kg)).filter(ProduccionMensual.mes == mes).scalar()
+    return total or 0
+
+
+# ----------------------------------------------------------------------
+# Escritura
+# ----------------------------------------------------------------------
+def _recalcular_kg_minutos(connection, producto_ids, meses=None):
+    """kg y minutos de las filas de esos productos a partir de batches y del Producto."""
+    peso = (
+        _productos.select()
+        .with_only_columns(_productos.c.peso_batch_kg)
+        .where(_productos.c.id == _tabla.c.producto_id)
+        .scalar_subquery()
+    )
+    min_mo = (
+        _productos.select()
+        .with_only_columns(_productos.c.min_mo_kg)
+        .where(_productos.c.id == _tabla.c.producto_id)
+        .scalar_subquery()
+    )
+    stmt = _tabla.update().values(
+        kg=_tabla.c.batches * peso,
+        minutos=_tabla.c.batches * peso * func.coalesce(min_mo, 0),
+    )
+    if producto_ids is not None:
+        stmt = stmt.where(_tabla.c.producto_id.in_(producto_ids))
+    if meses is not None:
+        stmt = stmt.where(_tabla.c.mes.in_(meses))
+    connection.execute(stmt)
+
+
+def _aplicar_deltas(connection, deltas):
+    """Suma a cada (mes, producto_id) su diferencia de batches."""
+    for (mes, producto_id), delta in deltas.items():
+        condicion = (_tabla.c.mes == mes) & (_tabla.c.producto_id == producto_id)
+        resultado = connection.execute(
+            _tabla.update().where(condicion).values(batches=_tabla.c.batches + delta)
+        )
+        if resultado.rowcount == 0:
+            connection.execute(
+                _tabla.insert().values(mes=mes, producto_id=producto_id, batches=delta, kg=0, minutos=0)
+            )
+    meses = {mes for mes, _ in deltas}
+    producto_ids = {producto_id for _, producto_id in deltas}
+    connection.execute(
+        _tabla.delete().where(
+            _tabla.c.mes.in_(meses),
+            _tabla.c.producto_id.in_(producto_ids),
+            _tabla.c.batches <= _EPSILON_BATCHES,
+        )
+    )
+    _recalcular_kg_minutos(connection, producto_ids, meses)
+
+
+def reconstruir(session=None):
+    """Vuelve a calcular la tabla completa desde ProduccionProgramada."""
+    session = session if session is not None else db.session
+    connection = session.connection()
+    filas = session.query(
+        ProduccionProgramada.producto_id,
+        ProduccionProgramada.fecha_programacion,
+        ProduccionProgramada.cantidad_batches,
+    ).all()
+    batches = defaultdict(float)
+    for producto_id, fecha, cantidad in filas:
+        batches[(clave_mes(fecha), producto_id)] += cantidad
+
+    connection.execute(_tabla.delete())
+    if batches:
+        connection.execute(_tabla.insert(), [
+            {'mes': mes, 'producto_id': producto_id, 'batches': total, 'kg': 0, 'minutos': 0}
+            for (mes, producto_id), total in batches.items()
+        ])
+        _recalcular_kg_minutos(connection, None)
+    logger.info("produccion_mensual.reconstruir programaciones=%s filas=%s", len(filas), len(batches))
+    return len(batches)
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _before_flush(session, flush_context, instances):
+    # Valores vigentes en la BD de las programaciones que se van a editar o
+    # borrar: el historial del ORM no los tiene si el objeto estaba expirado.
+    ids = {
+        obj.id
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, ProduccionProgramada) and obj.id is not None
+    }
+    if not ids:
+        return
+    programada = ProduccionProgramada.__table__
+    filas = session.connection().execute(
+        programada.select()
+        .with_only_columns(programada.c.id, programada.c.producto_id,
+                           programada.c.fecha_programacion, programada.c.cantidad_batches)
+        .where(programada.c.id.in_(ids))
+    )
+    anteriores = session.info.setdefault(_CLAVE_ANTERIORES, {})
+    for prog_id, producto_id, fecha, cantidad in filas:
+        anteriores.setdefault(prog_id, ((clave_mes(fecha), producto_id), cantidad))
+
+
+def _after_flush(session, flush_context):
+    deltas = defaultdict(float)
+    for clave, cantidad in session.info.pop(_CLAVE_ANTERIORES, {}).values():
+        deltas[clave] -= cantidad
+
+    productos_modificados = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, ProduccionProgramada):
+            deltas[(clave_mes(obj.fecha_programacion), obj.producto_id)] += obj.cantidad_batches
+        elif isinstance(obj, Producto) and obj not in session.new:
+            estado = sa_inspect(obj)
+            if any(estado.attrs[a].history.has_changes() for a in _ATRIBUTOS_PRODUCTO):
+                productos_modificados.add(obj.id)
+
+    deltas = {clave: delta for clave, delta in deltas.items() if delta != 0}
+    if not deltas and not productos_modificados:
+        return
+    connection = session.connection()
+    if deltas:
+        _aplicar_deltas(connection, deltas)
+    if productos_modificados:
+        _recalcular_kg_minutos(connection, productos_modificados)
+    logger.debug(
+        "produccion_mensual.incremental claves=%s productos=%s", len(deltas), len(productos_modificados)
+    )
+
+
+def _do_orm_execute(orm_execute_state):
+    # UPDATE/DELETE masivos (Query.delete(), update()) no pasan por after_flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (ProduccionProgramada, Producto):
+        orm_execute_state.session.info[_CLAVE_RECONSTRUIR] = True
+
+
+def _before_commit(session):
+    if session.info.pop(_CLAVE_RECONSTRUIR, False):
+        reconstruir(session)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    session.info.pop(_CLAVE_RECONSTRUIR, None)
+    session.info.pop(_CLAVE_ANTERIORES, None)
+
+
+_eventos_registrados = False
+
+
+def init_produccion_mensual(app=None):
+    """Registra los listeners de mantenimiento incremental (idempotente)."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
+    _eventos_registrados = True
@@ -0,0 +1,471 @@
+"""
+Sandboxes what-if en memoria.
+
+Un sandbox guarda un *overlay* sobre los datos confirmados:
+
+- ``precios``: {materia_prima_id: costo_unitario}
+- ``formulas``: {producto_id: [{materia_prima_id, cantidad}, ...]} (reemplaza
+  la fórmula completa del producto)
+- ``indirectos``: {cuenta: monto} (reemplaza el monto de la cuenta en
+  cualquier mes base; las cuentas inexistentes se ignoran)
+- ``inflacion``: {YYYY-MM: porcentaje} (reemplaza la inflación del mes)
+- ``produccion``: {YYYY-MM: {producto_id: batches}} (reemplaza los batches
+  programados de esos productos en el mes; 0 los quita del mes). Los kg y
+  minutos se derivan como en produccion_mensual.py; si el mes es un mes base
+  también cambia su volumen programado.
+
+Los endpoints de costeo, distribución, análisis marginal y proyección
+multiperíodo aceptan ``?sandbox=<id>`` y se evalúan contra el overlay sin
+escribir en la base de datos.
+
+El overlay es copy-on-write: cada sandbox deriva de la matriz de costeo del
+snapshot del catálogo (``catalogo.py``) y de los ContextoMes cacheados copias
+superficiales en las que solo se reemplazan los arrays o atributos que el
+overlay modifica. Las derivaciones se memorizan por revisión del overlay y
+se rehacen cuando cambia la base.
+
+Los sandboxes viven en un LRU con TTL desde el último acceso.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from models import db, MateriaPrima, Producto
+from catalogo import catalogo, matriz_costeo
+from costeo_cache import cache_costeo
+from costeo_engine import chunks
+from contexto_mensual import MatrizEscalamiento, TIPOS_DISTRIBUCION, obtener_contexto
+from indice_inflacion import indice_inflacion
+from produccion_mensual import produccion_del_mes
+from valores_costeo import ProductoCatalogo, ProduccionProducto
+
+TTL_SEGUNDOS = 30 * 60
+MAX_SANDBOXES = 32
+
+# Derivaciones memorizadas por sandbox (contextos y matrices)
+_MAX_MEMOS = 64
+
+_SECCIONES = ('precios', 'formulas', 'indirectos', 'inflacion', 'produccion')
+
+
+def _numero(valor, nombre, minimo=None):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        return None, f'{nombre} debe ser numérico'
+    if minimo is not None and valor < minimo:
+        return None, f'{nombre} debe ser mayor o igual a {minimo}'
+    return float(valor), None
+
+
+def _entero(clave, nombre):
+    try:
+        return int(clave), None
+    except (TypeError, ValueError):
+        return None, f'{nombre}: "{clave}" no es un id válido'
+
+
+def _mes(clave, seccion):
+    try:
+        datetime.strptime(clave, '%Y-%m')
+    except (TypeError, ValueError):
+        return f'{seccion}: "{clave}" no tiene formato YYYY-MM'
+    return None
+
+
+def normalizar_overlay(datos, parcial=False):
+    """
+    Valida y normaliza un overlay recibido como JSON.
+
+    Con ``parcial=True`` (PATCH) un valor null significa quitar la entrada y
+    se conserva como None.
+
+    Returns:
+        (overlay, error): overlay con las secciones presentes y claves
+        tipadas (ids enteros), o un mensaje de error.
+    """
+    if not isinstance(datos, dict):
+        return None, 'El overlay debe ser un objeto'
+    desconocidas = sorted(set(datos) - set(_SECCIONES))
+    if desconocidas:
+        return None, f'Secciones desconocidas: {desconocidas}'
+
+    overlay = {}
+    for seccion in _SECCIONES:
+        valores = datos.get(seccion)
+        if valores is None:
+            continue
+        if not isinstance(valores, dict):
+            return None, f'{seccion} debe ser un objeto'
+        normalizados = {}
+        for clave, valor in valores.items():
+            if seccion in ('precios', 'formulas'):
+                clave, error = _entero(clave, seccion)
+            elif seccion in ('inflacion', 'produccion'):
+                error = _mes(clave, seccion)
+            else:
+                error = None if str(clave).strip() else 'indirectos: la cuenta no puede estar vacía'
+            if error:
+                return None, error
+            if valor is None:
+                if not parcial:
+                    return None, f'{seccion}.{clave} no puede ser null'
+                normalizados[clave] = None
+                continue
+
+            if seccion == 'precios':
+                valor, error = _numero(valor, f'precios.{clave}', minimo=0)
+            elif seccion == 'indirectos':
+                valor, error = _numero(valor, f'indirectos.{clave}', minimo=0)
+            elif seccion == 'inflacion':
+                valor, error = _numero(valor, f'inflacion.{clave}', minimo=-100)
+            elif seccion == 'produccion':
+                valor, error = _normalizar_produccion(valor, clave)
+            else:
+                valor, error = _normalizar_formula(valor, clave)
+            if error:
+                return None, error
+            normalizados[clave] = valor
+        overlay[seccion] = normalizados
+
+    return overlay, _validar_ids(overlay)
+
+
+def _normalizar_formula(lineas, producto_id):
+    if not isinstance(lineas, list):
+        return None, f'formulas.{producto_id} debe ser una lista de ingredientes'
+    normalizadas = []
+    for i, linea in enumerate(lineas):
+        if not isinstance(linea, dict):
+            return None, f'formulas.{producto_id}[{i}] debe ser un objeto'
+        mp_id, error = _entero(linea.get('materia_prima_id'), f'formulas.{producto_id}[{i}].materia_prima_id')
+        if error:
+            return None, error
+        cantidad, error = _numero(linea.get('cantidad'), f'formulas.{producto_id}[{i}].cantidad', minimo=0)
+        if error:
+            return None, error
+        normalizadas.append((mp_id, cantidad))
+    return normalizadas, None
+
+
+def _normalizar_produccion(batches, mes):
+    if not isinstance(batches, dict):
+        return None, f'produccion.{mes} debe ser un objeto {{producto_id: batches}}'
+    normalizados = {}
+    for clave, valor in batches.items():
+        producto_id, error = _entero(clave, f'produccion.{mes}')
+        if error:
+            return None, error
+        valor, error = _numero(valor, f'produccion.{mes}.{clave}', minimo=0)
+        if error:
+            return None, error
+        normalizados[producto_id] = valor
+    return normalizados, None
+
+
+def _validar_ids(overlay):
+    """Verifica que las materias primas y productos referenciados existan."""
+    materias = {mp_id for mp_id, precio in overlay.get('precios', {}).items() if precio is not None}
+    for lineas in overlay.get('formulas', {}).values():
+        materias.update(mp_id for mp_id, _ in lineas or ())
+    productos = {pid for pid, lineas in overlay.get('formulas', {}).items() if lineas is not None}
+    for batches in overlay.get('produccion', {}).values():
+        productos.update(batches or ())
+
+    for modelo, ids, nombre in ((MateriaPrima, materias, 'Materias primas'), (Producto, productos, 'Productos')):
+        ids = sorted(ids)
+        existentes = set()
+        for chunk in chunks(ids):
+            existentes.update(i for (i,) in db.session.query(modelo.id).filter(modelo.id.in_(chunk)))
+        faltantes = [i for i in ids if i not in existentes]
+        if faltantes:
+            return f'{nombre} inexistentes: {faltantes}'
+    return None
+
+
+def _meses_entre(mes_desde, mes_hasta):
+    """Meses en (mes_desde, mes_hasta], en orden."""
+    año, mes = map(int, mes_desde.split('-'))
+    meses = []
+    while True:
+        año, mes = (año + 1, 1) if mes == 12 else (año, mes + 1)
+        actual = f'{año}-{mes:02d}'
+        if actual > mes_hasta:
+            return meses
+        meses.append(actual)
+
+
+def _productos_catalogo(producto_ids):
+    """{producto_id: ProductoCatalogo} (del snapshot del catálogo; los inactivos desde la base)."""
+    snapshot = catalogo.snapshot().productos
+    productos = {pid: snapshot[pid] for pid in producto_ids if pid in snapshot}
+    faltantes = sorted(set(producto_ids) - set(productos))
+    for chunk in chunks(faltantes):
+        productos.update((p.id, ProductoCatalogo(p)) for p in Producto.query.filter(Producto.id.in_(chunk)))
+    return productos
+
+
+def _produccion_con_overlay(produccion, batches):
+    """
+    {producto_id: ProduccionProducto} con los batches del overlay reemplazados.
+
+    kg = batches * peso_batch_kg y minutos = kg * min_mo_kg, como en el
+    agregado mensual; 0 batches quita el producto del mes.
+    """
+    produccion = dict(produccion)
+    productos = _productos_catalogo([pid for pid in batches if pid not in produccion])
+    for pid, cantidad in batches.items():
+        producto = produccion[pid].producto if pid in produccion else productos.get(pid)
+        if cantidad <= 0 or producto is None:
+            produccion.pop(pid, None)
+            continue
+        kg = cantidad * producto.peso_batch_kg
+        produccion[pid] = ProduccionProducto(producto, kg, kg * (producto.min_mo_kg or 0), cantidad)
+    return dict(sorted(produccion.items()))
+
+
+class Sandbox:
+    """Overlay what-if y sus derivaciones memorizadas."""
+
+    def __init__(self, overlay):
+        self.id = uuid.uuid4().hex
+        self.creado = datetime.now()
+        self.overlay = {seccion: dict(overlay.get(seccion, {})) for seccion in _SECCIONES}
+        self.revision = 0
+        self._lock = threading.Lock()
+        self._memos = {}
+
+    # ------------------------------------------------------------------
+    # Overlay
+    # ------------------------------------------------------------------
+    def actualizar(self, cambios):
+        """Mezcla un overlay parcial (None quita la entrada) y avanza la revisión."""
+        with self._lock:
+            overlay = dict(self.overlay)
+            for seccion, valores in cambios.items():
+                actual = overlay[seccion] = dict(overlay[seccion])
+                for clave, valor in valores.items():
+                    if valor is None:
+                        actual.pop(clave, None)
+                    else:
+                        actual[clave] = valor
+            # Se reemplaza el dict completo: los requests en curso siguen viendo el anterior
+            self.overlay = overlay
+            self.revision += 1
+            self._memos.clear()
+
+    def to_dict(self):
+        formulas = {
+            str(pid): [{'materia_prima_id': mp_id, 'cantidad': cantidad} for mp_id, cantidad in lineas]
+            for pid, lineas in self.overlay['formulas'].items()
+        }
+        return {
+            'id': self.id,
+            'revision': self.revision,
+            'fecha_creacion': self.creado.isoformat(),
+            'overlay': {
+                'precios': {str(k): v for k, v in self.overlay['precios'].items()},
+                'formulas': formulas,
+                'indirectos': dict(self.overlay['indirectos']),
+                'inflacion': dict(self.overlay['inflacion']),
+                'produccion': {
+                    mes: {str(pid): cantidad for pid, cantidad in batches.items()}
+                    for mes, batches in self.overlay['produccion'].items()
+                },
+            },
+        }
+
+    def _memo(self, clave, base, construir):
+        """Derivación de ``base`` memorizada mientras no cambien la base ni la revisión."""
+        with self._lock:
+            revision = self.revision
+            entrada = self._memos.get(clave)
+        if entrada is not None and entrada[0] is base:
+            return entrada[1]
+        valor = construir()
+        with self._lock:
+            if self.revision == revision:
+                if len(self._memos) >= _MAX_MEMOS:
+                    self._memos.clear()
+                self._memos[clave] = (base, valor)
+        return valor
+
+    # ------------------------------------------------------------------
+    # Costeo variable
+    # ------------------------------------------------------------------
+    def _aplicar(self, matriz, overlay):
+        matriz = matriz.con_formulas(overlay['formulas'])
+        if overlay['precios']:
+            precios = matriz.precios.copy()
+            for mp_id, precio in overlay['precios'].items():
+                col = matriz.columna_por_mp.get(mp_id)
+                if col is not None:
+                    precios[col] = precio
+            matriz = matriz.con_precios(precios)
+        return matriz
+
+    def _con_overlay(self, productos):
+        """(MatrizCosteo con el overlay aplicado, resultado de calcular())."""
+        overlay = self.overlay
+        base = matriz_costeo(productos)
+        return self._memo('matriz', base, lambda: self._derivar(base, overlay))
+
+    def _derivar(self, base, overlay):
+        matriz = self._aplicar(base, overlay)
+        return matriz, matriz.calcular()
+
+    def matriz_costeo(self, productos):
+        """MatrizCosteo con el overlay aplicado que incluye ``productos``."""
+        productos = list(productos)
+        if not (self.overlay['precios'] or self.overlay['formulas']):
+            return matriz_costeo(productos)
+        return self._con_overlay(productos)[0]
+
+    def costeos(self, productos):
+        """{producto_id: CosteoProducto} con el overlay aplicado."""
+        productos = list(productos)
+        if not (self.overlay['precios'] or self.overlay['formulas']):
+            return cache_costeo.costeos(productos)
+        matriz, resultado = self._con_overlay(productos)
+        return {p.id: matriz.costeo_producto(p.id, resultado) for p in productos}
+
+    # ------------------------------------------------------------------
+    # Costos indirectos, inflación y producción
+    # ------------------------------------------------------------------
+    def inflacion_acumulada_rango(self, mes_desde, meses_hasta):
+        """Como ``indice_inflacion.acumulada_rango`` con los meses del overlay reemplazados."""
+        return self._inflacion_rango(self.overlay['inflacion'], mes_desde, meses_hasta)
+
+    @staticmethod
+    def _inflacion_rango(inflacion, mes_desde, meses_hasta):
+        if not inflacion:
+            return indice_inflacion.acumulada_rango(mes_desde, meses_hasta)
+        if not meses_hasta:
+            return np.ones(0, dtype=np.float64)
+        meses = _meses_entre(mes_desde, max(meses_hasta))
+        factores = {}
+        acumulado = 1.0
+        anterior = mes_desde
+        for mes in meses:
+            if mes in inflacion:
+                acumulado *= 1 + inflacion[mes] / 100
+            else:
+                acumulado *= indice_inflacion.acumulada(anterior, mes)
+            factores[mes] = acumulado
+            anterior = mes
+        return np.array([factores.get(mes, 1.0) for mes in meses_hasta], dtype=np.float64)
+
+    def contexto(self, mes_base, mes_produccion):
+        """ContextoMes (compartido, solo lectura) con indirectos, inflación y producción del overlay."""
+        base = obtener_contexto(mes_base, mes_produccion)
+        overlay = self.overlay
+        produccion = overlay['produccion'].keys() & {mes_base, mes_produccion}
+        if not (overlay['indirectos'] or overlay['inflacion'] or produccion):
+            return base
+        return self._memo(
+            ('contexto', mes_base, mes_produccion), base, lambda: self._derivar_contexto(base, overlay)
+        )
+
+    def _derivar_contexto(self, base, overlay):
+        indirectos = overlay['indirectos']
+        ctx = copy.copy(base)
+        ctx._lock = threading.Lock()
+        ctx._escalamientos = {}
+        if indirectos and any(c.cuenta in indirectos for c in base.costos):
+            ctx.costos = [
+                c._replace(monto=indirectos[c.cuenta]) if c.cuenta in indirectos else c
+                for c in base.costos
+            ]
+            ctx.totales_base = {
+                tipo: sum(c.monto for c in ctx.costos if c.tipo_distribucion == tipo)
+                for tipo in TIPOS_DISTRIBUCION
+            }
+            ctx.matriz_escalamiento = MatrizEscalamiento(ctx.costos)
+        ctx.inflacion_acumulada = float(
+            self._inflacion_rango(overlay['inflacion'], base.mes_base, [base.mes_produccion])[0]
+        )
+
+        produccion = overlay['produccion']
+        if base.mes_produccion in produccion:
+            ctx.produccion = _produccion_con_overlay(base.produccion, produccion[base.mes_produccion])
+            ctx.total_kg = sum(datos.kg for datos in ctx.produccion.values())
+            ctx.total_minutos = sum(datos.minutos for datos in ctx.produccion.values())
+        if base.mes_base in produccion:
+            programada = {
+                producto.id: ProduccionProducto(ProductoCatalogo(producto), kg, minutos, batches)
+                for producto, batches, kg, minutos in produccion_del_mes(base.mes_base)
+            }
+            programada = _produccion_con_overlay(programada, produccion[base.mes_base])
+            ctx._volumen_base_programado_kg = sum(datos.kg for datos in programada.values())
+            if base.origen_volumen_base == 'programado':
+                ctx.volumen_base_kg = ctx._volumen_base_programado_kg
+        return ctx
+
+
+class AlmacenSandboxes:
+    """LRU de sandboxes con expiración por inactividad."""
+
+    def __init__(self, max_sandboxes=MAX_SANDBOXES, ttl_segundos=TTL_SEGUNDOS, reloj=time.monotonic):
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # id -> (Sandbox, último acceso)
+        self.max_sandboxes = max_sandboxes
+        self.ttl_segundos = ttl_segundos
+        self._reloj = reloj
+        self.expirados = 0
+        self.desalojados = 0
+
+    def _purgar(self, ahora):
+        while self._entradas:
+            sandbox_id, (_, acceso) = next(iter(self._entradas.items()))
+            if ahora - acceso < self.ttl_segundos:
+                break
+            del self._entradas[sandbox_id]
+            self.expirados += 1
+
+    def crear(self, overlay):
+        sandbox = Sandbox(overlay)
+        with self._lock:
+            ahora = self._reloj()
+            self._purgar(ahora)
+            self._entradas[sandbox.id] = (sandbox, ahora)
+            while len(self._entradas) > self.max_sandboxes:
+                self._entradas.popitem(last=False)
+                self.desalojados += 1
+        return sandbox
+
+    def obtener(self, sandbox_id):
+        """Sandbox por id (renueva su TTL) o None si no existe o expiró."""
+        with self._lock:
+            ahora = self._reloj()
+            self._purgar(ahora)
+            entrada = self._entradas.get(sandbox_id)
+            if entrada is None:
+                return None
+            self._entradas[sandbox_id] = (entrada[0], ahora)
+            self._entradas.move_to_end(sandbox_id)
+            return entrada[0]
+
+    def eliminar(self, sandbox_id):
+        with self._lock:
+            return self._entradas.pop(sandbox_id, None) is not None
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            self._purgar(self._reloj())
+            return {
+                'sandboxes': len(self._entradas),
+                'max_sandboxes': self.max_sandboxes,
+                'ttl_segundos': self.ttl_segundos,
+                'expirados': self.expirados,
+                'desalojados': self.desalojados,
+            }
+
+
+sandboxes = AlmacenSandboxes()
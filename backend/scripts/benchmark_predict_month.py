@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark de predict_month (predicción ML de un mes para muchos productos).
+
+Entrena el predictor sobre historia sintética (por defecto 500 productos con
+3 a 36 meses cada uno; el entrenamiento tarda ~1-2 min). Mide lo que tarda un
+predictor nuevo en abrir el almacén de modelos y hacer su primer predict()
+(no debería crecer con el catálogo: los modelos se leen bajo demanda) y la
+mediana de:
+
+- predict():         un predict() por producto (lo que hacía predict_month);
+- predict_month():   features en una pasada NumPy, árboles compilados en lote
+                     y una sola llamada al modelo global;
+- POST /api/ml/predict: endpoint completo (predicción + productos en una
+                     sola consulta).
+
+Verifica además que predict_month da lo mismo que predict() por producto.
+El modelo se guarda en un directorio temporal y la base es SQLite en
+memoria; no toca el modelo ni la base reales.
+
+Ejecutar desde backend/: python scripts/benchmark_predict_month.py [--productos 500] [--repeticiones 5] [--workers N]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Base en memoria y sin inicialización (antes de importar app)
+os.environ['COSTOS_EMBUTIDOS_SKIP_INIT_DB'] = '1'
+os.environ['COSTOS_EMBUTIDOS_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ.setdefault('FLASK_ENV', 'development')
+
+from app import app, db  # noqa: E402
+from catalogo import init_catalogo  # noqa: E402
+from models import Producto  # noqa: E402
+import predictor as predictor_mod  # noqa: E402
+
+AÑO, MES = 2025, 6
+
+
+def _historia(n_productos, rng):
+    data = []
+    for pid in range(1, n_productos + 1):
+        for k in range(int(rng.integers(3, 37))):
+            data.append({'producto_id': pid, 'año': 2022 + k // 12, 'mes': k % 12 + 1,
+                         'cantidad_kg': float(rng.uniform(100, 2000))})
+    return data
+
+
+def _mediana_ms(fn, repeticiones):
+    fn()  # calienta cachés
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--productos', type=int, default=500)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    warnings.simplefilter('ignore')
+    app.config.update(TESTING=True)
+    # Base en memoria: el snapshot se reconstruye en el hilo del benchmark
+    init_catalogo(app, refresco_en_segundo_plano=False)
+
+    with tempfile.TemporaryDirectory() as tmp, app.app_context():
+        predictor = predictor_mod.ProductionPredictor()
+        predictor.MODEL_PATH = os.path.join(tmp, 'production_model.pkl')
+        predictor.META_PATH = os.path.join(tmp, 'production_model.meta.json')
+        inicio = time.perf_counter()
+        metrics = predictor.train(_historia(args.productos, np.random.default_rng(42)), workers=args.workers)
+        print(f"Entrenamiento: {args.productos} productos, {metrics['productos_entrenados']} modelos "
+              f"por producto, {time.perf_counter() - inicio:.1f} s")
+
+        # Como un worker recién iniciado: solo manifest + memory-map, y un modelo al predecir
+        nuevo = predictor_mod.ProductionPredictor()
+        nuevo.MODEL_PATH, nuevo.META_PATH = predictor.MODEL_PATH, predictor.META_PATH
+        inicio = time.perf_counter()
+        nuevo._ensure_models_loaded()
+        carga_ms = (time.perf_counter() - inicio) * 1000
+        inicio = time.perf_counter()
+        nuevo.predict(1, AÑO, MES)
+        primer_ms = (time.perf_counter() - inicio) * 1000
+        print(f"Carga del almacén: {carga_ms:.1f} ms, primer predict(): {primer_ms:.1f} ms\n")
+
+        db.create_all()
+        db.session.execute(Producto.__table__.insert(), [
+            {'id': pid, 'codigo': f'P{pid:05d}', 'nombre': f'Producto {pid}', 'peso_batch_kg': 100.0, 'activo': True}
+            for pid in range(1, args.productos + 1)
+        ])
+        db.session.commit()
+        predictor_mod.predictor = predictor  # el que usa get_predictor() en los endpoints
+
+        ids = list(range(1, args.productos + 1))
+        uno_por_uno = [dict(predictor.predict(pid, AÑO, MES), producto_id=pid) for pid in ids]
+        assert predictor.predict_month(ids, AÑO, MES) == uno_por_uno
+
+        client = app.test_client()
+
+        def endpoint():
+            resp = client.post('/api/ml/predict', json={'año': AÑO, 'mes': MES})
+            assert resp.status_code == 200, resp.status_code
+
+        print(f"{'':<22} {'mediana ms':>10}")
+        for nombre, fn in (
+            ('predict() x producto', lambda: [predictor.predict(pid, AÑO, MES) for pid in ids]),
+            ('predict_month()', lambda: predictor.predict_month(ids, AÑO, MES)),
+            ('POST /api/ml/predict', endpoint),
+        ):
+            print(f"{nombre:<22} {_mediana_ms(fn, args.repeticiones):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
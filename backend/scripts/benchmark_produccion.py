@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los totales mensuales de producción programada.
+
+Compara, para meses de distinto tamaño (100 a 50.000 programaciones), la
+latencia de obtener batches / kg / minutos por producto con:
+
+- python:   filas ORM filtradas con extract(year/month) y sumas en Python
+            (cómo lo hacían los endpoints antes de consultas_produccion.py)
+- sql:      GROUP BY producto en SQL con rango de fechas sargable
+            (consultas_produccion.totales_del_mes)
+- agregado: lectura de la tabla produccion_mensual
+            (produccion_mensual.produccion_del_mes)
+
+Usa una base SQLite en memoria; no toca la base de datos real.
+
+Ejecutar desde backend/: python scripts/benchmark_produccion.py [--repeticiones 5]
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Base en memoria y sin inicialización (antes de importar app)
+os.environ['COSTOS_EMBUTIDOS_SKIP_INIT_DB'] = '1'
+os.environ['COSTOS_EMBUTIDOS_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ.setdefault('FLASK_ENV', 'development')
+
+from sqlalchemy import extract  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import Producto, ProduccionProgramada  # noqa: E402
+from consultas_produccion import totales_del_mes  # noqa: E402
+from produccion_mensual import produccion_del_mes, reconstruir  # noqa: E402
+
+TAMAÑOS = (100, 1_000, 5_000, 20_000, 50_000)
+N_PRODUCTOS = 80
+AÑO, MES = 2025, 6
+
+
+def _totales_python(año, mes):
+    filas = ProduccionProgramada.query.options(
+        joinedload(ProduccionProgramada.producto)
+    ).filter(
+        extract('year', ProduccionProgramada.fecha_programacion) == año,
+        extract('month', ProduccionProgramada.fecha_programacion) == mes
+    ).all()
+    totales = {}
+    for p in filas:
+        kg = p.cantidad_batches * p.producto.peso_batch_kg
+        t = totales.setdefault(p.producto_id, [0, 0, 0])
+        t[0] += p.cantidad_batches
+        t[1] += kg
+        t[2] += kg * p.producto.min_mo_kg
+    return totales
+
+
+def _poblar(n_mes, rng):
+    """n_mes programaciones en el mes medido y la misma cantidad repartida en otros meses."""
+    db.session.execute(ProduccionProgramada.__table__.delete())
+    filas = []
+    for i in range(2 * n_mes):
+        mes = MES if i < n_mes else rng.choice([m for m in range(1, 13) if m != MES])
+        filas.append({
+            'producto_id': rng.randint(1, N_PRODUCTOS),
+            'cantidad_batches': round(rng.uniform(0.5, 10.0), 2),
+            'fecha_programacion': date(AÑO, mes, rng.randint(1, 28)),
+            'es_sugerencia_ml': False,
+        })
+    db.session.execute(ProduccionProgramada.__table__.insert(), filas)
+    reconstruir()
+    db.session.commit()
+
+
+def _medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        db.session.expunge_all()
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger('produccion_mensual').setLevel(logging.WARNING)
+    rng = random.Random(42)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Producto(codigo=f'B{i:03d}', nombre=f'Producto {i}',
+                     peso_batch_kg=rng.uniform(20, 200), min_mo_kg=rng.uniform(0, 3))
+            for i in range(1, N_PRODUCTOS + 1)
+        ])
+        db.session.commit()
+
+        print(f"{'filas mes':>10} {'python ms':>10} {'sql ms':>10} {'agregado ms':>12}")
+        for n in TAMAÑOS:
+            _poblar(n, rng)
+            t_python = _medir(lambda: _totales_python(AÑO, MES), args.repeticiones)
+            t_sql = _medir(lambda: totales_del_mes(AÑO, MES), args.repeticiones)
+            t_agregado = _medir(lambda: produccion_del_mes(f"{AÑO}-{MES:02d}"), args.repeticiones)
+            print(f"{n:>10} {t_python:>10.2f} {t_sql:>10.2f} {t_agregado:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
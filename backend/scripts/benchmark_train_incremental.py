@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark del entrenamiento incremental del predictor (train(incremental=True)).
+
+Entrena el predictor sobre historia sintética (por defecto 500 productos con
+3 a 36 meses cada uno), simula una importación mensual que agrega un mes a
+algunos productos (--cambiados, default 5) y compara:
+
+- entrenamiento completo sobre los datos nuevos;
+- entrenamiento incremental: reentrena solo los productos cambiados y el
+  global, y reutiliza el resto de los modelos guardados.
+
+Verifica que ambos dan las mismas métricas y predicciones. Los modelos se
+guardan en un directorio temporal; no toca el modelo real. Tarda ~3-4 min
+con 500 productos (dos entrenamientos completos).
+
+Ejecutar desde backend/: python scripts/benchmark_train_incremental.py [--productos 500] [--cambiados 5] [--workers N]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import predictor as predictor_mod  # noqa: E402
+
+
+def _historia(n_productos, rng):
+    data = []
+    for pid in range(1, n_productos + 1):
+        for k in range(int(rng.integers(3, 37))):
+            data.append({'producto_id': pid, 'año': 2022 + k // 12, 'mes': k % 12 + 1,
+                         'cantidad_kg': float(rng.uniform(100, 2000))})
+    return data
+
+
+def _importar_mes(data, productos, rng):
+    """Agrega el mes siguiente al último de cada producto de `productos`."""
+    nuevos = []
+    for pid in productos:
+        año, mes = max((r['año'], r['mes']) for r in data if r['producto_id'] == pid)
+        año, mes = (año + 1, 1) if mes == 12 else (año, mes + 1)
+        nuevos.append({'producto_id': pid, 'año': año, 'mes': mes, 'cantidad_kg': float(rng.uniform(100, 2000))})
+    return data + nuevos
+
+
+def _predictor(directorio):
+    predictor = predictor_mod.ProductionPredictor()
+    predictor.MODEL_PATH = os.path.join(directorio, 'production_model.pkl')
+    predictor.META_PATH = os.path.join(directorio, 'production_model.meta.json')
+    return predictor
+
+
+def _entrenar(predictor, data, **kwargs):
+    inicio = time.perf_counter()
+    metrics = predictor.train(data, **kwargs)
+    return metrics, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--productos', type=int, default=500)
+    parser.add_argument('--cambiados', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    warnings.simplefilter('ignore')
+    rng = np.random.default_rng(42)
+    data = _historia(args.productos, rng)
+    # Productos con historia suficiente para tener modelo propio (>= 6 meses)
+    meses = Counter(r['producto_id'] for r in data)
+    con_modelo = sorted(pid for pid, n in meses.items() if n >= 6)
+    data_nueva = _importar_mes(data, con_modelo[:args.cambiados], rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        incremental = _predictor(os.path.join(tmp, 'incremental'))
+        _, segundos = _entrenar(incremental, data, workers=args.workers)
+        print(f"Entrenamiento inicial: {args.productos} productos, {segundos:.1f} s")
+
+        metrics, segundos_incremental = _entrenar(incremental, data_nueva, workers=args.workers, incremental=True)
+        info = metrics.pop('incremental')
+        completo = _predictor(os.path.join(tmp, 'completo'))
+        esperado, segundos_completo = _entrenar(completo, data_nueva, workers=args.workers)
+        esperado.pop('incremental')
+        metrics.pop('paralelismo')
+        esperado.pop('paralelismo')
+        assert metrics == esperado
+        ids = list(range(1, args.productos + 1))
+        assert incremental.predict_month(ids, 2025, 6) == completo.predict_month(ids, 2025, 6)
+
+        print(f"Importación de un mes en {args.cambiados} productos:")
+        print(f"  completo:     {segundos_completo:>7.1f} s")
+        print(f"  incremental:  {segundos_incremental:>7.1f} s "
+              f"({info['productos_reentrenados']} reentrenados, {info['productos_reutilizados']} reutilizados, "
+              f"global reentrenado: {'sí' if info['modelo_global_reentrenado'] else 'no'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memoria y latencia de los tipos de valor del costeo.
+
+Sobre un catálogo sintético (por defecto 2.000 productos, 400 materias
+primas, ~12 líneas de fórmula por producto) compara:
+
+- costeos:    costeo de todos los productos como dicts anidados (formato
+              get_costeo(), como los guardaba la caché) vs. CosteoProducto
+              con LineaIngrediente (valores_costeo.py): memoria retenida
+              (tracemalloc) y tiempo de construcción;
+- producción: filas del ContextoMes como dicts con producto.to_dict() vs.
+              ProduccionProducto;
+
+y mide la latencia (mediana) de los endpoints que recorren esos valores,
+con la caché ya caliente: costeo/resumen, costeo/completo,
+distribucion-costos, analisis-marginal y resumen-mensual.
+
+Usa una base SQLite en memoria; no toca la base de datos real.
+
+Ejecutar desde backend/: python scripts/benchmark_valores_costeo.py [--productos 2000] [--repeticiones 5]
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Base en memoria y sin inicialización (antes de importar app)
+os.environ['COSTOS_EMBUTIDOS_SKIP_INIT_DB'] = '1'
+os.environ['COSTOS_EMBUTIDOS_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ.setdefault('FLASK_ENV', 'development')
+
+from app import app, db  # noqa: E402
+from models import (  # noqa: E402
+    Categoria, MateriaPrima, Producto, FormulaDetalle, ProduccionProgramada, CostoIndirecto,
+)
+from catalogo import catalogo, init_catalogo  # noqa: E402
+from produccion_mensual import produccion_del_mes, reconstruir  # noqa: E402
+from valores_costeo import ProductoCatalogo, ProduccionProducto  # noqa: E402
+
+N_MATERIAS = 400
+LINEAS_POR_PRODUCTO = 12
+MES_BASE, MES_PRODUCCION = '2025-05', '2025-06'
+
+
+def _poblar(n_productos, rng):
+    categorias = [Categoria(nombre=n, tipo='DIRECTA') for n in ('CERDO', 'RES', 'CONDIMENTOS')]
+    categorias.append(Categoria(nombre='ENVASES', tipo='ENVASE'))
+    db.session.add_all(categorias)
+    db.session.commit()
+    db.session.execute(MateriaPrima.__table__.insert(), [
+        {'nombre': f'MP {i}', 'categoria_id': categorias[i % len(categorias)].id, 'unidad': 'Kg',
+         'costo_unitario': round(rng.uniform(1, 300), 2)}
+        for i in range(N_MATERIAS)
+    ])
+    db.session.execute(Producto.__table__.insert(), [
+        {'codigo': f'P{i:05d}', 'nombre': f'Producto {i}', 'peso_batch_kg': rng.uniform(20, 200),
+         'porcentaje_merma': rng.uniform(0, 10), 'min_mo_kg': rng.uniform(0, 3),
+         'precio_venta': rng.uniform(500, 3000), 'activo': True}
+        for i in range(n_productos)
+    ])
+    mp_ids = [mp_id for (mp_id,) in db.session.query(MateriaPrima.id)]
+    producto_ids = [pid for (pid,) in db.session.query(Producto.id)]
+    db.session.execute(FormulaDetalle.__table__.insert(), [
+        {'producto_id': pid, 'materia_prima_id': mp_id, 'cantidad': round(rng.uniform(0.1, 30), 3)}
+        for pid in producto_ids
+        for mp_id in rng.sample(mp_ids, LINEAS_POR_PRODUCTO)
+    ])
+    db.session.execute(ProduccionProgramada.__table__.insert(), [
+        {'producto_id': pid, 'cantidad_batches': round(rng.uniform(0.5, 10), 2),
+         'fecha_programacion': date(2025, mes, rng.randint(1, 28)), 'es_sugerencia_ml': False}
+        for pid in producto_ids for mes in (5, 6)
+    ])
+    db.session.add_all([
+        CostoIndirecto(cuenta='Sueldos', monto=4_000_000.0, tipo_distribucion='SP', mes_base=MES_BASE),
+        CostoIndirecto(cuenta='Energía', monto=900_000.0, tipo_distribucion='GIF', mes_base=MES_BASE,
+                       es_variable=True, variacion_max_pct=50.0),
+        CostoIndirecto(cuenta='Depreciación', monto=300_000.0, tipo_distribucion='DEP', mes_base=MES_BASE),
+    ])
+    reconstruir()
+    db.session.commit()
+
+
+def _retenido(construir):
+    """(objeto, KiB retenidos, ms) de construir()."""
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    valor = construir()
+    duracion = (time.perf_counter() - inicio) * 1000
+    gc.collect()
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return valor, actual / 1024, duracion
+
+
+def _medir(client, url, repeticiones):
+    client.get(url)  # calienta cachés y contexto
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resp = client.get(url)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert resp.status_code == 200, (url, resp.status_code)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--productos', type=int, default=2000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    app.config.update(TESTING=True)
+    # Base en memoria: el snapshot se reconstruye en el hilo del benchmark
+    init_catalogo(app, refresco_en_segundo_plano=False)
+    with app.app_context():
+        db.create_all()
+        _poblar(args.productos, random.Random(42))
+        matriz = catalogo.snapshot().matriz
+        resultado = matriz.calcular()
+        ids = [p.id for p in matriz.productos]
+
+        print(f"Catálogo: {len(ids)} productos, {N_MATERIAS} materias primas, "
+              f"{len(matriz.cantidades)} líneas de fórmula\n")
+        print(f"{'':<12} {'dicts KiB':>10} {'slots KiB':>10} {'dicts ms':>10} {'slots ms':>10}")
+
+        _, kib_dicts, ms_dicts = _retenido(lambda: {pid: matriz.costeo(pid, resultado) for pid in ids})
+        _, kib_slots, ms_slots = _retenido(lambda: {pid: matriz.costeo_producto(pid, resultado) for pid in ids})
+        print(f"{'costeos':<12} {kib_dicts:>10.0f} {kib_slots:>10.0f} {ms_dicts:>10.1f} {ms_slots:>10.1f}")
+
+        plan = produccion_del_mes(MES_PRODUCCION)
+        _, kib_dicts, ms_dicts = _retenido(lambda: {
+            p.id: {'producto': p.to_dict(), 'kg': kg, 'minutos': minutos, 'batches': batches}
+            for p, batches, kg, minutos in plan
+        })
+        _, kib_slots, ms_slots = _retenido(lambda: {
+            p.id: ProduccionProducto(ProductoCatalogo(p), kg, minutos, batches)
+            for p, batches, kg, minutos in plan
+        })
+        print(f"{'producción':<12} {kib_dicts:>10.0f} {kib_slots:>10.0f} {ms_dicts:>10.1f} {ms_slots:>10.1f}")
+
+        client = app.test_client()
+        meses = f'mes_base={MES_BASE}&mes_produccion={MES_PRODUCCION}'
+        print(f"\n{'endpoint':<40} {'mediana ms':>10}")
+        for url in (
+            '/api/costeo/resumen',
+            f'/api/costeo/completo?{meses}',
+            f'/api/distribucion-costos?{meses}',
+            f'/api/analisis-marginal?{meses}',
+            f'/api/resumen-mensual?mes={MES_PRODUCCION}',
+        ):
+            print(f"{url.split('?')[0]:<40} {_medir(client, url, args.repeticiones):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
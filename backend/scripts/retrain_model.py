@@ -6,22 +6,34 @@ from app import app
 from models import ProduccionHistorica
 from predictor import get_predictor
 
-with app.app_context():
-    historicos = ProduccionHistorica.query.all()
-    data = [
-        {'producto_id': h.producto_id, 'año': h.año, 'mes': h.mes, 'cantidad_kg': h.cantidad_kg}
-        for h in historicos
-    ]
-    print(f'📊 Datos a entrenar: {len(data)} registros')
-    productos_unicos = len(set(h['producto_id'] for h in data))
-    print(f'📦 Productos únicos con historial: {productos_unicos}')
+def main():
+    # --incremental: solo reentrena los productos cuya serie cambió
+    incremental = '--incremental' in sys.argv[1:]
+
+    with app.app_context():
+        historicos = ProduccionHistorica.query.all()
+        data = [
+            {'producto_id': h.producto_id, 'año': h.año, 'mes': h.mes, 'cantidad_kg': h.cantidad_kg}
+            for h in historicos
+        ]
+        print(f'📊 Datos a entrenar: {len(data)} registros')
+        productos_unicos = len(set(h['producto_id'] for h in data))
+        print(f'📦 Productos únicos con historial: {productos_unicos}')
     
-    predictor = get_predictor()
-    result = predictor.train(data)
+        predictor = get_predictor()
+        result = predictor.train(data, incremental=incremental)
     
-    if result.get('success'):
-        print(f'✅ Modelo entrenado:')
-        print(f'   Productos entrenados: {result.get("productos_entrenados", 0)}')
-        print(f'   Modelo global: {"Sí" if result.get("modelo_global") else "No"}')
-    else:
-        print(f'❌ Error: {result.get("error")}')
+        if result.get('success'):
+            print(f'✅ Modelo entrenado:')
+            print(f'   Productos entrenados: {result.get("productos_entrenados", 0)}')
+            print(f'   Modelo global: {"Sí" if result.get("modelo_global") else "No"}')
+            if incremental:
+                print(f'   Reentrenados: {result["incremental"]["productos_reentrenados"]}, '
+                      f'reutilizados: {result["incremental"]["productos_reutilizados"]}')
+        else:
+            print(f'❌ Error: {result.get("error")}')
+
+
+# Guard necesario: el entrenamiento lanza workers con 'spawn', que re-importan este módulo
+if __name__ == '__main__':
+    main()
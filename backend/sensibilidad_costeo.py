@@ -0,0 +1,179 @@
+"""
+Matriz de sensibilidad del costo por kg a los precios de materia prima.
+
+``costo_por_kg`` es lineal en los costos unitarios de las materias primas, así
+que su derivada respecto de cada precio no depende de los precios:
+
+    ∂costo_por_kg[p] / ∂costo_unitario[m] =
+        Σ cantidad(p, m) × (1 + merma/100 salvo ENVASES) / peso_neto_batch_kg[p]
+
+Se obtiene de una vez a partir del BOM disperso de ``MatrizCosteo``
+(``sensibilidad_lineas()``) y se guarda en dos órdenes:
+
+- por producto (CSR), para listar la exposición de cada producto;
+- por materia prima (CSC) con los productos de cada columna ordenados de
+  mayor a menor sensibilidad, de modo que los ``k`` productos más expuestos a
+  una materia prima son un slice, sin recorrer la matriz.
+
+Como no depende de los precios, un ajuste de precios no la invalida: se
+descarta al confirmar una transacción que cambia fórmulas, peso del batch,
+merma o estado activo de productos, o la categoría de materias primas.
+"""
+import logging
+import threading
+
+import numpy as np
+from sqlalchemy import inspect as sa_inspect
+
+from models import db, Categoria, MateriaPrima, Producto, FormulaDetalle
+from catalogo import matriz_costeo
+from invalidacion import registrar_invalidacion
+
+logger = logging.getLogger(__name__)
+
+_CLAVE_CAMBIOS = 'sensibilidad_costeo_cambios'
+
+# Atributos que cambian la sensibilidad (los precios no la cambian)
+_ATRIBUTOS_PRODUCTO = ('peso_batch_kg', 'porcentaje_merma', 'activo')
+_ATRIBUTOS_MP = ('categoria_id',)
+
+
+class MatrizSensibilidad:
+    """Sensibilidades no nulas de los productos activos, por producto y por materia prima."""
+
+    def __init__(self, matriz):
+        """
+        Args:
+            matriz: MatrizCosteo de los productos activos
+        """
+        self.producto_ids = np.array([p.id for p in matriz.productos], dtype=np.int64)
+        self.fila_por_producto = dict(matriz.fila_por_producto)
+        self.mp_ids = matriz.mp_ids
+        self.columna_por_mp = dict(matriz.columna_por_mp)
+        n, m = len(self.producto_ids), len(self.mp_ids)
+
+        # Suma las líneas repetidas de una misma materia prima en un producto
+        clave = matriz.filas * m + matriz.indices
+        claves, inversa = np.unique(clave, return_inverse=True)
+        valores = np.bincount(inversa, weights=matriz.sensibilidad_lineas(), minlength=len(claves))
+
+        # Por producto (CSR): claves ya ordenadas por (fila, columna)
+        self.filas = claves // m if m else claves
+        self.columnas = claves % m if m else claves
+        self.valores = valores
+        self.indptr = np.searchsorted(self.filas, np.arange(n + 1))
+
+        # Por materia prima (CSC) con sensibilidad descendente dentro de cada columna
+        orden = np.lexsort((-valores, self.columnas))
+        self.filas_por_mp = self.filas[orden]
+        self.valores_por_mp = valores[orden]
+        self.colptr = np.searchsorted(self.columnas[orden], np.arange(m + 1))
+
+    def de_producto(self, producto_id):
+        """{materia_prima_id: sensibilidad} de un producto (vacío si no está activo)."""
+        fila = self.fila_por_producto.get(producto_id)
+        if fila is None:
+            return {}
+        tramo = slice(self.indptr[fila], self.indptr[fila + 1])
+        return {
+            int(self.mp_ids[c]): float(v) for c, v in zip(self.columnas[tramo], self.valores[tramo])
+        }
+
+    def mas_expuestos(self, materia_prima_id, k=None):
+        """
+        Los ``k`` productos con mayor sensibilidad a la materia prima.
+
+        Returns:
+            lista de (producto_id, sensibilidad) ordenada de mayor a menor.
+        """
+        col = self.columna_por_mp.get(materia_prima_id)
+        if col is None:
+            return []
+        inicio, fin = self.colptr[col], self.colptr[col + 1]
+        if k is not None:
+            fin = min(fin, inicio + k)
+        return [
+            (int(self.producto_ids[f]), float(v))
+            for f, v in zip(self.filas_por_mp[inicio:fin], self.valores_por_mp[inicio:fin])
+        ]
+
+    def variacion_costo_por_kg(self, variaciones):
+        """
+        Variación de costo_por_kg de cada producto activo ante cambios de precio.
+
+        Args:
+            variaciones: {materia_prima_id: variación absoluta del costo unitario}
+
+        Returns:
+            array (P,) alineado con ``producto_ids``.
+        """
+        delta = np.zeros(len(self.mp_ids), dtype=np.float64)
+        for mp_id, valor in variaciones.items():
+            col = self.columna_por_mp.get(mp_id)
+            if col is not None:
+                delta[col] = valor
+        return np.bincount(
+            self.filas, weights=self.valores * delta[self.columnas], minlength=len(self.producto_ids)
+        )
+
+
+class CacheSensibilidad:
+    """Matriz de sensibilidad construida a demanda y descartada ante cambios de estructura."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._matriz = None
+
+    def matriz(self):
+        with self._lock:
+            if self._matriz is not None:
+                return self._matriz
+            matriz = MatrizSensibilidad(matriz_costeo())
+            # Con cambios sin confirmar en la sesión la matriz se usa pero no se guarda
+            if not db.session.info.get(_CLAVE_CAMBIOS):
+                self._matriz = matriz
+            logger.debug(
+                "sensibilidad_costeo.construir productos=%s materias=%s entradas=%s",
+                len(matriz.producto_ids), len(matriz.mp_ids), len(matriz.valores),
+            )
+            return matriz
+
+    def invalidar(self):
+        with self._lock:
+            self._matriz = None
+
+
+cache_sensibilidad = CacheSensibilidad()
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy
+# ----------------------------------------------------------------------
+def _cambia_estructura(session, obj):
+    if isinstance(obj, (FormulaDetalle, Categoria)):
+        return True
+    if isinstance(obj, Producto):
+        atributos = _ATRIBUTOS_PRODUCTO
+    elif isinstance(obj, MateriaPrima):
+        atributos = _ATRIBUTOS_MP
+    else:
+        return False
+    if obj in session.new or obj in session.deleted:
+        return True
+    estado = sa_inspect(obj)
+    return any(estado.attrs[a].history.has_changes() for a in atributos)
+
+
+def _anotar(session, objetos):
+    if any(_cambia_estructura(session, obj) for obj in objetos):
+        session.info[_CLAVE_CAMBIOS] = True
+
+
+def init_sensibilidad_costeo(app=None):
+    """Registra los listeners que descartan la matriz (idempotente)."""
+    registrar_invalidacion(
+        _CLAVE_CAMBIOS,
+        (FormulaDetalle, MateriaPrima, Producto, Categoria),
+        lambda session, anotado: cache_sensibilidad.invalidar(),
+        anotar=_anotar,
+    )
@@ -0,0 +1,305 @@
+"""
+Simulación Monte Carlo del margen por producto.
+
+Sobre la misma matemática del análisis marginal, sortea la inflación mensual
+y un shock de precio (%) por categoría de materia prima desde distribuciones
+configurables, y obtiene la distribución del costo unitario y del margen de
+cada producto.
+
+El costo variable por kg es lineal en los precios de las materias primas
+(la merma multiplica solo la parte no ENVASES, como en ``get_costeo()``), así
+que se descompone una vez en una matriz producto × categoría ``A``:
+
+    costo_variable(sorteo) = inflacion(sorteo) * A @ factores_categoria(sorteo)
+
+El costo fijo unitario solo escala con la inflación. Con eso los costos de
+un grupo de productos son un producto de matrices (productos × categorías) ·
+(categorías × sorteos).
+
+Los sorteos (inflación y factores por categoría, pocos valores por sorteo)
+se generan acá en lotes de tamaño fijo, cada uno con su propia semilla
+derivada (``SeedSequence.spawn``). Los productos se reparten en bloques de
+``PRODUCTOS_POR_BLOQUE``: cada bloque calcula sus costos en todos los sorteos
+y los resume (percentiles exactos, media, probabilidades), así que de un
+worker vuelven unos pocos números por producto y no la matriz de costos. El
+pool de procesos se usa a partir de ``UMBRAL_POOL`` sorteos si hay más de
+una CPU; si falla se descarta y los bloques corren en este proceso. El
+resultado es el mismo en ambos casos.
+
+Este módulo solo depende de NumPy para que los workers (``spawn``) no
+importen la app.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_SORTEOS = 100_000
+TAMAÑO_LOTE = 25_000
+UMBRAL_POOL = 50_000
+PRODUCTOS_POR_BLOQUE = 32
+PERCENTILES_DEFAULT = (5, 25, 50, 75, 95)
+
+_DISTRIBUCIONES = {
+    'fija': ('valor',),
+    'normal': ('media', 'desvio'),
+    'uniforme': ('min', 'max'),
+    'triangular': ('min', 'moda', 'max'),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_distribucion(spec, nombre):
+    """
+    Valida una distribución, ej. ``{'distribucion': 'normal', 'media': 2, 'desvio': 0.5}``.
+    Un número se interpreta como distribución fija.
+
+    Returns:
+        (tupla (tipo, parametros...), None) o (None, mensaje_error)
+    """
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        return ('fija', float(spec)), None
+    if not isinstance(spec, dict):
+        return None, f'{nombre} debe ser un número o un objeto con distribucion'
+    tipo = spec.get('distribucion', 'fija')
+    if tipo not in _DISTRIBUCIONES:
+        return None, f'{nombre}: distribucion debe ser una de {sorted(_DISTRIBUCIONES)}'
+    parametros = []
+    for clave in _DISTRIBUCIONES[tipo]:
+        try:
+            parametros.append(float(spec[clave]))
+        except (KeyError, ValueError, TypeError):
+            return None, f'{nombre}: {clave} debe ser un número válido'
+    if tipo == 'normal' and parametros[1] < 0:
+        return None, f'{nombre}: desvio no puede ser negativo'
+    if tipo == 'uniforme' and parametros[1] < parametros[0]:
+        return None, f'{nombre}: max debe ser mayor o igual a min'
+    if tipo == 'triangular' and not (parametros[0] <= parametros[1] <= parametros[2] and parametros[0] < parametros[2]):
+        return None, f'{nombre}: se requiere min <= moda <= max y min < max'
+    return (tipo, *parametros), None
+
+
+def _sortear(rng, distribucion, n):
+    tipo, *p = distribucion
+    if tipo == 'fija':
+        return np.full(n, p[0])
+    if tipo == 'normal':
+        return rng.normal(p[0], p[1], n)
+    if tipo == 'uniforme':
+        return rng.uniform(p[0], p[1], n)
+    return rng.triangular(p[0], p[1], p[2], n)
+
+
+class ModeloMargen:
+    """Arrays de un mes necesarios para simular (livianos y serializables)."""
+
+    def __init__(self, producto_ids, precio_venta, cv_por_categoria, cf_unitario_base,
+                 categorias, meses_diferencia, inflacion_acumulada_base):
+        self.producto_ids = list(producto_ids)
+        self.precio_venta = np.asarray(precio_venta, dtype=np.float64)        # (P,)
+        self.cv_por_categoria = np.asarray(cv_por_categoria, dtype=np.float64)  # (P, C)
+        self.cf_unitario_base = np.asarray(cf_unitario_base, dtype=np.float64)  # (P,) sin inflación
+        self.categorias = list(categorias)
+        self.meses_diferencia = meses_diferencia
+        self.inflacion_acumulada_base = inflacion_acumulada_base
+
+    @classmethod
+    def desde_contexto(cls, ctx, productos, matriz=None):
+        """
+        Args:
+            ctx: ContextoMes con producción y costos
+            productos: {producto_id: ProductoCatalogo o Producto} de ctx.produccion
+            matriz: MatrizCosteo con los productos (opcional)
+        """
+        from analisis_marginal import evaluar_escenarios
+        from catalogo import matriz_costeo
+
+        producto_ids = list(ctx.produccion)
+        if matriz is None:
+            matriz = matriz_costeo([productos[pid] for pid in producto_ids])
+        filas = np.array([matriz.fila_por_producto[pid] for pid in producto_ids], dtype=np.int64)
+        # Columna c = costo por kg con solo las materias primas de la categoría c
+        columnas = []
+        for codigo in range(len(matriz.categorias)):
+            indicador = (matriz.mp_categoria == codigo).astype(np.float64)
+            columnas.append(matriz.calcular(indicador)['costo_por_kg'][filas])
+        cv_por_categoria = np.column_stack(columnas) if columnas else np.zeros((len(producto_ids), 0))
+
+        # Costo fijo unitario del escenario sin ajustes, con inflación 1
+        base = evaluar_escenarios(ctx, productos, [{'inflacion': 0.0}], matriz)
+        cf_base = base['costo_fijo_unitario'][0] / base['inflacion_acumulada'][0]
+        return cls(
+            producto_ids,
+            base['precio_venta'],
+            cv_por_categoria,
+            cf_base,
+            matriz.categorias,
+            ctx.meses_diferencia,
+            ctx.inflacion_acumulada,
+        )
+
+    def inflacion_acumulada(self, inflacion_mensual_pct):
+        """Inflación acumulada (como en analisis-marginal) para cada sorteo."""
+        if self.meses_diferencia > 0:
+            return (1 + inflacion_mensual_pct / 100) ** self.meses_diferencia
+        return np.full_like(inflacion_mensual_pct, self.inflacion_acumulada_base)
+
+
+def _sortear_lote(modelo, inflacion, shocks, semilla, n):
+    """
+    Sorteos de un lote.
+
+    Returns:
+        (inflacion acumulada (n,), factores de precio por categoría (C, n))
+    """
+    rng = np.random.default_rng(semilla)
+    inflacion_mensual = _sortear(rng, inflacion, n)
+    factores = np.ones((len(modelo.categorias), n))
+    for c, categoria in enumerate(modelo.categorias):
+        distribucion = shocks.get(categoria)
+        if distribucion is not None:
+            factores[c] = 1 + _sortear(rng, distribucion, n) / 100
+    return modelo.inflacion_acumulada(inflacion_mensual), factores
+
+
+def _resumir_bloque(cv_por_categoria, cf_unitario_base, precio_venta, acumulada, factores, q, q_inverso):
+    """
+    Costos de un bloque de productos en todos los sorteos, resumidos por producto.
+
+    Corre en los workers: recibe solo las filas del bloque y los sorteos, y
+    devuelve unos pocos números por producto en lugar de la matriz de costos.
+
+    Returns:
+        (percentiles q del costo total, percentiles 100 - q del costo total,
+        percentiles 100 - q del costo variable, media del costo total,
+        probabilidad de costo variable > precio, de costo total > precio)
+    """
+    costo_variable = (cv_por_categoria @ factores) * acumulada[None, :]
+    costo_total = costo_variable + cf_unitario_base[:, None] * acumulada[None, :]
+    precio = precio_venta[:, None]
+    pct_total = np.percentile(costo_total, q + q_inverso, axis=1).T
+    return (
+        pct_total[:, :len(q)],
+        pct_total[:, len(q):],
+        np.percentile(costo_variable, q_inverso, axis=1).T,
+        costo_total.mean(axis=1),
+        (costo_variable > precio).mean(axis=1),
+        (costo_total > precio).mean(axis=1),
+    )
+
+
+def _workers():
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _descartar_pool():
+    """Descarta el pool (roto o sin poder lanzar workers); el próximo uso crea otro."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def simular(modelo, inflacion, shocks, n_sorteos, semilla=None, percentiles=PERCENTILES_DEFAULT,
+            usar_pool=None):
+    """
+    Simula ``n_sorteos`` escenarios y resume la distribución por producto.
+
+    Args:
+        modelo: ModeloMargen del par de meses
+        inflacion: distribución de la inflación mensual (%) (ver parse_distribucion)
+        shocks: {nombre_categoria: distribución del cambio de precio (%)}
+        n_sorteos: cantidad de sorteos (hasta MAX_SORTEOS)
+        semilla: entero para reproducir la simulación
+        percentiles: percentiles a informar
+        usar_pool: forzar (True/False) el pool de procesos; por defecto se usa
+            desde UMBRAL_POOL sorteos si hay más de una CPU
+
+    Returns:
+        dict con ``inflacion_acumulada`` (percentiles) y ``productos``:
+        lista con percentiles de costo unitario y margen, y probabilidad de
+        margen negativo, en el orden de modelo.producto_ids.
+    """
+    tamaños = [TAMAÑO_LOTE] * (n_sorteos // TAMAÑO_LOTE)
+    if n_sorteos % TAMAÑO_LOTE:
+        tamaños.append(n_sorteos % TAMAÑO_LOTE)
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamaños))
+    lotes = [_sortear_lote(modelo, inflacion, shocks, s, n) for s, n in zip(semillas, tamaños)]
+    acumulada = np.concatenate([lote[0] for lote in lotes])
+    factores = np.concatenate([lote[1] for lote in lotes], axis=1)
+
+    # Los márgenes son decrecientes en el costo de cada producto: el percentil q
+    # del margen es precio - percentil (100 - q) del costo, así que solo se
+    # ordenan los costos.
+    q = list(percentiles)
+    q_inverso = [100 - p for p in q]
+    n_productos = len(modelo.producto_ids)
+    bloques = [slice(i, i + PRODUCTOS_POR_BLOQUE) for i in range(0, max(n_productos, 1), PRODUCTOS_POR_BLOQUE)]
+    argumentos = [
+        (modelo.cv_por_categoria[b], modelo.cf_unitario_base[b], modelo.precio_venta[b], acumulada, factores, q, q_inverso)
+        for b in bloques
+    ]
+    if usar_pool is None:
+        usar_pool = n_sorteos >= UMBRAL_POOL and len(bloques) > 1 and _workers() > 1
+
+    resumenes = None
+    if usar_pool:
+        try:
+            resumenes = list(_obtener_pool().map(_resumir_bloque, *zip(*argumentos)))
+        except Exception as e:
+            # BrokenProcessPool (un worker murió) o workers que no se pudieron lanzar
+            logger.warning("simulacion_margen.pool_failed error=%s", str(e))
+            _descartar_pool()
+            usar_pool = False
+    if resumenes is None:
+        resumenes = [_resumir_bloque(*args) for args in argumentos]
+
+    pct_costo, pct_costo_inverso, pct_variable_inverso, media_costo, prob_mc_negativo, prob_neto_negativo = (
+        np.concatenate(partes) for partes in zip(*resumenes)
+    )
+    precio = modelo.precio_venta[:, None]
+    pct_neto = precio - pct_costo_inverso
+    pct_mc = precio - pct_variable_inverso
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_mc_pct = np.where(precio > 0, pct_mc / precio * 100, 0.0)
+
+    def _resumen(valores, j):
+        return {f'p{p:g}': round(float(valores[j, k]), 2) for k, p in enumerate(q)}
+
+    productos = []
+    for j, pid in enumerate(modelo.producto_ids):
+        productos.append({
+            'producto_id': pid,
+            'precio_venta': round(float(modelo.precio_venta[j]), 2),
+            'costo_unitario_total': {**_resumen(pct_costo, j), 'media': round(float(media_costo[j]), 2)},
+            'margen_contribucion_unitario': _resumen(pct_mc, j),
+            'margen_contribucion_pct': _resumen(pct_mc_pct, j),
+            'margen_neto_unitario': _resumen(pct_neto, j),
+            'prob_margen_contribucion_negativo': round(float(prob_mc_negativo[j]), 4),
+            'prob_margen_neto_negativo': round(float(prob_neto_negativo[j]), 4),
+        })
+    return {
+        'sorteos': int(n_sorteos),
+        'lotes': len(tamaños),
+        'pool': bool(usar_pool),
+        'inflacion_acumulada_pct': {
+            f'p{p:g}': round(float(v), 2) for p, v in zip(q, (np.percentile(acumulada, q) - 1) * 100)
+        },
+        'productos': productos,
+    }
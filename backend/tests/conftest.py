@@ -1,5 +1,8 @@
 import os
 import sys
+from datetime import date
+from types import SimpleNamespace
+
 import pytest
 
 # IMPORTANT: set env vars BEFORE importing backend/app.py
@@ -11,7 +14,26 @@ BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if BACKEND_DIR not in sys.path:
     sys.path.insert(0, BACKEND_DIR)
 
-from app import app as flask_app, db  # noqa: E402
+from app import (  # noqa: E402
+    app as flask_app, db, Categoria, MateriaPrima, Producto, FormulaDetalle, ProduccionProgramada, CostoIndirecto,
+)
+from costeo_cache import cache_costeo  # noqa: E402
+from indice_precios import indice_precios  # noqa: E402
+from contexto_mensual import cache_contextos  # noqa: E402
+from indice_inflacion import indice_inflacion  # noqa: E402
+from sensibilidad_costeo import cache_sensibilidad  # noqa: E402
+from indice_uso import indice_uso  # noqa: E402
+from sandbox import sandboxes  # noqa: E402
+from catalogo import catalogo, init_catalogo  # noqa: E402
+from predictor import ProductionPredictor  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def modelos_en_tmp(tmp_path, monkeypatch):
+    # El almacén de modelos se guarda junto a MODEL_PATH: los tests no escriben en backend/models/
+    directorio = tmp_path / 'modelos'
+    monkeypatch.setattr(ProductionPredictor, 'MODEL_PATH', str(directorio / 'production_model.pkl'))
+    monkeypatch.setattr(ProductionPredictor, 'META_PATH', str(directorio / 'production_model.meta.json'))
 
 
 @pytest.fixture()
@@ -19,14 +41,83 @@ def app():
     flask_app.config.update(
         TESTING=True,
     )
+    # Snapshot del catálogo reconstruido en la primera lectura, sin hilo (determinista)
+    init_catalogo(flask_app, refresco_en_segundo_plano=False)
 
     with flask_app.app_context():
         db.create_all()
         yield flask_app
         db.session.remove()
         db.drop_all()
+        # drop_all no emite eventos ORM: limpiar la caché entre tests
+        cache_costeo.invalidar_todo()
+        indice_precios.invalidar()
+        cache_contextos.limpiar()
+        indice_inflacion.invalidar()
+        cache_sensibilidad.invalidar()
+        indice_uso.invalidar()
+        catalogo.invalidar()
+        sandboxes.limpiar()
 
 
 @pytest.fixture()
 def client(app):
     return app.test_client()
+
+
+@pytest.fixture()
+def crear_mes(app):
+    """
+    Crea un mes de costeo de referencia y devuelve sus objetos:
+
+    - categorías CERDO (DIRECTA) y ENVASES (ENVASE)
+    - carne (100 $/Kg), grasa (20 $/Kg) y tripa (3 $/UND)
+    - p1 (batch 100 kg, 1 min/kg, merma 5 %, fórmula carne 90 + tripa 10) y
+      p2 (batch 50 kg, 2 min/kg, fórmula carne 40)
+    - producción 2025-05: p1 3 batches, p2 2 batches; 2025-03: p1 2 batches
+    - costos indirectos del mes base 2025-03: Sueldos (SP), Energía (GIF,
+      variable hasta 50 %) y Máquinas (DEP)
+
+    Cada test pasa solo lo que necesita distinto: atributos de p1 / p2,
+    ``precios`` {materia: costo} y ``formulas`` {producto: [(materia, cantidad)]}.
+    """
+    def crear(p1=None, p2=None, precios=None, formulas=None):
+        cerdo = Categoria(nombre='CERDO', tipo='DIRECTA')
+        envases = Categoria(nombre='ENVASES', tipo='ENVASE')
+        db.session.add_all([cerdo, envases])
+        db.session.commit()
+        costos = {'carne': 100.0, 'grasa': 20.0, 'tripa': 3.0, **(precios or {})}
+        datos = SimpleNamespace(
+            cerdo=cerdo,
+            envases=envases,
+            carne=MateriaPrima(nombre='Carne', categoria_id=cerdo.id, unidad='Kg', costo_unitario=costos['carne']),
+            grasa=MateriaPrima(nombre='Grasa', categoria_id=cerdo.id, unidad='Kg', costo_unitario=costos['grasa']),
+            tripa=MateriaPrima(nombre='Tripa', categoria_id=envases.id, unidad='UND', costo_unitario=costos['tripa']),
+            p1=Producto(**{'codigo': 'P-1', 'nombre': 'Uno', 'peso_batch_kg': 100.0, 'min_mo_kg': 1.0,
+                           'porcentaje_merma': 5.0, 'precio_venta': 250.0, **(p1 or {})}),
+            p2=Producto(**{'codigo': 'P-2', 'nombre': 'Dos', 'peso_batch_kg': 50.0, 'min_mo_kg': 2.0,
+                           'precio_venta': 180.0, **(p2 or {})}),
+        )
+        db.session.add_all([datos.carne, datos.grasa, datos.tripa, datos.p1, datos.p2])
+        db.session.commit()
+
+        formulas = {'p1': [('carne', 90.0), ('tripa', 10.0)], 'p2': [('carne', 40.0)], **(formulas or {})}
+        for producto, lineas in formulas.items():
+            db.session.add_all(
+                FormulaDetalle(producto_id=getattr(datos, producto).id, materia_prima_id=getattr(datos, mp).id,
+                               cantidad=cantidad)
+                for mp, cantidad in lineas
+            )
+        db.session.add_all([
+            ProduccionProgramada(producto_id=datos.p1.id, cantidad_batches=3.0, fecha_programacion=date(2025, 5, 5)),
+            ProduccionProgramada(producto_id=datos.p2.id, cantidad_batches=2.0, fecha_programacion=date(2025, 5, 12)),
+            ProduccionProgramada(producto_id=datos.p1.id, cantidad_batches=2.0, fecha_programacion=date(2025, 3, 5)),
+            CostoIndirecto(cuenta='Sueldos', monto=40000.0, tipo_distribucion='SP', mes_base='2025-03'),
+            CostoIndirecto(cuenta='Energía', monto=8000.0, tipo_distribucion='GIF', mes_base='2025-03',
+                           es_variable=True, variacion_max_pct=50.0),
+            CostoIndirecto(cuenta='Máquinas', monto=3000.0, tipo_distribucion='DEP', mes_base='2025-03'),
+        ])
+        db.session.commit()
+        return datos
+
+    return crear
@@ -0,0 +1,127 @@
+"""
+Tests del almacén de modelos del predictor (almacen_modelos.py)
+"""
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IDS = [1, 2, 3, 4, 99]
+
+
+def _historia():
+    rng = np.random.default_rng(11)
+    return [
+        {'producto_id': pid, 'año': 2023 + k // 12, 'mes': k % 12 + 1,
+         'cantidad_kg': float(rng.uniform(500, 1500))}
+        for pid, meses in ((1, 20), (2, 8), (3, 7), (4, 4))
+        for k in range(meses)
+    ]
+
+
+def _predictor(directorio, cargar=False):
+    from predictor import ProductionPredictor
+
+    predictor = ProductionPredictor()
+    predictor.MODEL_PATH = os.path.join(directorio, 'production_model.pkl')
+    predictor.META_PATH = os.path.join(directorio, 'production_model.meta.json')
+    if cargar:
+        predictor._load_model()
+    return predictor
+
+
+def _predicciones(predictor):
+    return [predictor.predict(pid, 2025, 3) for pid in IDS] + predictor.predict_month(IDS, 2025, 3)
+
+
+@pytest.fixture(scope='module')
+def entrenado(tmp_path_factory):
+    directorio = str(tmp_path_factory.mktemp('modelo'))
+    predictor = _predictor(directorio)
+    predictor.train(_historia(), workers=1)
+    return directorio, _predicciones(predictor)
+
+
+def test_carga_bajo_demanda_con_lru(entrenado):
+    directorio, esperado = entrenado
+    predictor = _predictor(directorio, cargar=True)
+
+    # Cargar el manifest no lee ningún modelo
+    assert predictor._models_loaded
+    assert len(predictor.models) == 3 and predictor.models.en_memoria == 0
+    assert predictor._global_model is None and predictor._has_global_model()
+    assert 1 in predictor.models and np.int64(2) in predictor.models and 4 not in predictor.models
+
+    # predict_month usa los árboles compilados (memory-map) sin leer modelos por producto
+    assert predictor.predict_month(IDS, 2025, 3) == esperado[len(IDS):]
+    assert predictor.models.en_memoria == 0
+
+    predictor.models.capacidad = 2
+    assert _predicciones(predictor) == esperado
+    assert predictor.models.en_memoria == 2
+    assert predictor.get_training_status()['model_path'].endswith('manifest.json')
+
+
+def test_migra_pickle_anterior(entrenado, tmp_path):
+    directorio, esperado = entrenado
+    origen = _predictor(directorio, cargar=True)
+    with open(tmp_path / 'production_model.pkl', 'wb') as f:
+        # Formato anterior: todos los modelos en un pickle, sin árboles compilados
+        pickle.dump({
+            'models': {pid: origen.models[pid] for pid in origen.models},
+            'global_model': origen.global_model,
+            'product_encodings': origen.product_encodings,
+            'is_trained': True,
+            'metadata': origen.metadata,
+        }, f)
+
+    predictor = _predictor(str(tmp_path), cargar=True)
+
+    assert not (tmp_path / 'production_model.pkl').exists()
+    assert (tmp_path / 'production_model.pkl.migrado').exists()
+    assert (tmp_path / 'production_model' / 'manifest.json').exists()
+    assert set(predictor._arboles[0]) == {'1', '2', '3'}
+    assert _predicciones(predictor) == esperado
+    assert _predicciones(_predictor(str(tmp_path), cargar=True)) == esperado
+
+
+def test_guardar_conserva_dos_generaciones(entrenado, tmp_path):
+    directorio, esperado = entrenado
+    shutil.copytree(directorio, tmp_path, dirs_exist_ok=True)
+    predictor = _predictor(str(tmp_path), cargar=True)
+    for _ in range(3):
+        predictor._save_model()
+        predictor._load_model()
+
+    almacen = predictor._store()
+    generaciones = [n for n in os.listdir(almacen.directorio) if os.path.isdir(os.path.join(almacen.directorio, n))]
+    assert len(generaciones) == 2
+    assert almacen.leer_manifest()['generacion'] == max(generaciones)
+    assert _predicciones(predictor) == esperado
+
+
+def test_recarga_si_otro_proceso_borra_la_generacion(entrenado, tmp_path):
+    directorio, _ = entrenado
+    shutil.copytree(directorio, tmp_path, dirs_exist_ok=True)
+    # Proceso de larga vida: cargó el manifest pero todavía no leyó ningún modelo
+    servidor = _predictor(str(tmp_path), cargar=True)
+
+    # Otro proceso entrena dos veces: la generación que usa `servidor` se borra
+    otro = _predictor(str(tmp_path))
+    for factor in (1.1, 1.2):
+        otro.train([dict(r, cantidad_kg=r['cantidad_kg'] * factor) for r in _historia()], workers=1)
+    esperado = _predicciones(_predictor(str(tmp_path), cargar=True))
+    assert _predicciones(servidor) == esperado
+
+    # Generación borrada entre el chequeo del manifest y la lectura del modelo
+    servidor = _predictor(str(tmp_path), cargar=True)
+    for factor in (1.3, 1.4):
+        otro.train([dict(r, cantidad_kg=r['cantidad_kg'] * factor) for r in _historia()], workers=1)
+    estado = os.stat(servidor._store().ruta_manifest)
+    servidor._manifest_firma = (estado.st_ino, estado.st_mtime_ns)
+    assert [servidor.predict(pid, 2025, 3) for pid in IDS] == _predicciones(otro)[:len(IDS)]
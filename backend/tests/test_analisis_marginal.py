@@ -0,0 +1,62 @@
+import pytest
+
+
+def test_grilla_coincide_con_el_endpoint_individual(client, crear_mes):
+    carne = crear_mes().carne
+    resp = client.post('/api/analisis-marginal/escenarios', json={
+        'mes_base': '2025-03',
+        'mes_produccion': '2025-05',
+        'escenarios': [{'tipo': 'indirectos', 'valor': 15}, {'tipo': 'produccion', 'valor': -20}],
+        'grilla': {
+            'inflacion': {'desde': 0, 'hasta': 3, 'paso': 1.5},
+            'materia_prima': {str(carne.id): [-10, 0, 10]},
+        },
+    })
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert len(data['escenarios']) == 2 + 3 * 3
+    assert data['escenarios'][2]['inflacion'] == 0.0
+    assert data['escenarios'][2]['materia_prima'] == {str(carne.id): -10.0}
+
+    individuales = [('indirectos', 15, None), ('produccion', -20, None)]
+    for e in data['escenarios'][2:]:
+        individuales.append(('inflacion', e['inflacion'], None))
+    for i, (tipo, valor, extra) in enumerate(individuales):
+        if i >= 2 and data['escenarios'][i]['materia_prima'][str(carne.id)] != 0:
+            continue  # el endpoint GET no combina inflación y precio de MP
+        url = (f'/api/analisis-marginal?mes_base=2025-03&mes_produccion=2025-05'
+               f'&escenario_tipo={tipo}&escenario_valor={valor}')
+        individual = client.get(url).get_json()
+        for j, fila in enumerate(individual['filas']):
+            assert data['productos'][j]['producto_id'] == fila['producto_id']
+            for campo in ('costo_unitario_total', 'markup', 'margen_contribucion_pct', 'punto_equilibrio_kg'):
+                assert data['matrices'][campo][i][j] == pytest.approx(fila[campo], abs=0.011)
+        for campo, valor_total in individual['totales'].items():
+            if campo in data['escenarios'][i]['totales']:
+                assert data['escenarios'][i]['totales'][campo] == pytest.approx(valor_total, abs=0.011)
+
+    url = (f'/api/analisis-marginal?mes_base=2025-03&mes_produccion=2025-05'
+           f'&escenario_tipo=materia_prima&escenario_valor=10&escenario_extra={carne.id}')
+    individual = client.get(url).get_json()
+    resp = client.post('/api/analisis-marginal/escenarios', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-05',
+        'escenarios': [{'materia_prima': {str(carne.id): 10}}],
+    })
+    fila_lote = resp.get_json()['matrices']['costo_unitario_total'][0]
+    assert fila_lote == [f['costo_unitario_total'] for f in individual['filas']]
+
+
+def test_escenarios_invalidos(client, crear_mes):
+    crear_mes()
+    base = {'mes_base': '2025-03', 'mes_produccion': '2025-05'}
+    assert client.post('/api/analisis-marginal/escenarios', json=base).status_code == 400
+    resp = client.post('/api/analisis-marginal/escenarios', json={**base, 'grilla': {'precio': [1]}})
+    assert resp.status_code == 400
+    resp = client.post('/api/analisis-marginal/escenarios', json={
+        **base, 'grilla': {'inflacion': {'desde': 0, 'hasta': 100, 'paso': 0.01}},
+    })
+    assert resp.status_code == 400
+    resp = client.post('/api/analisis-marginal/escenarios', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-08', 'escenarios': [{'inflacion': 1}],
+    })
+    assert resp.status_code == 404
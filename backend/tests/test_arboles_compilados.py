@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip('xgboost')
+
+from arboles_compilados import LoteArboles, compilar  # noqa: E402
+
+
+def _modelo(rng, n_features, n_estimators, max_depth):
+    X = rng.uniform(0, 100, size=(60, n_features))
+    y = X[:, 0] * 3 + np.sin(X[:, 1]) * 50 + rng.normal(0, 5, size=60)
+    model = xgboost.XGBRegressor(
+        n_estimators=n_estimators, max_depth=max_depth, learning_rate=0.1,
+        objective='reg:squarederror', random_state=0, n_jobs=1,
+    )
+    model.fit(X, y)
+    return model
+
+
+def test_lote_igual_a_xgboost_bit_a_bit(tmp_path):
+    rng = np.random.default_rng(0)
+    modelos = [_modelo(rng, 5, 40, 3), _modelo(rng, 5, 25, 4), _modelo(rng, 3, 10, 2)]
+    lote = LoteArboles.apilar(compilar(m) for m in modelos)
+    assert (lote.n_arboles, lote.profundidad) == (40, 4)
+    assert list(lote.n_features) == [5, 5, 3]
+
+    X = rng.uniform(-10, 110, size=(30, 5))
+    X[::4, 1] = np.nan  # NaN sigue la rama por defecto
+    indices = np.arange(30) % 3
+    esperado = np.array([
+        modelos[m].predict(X[i:i + 1, :modelos[m].n_features_in_])[0] for i, m in enumerate(indices)
+    ])
+    np.testing.assert_array_equal(lote.predecir(X, indices), esperado)
+
+    # Guardado y abierto con memory-map: misma predicción
+    cargado = LoteArboles.cargar(tmp_path, **lote.guardar(tmp_path))
+    assert isinstance(cargado.hojas, np.memmap)
+    np.testing.assert_array_equal(cargado.predecir(X, indices), esperado)
+
+
+def test_modelos_no_soportados():
+    rng = np.random.default_rng(1)
+    X, y = rng.uniform(size=(30, 2)), rng.integers(0, 2, size=30)
+    clasificador = xgboost.XGBClassifier(n_estimators=5, n_jobs=1).fit(X, y)
+    assert compilar(clasificador) is None
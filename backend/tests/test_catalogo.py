@@ -0,0 +1,53 @@
+import time
+
+from app import db, MateriaPrima, Producto
+from catalogo import ProductoCatalogo, catalogo, init_catalogo
+
+
+def _precio(snapshot, materia_prima_id):
+    return snapshot.matriz.precios[snapshot.matriz.columna_por_mp[materia_prima_id]]
+
+
+def test_snapshot_compartido_y_reemplazado_al_confirmar(client, crear_mes):
+    datos = crear_mes(p2={'activo': False})
+    carne, producto, inactivo = datos.carne, datos.p1, datos.p2
+    snapshot = catalogo.snapshot()
+    assert catalogo.snapshot() is snapshot
+    assert set(snapshot.productos) == {producto.id}
+    assert all(isinstance(p, ProductoCatalogo) for p in snapshot.matriz.productos)
+    assert snapshot.matriz.costeo(producto.id) == producto.get_costeo()
+
+    client.put(f'/api/materias-primas/{carne.id}', json={'costo_unitario': 110.0})
+    nuevo = catalogo.snapshot()
+    assert nuevo is not snapshot
+    assert _precio(nuevo, carne.id) == 110.0
+    assert _precio(snapshot, carne.id) == 100.0  # el anterior no se modifica
+
+    db.session.get(Producto, inactivo.id).activo = True
+    db.session.commit()
+    assert set(catalogo.snapshot().productos) == {producto.id, inactivo.id}
+
+
+def test_cambios_sin_confirmar_no_se_publican(client, crear_mes):
+    carne = crear_mes().carne
+    snapshot = catalogo.snapshot()
+    db.session.get(MateriaPrima, carne.id).costo_unitario = 150.0
+    assert _precio(catalogo.snapshot(), carne.id) == 150.0
+    db.session.rollback()
+    assert catalogo.snapshot() is snapshot
+
+
+def test_refresco_en_segundo_plano(app, crear_mes):
+    carne = crear_mes().carne
+    catalogo.snapshot()
+    init_catalogo(app, refresco_en_segundo_plano=True)
+    try:
+        db.session.get(MateriaPrima, carne.id).costo_unitario = 120.0
+        db.session.commit()
+        limite = time.monotonic() + 5
+        while catalogo.estadisticas()['generacion_snapshot'] != catalogo.estadisticas()['generacion']:
+            assert time.monotonic() < limite
+            time.sleep(0.01)
+    finally:
+        init_catalogo(app, refresco_en_segundo_plano=False)
+    assert _precio(catalogo.snapshot(), carne.id) == 120.0
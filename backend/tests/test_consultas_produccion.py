@@ -0,0 +1,29 @@
+from datetime import date
+
+from app import db, Producto, ProduccionProgramada
+from consultas_produccion import TotalProducto, filtro_mes, totales_del_mes, productos_con_totales
+
+
+def test_totales_del_mes_agrupan_en_sql_con_limites_del_rango(app):
+    p1 = Producto(codigo='SQL-1', nombre='Uno', peso_batch_kg=100.0, min_mo_kg=1.5)
+    p2 = Producto(codigo='SQL-2', nombre='Dos', peso_batch_kg=40.0, min_mo_kg=0)
+    db.session.add_all([p1, p2])
+    db.session.commit()
+    db.session.add_all([
+        ProduccionProgramada(producto_id=p1.id, cantidad_batches=2.0, fecha_programacion=date(2024, 12, 1)),
+        ProduccionProgramada(producto_id=p1.id, cantidad_batches=1.0, fecha_programacion=date(2024, 12, 31)),
+        ProduccionProgramada(producto_id=p2.id, cantidad_batches=3.0, fecha_programacion=date(2024, 12, 15)),
+        # Fuera del mes: último día anterior y primero siguiente
+        ProduccionProgramada(producto_id=p1.id, cantidad_batches=7.0, fecha_programacion=date(2024, 11, 30)),
+        ProduccionProgramada(producto_id=p2.id, cantidad_batches=7.0, fecha_programacion=date(2025, 1, 1)),
+    ])
+    db.session.commit()
+
+    assert totales_del_mes(2024, 12) == [
+        TotalProducto(p1.id, 3.0, 300.0, 450.0),
+        TotalProducto(p2.id, 3.0, 120.0, 0.0),
+    ]
+    assert totales_del_mes(2025, 2) == []
+
+    con_producto = productos_con_totales(*filtro_mes(2025, 1))
+    assert [(p.codigo, t) for p, t in con_producto] == [('SQL-2', TotalProducto(p2.id, 7.0, 280.0, 0.0))]
@@ -0,0 +1,93 @@
+from datetime import date
+
+from app import db, Categoria, MateriaPrima, Producto, FormulaDetalle, ProduccionProgramada, CostoIndirecto
+from contexto_mensual import cache_contextos
+
+
+def _crear_mes():
+    cat = Categoria(nombre='CERDO', tipo='DIRECTA')
+    db.session.add(cat)
+    db.session.commit()
+    mp = MateriaPrima(nombre='Carne', categoria_id=cat.id, unidad='Kg', costo_unitario=100.0)
+    db.session.add(mp)
+    db.session.commit()
+    p1 = Producto(codigo='CTX-1', nombre='Uno', peso_batch_kg=100.0, min_mo_kg=1.0)
+    p2 = Producto(codigo='CTX-2', nombre='Dos', peso_batch_kg=50.0, min_mo_kg=2.0)
+    db.session.add_all([p1, p2])
+    db.session.commit()
+    db.session.add_all([
+        FormulaDetalle(producto_id=p1.id, materia_prima_id=mp.id, cantidad=100.0),
+        FormulaDetalle(producto_id=p2.id, materia_prima_id=mp.id, cantidad=50.0),
+        ProduccionProgramada(producto_id=p1.id, cantidad_batches=3.0, fecha_programacion=date(2025, 3, 5)),
+        ProduccionProgramada(producto_id=p2.id, cantidad_batches=2.0, fecha_programacion=date(2025, 3, 12)),
+        CostoIndirecto(cuenta='Sueldos', monto=40000.0, tipo_distribucion='SP', mes_base='2025-03'),
+        CostoIndirecto(cuenta='Energía', monto=8000.0, tipo_distribucion='GIF', mes_base='2025-03'),
+    ])
+    db.session.commit()
+    return p1, p2
+
+
+def _completo(client, producto_id):
+    resp = client.get(f'/api/costeo/{producto_id}/completo?mes_base=2025-03&mes_produccion=2025-03')
+    assert resp.status_code == 200
+    return resp.get_json()['costos_indirectos']
+
+
+def test_contexto_compartido_entre_productos_y_endpoints(client):
+    p1, p2 = _crear_mes()
+    inicial = cache_contextos.estadisticas()
+
+    ind_p1 = _completo(client, p1.id)
+    ind_p2 = _completo(client, p2.id)
+    resp = client.get('/api/distribucion-costos?mes_base=2025-03&mes_produccion=2025-03')
+    assert resp.status_code == 200
+
+    stats = cache_contextos.estadisticas()
+    assert stats['misses'] - inicial['misses'] == 1
+    assert stats['hits'] - inicial['hits'] == 2
+
+    distribucion = {d['producto']['id']: d for d in resp.get_json()['distribucion']}
+    assert ind_p1['costo_indirecto_por_kg'] == distribucion[p1.id]['costo_indirecto_por_kg']
+    assert ind_p2['costo_indirecto_por_kg'] == distribucion[p2.id]['costo_indirecto_por_kg']
+    # SP por minutos: 300 min de 500; GIF por kg: 300 kg de 400
+    assert ind_p1['costo_sp'] == 24000.0
+    assert ind_p1['costo_gif'] == 6000.0
+
+
+def test_escritura_en_tabla_dependiente_invalida_contexto(client):
+    p1, _ = _crear_mes()
+    misses = cache_contextos.estadisticas()['misses']
+    assert _completo(client, p1.id)['costo_sp'] == 24000.0
+
+    resp = client.post('/api/costos-indirectos', json={
+        'cuenta': 'Supervisión', 'monto': 10000.0, 'tipo_distribucion': 'SP', 'mes_base': '2025-03',
+    })
+    assert resp.status_code == 201
+    assert _completo(client, p1.id)['costo_sp'] == 30000.0
+
+    resp = client.put(f'/api/productos/{p1.id}', json={'min_mo_kg': 0.5})
+    assert resp.status_code == 200
+    # 150 min de 350
+    assert _completo(client, p1.id)['costo_sp'] == round(50000.0 * 150 / 350, 2)
+    assert cache_contextos.estadisticas()['misses'] - misses == 3
+
+
+def test_costeo_completo_de_todos_coincide_con_el_individual(client):
+    p1, p2 = _crear_mes()
+    sin_produccion = Producto(codigo='CTX-3', nombre='Tres', peso_batch_kg=20.0)
+    db.session.add(sin_produccion)
+    db.session.commit()
+
+    resp = client.get('/api/costeo/completo?mes_base=2025-03&mes_produccion=2025-03')
+    assert resp.status_code == 200
+    todos = {c['producto']['id']: c for c in resp.get_json()}
+    assert set(todos) == {p1.id, p2.id, sin_produccion.id}
+    for pid in todos:
+        individual = client.get(f'/api/costeo/{pid}/completo?mes_base=2025-03&mes_produccion=2025-03')
+        assert todos[pid] == individual.get_json()
+    assert todos[sin_produccion.id]['costos_indirectos']['costo_indirecto_total'] == 0
+
+    resp = client.get(f'/api/costeo/completo?mes_base=2025-03&mes_produccion=2025-03&ids={p2.id}')
+    assert [c['producto']['id'] for c in resp.get_json()] == [p2.id]
+    assert client.get('/api/costeo/completo?ids=1,x').status_code == 400
+    assert client.get('/api/costeo/completo?mes_base=2025-13').status_code == 400
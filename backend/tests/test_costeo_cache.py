@@ -0,0 +1,131 @@
+from app import db, MateriaPrima, Producto, FormulaDetalle, Categoria
+from costeo_cache import cache_costeo
+
+
+def _crear_productos():
+    cat = Categoria(nombre='CERDO', tipo='DIRECTA')
+    db.session.add(cat)
+    db.session.commit()
+
+    mp_a = MateriaPrima(nombre='MP A', categoria_id=cat.id, unidad='Kg', costo_unitario=100.0)
+    mp_b = MateriaPrima(nombre='MP B', categoria_id=cat.id, unidad='Kg', costo_unitario=50.0)
+    db.session.add_all([mp_a, mp_b])
+    db.session.commit()
+
+    p1 = Producto(codigo='C-1', nombre='Usa A', peso_batch_kg=10.0)
+    p2 = Producto(codigo='C-2', nombre='Usa B', peso_batch_kg=10.0)
+    db.session.add_all([p1, p2])
+    db.session.commit()
+
+    db.session.add_all([
+        FormulaDetalle(producto_id=p1.id, materia_prima_id=mp_a.id, cantidad=10.0),
+        FormulaDetalle(producto_id=p2.id, materia_prima_id=mp_b.id, cantidad=10.0),
+    ])
+    db.session.commit()
+    return p1, p2, mp_a, mp_b
+
+
+def _costo_por_kg(client, producto_id):
+    resp = client.get(f'/api/costeo/{producto_id}')
+    assert resp.status_code == 200
+    return resp.get_json()['resumen']['costo_por_kg']
+
+
+def test_edicion_de_precio_invalida_solo_productos_afectados(client):
+    p1, p2, mp_a, _ = _crear_productos()
+
+    client.get('/api/costeo/resumen')
+    assert cache_costeo.productos_que_usan(mp_a.id) == {p1.id}
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 2
+
+    resp = client.put(f'/api/materias-primas/{mp_a.id}', json={'costo_unitario': 200.0})
+    assert resp.status_code == 200
+
+    # Solo p1 se invalida; p2 sigue en caché
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 1
+    assert _costo_por_kg(client, p1.id) == 200.0
+    assert _costo_por_kg(client, p2.id) == 50.0
+
+
+def test_cambios_de_formula_y_producto_invalidan(client):
+    p1, _, _, mp_b = _crear_productos()
+    assert _costo_por_kg(client, p1.id) == 100.0
+
+    resp = client.post(f'/api/formulas/{p1.id}/ingrediente', json={'materia_prima_id': mp_b.id, 'cantidad': 2.0})
+    assert resp.status_code == 201
+    assert _costo_por_kg(client, p1.id) == 110.0
+
+    resp = client.put(f'/api/productos/{p1.id}', json={'peso_batch_kg': 20.0})
+    assert resp.status_code == 200
+    assert _costo_por_kg(client, p1.id) == 55.0
+
+    # save_formula borra en bloque (Query.delete) y reinserta
+    resp = client.post(f'/api/formulas/{p1.id}', json={'ingredientes': []})
+    assert resp.status_code == 200
+    assert _costo_por_kg(client, p1.id) == 0
+
+
+def test_guardar_formula_invalida_solo_ese_producto(client):
+    p1, p2, mp_a, mp_b = _crear_productos()
+    client.get('/api/costeo/resumen')
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 2
+
+    # save_formula borra en bloque (Query.delete) solo las líneas de p1
+    resp = client.post(f'/api/formulas/{p1.id}', json={'ingredientes': [
+        {'materia_prima_id': mp_b.id, 'cantidad': 10.0},
+    ]})
+    assert resp.status_code == 200
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 1
+    assert cache_costeo.productos_que_usan(mp_a.id) == set()
+    assert _costo_por_kg(client, p1.id) == 50.0
+    assert cache_costeo.productos_que_usan(mp_b.id) == {p1.id, p2.id}
+
+    # Un UPDATE masivo de materias primas sigue invalidando todo
+    MateriaPrima.query.filter_by(id=mp_b.id).update({'costo_unitario': 60.0})
+    db.session.commit()
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 0
+    assert _costo_por_kg(client, p2.id) == 60.0
+
+
+def test_rollback_no_deja_valores_sin_confirmar_en_cache(client):
+    p1, _, mp_a, _ = _crear_productos()
+    assert _costo_por_kg(client, p1.id) == 100.0
+
+    cache_costeo.invalidar_todo()
+    mp_a.costo_unitario = 999.0
+    db.session.flush()
+    # El cálculo ve el cambio sin confirmar pero no debe quedar cacheado
+    assert cache_costeo.costeos([p1])[p1.id].costo_por_kg == 999.0
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 0
+    db.session.rollback()
+
+    assert _costo_por_kg(client, p1.id) == 100.0
+
+
+def test_ajuste_masivo_propaga_delta_sin_recalcular(client):
+    p1, p2, _, _ = _crear_productos()
+    client.get('/api/costeo/resumen')
+    misses = cache_costeo.estadisticas()['misses']
+
+    resp = client.post('/api/materias-primas/ajustar-precios', json={'porcentaje': 10, 'categoria': 'CERDO'})
+    assert resp.status_code == 200
+    impacto = {i['producto_id']: i for i in resp.get_json()['impacto_productos']}
+    assert impacto[p1.id]['costo_por_kg_anterior'] == 100.0
+    assert abs(impacto[p1.id]['costo_por_kg_nuevo'] - 110.0) < 1e-9
+    assert abs(impacto[p2.id]['delta_costo_batch'] - 50.0) < 1e-9
+
+    # Los costeos se actualizaron en caché con el delta: no hubo recálculo
+    assert cache_costeo.estadisticas()['productos_cacheados'] == 2
+    for p in (p1, p2):
+        cacheado = client.get(f'/api/costeo/{p.id}').get_json()
+        esperado = p.get_costeo()
+        assert abs(cacheado['resumen']['costo_por_kg'] - esperado['resumen']['costo_por_kg']) < 1e-9
+        assert cacheado['ingredientes'] == esperado['ingredientes']
+    assert cache_costeo.estadisticas()['misses'] == misses
+
+    resp = client.post('/api/materias-primas/deshacer-ajuste')
+    assert resp.status_code == 200
+    impacto = {i['producto_id']: i for i in resp.get_json()['impacto_productos']}
+    assert abs(impacto[p1.id]['costo_por_kg_nuevo'] - 100.0) < 1e-9
+    assert abs(_costo_por_kg(client, p2.id) - 50.0) < 1e-9
+    assert cache_costeo.estadisticas()['misses'] == misses
@@ -0,0 +1,113 @@
+from datetime import date
+
+from app import db, MateriaPrima, Producto, FormulaDetalle, ProduccionProgramada, Categoria
+from costeo_engine import MatrizCosteo
+
+
+def _crear_catalogo():
+    carne = Categoria(nombre='CERDO', tipo='DIRECTA')
+    insumos = Categoria(nombre='INSUMOS', tipo='INDIRECTA')
+    envases = Categoria(nombre='ENVASES', tipo='ENVASE')
+    db.session.add_all([carne, insumos, envases])
+    db.session.commit()
+
+    mp_carne = MateriaPrima(nombre='Carne Cerdo', categoria_id=carne.id, unidad='Kg', costo_unitario=1234.57)
+    mp_sal = MateriaPrima(nombre='Sal', categoria_id=insumos.id, unidad='Kg', costo_unitario=0.33)
+    mp_tripa = MateriaPrima(nombre='Tripa', categoria_id=envases.id, unidad='UND', costo_unitario=17.1)
+    db.session.add_all([mp_carne, mp_sal, mp_tripa])
+    db.session.commit()
+
+    p1 = Producto(codigo='ENG-1', nombre='Chorizo', peso_batch_kg=103.7, porcentaje_merma=3.6, min_mo_kg=1.2)
+    p2 = Producto(codigo='ENG-2', nombre='Salame', peso_batch_kg=50.0, porcentaje_merma=0, min_mo_kg=0.5)
+    p3 = Producto(codigo='ENG-3', nombre='Sin formula', peso_batch_kg=10.0, porcentaje_merma=1.0)
+    p4 = Producto(codigo='ENG-4', nombre='Merma total', peso_batch_kg=10.0, porcentaje_merma=100.0)
+    db.session.add_all([p1, p2, p3, p4])
+    db.session.commit()
+
+    db.session.add_all([
+        FormulaDetalle(producto_id=p1.id, materia_prima_id=mp_carne.id, cantidad=98.13),
+        FormulaDetalle(producto_id=p1.id, materia_prima_id=mp_sal.id, cantidad=2.07),
+        FormulaDetalle(producto_id=p1.id, materia_prima_id=mp_tripa.id, cantidad=41.0),
+        FormulaDetalle(producto_id=p1.id, materia_prima_id=mp_sal.id, cantidad=0.11),
+        FormulaDetalle(producto_id=p2.id, materia_prima_id=mp_tripa.id, cantidad=7.0),
+        FormulaDetalle(producto_id=p2.id, materia_prima_id=mp_carne.id, cantidad=49.9),
+        FormulaDetalle(producto_id=p4.id, materia_prima_id=mp_carne.id, cantidad=10.0),
+    ])
+    db.session.commit()
+    return [p1, p2, p3, p4], mp_carne
+
+
+def test_matriz_costeo_identica_a_get_costeo(app):
+    productos, _ = _crear_catalogo()
+
+    matriz = MatrizCosteo.desde_db()
+    resultado = matriz.calcular()
+    totales = matriz.totales_por_categoria()
+
+    for p in productos:
+        esperado = p.get_costeo()
+        assert matriz.costeo(p.id, resultado) == esperado
+        assert matriz.totales_categoria(p.id, totales) == esperado['totales_categoria']
+
+
+def test_factor_por_materia_prima_equivale_a_escalar_lineas(app):
+    productos, mp_carne = _crear_catalogo()
+    p1 = productos[0]
+
+    matriz = MatrizCosteo.desde_db([p1])
+    resultado = matriz.calcular(matriz.factor_por_materia_prima({mp_carne.id: 1.1}))
+
+    costeo = p1.get_costeo()
+    total_mp = 0
+    total_envases = 0
+    for ing in costeo['ingredientes']:
+        costo = ing['costo_total']
+        if ing['materia_prima_id'] == mp_carne.id:
+            costo *= 1.1
+        if ing['categoria'] == 'ENVASES':
+            total_envases += costo
+        else:
+            total_mp += costo
+    total_neto = total_mp + total_mp * (p1.porcentaje_merma / 100) + total_envases
+    esperado = total_neto / (p1.peso_batch_kg * ((100 - p1.porcentaje_merma) / 100))
+
+    assert resultado['costo_por_kg'][0] == esperado
+
+
+def test_endpoints_mensuales_usan_costeo_vectorizado(client):
+    productos, _ = _crear_catalogo()
+    p1, p2 = productos[0], productos[1]
+    db.session.add_all([
+        ProduccionProgramada(producto_id=p1.id, cantidad_batches=2.0, fecha_programacion=date(2025, 3, 3)),
+        ProduccionProgramada(producto_id=p2.id, cantidad_batches=1.5, fecha_programacion=date(2025, 3, 10)),
+        ProduccionProgramada(producto_id=p1.id, cantidad_batches=1.0, fecha_programacion=date(2025, 3, 20)),
+    ])
+    db.session.commit()
+
+    resp = client.get('/api/costeo/resumen')
+    assert resp.status_code == 200
+    por_id = {r['producto']['id']: r for r in resp.get_json()}
+    for p in productos:
+        costeo = p.get_costeo()
+        assert por_id[p.id]['costo_por_kg'] == costeo['resumen']['costo_por_kg']
+        assert por_id[p.id]['costo_total'] == costeo['resumen']['total_neto']
+
+    resp = client.get('/api/resumen-mensual?mes=2025-03')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    esperado = 3.0 * p1.get_costeo()['resumen']['total_neto'] + 1.5 * p2.get_costeo()['resumen']['total_neto']
+    assert abs(data['costo_total'] - esperado) < 1e-6
+    for cat in ('CERDO', 'INSUMOS', 'ENVASES'):
+        esperado_cat = (
+            3.0 * p1.get_costeo()['totales_categoria'][cat]['costo']
+            + 1.5 * p2.get_costeo()['totales_categoria'].get(cat, {'costo': 0})['costo']
+        )
+        assert abs(data['totales_categoria'][cat] - esperado_cat) < 1e-6
+
+    resp = client.get('/api/requerimientos?mes=2025-03')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert [r['nombre'] for r in data['requerimientos']] == ['Carne Cerdo', 'Sal', 'Tripa']
+    carne = data['requerimientos'][0]
+    assert abs(carne['cantidad_total'] - (98.13 * 3.0 + 49.9 * 1.5)) < 1e-9
+    assert data['total_batches'] == 4.5
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import db, MateriaPrima, Producto, FormulaDetalle, ProduccionProgramada, Categoria
+from costeo_cache import cache_costeo
+from contexto_mensual import cache_contextos
+from catalogo import catalogo
+
+# Consultas máximas por endpoint, independientes del tamaño del catálogo
+PRESUPUESTO_CONSULTAS = {
+    '/api/costeo/resumen': 3,
+    '/api/costeo/{pid}': 3,
+    '/api/costeo/{pid}/completo?mes_base=2025-02&mes_produccion=2025-03': 8,
+    '/api/costeo/completo?mes_base=2025-02&mes_produccion=2025-03': 8,
+    '/api/resumen-mensual?mes=2025-03': 3,
+    '/api/requerimientos?mes=2025-03': 3,
+    '/api/exportar/costeo/{pid}': 2,
+    '/api/exportar/produccion?mes=2025-03': 2,
+    '/api/exportar/requerimientos?mes=2025-03': 2,
+    '/api/exportar/pdf/costeo/{pid}': 2,
+    '/api/exportar/pdf/produccion?mes=2025-03': 2,
+    '/api/exportar/pdf/requerimientos?mes=2025-03': 2,
+    '/api/exportar/pdf/resumen?mes=2025-03': 5,
+}
+
+
+@contextmanager
+def _contar_consultas():
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _registrar)
+
+
+def _crear_catalogo(num_productos):
+    categorias = [
+        Categoria(nombre='CERDO', tipo='DIRECTA'),
+        Categoria(nombre='INSUMOS', tipo='INDIRECTA'),
+        Categoria(nombre='ENVASES', tipo='ENVASE'),
+    ]
+    db.session.add_all(categorias)
+    db.session.flush()
+    materias = [
+        MateriaPrima(nombre=f'MP {i}', categoria_id=categorias[i % 3].id, unidad='Kg', costo_unitario=10.0 + i)
+        for i in range(6)
+    ]
+    db.session.add_all(materias)
+    db.session.flush()
+    productos = []
+    for i in range(num_productos):
+        p = Producto(codigo=f'Q-{i}', nombre=f'Producto {i}', peso_batch_kg=50.0, porcentaje_merma=2.0)
+        db.session.add(p)
+        db.session.flush()
+        for j in range(3):
+            mp = materias[(i + j) % len(materias)]
+            db.session.add(FormulaDetalle(producto_id=p.id, materia_prima_id=mp.id, cantidad=5.0 + j))
+        db.session.add(ProduccionProgramada(
+            producto_id=p.id, cantidad_batches=2.0, fecha_programacion=date(2025, 3, 1 + i % 28)
+        ))
+        productos.append(p)
+    db.session.commit()
+    return productos
+
+
+def _medir(client, num_productos):
+    productos = _crear_catalogo(num_productos)
+    pid = productos[0].id
+    # El snapshot del catálogo se reconstruye fuera del request (en segundo plano tras el commit)
+    catalogo.snapshot()
+    consultas = {}
+    for ruta in PRESUPUESTO_CONSULTAS:
+        # Sin caché ni identidad precargada: se mide el camino frío
+        cache_costeo.invalidar_todo()
+        cache_contextos.limpiar()
+        db.session.expire_all()
+        with _contar_consultas() as sentencias:
+            resp = client.get(ruta.format(pid=pid))
+        assert resp.status_code == 200, ruta
+        consultas[ruta] = len(sentencias)
+    return consultas
+
+
+@pytest.mark.parametrize('num_productos', [2, 25])
+def test_consultas_acotadas_por_endpoint(client, num_productos):
+    consultas = _medir(client, num_productos)
+    excedidos = {
+        ruta: n for ruta, n in consultas.items() if n > PRESUPUESTO_CONSULTAS[ruta]
+    }
+    assert not excedidos, excedidos
@@ -392,3 +392,41 @@ def test_escalamiento_sin_limite(client):
     # Factor base 2.5, sin límite individual
     # Costo escalado = 10000 * 2.5 = 25000
     assert data['escalamiento']['total_variables_escalados'] == 25000.0
+
+
+def test_curva_escalamiento_coincide_con_calculo_puntual(client):
+    """La curva vectorizada reproduce calcular_costos_con_escalamiento en cada volumen."""
+    from contexto_mensual import MatrizEscalamiento, calcular_costos_con_escalamiento, CostoSnapshot
+
+    costos = [
+        CostoSnapshot('Alquiler', 'GIF', 10000.0, False, None),
+        CostoSnapshot('Energía', 'GIF', 8000.0, True, 80.0),
+        CostoSnapshot('Horas extra', 'SP', 5000.0, True, None),
+        CostoSnapshot('Mantenimiento', 'DEP', 2000.0, True, 20.0),
+        CostoSnapshot('Otro', 'XX', 999.0, True, None),
+    ]
+    matriz = MatrizEscalamiento(costos)
+    volumenes = [0, 100, 400, 1000, 1150, 1900, 2500, 3500, 5000]
+    curva = matriz.evaluar(1000.0, volumenes)
+    for i, volumen in enumerate(volumenes):
+        puntual = calcular_costos_con_escalamiento(costos, 1000.0, volumen)
+        for tipo in ('SP', 'GIF', 'DEP'):
+            assert abs(curva[tipo][i] - puntual['totales_escalados'][tipo]) < 1e-9
+    # Energía topeada en 1.8, mantenimiento en 1.2, límite global 0.5..3.0
+    assert curva['GIF'][-1] == 10000.0 + 8000.0 * 1.8
+    assert curva['SP'][1] == 5000.0 * 0.5
+    assert [q['volumen_kg'] for q in matriz.quiebres(1000.0)] == [500.0, 1200.0, 1800.0, 3000.0]
+
+    resp = client.post('/api/costos-indirectos', json={
+        'cuenta': 'Energía', 'monto': 8000.0, 'tipo_distribucion': 'GIF', 'mes_base': '2025-05',
+        'es_variable': True, 'variacion_max_pct': 80,
+    })
+    assert resp.status_code == 201
+    resp = client.get('/api/costos-indirectos/curva-escalamiento?mes_base=2025-05&volumen_base=1000&puntos=5')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['curva']['volumen_kg'] == [0.0, 875.0, 1750.0, 2625.0, 3500.0]
+    assert data['curva']['gif'] == [8000.0, 7000.0, 14000.0, 14400.0, 14400.0]
+    assert [q['origen'] for q in data['quiebres']] == ['factor_limite_min', 'variacion_max_pct', 'factor_limite_max']
+    # Sin volumen base (ni histórico ni programado) no hay curva
+    assert client.get('/api/costos-indirectos/curva-escalamiento?mes_base=2025-05').status_code == 404
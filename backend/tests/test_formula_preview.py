@@ -0,0 +1,43 @@
+from app import Producto, FormulaDetalle
+
+
+def test_preview_coincide_con_la_formula_guardada(client, crear_mes):
+    datos = crear_mes()
+    producto, carne, grasa, tripa = datos.p1, datos.carne, datos.grasa, datos.tripa
+    ingredientes = [
+        {'materia_prima_id': carne.id, 'cantidad': 70},
+        {'materia_prima_id': grasa.id, 'cantidad': 25.5},
+        {'materia_prima_id': tripa.id, 'cantidad': 12},
+    ]
+    body = {'producto_id': producto.id, 'ingredientes': ingredientes, 'peso_batch_kg': 100, 'porcentaje_merma': 5,
+            'mes_base': '2025-03', 'mes_produccion': '2025-05'}
+    resp = client.post('/api/formulas/preview', json=body)
+    assert resp.status_code == 200
+    previa = resp.get_json()
+    assert FormulaDetalle.query.filter_by(producto_id=producto.id).count() == 2
+
+    client.post(f'/api/formulas/{producto.id}', json={'ingredientes': ingredientes})
+    real = client.get(f'/api/costeo/{producto.id}/completo?mes_base=2025-03&mes_produccion=2025-05').get_json()
+    previa.pop('duracion_ms')
+    for costeo in (previa, real):
+        for ing in costeo['ingredientes']:
+            ing['id'] = None
+    assert previa == real
+    assert previa['resumen']['costo_indirecto_por_kg'] > 0
+
+
+def test_preview_sin_producto_y_validaciones(client, crear_mes):
+    carne = crear_mes().carne
+    resp = client.post('/api/formulas/preview', json={
+        'ingredientes': [{'materia_prima_id': carne.id, 'cantidad': 45}], 'peso_batch_kg': 50, 'porcentaje_merma': 10,
+    })
+    data = resp.get_json()
+    assert data['resumen']['costo_merma'] == 450.0
+    assert data['resumen']['costo_por_kg'] == 4950.0 / 45
+    assert Producto.query.count() == 2
+
+    assert client.post('/api/formulas/preview', json={'ingredientes': [], 'peso_batch_kg': 0}).status_code == 400
+    resp = client.post('/api/formulas/preview', json={
+        'ingredientes': [{'materia_prima_id': 999, 'cantidad': 1}], 'peso_batch_kg': 10,
+    })
+    assert resp.status_code == 400
@@ -0,0 +1,38 @@
+import pytest
+
+from app import db, MateriaPrima, HistorialPrecios
+
+
+def test_dry_run_anticipa_el_ajuste_sin_escribir(client, crear_mes):
+    datos = crear_mes(precios={'tripa': 3.33}, formulas={'p2': [('tripa', 40.0)]})
+    p1, p2, tripa = datos.p1, datos.p2, datos.tripa
+    resumen_antes = client.get('/api/resumen-mensual?mes=2025-05').get_json()
+
+    resp = client.post('/api/materias-primas/ajustar-precios',
+                       json={'porcentaje': 7, 'categoria': 'ENVASES', 'dry_run': True, 'mes': '2025-05'})
+    assert resp.status_code == 200
+    previa = resp.get_json()
+    assert previa['dry_run'] is True
+    assert previa['detalle'][0]['precio_nuevo'] == round(3.33 * 1.07, 2)
+    assert db.session.get(MateriaPrima, tripa.id).costo_unitario == 3.33
+    assert HistorialPrecios.query.count() == 0
+    assert previa['plan']['costo_total_anterior'] == pytest.approx(resumen_antes['costo_total'])
+
+    resp = client.post('/api/materias-primas/ajustar-precios', json={'porcentaje': 7, 'categoria': 'ENVASES'})
+    real = {i['producto_id']: i for i in resp.get_json()['impacto_productos']}
+    resumen_despues = client.get('/api/resumen-mensual?mes=2025-05').get_json()
+
+    assert {i['producto_id'] for i in previa['impacto_productos']} == {p1.id, p2.id}
+    for item in previa['impacto_productos']:
+        assert item['costo_por_kg_nuevo'] == pytest.approx(real[item['producto_id']]['costo_por_kg_nuevo'])
+        assert item['costo_por_kg_anterior'] == pytest.approx(real[item['producto_id']]['costo_por_kg_anterior'])
+    assert previa['plan']['costo_total_nuevo'] == pytest.approx(resumen_despues['costo_total'])
+    for categoria, total in resumen_despues['totales_categoria'].items():
+        assert previa['totales_categoria'][categoria]['nuevo'] == pytest.approx(total)
+    assert previa['totales_categoria']['CERDO']['diferencia'] == 0
+
+
+def test_dry_run_valida_mes(client, crear_mes):
+    crear_mes()
+    resp = client.post('/api/materias-primas/ajustar-precios', json={'porcentaje': 5, 'dry_run': True, 'mes': '2025-13'})
+    assert resp.status_code == 400
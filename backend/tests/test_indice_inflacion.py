@@ -0,0 +1,50 @@
+import random
+
+from app import db, InflacionMensual
+from indice_inflacion import indice_inflacion
+
+
+def _acumulada_por_consulta(desde, hasta):
+    factor = 1.0
+    for inf in InflacionMensual.query.filter(InflacionMensual.mes > desde, InflacionMensual.mes <= hasta).all():
+        factor *= (1 + inf.porcentaje / 100)
+    return factor
+
+
+def _mes(indice):
+    return f"{2023 + indice // 12}-{indice % 12 + 1:02d}"
+
+
+def test_indice_equivale_a_multiplicar_el_rango(app):
+    rng = random.Random(8)
+    # Meses salteados: los huecos no aportan inflación
+    for i in rng.sample(range(36), 20):
+        db.session.add(InflacionMensual(mes=_mes(i), porcentaje=round(rng.uniform(-1.0, 6.0), 2)))
+    db.session.commit()
+
+    for _ in range(200):
+        desde, hasta = _mes(rng.randrange(-3, 40)), _mes(rng.randrange(-3, 40))
+        assert abs(indice_inflacion.acumulada(desde, hasta) - _acumulada_por_consulta(desde, hasta)) < 1e-12
+
+    meses = [_mes(i) for i in range(-2, 40)]
+    rango = indice_inflacion.acumulada_rango('2024-03', meses)
+    esperado = [_acumulada_por_consulta('2024-03', m) for m in meses]
+    assert max(abs(a - b) for a, b in zip(rango, esperado)) < 1e-12
+
+
+def test_alta_y_baja_de_inflacion_reconstruyen_el_indice(client):
+    resp = client.post('/api/inflacion', json={'mes': '2025-02', 'porcentaje': 10})
+    assert resp.status_code == 201
+    assert indice_inflacion.acumulada('2025-01', '2025-03') == 1.1
+
+    resp = client.post('/api/inflacion', json={'mes': '2025-03', 'porcentaje': 10})
+    assert abs(indice_inflacion.acumulada('2025-01', '2025-03') - 1.21) < 1e-12
+    id_marzo = resp.get_json()['id']
+
+    client.post('/api/inflacion', json={'mes': '2025-02', 'porcentaje': 5})
+    assert abs(indice_inflacion.acumulada('2025-01', '2025-03') - 1.05 * 1.1) < 1e-12
+
+    resp = client.delete(f'/api/inflacion/{id_marzo}')
+    assert resp.status_code == 200
+    assert indice_inflacion.acumulada('2025-01', '2025-03') == 1.05
+    assert list(indice_inflacion.acumulada_rango('2025-02', ['2025-01', '2025-02', '2025-03'])) == [1.0, 1.0, 1.0]
@@ -0,0 +1,106 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import db, MateriaPrima, Producto, FormulaDetalle, Categoria, HistorialPrecios
+from indice_precios import indice_precios
+
+
+def _crear_producto_con_historial():
+    cat = Categoria(nombre='CERDO', tipo='DIRECTA')
+    db.session.add(cat)
+    db.session.commit()
+
+    mp_a = MateriaPrima(nombre='Carne', categoria_id=cat.id, unidad='Kg', costo_unitario=150.0)
+    mp_b = MateriaPrima(nombre='Sal', categoria_id=cat.id, unidad='Kg', costo_unitario=50.0)
+    db.session.add_all([mp_a, mp_b])
+    db.session.commit()
+
+    producto = Producto(codigo='H-1', nombre='Histórico', peso_batch_kg=20.0)
+    db.session.add(producto)
+    db.session.commit()
+    db.session.add_all([
+        FormulaDetalle(producto_id=producto.id, materia_prima_id=mp_a.id, cantidad=10.0),
+        FormulaDetalle(producto_id=producto.id, materia_prima_id=mp_b.id, cantidad=10.0),
+        HistorialPrecios(materia_prima_id=mp_a.id, precio_anterior=100.0, precio_nuevo=120.0,
+                         fecha_cambio=datetime(2025, 1, 10, 9, 0), tipo_cambio='EDICION_INDIVIDUAL'),
+        HistorialPrecios(materia_prima_id=mp_a.id, precio_anterior=120.0, precio_nuevo=150.0,
+                         fecha_cambio=datetime(2025, 3, 1, 9, 0), tipo_cambio='AJUSTE_MASIVO'),
+    ])
+    db.session.commit()
+    return producto, mp_a
+
+
+def test_costeo_as_of_usa_precios_vigentes(client):
+    producto, mp_a = _crear_producto_con_historial()
+
+    esperados = {'2025-01-05': 100.0, '2025-01-10': 120.0, '2025-02-15': 120.0, '2025-03-15': 150.0}
+    for as_of, precio_a in esperados.items():
+        resp = client.get(f'/api/costeo/{producto.id}?as_of={as_of}')
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert data['as_of'] == as_of
+        carne = next(i for i in data['ingredientes'] if i['materia_prima_id'] == mp_a.id)
+        assert carne['costo_unitario'] == precio_a
+        assert data['resumen']['costo_por_kg'] == (10 * precio_a + 10 * 50.0) / 20.0
+
+    resp = client.get('/api/costeo/resumen?as_of=2025-02-15')
+    assert resp.status_code == 200
+    assert resp.get_json()[0]['costo_por_kg'] == (1200.0 + 500.0) / 20.0
+
+    assert client.get('/api/costeo/resumen?as_of=15/02/2025').status_code == 400
+
+
+def test_indice_se_actualiza_con_nuevos_cambios(client):
+    producto, mp_a = _crear_producto_con_historial()
+    hoy = datetime.utcnow().date().isoformat()
+    assert client.get(f'/api/costeo/{producto.id}?as_of={hoy}').get_json()['resumen']['costo_por_kg'] == 100.0
+
+    resp = client.put(f'/api/materias-primas/{mp_a.id}', json={'costo_unitario': 170.0})
+    assert resp.status_code == 200
+
+    # El índice no se reconstruye: la fila nueva se insertó al confirmar
+    assert len(indice_precios.intervalos(mp_a.id)) == 4
+    data = client.get(f'/api/costeo/{producto.id}?as_of={hoy}').get_json()
+    assert data['resumen']['costo_por_kg'] == (1700.0 + 500.0) / 20.0
+
+
+def test_precios_en_equivale_a_recorrer_historial(app):
+    rng = random.Random(7)
+    cat = Categoria(nombre='CERDO', tipo='DIRECTA')
+    db.session.add(cat)
+    db.session.commit()
+    materias = [MateriaPrima(nombre=f'MP {i}', categoria_id=cat.id, unidad='Kg', costo_unitario=1.0) for i in range(6)]
+    db.session.add_all(materias)
+    db.session.commit()
+
+    inicio = datetime(2024, 1, 1)
+    filas = []
+    for mp in materias[:5]:
+        precio = 10.0
+        for _ in range(rng.randint(1, 8)):
+            fecha = inicio + timedelta(days=rng.randint(0, 400))
+            nuevo = round(precio * rng.uniform(0.9, 1.2), 2)
+            filas.append(HistorialPrecios(materia_prima_id=mp.id, precio_anterior=precio, precio_nuevo=nuevo,
+                                          fecha_cambio=fecha, tipo_cambio='EDICION_INDIVIDUAL'))
+            precio = nuevo
+    db.session.add_all(filas)
+    db.session.commit()
+
+    def precio_recorriendo(mp, fecha):
+        cambios = sorted(
+            (h for h in filas if h.materia_prima_id == mp.id), key=lambda h: (h.fecha_cambio, h.id)
+        )
+        if not cambios:
+            return mp.costo_unitario
+        vigentes = [h for h in cambios if h.fecha_cambio <= fecha]
+        return vigentes[-1].precio_nuevo if vigentes else cambios[0].precio_anterior
+
+    fechas = [inicio + timedelta(days=d) for d in range(-10, 420, 7)]
+    fechas += [h.fecha_cambio for h in filas]
+    mp_ids = np.array([m.id for m in materias])
+    precios = indice_precios.precios_en(mp_ids, [m.costo_unitario for m in materias], fechas)
+    for i, fecha in enumerate(fechas):
+        for j, mp in enumerate(materias):
+            assert precios[i, j] == precio_recorriendo(mp, fecha)
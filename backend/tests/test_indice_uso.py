@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+import pytest
+
+from app import db, MateriaPrima, Producto, FormulaDetalle
+from indice_uso import indice_uso
+
+
+def _usos_por_consulta(materia_prima_id):
+    usos = defaultdict(float)
+    for d in FormulaDetalle.query.join(Producto).filter(
+        Producto.activo == True, FormulaDetalle.materia_prima_id == materia_prima_id  # noqa: E712
+    ):
+        usos[d.producto_id] += d.cantidad
+    return dict(usos)
+
+
+# p2 usa grasa: la baja de grasa queda protegida
+_FORMULAS = {'p2': [('carne', 30.0), ('grasa', 20.0)]}
+
+
+def test_indice_se_mantiene_con_ediciones_de_formula(client, crear_mes):
+    datos = crear_mes(formulas=_FORMULAS)
+    p1, p2, carne, grasa, tripa = datos.p1, datos.p2, datos.carne, datos.grasa, datos.tripa
+    materias = (carne.id, grasa.id, tripa.id)
+    assert indice_uso.usos(carne.id) == {p1.id: 90.0, p2.id: 30.0}
+
+    resp = client.post(f'/api/formulas/{p1.id}/ingrediente', json={'materia_prima_id': grasa.id, 'cantidad': 5.0})
+    detalle_id = resp.get_json()['id']
+    client.put(f'/api/formulas/ingrediente/{detalle_id}', json={'materia_prima_id': carne.id})
+    for mp_id in materias:
+        assert indice_uso.usos(mp_id) == _usos_por_consulta(mp_id)
+    assert indice_uso.usos(carne.id)[p1.id] == 95.0
+
+    # save_formula reemplaza con Query.delete()
+    resp = client.post(f'/api/formulas/{p2.id}', json={'ingredientes': [{'materia_prima_id': tripa.id, 'cantidad': 3}]})
+    assert resp.status_code == 200
+    client.delete(f'/api/formulas/ingrediente/{detalle_id}')
+    client.delete(f'/api/productos/{p1.id}')
+    for mp_id in materias:
+        assert indice_uso.usos(mp_id) == _usos_por_consulta(mp_id)
+    assert indice_uso.productos_que_usan(materias) == {p2.id}
+
+
+def test_uso_y_baja_protegida(client, crear_mes):
+    datos = crear_mes(formulas=_FORMULAS)
+    p1, p2, carne, grasa = datos.p1, datos.p2, datos.carne, datos.grasa
+
+    data = client.get(f'/api/materias-primas/{carne.id}/uso').get_json()
+    assert data['total_productos'] == 2
+    por_producto = {p['producto_id']: p for p in data['productos']}
+    # p1: carne 9000 con merma 5 % = 9450 sobre 9450 + 30 de envases
+    assert por_producto[p1.id]['participacion_pct'] == pytest.approx(9450 / 9480 * 100)
+    assert por_producto[p2.id]['participacion_pct'] == pytest.approx(3000 / 3400 * 100)
+
+    resp = client.delete(f'/api/materias-primas/{grasa.id}')
+    assert resp.status_code == 409
+    assert resp.get_json()['productos'][0]['codigo'] == p2.codigo
+    assert client.delete(f'/api/materias-primas/{grasa.id}?forzar=true').status_code == 200
+
+    sin_uso = MateriaPrima(nombre='Sin uso', categoria_id=grasa.categoria_id, unidad='Kg', costo_unitario=1.0)
+    db.session.add(sin_uso)
+    db.session.commit()
+    assert client.delete(f'/api/materias-primas/{sin_uso.id}').status_code == 200
@@ -0,0 +1,45 @@
+from app import db, InflacionMensual
+from invalidacion import registrar_invalidacion
+
+_CLAVE = 'test_invalidacion_meses'
+confirmados = []
+
+
+def _anotar(session, objetos):
+    session.info.setdefault(_CLAVE, set()).update(obj.mes for obj in objetos)
+
+
+registrar_invalidacion(_CLAVE, (InflacionMensual,), lambda session, meses: confirmados.append(meses),
+                       anotar=_anotar, descartar=('test_invalidacion_extra',))
+
+
+def test_anota_en_la_transaccion_y_aplica_al_confirmar(app):
+    confirmados.clear()
+    db.session.add(InflacionMensual(mes='2025-01', porcentaje=2.0))
+    db.session.add(InflacionMensual(mes='2025-02', porcentaje=3.0))
+    db.session.flush()
+    assert confirmados == []
+    db.session.info['test_invalidacion_extra'] = True
+    db.session.commit()
+    assert confirmados == [{'2025-01', '2025-02'}]
+    assert 'test_invalidacion_extra' not in db.session.info
+
+    # Un rollback descarta lo anotado
+    db.session.add(InflacionMensual(mes='2025-03', porcentaje=1.0))
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert len(confirmados) == 1
+
+    # UPDATE masivo: anotación por defecto (True)
+    InflacionMensual.query.filter_by(mes='2025-01').update({'porcentaje': 2.5})
+    db.session.commit()
+    assert confirmados[1] is True
+
+
+def test_registrar_es_idempotente(app):
+    confirmados.clear()
+    registrar_invalidacion(_CLAVE, (InflacionMensual,), lambda session, meses: confirmados.append(meses))
+    db.session.add(InflacionMensual(mes='2025-04', porcentaje=1.0))
+    db.session.commit()
+    assert confirmados == [{'2025-04'}]
@@ -200,6 +200,199 @@ class TestPredictorTrain:
         
         assert predictor.metadata.get('features_version') == 'v2.0_with_lags'
 
+    def test_train_parallel_matches_sequential(self):
+        """Verifica que entrenar con varios workers da el mismo artefacto y métricas"""
+        from predictor import ProductionPredictor
+
+        rng = np.random.default_rng(7)
+        data = [
+            {'producto_id': pid, 'año': 2023 + k // 12, 'mes': k % 12 + 1,
+             'cantidad_kg': float(rng.uniform(500, 1500))}
+            for pid, meses in ((1, 20), (2, 14), (3, 8), (4, 4))
+            for k in range(meses)
+        ]
+
+        def entrenar(workers):
+            predictor = ProductionPredictor()
+            metrics = predictor.train(data, workers=workers)
+            almacen = predictor._store()
+            manifest = almacen.leer_manifest()
+            generacion = os.path.join(almacen.directorio, manifest.pop('generacion'))
+            manifest['metadata'].pop('trained_at')
+            archivos = {}
+            for raiz, _, nombres in os.walk(generacion):
+                for nombre in nombres:
+                    with open(os.path.join(raiz, nombre), 'rb') as f:
+                        archivos[os.path.relpath(os.path.join(raiz, nombre), generacion)] = f.read()
+            return metrics, (manifest, archivos)
+
+        secuencial, artefacto_secuencial = entrenar(1)
+        paralelo, artefacto_paralelo = entrenar(2)
+
+        assert secuencial.pop('paralelismo')['workers'] == 1
+        info = paralelo.pop('paralelismo')
+        assert info['workers'] == 2 and info['speedup'] > 0
+        assert secuencial == paralelo
+        assert secuencial['productos_entrenados'] == 3 and secuencial['productos_sin_datos'] == 1
+        assert list(artefacto_paralelo[0]['productos']) == ['1', '2', '3']
+        assert artefacto_secuencial == artefacto_paralelo
+
+    def test_train_incremental_matches_full(self):
+        """Verifica que el modo incremental reentrena solo lo que cambió y da lo mismo que entrenar todo"""
+        from predictor import ProductionPredictor
+
+        rng = np.random.default_rng(5)
+        data = [
+            {'producto_id': pid, 'año': 2023 + k // 12, 'mes': k % 12 + 1,
+             'cantidad_kg': float(rng.uniform(500, 1500))}
+            for pid, meses in ((1, 20), (2, 14), (3, 8), (4, 4))
+            for k in range(meses)
+        ]
+
+        predictor = ProductionPredictor()
+        primero = predictor.train(data, workers=1, incremental=True)
+        assert primero['incremental']['motivo_completo'] == 'sin_modelo_guardado'
+        sin_cambios = predictor.train(data, workers=1, incremental=True)
+        assert sin_cambios['incremental'] == {
+            'aplicado': True, 'motivo_completo': None, 'productos_reentrenados': 0,
+            'productos_reutilizados': 3, 'modelo_global_reentrenado': False,
+        }
+        assert sin_cambios['validacion'] == primero['validacion']
+
+        data[25]['cantidad_kg'] += 100  # un mes del producto 2
+        metrics = predictor.train(data, workers=1, incremental=True)
+        assert metrics.pop('incremental') == {
+            'aplicado': True, 'motivo_completo': None, 'productos_reentrenados': 1,
+            'productos_reutilizados': 2, 'modelo_global_reentrenado': True,
+        }
+
+        # Predicciones antes de entrenar completo: ambos comparten el almacén de modelos
+        ids = [1, 2, 3, 4]
+        predicciones = (predictor.predict_month(ids, 2025, 7), [predictor.predict(pid, 2025, 7) for pid in ids])
+
+        completo = ProductionPredictor()
+        esperado = completo.train(data, workers=1)
+        assert esperado.pop('incremental')['motivo_completo'] == 'no_solicitado'
+        metrics.pop('paralelismo')
+        esperado.pop('paralelismo')
+        assert metrics == esperado
+        assert predicciones == (completo.predict_month(ids, 2025, 7), [completo.predict(pid, 2025, 7) for pid in ids])
+
+
+class TestPredictorBatch:
+    """Tests para la predicción en lote de predict_month"""
+
+    def test_predict_month_matches_predict(self):
+        """Verifica que predict_month da lo mismo que predict() por producto"""
+        from predictor import ProductionPredictor
+
+        rng = np.random.default_rng(3)
+        # 1: 30 meses (modelo con lags), 2: 13 meses (modelo sin lags + historial
+        # con lag_12 -> cae al global), 3: 8 meses, 4: 4 meses (solo global)
+        data = [
+            {'producto_id': pid, 'año': 2023 + k // 12, 'mes': k % 12 + 1,
+             'cantidad_kg': float(rng.uniform(500, 1500))}
+            for pid, meses in ((1, 30), (2, 13), (3, 8), (4, 4))
+            for k in range(meses)
+        ]
+        predictor = ProductionPredictor()
+        predictor.train(data, workers=1)
+        assert set(predictor._arboles[0]) == {'1', '2', '3'}
+
+        ids = [1, 2, 3, 4, 99]
+        for año, mes in ((2025, 7), (2026, 1), (2025, 12)):
+            esperado = [dict(predictor.predict(pid, año, mes), producto_id=pid) for pid in ids]
+            assert predictor.predict_month(ids, año, mes) == esperado
+        metodos = [p['metodo'] for p in predictor.predict_month(ids, 2025, 7)]
+        assert metodos == ['modelo_producto', 'modelo_global', 'modelo_producto', 'modelo_global', 'sin_datos']
+
+        # Modelos sin árboles compilados: mismo resultado vía model.predict
+        predictor._arboles = None
+        assert predictor.predict_month(ids, 2025, 7) == [
+            dict(predictor.predict(pid, 2025, 7), producto_id=pid) for pid in ids
+        ]
+
+    def test_predict_horizon_recursive(self):
+        """Verifica que predict_horizon equivale a predict_month mes a mes realimentando el historial"""
+        from predictor import ProductionPredictor
+
+        rng = np.random.default_rng(4)
+        # Historiales que terminan en 2025-06 (1), 2024-01 (2), 2023-08 (3), 2023-04 (4); 99 sin historial
+        data = [
+            {'producto_id': pid, 'año': 2023 + k // 12, 'mes': k % 12 + 1,
+             'cantidad_kg': float(rng.uniform(500, 1500))}
+            for pid, meses in ((1, 30), (2, 13), (3, 8), (4, 4))
+            for k in range(meses)
+        ]
+        predictor = ProductionPredictor()
+        predictor.train(data, workers=1)
+        ids = [1, 2, 3, 4, 99]
+        horizonte = predictor.predict_horizon(ids, 2025, 7, 14)
+
+        # Referencia: predict_month mes a mes desde el fin de cada historial, agregando
+        # cada predicción al historial del producto antes de predecir el mes siguiente
+        referencia = ProductionPredictor()
+        referencia._load_model()
+        historiales = {k: list(v) for k, v in referencia.metadata['product_histories'].items()}
+        fin = {pid: max((r['año'], r['mes']) for r in historiales[str(pid)]) for pid in (1, 2, 3, 4)}
+        esperado = []
+        for paso in range(2023 * 12 + 4, 2025 * 12 + 6 + 14):
+            año, mes = paso // 12, paso % 12 + 1
+            referencia.metadata = dict(referencia.metadata, product_histories={k: list(v) for k, v in historiales.items()})
+            predicciones = referencia.predict_month(ids, año, mes)
+            if (año, mes) >= (2025, 7):
+                esperado.append(predicciones)
+            for pred in predicciones:
+                pid = pred['producto_id']
+                if pid in fin and (año, mes) > fin[pid]:
+                    historiales[str(pid)].append({'año': año, 'mes': mes, 'cantidad_kg': pred['cantidad_kg']})
+
+        assert horizonte == esperado
+        assert len(horizonte) == 14
+        # El mes siguiente al historial es el mismo que predict_month; más adelante
+        # los lags vienen de las predicciones y no del historial guardado
+        assert horizonte[0][0] == predictor.predict_month([1], 2025, 7)[0]
+        assert any(h[0] != predictor.predict_month([1], 2025, 7 + k)[0] for k, h in enumerate(horizonte[:6]))
+        assert [p['metodo'] for p in horizonte[-1]][-1] == 'sin_datos'
+
+    def test_predict_horizon_endpoint(self, client, monkeypatch):
+        """Verifica POST /api/ml/predict/horizonte (matrices producto x mes)"""
+        import predictor as predictor_mod
+
+        rng = np.random.default_rng(6)
+        data = [
+            {'producto_id': pid, 'año': 2023 + k // 12, 'mes': k % 12 + 1,
+             'cantidad_kg': float(rng.uniform(500, 1500))}
+            for pid, meses in ((1, 20), (2, 8))
+            for k in range(meses)
+        ]
+        predictor = predictor_mod.ProductionPredictor()
+        predictor.train(data, workers=1)
+        monkeypatch.setattr(predictor_mod, 'predictor', predictor)
+
+        resp = client.post('/api/ml/predict/horizonte', json={'año': 2024, 'mes': 11, 'horizonte': 3, 'productos_ids': [1, 2]})
+        assert resp.status_code == 200, resp.get_data(as_text=True)
+        body = resp.get_json()
+        esperado = predictor.predict_horizon([1, 2], 2024, 11, 3)
+        assert body['meses'] == ['2024-11', '2024-12', '2025-01']
+        assert body['cantidad_kg'] == [[mes[i]['cantidad_kg'] for mes in esperado] for i in range(2)]
+        assert body['metodo'][0] == ['modelo_producto'] * 3
+
+        resp = client.post('/api/ml/predict/horizonte', json={'horizonte': 25})
+        assert resp.status_code == 400
+
+    def test_predict_month_untrained(self, tmp_path):
+        from predictor import ProductionPredictor
+
+        predictor = ProductionPredictor()
+        predictor.is_trained = False
+        predictor._models_loaded = True
+        resultado = predictor.predict_month([1, 2], 2025, 1)
+        assert [r['metodo'] for r in resultado] == ['sin_modelo', 'sin_modelo']
+        assert [r['producto_id'] for r in resultado] == [1, 2]
+        horizonte = predictor.predict_horizon([1, 2], 2025, 1, 3)
+        assert [[r['metodo'] for r in mes] for mes in horizonte] == [['sin_modelo', 'sin_modelo']] * 3
+
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
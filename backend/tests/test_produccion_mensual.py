@@ -0,0 +1,86 @@
+import random
+from datetime import date
+
+from app import db, Producto, ProduccionProgramada
+from models import ProduccionMensual
+from produccion_mensual import reconstruir
+
+
+def _productos():
+    p1 = Producto(codigo='AGR-1', nombre='Uno', peso_batch_kg=100.0, min_mo_kg=1.0)
+    p2 = Producto(codigo='AGR-2', nombre='Dos', peso_batch_kg=50.0, min_mo_kg=2.0)
+    db.session.add_all([p1, p2])
+    db.session.commit()
+    return p1, p2
+
+
+def _agregado():
+    return {
+        (f.mes, f.producto_id): (round(f.batches, 9), round(f.kg, 6), round(f.minutos, 6))
+        for f in ProduccionMensual.query.all()
+    }
+
+
+def test_altas_ediciones_y_bajas_mantienen_el_agregado(client):
+    p1, p2 = _productos()
+    for body in (
+        {'producto_id': p1.id, 'cantidad_batches': 3, 'fecha_programacion': '2025-03-05'},
+        {'producto_id': p1.id, 'cantidad_batches': 1, 'fecha_programacion': '2025-03-20'},
+        {'producto_id': p2.id, 'cantidad_batches': 2, 'fecha_programacion': '2025-03-12'},
+    ):
+        assert client.post('/api/produccion-programada', json=body).status_code == 201
+    assert _agregado() == {
+        ('2025-03', p1.id): (4.0, 400.0, 400.0),
+        ('2025-03', p2.id): (2.0, 100.0, 200.0),
+    }
+
+    prog_id = ProduccionProgramada.query.filter_by(producto_id=p2.id).one().id
+    resp = client.put(f'/api/produccion-programada/{prog_id}', json={'fecha_programacion': '2025-04-01'})
+    assert resp.status_code == 200
+    assert _agregado() == {
+        ('2025-03', p1.id): (4.0, 400.0, 400.0),
+        ('2025-04', p2.id): (2.0, 100.0, 200.0),
+    }
+
+    resp = client.put(f'/api/productos/{p1.id}', json={'peso_batch_kg': 80.0, 'min_mo_kg': 0.5})
+    assert resp.status_code == 200
+    assert _agregado()[('2025-03', p1.id)] == (4.0, 320.0, 160.0)
+
+    assert client.delete(f'/api/produccion-programada/{prog_id}').status_code == 200
+    assert set(_agregado()) == {('2025-03', p1.id)}
+
+    resumen = client.get('/api/resumen-mensual?mes=2025-03').get_json()
+    assert resumen['total_batches'] == 4.0
+    assert resumen['total_peso'] == 320.0
+
+
+def test_incremental_coincide_con_reconstruir(app):
+    rng = random.Random(9)
+    productos = list(_productos())
+    programaciones = []
+    for _ in range(60):
+        prog = ProduccionProgramada(
+            producto_id=rng.choice(productos).id,
+            cantidad_batches=round(rng.uniform(0.5, 5.0), 2),
+            fecha_programacion=date(2025, rng.randint(1, 4), rng.randint(1, 28)),
+        )
+        db.session.add(prog)
+        programaciones.append(prog)
+    db.session.commit()
+    for prog in rng.sample(programaciones, 20):
+        prog.cantidad_batches = round(rng.uniform(0.5, 5.0), 2)
+        prog.fecha_programacion = date(2025, rng.randint(1, 4), 15)
+    for prog in rng.sample(programaciones, 10):
+        db.session.delete(prog)
+    productos[1].min_mo_kg = 3.0
+    db.session.commit()
+
+    incremental = _agregado()
+    reconstruir()
+    db.session.commit()
+    assert _agregado() == incremental
+
+    # Los borrados masivos no pasan por el flush: se reconstruye al confirmar
+    ProduccionProgramada.query.filter_by(producto_id=productos[0].id).delete()
+    db.session.commit()
+    assert {pid for _, pid in _agregado()} == {productos[1].id}
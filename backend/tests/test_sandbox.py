@@ -0,0 +1,144 @@
+from datetime import date
+
+from app import db, MateriaPrima, FormulaDetalle, ProduccionProgramada, CostoIndirecto, InflacionMensual
+from sandbox import AlmacenSandboxes
+
+
+def _sin_ids(costeo):
+    return {**costeo, 'ingredientes': [{**i, 'id': None} for i in costeo['ingredientes']]}
+
+
+def test_precios_y_formulas_sin_escribir(client, crear_mes):
+    datos = crear_mes()
+    p1, p2, carne, grasa = datos.p1, datos.p2, datos.carne, datos.grasa
+    overlay = {
+        'precios': {str(carne.id): 120.0},
+        'formulas': {str(p2.id): [{'materia_prima_id': grasa.id, 'cantidad': 10},
+                                  {'materia_prima_id': carne.id, 'cantidad': 30}]},
+    }
+    resp = client.post('/api/sandbox', json=overlay)
+    assert resp.status_code == 201
+    sandbox_id = resp.get_json()['id']
+
+    original = client.get(f'/api/costeo/{p1.id}').get_json()
+    previstos = {p.id: client.get(f'/api/costeo/{p.id}?sandbox={sandbox_id}').get_json() for p in (p1, p2)}
+    resumen = client.get(f'/api/costeo/resumen?sandbox={sandbox_id}').get_json()
+    assert previstos[p1.id]['ingredientes'][0]['costo_unitario'] == 120.0
+    assert db.session.get(MateriaPrima, carne.id).costo_unitario == 100.0
+    assert FormulaDetalle.query.filter_by(producto_id=p2.id).count() == 1
+    assert client.get(f'/api/costeo/{p1.id}').get_json() == original
+
+    # Los mismos cambios confirmados dan el mismo costeo
+    client.put(f'/api/materias-primas/{carne.id}', json={'costo_unitario': 120.0})
+    client.post(f'/api/formulas/{p2.id}', json={'ingredientes': overlay['formulas'][str(p2.id)]})
+    for p in (p1, p2):
+        real = client.get(f'/api/costeo/{p.id}').get_json()
+        assert _sin_ids(previstos[p.id]) == _sin_ids(real)
+    assert resumen == client.get('/api/costeo/resumen').get_json()
+
+
+def test_indirectos_e_inflacion(client, crear_mes):
+    crear_mes()
+    db.session.add(InflacionMensual(mes='2025-04', porcentaje=1.0))
+    db.session.commit()
+    resp = client.post('/api/sandbox', json={
+        'indirectos': {'Sueldos': 52000},
+        'inflacion': {'2025-04': 2.5, '2025-05': 1.5},
+    })
+    sandbox_id = resp.get_json()['id']
+    consultas = [
+        '/api/distribucion-costos?mes_base=2025-03&mes_produccion=2025-05',
+        '/api/analisis-marginal?mes_base=2025-03&mes_produccion=2025-05',
+        '/api/costeo/completo?mes_base=2025-03&mes_produccion=2025-05',
+    ]
+    previstos = [client.get(f'{url}&sandbox={sandbox_id}').get_json() for url in consultas]
+    originales = [client.get(url).get_json() for url in consultas]
+    assert previstos[0] != originales[0]
+
+    costo = CostoIndirecto.query.filter_by(cuenta='Sueldos').one()
+    costo.monto = 52000.0
+    InflacionMensual.query.filter_by(mes='2025-04').one().porcentaje = 2.5
+    db.session.add(InflacionMensual(mes='2025-05', porcentaje=1.5))
+    db.session.commit()
+    for url, previsto in zip(consultas, previstos):
+        assert previsto == client.get(url).get_json()
+
+
+def test_produccion(client, crear_mes):
+    datos = crear_mes()
+    p1, p2 = datos.p1, datos.p2
+    resp = client.post('/api/sandbox', json={
+        'produccion': {'2025-05': {str(p1.id): 5, str(p2.id): 0}, '2025-03': {str(p2.id): 4}},
+    })
+    assert resp.status_code == 201
+    sandbox_id = resp.get_json()['id']
+    consultas = [
+        '/api/distribucion-costos?mes_base=2025-03&mes_produccion=2025-05',
+        '/api/analisis-marginal?mes_base=2025-03&mes_produccion=2025-05',
+        '/api/costeo/completo?mes_base=2025-03&mes_produccion=2025-05',
+    ]
+    multiperiodo = {'mes_inicio': '2025-05', 'mes_fin': '2025-05', 'mes_base_costos': '2025-03', 'modo': 'manual'}
+    previstos = [client.get(f'{url}&sandbox={sandbox_id}').get_json() for url in consultas]
+    previstos.append(client.post(f'/api/proyeccion-multiperiodo?sandbox={sandbox_id}', json=multiperiodo).get_json())
+    assert [fila['producto']['id'] for fila in previstos[0]['distribucion']] == [p1.id]
+    assert previstos[0]['totales']['kg'] == 500
+    assert previstos[0]['escalamiento']['volumen_base_kg'] == 400
+    assert previstos[0] != client.get(consultas[0]).get_json()
+
+    # Los mismos batches confirmados dan los mismos resultados
+    ProduccionProgramada.query.filter_by(producto_id=p1.id, fecha_programacion=date(2025, 5, 5)).one() \
+        .cantidad_batches = 5.0
+    ProduccionProgramada.query.filter_by(producto_id=p2.id).delete()
+    db.session.add(ProduccionProgramada(producto_id=p2.id, cantidad_batches=4.0, fecha_programacion=date(2025, 3, 20)))
+    db.session.commit()
+    for url, previsto in zip(consultas, previstos):
+        assert previsto == client.get(url).get_json()
+    assert previstos[-1] == client.post('/api/proyeccion-multiperiodo', json=multiperiodo).get_json()
+
+
+def test_patch_y_errores(client, crear_mes):
+    datos = crear_mes()
+    p1, carne = datos.p1, datos.carne
+    assert client.post('/api/sandbox', json={'precios': {'999': 1}}).status_code == 400
+    assert client.post('/api/sandbox', json={'inflacion': {'2025-13': 1}}).status_code == 400
+    assert client.post('/api/sandbox', json={'produccion': {'2025-05': {str(p1.id): -1}}}).status_code == 400
+    assert client.post('/api/sandbox', json={'produccion': {'2025-05': {'999': 1}}}).status_code == 400
+
+    sandbox_id = client.post('/api/sandbox', json={'precios': {str(carne.id): 150}}).get_json()['id']
+    data = client.patch(f'/api/sandbox/{sandbox_id}', json={'precios': {str(carne.id): None}}).get_json()
+    assert data['revision'] == 1 and data['overlay']['precios'] == {}
+    assert client.get(f'/api/costeo/{p1.id}?sandbox={sandbox_id}').get_json() == \
+        client.get(f'/api/costeo/{p1.id}').get_json()
+
+    assert client.delete(f'/api/sandbox/{sandbox_id}').status_code == 200
+    assert client.get(f'/api/sandbox/{sandbox_id}').status_code == 404
+    resp = client.get(f'/api/distribucion-costos?mes_base=2025-03&mes_produccion=2025-05&sandbox={sandbox_id}')
+    assert resp.status_code == 404
+
+
+def test_escrituras_rechazan_sandbox(client, crear_mes):
+    carne = crear_mes().carne
+    sandbox_id = client.post('/api/sandbox', json={}).get_json()['id']
+    resp = client.put(f'/api/materias-primas/{carne.id}?sandbox={sandbox_id}', json={'costo_unitario': 150.0})
+    assert resp.status_code == 400
+    assert db.session.get(MateriaPrima, carne.id).costo_unitario == 100.0
+    resp = client.post(f'/api/analisis-marginal/escenarios?sandbox={sandbox_id}', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-05', 'escenarios': [{'inflacion': 1}],
+    })
+    assert resp.status_code == 200
+
+
+def test_expiracion_y_lru():
+    ahora = [0.0]
+    almacen = AlmacenSandboxes(max_sandboxes=2, ttl_segundos=60, reloj=lambda: ahora[0])
+    a, b = almacen.crear({}), almacen.crear({})
+    ahora[0] = 30
+    assert almacen.obtener(a.id) is a  # renueva a
+    c = almacen.crear({})
+    assert almacen.obtener(b.id) is None  # desalojado por LRU
+    ahora[0] = 80
+    assert almacen.obtener(a.id) is a
+    assert almacen.obtener(c.id) is c
+    ahora[0] = 200
+    assert almacen.obtener(a.id) is None
+    assert almacen.estadisticas()['sandboxes'] == 0
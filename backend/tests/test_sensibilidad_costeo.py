@@ -0,0 +1,91 @@
+import random
+
+import numpy as np
+import pytest
+
+from app import db, Categoria, MateriaPrima, Producto, FormulaDetalle
+from costeo_engine import MatrizCosteo
+from sensibilidad_costeo import cache_sensibilidad
+
+
+def _crear_catalogo(rng, n_productos=15, n_materias=10):
+    cerdo = Categoria(nombre='CERDO', tipo='DIRECTA')
+    envases = Categoria(nombre='ENVASES', tipo='ENVASE')
+    db.session.add_all([cerdo, envases])
+    db.session.commit()
+    materias = [
+        MateriaPrima(nombre=f'MP {i}', categoria_id=(envases if i % 4 == 0 else cerdo).id,
+                     unidad='Kg', costo_unitario=round(rng.uniform(1, 100), 2))
+        for i in range(n_materias)
+    ]
+    productos = [
+        Producto(codigo=f'S-{i}', nombre=f'Producto {i}', peso_batch_kg=rng.uniform(20, 100),
+                 porcentaje_merma=rng.choice([0, 0, 3.0, 7.5]))
+        for i in range(n_productos)
+    ]
+    db.session.add_all(materias + productos)
+    db.session.commit()
+    for p in productos:
+        for mp in rng.sample(materias, 4):
+            db.session.add(FormulaDetalle(producto_id=p.id, materia_prima_id=mp.id, cantidad=rng.uniform(0.5, 20)))
+    # Una materia prima repetida en la fórmula se suma
+    db.session.add(FormulaDetalle(producto_id=productos[0].id, materia_prima_id=materias[1].id, cantidad=2.0))
+    db.session.commit()
+    return productos, materias
+
+
+def test_sensibilidad_coincide_con_diferencias_finitas(app):
+    productos, materias = _crear_catalogo(random.Random(5))
+    sensibilidad = cache_sensibilidad.matriz()
+    matriz = MatrizCosteo.desde_db()
+    base = matriz.calcular()['costo_por_kg']
+
+    for mp in materias:
+        factor = matriz.factor_por_materia_prima({mp.id: 1 + 1 / mp.costo_unitario})  # +1 $ al precio
+        derivada = matriz.calcular(factor)['costo_por_kg'] - base
+        for p in productos:
+            esperado = derivada[matriz.fila_por_producto[p.id]]
+            assert sensibilidad.de_producto(p.id).get(mp.id, 0.0) == pytest.approx(esperado, abs=1e-9)
+
+        expuestos = sensibilidad.mas_expuestos(mp.id)
+        valores = [v for _, v in expuestos]
+        assert valores == sorted(valores, reverse=True)
+        assert {pid for pid, _ in expuestos} == {
+            p.id for p in productos if derivada[matriz.fila_por_producto[p.id]] > 0
+        }
+        assert sensibilidad.mas_expuestos(mp.id, 2) == expuestos[:2]
+
+    delta = sensibilidad.variacion_costo_por_kg({materias[1].id: 3.0, materias[4].id: -2.0})
+    precios = matriz.precios.copy()
+    precios[matriz.columna_por_mp[materias[1].id]] += 3.0
+    precios[matriz.columna_por_mp[materias[4].id]] -= 2.0
+    nuevo = matriz.con_precios(precios).calcular()['costo_por_kg']
+    assert np.allclose(delta, nuevo - base)
+
+
+def test_precios_no_invalidan_y_formulas_si(client):
+    productos, materias = _crear_catalogo(random.Random(9), n_productos=4, n_materias=5)
+    matriz = cache_sensibilidad.matriz()
+
+    resp = client.post('/api/materias-primas/ajustar-precios', json={'porcentaje': 10})
+    assert resp.status_code == 200
+    assert cache_sensibilidad.matriz() is matriz
+
+    resp = client.put(f'/api/productos/{productos[0].id}', json={'porcentaje_merma': 12.0})
+    assert resp.status_code == 200
+    assert cache_sensibilidad.matriz() is not matriz
+
+    matriz = cache_sensibilidad.matriz()
+    resp = client.post(f'/api/formulas/{productos[1].id}/ingrediente',
+                       json={'materia_prima_id': materias[0].id, 'cantidad': 50.0})
+    assert resp.status_code == 201
+    resp = client.get(f'/api/materias-primas/{materias[0].id}/sensibilidad?top=1')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['productos'][0]['producto_id'] == productos[1].id
+    assert data['productos'][0]['impacto_1pct'] == pytest.approx(
+        data['productos'][0]['sensibilidad'] * materias[0].costo_unitario * 0.01)
+
+    resp = client.get(f'/api/costeo/sensibilidad?ids={productos[1].id}')
+    fila = resp.get_json()[0]
+    assert fila['sensibilidades'][str(materias[0].id)] == pytest.approx(data['productos'][0]['sensibilidad'])
@@ -0,0 +1,95 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from app import Producto
+from contexto_mensual import obtener_contexto
+import simulacion_margen
+from simulacion_margen import ModeloMargen, parse_distribucion, simular
+
+
+def _modelo():
+    ctx = obtener_contexto('2025-03', '2025-05')
+    productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(list(ctx.produccion))).all()}
+    return ModeloMargen.desde_contexto(ctx, productos)
+
+
+def test_distribuciones_fijas_coinciden_con_escenarios(client, crear_mes):
+    crear_mes()
+    resp = client.post('/api/analisis-marginal/simulacion', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-05', 'simulaciones': 50,
+        'inflacion': 2, 'categorias': {'CERDO': {'distribucion': 'fija', 'valor': 10}},
+    })
+    assert resp.status_code == 200
+    data = resp.get_json()
+
+    esperado = client.post('/api/analisis-marginal/escenarios', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-05',
+        'escenarios': [{'inflacion': 2, 'categoria': {'CERDO': 10}}],
+    }).get_json()
+    for j, fila in enumerate(data['productos']):
+        assert fila['producto_id'] == esperado['productos'][j]['producto_id']
+        assert fila['costo_unitario_total']['p50'] == pytest.approx(
+            esperado['matrices']['costo_unitario_total'][0][j], abs=0.02)
+        assert fila['margen_contribucion_pct']['p5'] == pytest.approx(
+            esperado['matrices']['margen_contribucion_pct'][0][j], abs=0.02)
+        assert fila['prob_margen_contribucion_negativo'] == 0.0
+
+
+def test_semilla_reproducible_y_pool_equivalente(client, crear_mes):
+    crear_mes()
+    modelo = _modelo()
+    inflacion, _ = parse_distribucion({'distribucion': 'normal', 'media': 3, 'desvio': 1}, 'inflacion')
+    shocks = {'CERDO': parse_distribucion({'distribucion': 'triangular', 'min': -5, 'moda': 5, 'max': 60}, 'c')[0]}
+
+    local = simular(modelo, inflacion, shocks, 30_000, semilla=7, usar_pool=False)
+    assert local['lotes'] == 2
+    assert simular(modelo, inflacion, shocks, 30_000, semilla=7, usar_pool=False) == local
+    en_pool = simular(modelo, inflacion, shocks, 30_000, semilla=7, usar_pool=True)
+    assert en_pool['productos'] == local['productos']
+
+    probabilidades = np.array([p['prob_margen_neto_negativo'] for p in local['productos']])
+    assert ((probabilidades >= 0) & (probabilidades <= 1)).all()
+    for p in local['productos']:
+        assert p['costo_unitario_total']['p5'] <= p['costo_unitario_total']['p95']
+
+
+def test_pool_roto_se_descarta_y_corre_en_el_proceso(client, crear_mes, monkeypatch):
+    crear_mes()
+    modelo = _modelo()
+    inflacion, _ = parse_distribucion({'distribucion': 'normal', 'media': 3, 'desvio': 1}, 'inflacion')
+    local = simular(modelo, inflacion, {}, 2_000, semilla=3, usar_pool=False)
+
+    class PoolRoto:
+        def map(self, *args):
+            raise BrokenProcessPool('un worker terminó abruptamente')
+
+        def shutdown(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(simulacion_margen, '_pool', PoolRoto())
+    resultado = simular(modelo, inflacion, {}, 2_000, semilla=3, usar_pool=True)
+    assert resultado['pool'] is False
+    assert resultado['productos'] == local['productos']
+    assert simulacion_margen._pool is None
+
+    # Con una sola CPU no se usa el pool aunque se supere el umbral
+    monkeypatch.setattr(simulacion_margen, 'PRODUCTOS_POR_BLOQUE', 1)
+    monkeypatch.setattr(simulacion_margen.os, 'cpu_count', lambda: 1)
+    monkeypatch.setattr(simulacion_margen, '_obtener_pool', lambda: pytest.fail('no debería usar el pool'))
+    assert simular(modelo, inflacion, {}, simulacion_margen.UMBRAL_POOL, semilla=3)['pool'] is False
+
+
+def test_validaciones(client, crear_mes):
+    assert parse_distribucion({'distribucion': 'uniforme', 'min': 3, 'max': 1}, 'x')[1]
+    assert parse_distribucion({'distribucion': 'lognormal'}, 'x')[1]
+    crear_mes()
+    resp = client.post('/api/analisis-marginal/simulacion', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-05', 'simulaciones': 200_000,
+    })
+    assert resp.status_code == 400
+    resp = client.post('/api/analisis-marginal/simulacion', json={
+        'mes_base': '2025-03', 'mes_produccion': '2025-05', 'categorias': {'VACUNO': 5},
+    })
+    assert resp.status_code == 400
@@ -0,0 +1,32 @@
+from contexto_mensual import obtener_contexto
+from costeo_cache import cache_costeo
+from valores_costeo import CosteoProducto, LineaIngrediente, ProduccionProducto
+
+
+def test_costeo_compacto_y_json_en_el_borde(client, crear_mes):
+    datos = crear_mes(p2={'peso_batch_kg': 0}, formulas={'p2': []})
+    producto, sin_formula = datos.p1, datos.p2
+    costeos = cache_costeo.costeos([producto, sin_formula])
+    costeo = costeos[producto.id]
+    assert isinstance(costeo, CosteoProducto)
+    assert all(isinstance(ing, LineaIngrediente) for ing in costeo.ingredientes)
+    assert not hasattr(costeo, '__dict__') and not hasattr(costeo.ingredientes[0], '__dict__')
+
+    for p in (producto, sin_formula):
+        assert costeos[p.id].to_dict() == p.get_costeo()
+        assert client.get(f'/api/costeo/{p.id}').get_json() == p.get_costeo()
+
+    # to_dict() da copias: modificarlas no altera el valor cacheado
+    copia = costeo.to_dict()
+    copia['resumen']['costo_por_kg'] = 0
+    copia['producto']['nombre'] = 'otro'
+    assert cache_costeo.costeos([producto])[producto.id].to_dict() == producto.get_costeo()
+
+
+def test_contexto_guarda_filas_compactas(client, crear_mes):
+    producto = crear_mes().p1
+    ctx = obtener_contexto('2025-04', '2025-05')
+    fila = ctx.produccion[producto.id]
+    assert isinstance(fila, ProduccionProducto)
+    assert (fila.kg, fila.minutos, fila.batches) == (300.0, 300.0, 3.0)
+    assert ctx.productos[producto.id].to_dict() == producto.to_dict()
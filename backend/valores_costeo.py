@@ -0,0 +1,212 @@
+"""
+Tipos de valor internos del costeo.
+
+Los cálculos (caché de costeo, sandboxes, contexto mensual, análisis
+marginal, distribución de indirectos) pasan estos registros compactos
+(``__slots__``, sin sesión ORM) en lugar de dicts anidados y objetos
+Producto. El formato JSON de la API se arma con ``to_dict()`` solo al
+construir la respuesta.
+
+- ``ProductoCatalogo``: parámetros de un producto.
+- ``LineaIngrediente``: una línea de fórmula costeada.
+- ``CosteoProducto``: costeo variable de un producto (``get_costeo()``).
+- ``ProduccionProducto``: kg, minutos de MO y batches de un producto en un mes.
+- ``FilaDistribucion``: indirectos asignados a un producto en un mes.
+
+Son compartidos entre requests (cachés, snapshot del catálogo): tratarlos
+como solo lectura.
+"""
+
+
+class ProductoCatalogo:
+    """Parámetros de un producto, desligados de la sesión ORM (solo lectura)."""
+
+    _CAMPOS = (
+        'id', 'codigo', 'nombre', 'peso_batch_kg', 'porcentaje_merma', 'min_mo_kg',
+        'precio_venta', 'activo', 'fecha_creacion',
+    )
+    __slots__ = _CAMPOS + ('_dict',)
+
+    def __init__(self, producto):
+        for nombre in self._CAMPOS:
+            setattr(self, nombre, getattr(producto, nombre))
+        self._dict = None
+
+    @classmethod
+    def de(cls, producto):
+        """``producto`` si ya es un ProductoCatalogo; si no, una copia desligada."""
+        return producto if isinstance(producto, cls) else cls(producto)
+
+    def to_dict(self):
+        """Mismo formato que ``Producto.to_dict()`` (copia de un dict armado una sola vez)."""
+        if self._dict is None:
+            self._dict = self._armar_dict()
+        return dict(self._dict)
+
+    def _armar_dict(self):
+        return {
+            'id': self.id,
+            'codigo': self.codigo,
+            'nombre': self.nombre,
+            'peso_batch_kg': self.peso_batch_kg,
+            'porcentaje_merma': self.porcentaje_merma,
+            'min_mo_kg': self.min_mo_kg,
+            'precio_venta': self.precio_venta or 0,
+            'activo': self.activo,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None
+        }
+
+
+class LineaIngrediente:
+    """Línea de fórmula con su costo (un elemento de ``ingredientes``)."""
+
+    __slots__ = (
+        'detalle_id', 'materia_prima_id', 'nombre', 'categoria', 'unidad',
+        'costo_unitario', 'cantidad', 'costo_total',
+    )
+
+    def __init__(self, detalle_id, materia_prima_id, nombre, categoria, unidad, costo_unitario, cantidad):
+        self.detalle_id = detalle_id
+        self.materia_prima_id = materia_prima_id
+        self.nombre = nombre
+        self.categoria = categoria
+        self.unidad = unidad
+        self.costo_unitario = costo_unitario
+        self.cantidad = cantidad
+        self.costo_total = cantidad * costo_unitario
+
+    def con_precio(self, costo_unitario):
+        """Copia de la línea con otro costo unitario."""
+        return LineaIngrediente(
+            self.detalle_id, self.materia_prima_id, self.nombre, self.categoria, self.unidad,
+            costo_unitario, self.cantidad,
+        )
+
+    def to_dict(self):
+        return {
+            'id': self.detalle_id,
+            'materia_prima_id': self.materia_prima_id,
+            'nombre': self.nombre,
+            'categoria': self.categoria,
+            'unidad': self.unidad,
+            'costo_unitario': self.costo_unitario,
+            'cantidad': self.cantidad,
+            'costo_total': self.costo_total
+        }
+
+
+class CosteoProducto:
+    """
+    Costeo variable de un producto.
+
+    ``to_dict()`` devuelve un dict nuevo (mutable) con la estructura de
+    ``Producto.get_costeo()``; los totales del bloque ``resumen`` son
+    atributos.
+    """
+
+    __slots__ = (
+        'producto', 'ingredientes', 'totales_categoria', 'advertencias',
+        'total_materia_prima', 'costo_merma', 'materia_prima_neta', 'total_envases', 'total_neto',
+        'rendimiento', 'peso_neto_batch_kg', 'costo_por_kg',
+    )
+
+    def __init__(self, producto, ingredientes, totales_categoria, advertencias, total_materia_prima,
+                 costo_merma, materia_prima_neta, total_envases, total_neto, rendimiento,
+                 peso_neto_batch_kg, costo_por_kg):
+        """
+        Args:
+            producto: ProductoCatalogo
+            ingredientes: tupla de LineaIngrediente
+            totales_categoria: {categoria: (cantidad, costo)}
+            advertencias: tupla de mensajes o None
+        """
+        self.producto = producto
+        self.ingredientes = ingredientes
+        self.totales_categoria = totales_categoria
+        self.advertencias = advertencias
+        self.total_materia_prima = total_materia_prima
+        self.costo_merma = costo_merma
+        self.materia_prima_neta = materia_prima_neta
+        self.total_envases = total_envases
+        self.total_neto = total_neto
+        self.rendimiento = rendimiento
+        self.peso_neto_batch_kg = peso_neto_batch_kg
+        self.costo_por_kg = costo_por_kg
+
+    def materias(self):
+        """Ids de las materias primas de la fórmula."""
+        return {ing.materia_prima_id for ing in self.ingredientes}
+
+    def resumen(self):
+        """Bloque ``resumen`` de ``get_costeo()``."""
+        return {
+            'total_materia_prima': self.total_materia_prima,
+            'costo_merma': self.costo_merma,
+            'materia_prima_neta': self.materia_prima_neta,
+            'total_envases': self.total_envases,
+            'total_neto': self.total_neto,
+            'peso_batch_kg': self.producto.peso_batch_kg,
+            'porcentaje_merma': self.producto.porcentaje_merma,
+            'rendimiento': self.rendimiento,
+            'peso_neto_batch_kg': self.peso_neto_batch_kg,
+            'costo_por_kg': self.costo_por_kg
+        }
+
+    def to_dict(self):
+        return {
+            'producto': self.producto.to_dict(),
+            'ingredientes': [ing.to_dict() for ing in self.ingredientes],
+            'totales_categoria': {
+                categoria: {'cantidad': cantidad, 'costo': costo}
+                for categoria, (cantidad, costo) in self.totales_categoria.items()
+            },
+            'resumen': self.resumen(),
+            'advertencias': list(self.advertencias) if self.advertencias else None
+        }
+
+
+class ProduccionProducto:
+    """Producción programada de un producto en el mes de un ContextoMes."""
+
+    __slots__ = ('producto', 'kg', 'minutos', 'batches')
+
+    def __init__(self, producto, kg, minutos, batches):
+        self.producto = producto
+        self.kg = kg
+        self.minutos = minutos
+        self.batches = batches
+
+
+class FilaDistribucion:
+    """Costos indirectos asignados a un producto (fila de distribucion-costos)."""
+
+    __slots__ = (
+        'produccion', 'pct_kg', 'pct_mo', 'costo_sp', 'costo_gif', 'costo_dep',
+        'costo_total_indirecto', 'costo_indirecto_por_kg',
+    )
+
+    def __init__(self, produccion, pct_kg, pct_mo, costo_sp, costo_gif, costo_dep):
+        self.produccion = produccion
+        self.pct_kg = pct_kg
+        self.pct_mo = pct_mo
+        self.costo_sp = costo_sp
+        self.costo_gif = costo_gif
+        self.costo_dep = costo_dep
+        self.costo_total_indirecto = costo_sp + costo_gif + costo_dep
+        self.costo_indirecto_por_kg = self.costo_total_indirecto / produccion.kg if produccion.kg > 0 else 0
+
+    def to_dict(self):
+        produccion = self.produccion
+        return {
+            'producto': produccion.producto.to_dict(),
+            'kg_producidos': round(produccion.kg, 2),
+            'minutos_mo': round(produccion.minutos, 2),
+            'batches': produccion.batches,
+            'pct_kg': round(self.pct_kg, 2),
+            'pct_mo': round(self.pct_mo, 2),
+            'costo_sp': round(self.costo_sp, 2),
+            'costo_gif': round(self.costo_gif, 2),
+            'costo_dep': round(self.costo_dep, 2),
+            'costo_total_indirecto': round(self.costo_total_indirecto, 2),
+            'costo_indirecto_por_kg': round(self.costo_indirecto_por_kg, 2)
+        }
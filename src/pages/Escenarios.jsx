@@ -141,18 +141,15 @@ function Escenarios() {
                 setCostosIndirectosBase(resumen)
             }
 
-            // Cargar costeo de cada producto
+            // Cargar costeo de todos los productos activos en una sola consulta
             const costeos = {}
-            await Promise.all(
-                productosData.map(async (p) => {
-                    try {
-                        const costeo = await costeoApi.getByProducto(p.id)
-                        costeos[p.id] = costeo
-                    } catch {
-                        costeos[p.id] = null
-                    }
-                })
-            )
+            productosData.forEach(p => { costeos[p.id] = null })
+            try {
+                const costeosData = await costeoApi.getCompletoTodos()
+                costeosData.forEach(c => { costeos[c.producto.id] = c })
+            } catch (err) {
+                setMensaje({ type: 'error', text: `Error al cargar el costeo de los productos: ${err.message}` })
+            }
             setCosteoProductos(costeos)
 
             // Mes de producción por defecto
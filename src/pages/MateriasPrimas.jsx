@@ -110,7 +110,7 @@ function MateriasPrimas() {
             await loadData() // Recargar datos
         } catch (err) {
             console.error('Error deleting:', err)
-            alert('Error al eliminar la materia prima')
+            alert(err.message || 'Error al eliminar la materia prima')
         }
     }
 
@@ -94,13 +94,18 @@ export const materiasPrimasApi = {
         method: 'PUT',
         body: JSON.stringify(data),
     }),
-    delete: (id) => request(`/materias-primas/${id}`, {
+    delete: (id, forzar = false) => request(`/materias-primas/${id}${forzar ? '?forzar=true' : ''}`, {
         method: 'DELETE',
     }),
     ajustarPrecios: (porcentaje, categoria = null) => request('/materias-primas/ajustar-precios', {
         method: 'POST',
         body: JSON.stringify({ porcentaje, categoria }),
     }),
+    // Impacto del ajuste (costo/kg por producto, plan del mes y categorías) sin guardar cambios
+    previsualizarAjustePrecios: (porcentaje, categoria = null, mes = null) => request('/materias-primas/ajustar-precios', {
+        method: 'POST',
+        body: JSON.stringify({ porcentaje, categoria, dry_run: true, ...(mes ? { mes } : {}) }),
+    }),
     getHistorial: (materiaPrimaId = null, limit = 100) => {
         let url = '/materias-primas/historial'
         const params = []
@@ -112,6 +117,8 @@ export const materiasPrimasApi = {
     deshacerUltimoAjuste: () => request('/materias-primas/deshacer-ajuste', {
         method: 'POST',
     }),
+    getUso: (id) => request(`/materias-primas/${id}/uso`),
+    getSensibilidad: (id, top = 20) => request(`/materias-primas/${id}/sensibilidad?top=${top}`),
 }
 
 // ===== PRODUCTOS =====
@@ -150,6 +157,13 @@ export const formulasApi = {
     deleteIngrediente: (id) => request(`/formulas/ingrediente/${id}`, {
         method: 'DELETE',
     }),
+    // Costeo de una fórmula sin guardar; data: {ingredientes, peso_batch_kg, porcentaje_merma,
+    // producto_id?, mes_base?, mes_produccion?}. Cancela la vista previa anterior.
+    preview: (data) => request('/formulas/preview', {
+        method: 'POST',
+        body: JSON.stringify(data),
+        cancelKey: 'formula-preview',
+    }),
 }
 
 // ===== PRODUCCIÓN PROGRAMADA =====
@@ -181,7 +195,16 @@ export const costeoApi = {
         if (params.length > 0) url += `?${params.join('&')}`
         return request(url)
     },
+    getCompletoTodos: (mesBase = null, mesProduccion = null, ids = null) => {
+        const params = []
+        if (mesBase) params.push(`mes_base=${mesBase}`)
+        if (mesProduccion) params.push(`mes_produccion=${mesProduccion}`)
+        if (ids && ids.length > 0) params.push(`ids=${ids.join(',')}`)
+        return request(params.length > 0 ? `/costeo/completo?${params.join('&')}` : '/costeo/completo')
+    },
     getResumen: () => request('/costeo/resumen'),
+    getSensibilidad: (ids = null) =>
+        request(ids && ids.length > 0 ? `/costeo/sensibilidad?ids=${ids.join(',')}` : '/costeo/sensibilidad'),
 }
 
 // ===== ML / PREDICCIONES =====
@@ -229,6 +252,8 @@ export const historicoApi = {
 export const costosIndirectosApi = {
     getAll: (mesBase = null) => request(mesBase ? `/costos-indirectos?mes_base=${mesBase}` : '/costos-indirectos'),
     getResumen: (mesBase) => request(`/costos-indirectos/resumen?mes_base=${mesBase}`),
+    getCurvaEscalamiento: (mesBase, puntos = 200) =>
+        request(`/costos-indirectos/curva-escalamiento?mes_base=${mesBase}&puntos=${puntos}`),
     create: (data) => request('/costos-indirectos', {
         method: 'POST',
         body: JSON.stringify(data),
@@ -271,6 +296,23 @@ export const analisisMarginalApi = {
         }
         return request(url, { cancelKey: 'analisis-marginal' })
     },
+    // escenarios: lista de {inflacion, materia_prima, categoria, indirectos, produccion}; grilla: ejes a cruzar
+    evaluarEscenarios: (mesBase, mesProduccion, { escenarios = [], grilla = null } = {}) =>
+        request('/analisis-marginal/escenarios', {
+            method: 'POST',
+            body: JSON.stringify({
+                mes_base: mesBase,
+                mes_produccion: mesProduccion,
+                escenarios,
+                ...(grilla ? { grilla } : {}),
+            }),
+        }),
+    // opciones: {simulaciones, semilla, inflacion, categorias, percentiles}; distribuciones {distribucion, ...params}
+    simular: (mesBase, mesProduccion, opciones = {}) =>
+        request('/analisis-marginal/simulacion', {
+            method: 'POST',
+            body: JSON.stringify({ mes_base: mesBase, mes_produccion: mesProduccion, ...opciones }),
+        }),
 }
 
 // ===== PROYECCIÓN MULTI-PERÍODO =====
@@ -287,6 +329,17 @@ export const proyeccionApi = {
         }),
 }
 
+// ===== SANDBOX WHAT-IF =====
+// overlay: {precios, formulas, indirectos, inflacion, produccion}; los endpoints de costeo,
+// distribución, análisis marginal y multiperíodo aceptan ?sandbox=<id>
+export const sandboxApi = {
+    crear: (overlay = {}) => request('/sandbox', { method: 'POST', body: JSON.stringify(overlay) }),
+    get: (id) => request(`/sandbox/${id}`),
+    // Un valor null quita la entrada del overlay
+    actualizar: (id, cambios) => request(`/sandbox/${id}`, { method: 'PATCH', body: JSON.stringify(cambios) }),
+    delete: (id) => request(`/sandbox/${id}`, { method: 'DELETE' }),
+}
+
 
 // ===== EXPORTACIÓN A EXCEL =====
 export const exportarApi = {